@@ -15,6 +15,7 @@ from copy import deepcopy
 
 from flow.core.util import ensure_dir
 from flow.utils.registry import env_constructor
+from flow.utils.vec_env import FlowVecEnv
 from flow.utils.rllib import FlowParamsEncoder, get_flow_params
 from flow.utils.registry import make_create_env
 
@@ -82,7 +83,7 @@ def run_model_stablebaseline(flow_params,
     stable_baselines.*
         the trained model
     """
-    from stable_baselines.common.vec_env import DummyVecEnv, SubprocVecEnv
+    from stable_baselines.common.vec_env import DummyVecEnv
     from stable_baselines import PPO2
 
     if num_cpus == 1:
@@ -90,8 +91,8 @@ def run_model_stablebaseline(flow_params,
         # The algorithms require a vectorized environment to run
         env = DummyVecEnv([lambda: constructor])
     else:
-        env = SubprocVecEnv([env_constructor(params=flow_params, version=i)
-                             for i in range(num_cpus)])
+        env = FlowVecEnv([env_constructor(params=flow_params, version=i)
+                          for i in range(num_cpus)])
 
     train_model = PPO2('MlpPolicy', env, verbose=1, n_steps=rollout_size)
     train_model.learn(total_timesteps=num_steps)
@@ -1,8 +1,16 @@
 """Contains the base acceleration controller class."""
 
 from abc import ABCMeta, abstractmethod
+import collections
 import numpy as np
 
+# whether the accelerations of the controllers of every class can be computed
+# in bulk, see BaseController.get_accel_batch
+_batchable = {}
+# whether the controllers of every class modify the failsafes, see
+# apply_failsafes
+_overrides = {}
+
 
 class BaseController(metaclass=ABCMeta):
     """Base class for flow-controlled acceleration behavior.
@@ -42,8 +50,21 @@ class BaseController(metaclass=ABCMeta):
         Flag for toggling on/off printing failsafe warnings to screen.
     noise : double
         variance of the gaussian from which to sample a noisy acceleration
+
+    Controllers whose class (and parent classes) declare ``__slots__`` are
+    recycled by the vehicle kernel once their vehicle leaves the network, see
+    `reset`.
+
+    The actions of many controllers may be computed at once via
+    `get_accel_batch`. Controller classes that implement `batch_accel` are
+    evaluated as array expressions over all vehicles that use them, while
+    the remaining ones fall back to `get_action`.
     """
 
+    __slots__ = ('veh_id', 'accel_noise', 'delay', 'failsafes',
+                 'failsafe_names', 'display_warnings', 'max_accel',
+                 'max_deaccel', 'car_following_params')
+
     def __init__(self,
                  veh_id,
                  car_following_params,
@@ -82,6 +103,7 @@ class BaseController(metaclass=ABCMeta):
                     self.failsafes.append(failsafe_map.get(check))
                 else:
                     raise ValueError('Skipping {}, as it is not a valid failsafe.'.format(check))
+        self.failsafe_names = tuple(failsafe_list or ())
 
         self.display_warnings = display_warnings
 
@@ -91,11 +113,155 @@ class BaseController(metaclass=ABCMeta):
 
         self.car_following_params = car_following_params
 
+    def reset(self, veh_id):
+        """Assign the controller to a new vehicle of the same type.
+
+        Subclasses that store per-vehicle state (e.g. the history of a
+        vehicle's speeds) should extend this method to reset that state.
+
+        Parameters
+        ----------
+        veh_id : str
+            ID of the new vehicle this controller is used for
+        """
+        self.veh_id = veh_id
+
     @abstractmethod
     def get_accel(self, env):
         """Return the acceleration of the controller."""
         pass
 
+    @classmethod
+    def batch_accel(cls, env, controllers, obs):
+        """Return the accelerations of several controllers of this class.
+
+        This is the vectorized counterpart to `get_accel`, and is used by
+        `get_accel_batch`. Subclasses that implement it must return the same
+        values as `get_accel` (including any update to the state of the
+        controllers), and are otherwise evaluated vehicle by vehicle.
+
+        Parameters
+        ----------
+        env : flow.envs.Env
+            state of the environment at the current time step
+        controllers : list of BaseController
+            controllers of this class
+        obs : dict < str, np.ndarray >
+            state of the vehicles of the controllers, see `get_accel_batch`
+
+        Returns
+        -------
+        np.ndarray or None
+            acceleration of every controller, with NaN denoting that sumo
+            should control the vehicle for the current time step. None if
+            the class does not support batched evaluation
+        """
+        return None
+
+    @classmethod
+    def get_accel_batch(cls, env, veh_ids):
+        """Return the actions of the acceleration controllers of vehicles.
+
+        This is equivalent to calling `get_action` for the controller of every
+        vehicle, but controllers of the same class are evaluated at once via
+        `batch_accel`, using the following state of their vehicles (stored in
+        the `obs` dictionary):
+
+        * speed: speed of the vehicle
+        * headway: headway to the leader of the vehicle
+        * length: length of the vehicle
+        * edges: list of the edges the vehicles are on
+        * lead_ids: list of the leaders of the vehicles, "" if there is none
+        * has_leader: whether the vehicle has a leader
+        * lead_speed: speed of the leader, -1001 if there is none
+
+        Noise is added to the accelerations of all vehicles via a single
+        random draw, the failsafes are applied to the whole batch of
+        accelerations at once, and the four variants of the accelerations
+        (with and without noise and failsafes) are stored in the vehicle
+        kernel via `update_accels`.
+
+        Parameters
+        ----------
+        env : flow.envs.Env
+            state of the environment at the current time step
+        veh_ids : list of str
+            ids of the vehicles
+
+        Returns
+        -------
+        list of float or None
+            action of every vehicle, see `get_action`
+        """
+        vehicle = env.k.vehicle
+        veh_ids = list(veh_ids)
+        controllers = vehicle.get_acc_controller(veh_ids)
+        actions = [None] * len(veh_ids)
+
+        indices = []
+        for i, controller in enumerate(controllers):
+            if _is_batchable(type(controller)):
+                indices.append(i)
+            else:
+                actions[i] = controller.get_action(env)
+        if len(indices) == 0:
+            return actions
+
+        # clear the current stored accels of these vehicles
+        batch_ids = [veh_ids[i] for i in indices]
+        for noise in (False, True):
+            for failsafe in (False, True):
+                vehicle.update_accels(batch_ids, None, noise, failsafe)
+
+        # vehicles that were just added or that are in a junction are
+        # controlled by sumo, see get_action
+        edges = vehicle.get_edge(batch_ids)
+        valid = [j for j, edge in enumerate(edges)
+                 if len(edge) > 0 and edge[0] != ":"]
+        if len(valid) == 0:
+            return actions
+        indices = [indices[j] for j in valid]
+        batch_ids = [batch_ids[j] for j in valid]
+        controllers = [controllers[i] for i in indices]
+        obs = _batch_obs(env, batch_ids)
+        obs['edges'] = [edges[j] for j in valid]
+
+        # compute the accelerations of every class of controllers at once
+        accel = np.empty(len(indices))
+        groups = collections.OrderedDict()
+        for j, controller in enumerate(controllers):
+            groups.setdefault(type(controller), []).append(j)
+        for controller_cls, group in groups.items():
+            accel[group] = controller_cls.batch_accel(
+                env, [controllers[j] for j in group], _take(obs, group))
+
+        # add noise to the accelerations, if requested
+        noise = np.array([c.accel_noise for c in controllers], dtype=float)
+        noisy = (noise > 0) & ~np.isnan(accel)
+        accel_noise = accel.copy()
+        if np.any(noisy):
+            accel_noise[noisy] += np.sqrt(env.sim_step) * \
+                np.random.normal(0, noise[noisy])
+
+        # run the fail-safes, if requested
+        accel_failsafe = apply_failsafes(env, controllers, accel, obs)
+        accel_noise_failsafe = apply_failsafes(
+            env, controllers, accel_noise, obs)
+
+        vehicle.update_accels(batch_ids, accel, noise=False, failsafe=False)
+        vehicle.update_accels(
+            batch_ids, accel_failsafe, noise=False, failsafe=True)
+        vehicle.update_accels(
+            batch_ids, accel_noise, noise=True, failsafe=False)
+        vehicle.update_accels(
+            batch_ids, accel_noise_failsafe, noise=True, failsafe=True)
+
+        for i, acc in zip(indices, accel_noise_failsafe.tolist()):
+            # if no acceleration is specified, let sumo take over
+            actions[i] = None if acc != acc else acc
+
+        return actions
+
     def get_action(self, env):
         """Convert the get_accel() acceleration into an action.
 
@@ -379,3 +545,217 @@ class BaseController(metaclass=ABCMeta):
                     "=====================================".format(self.veh_id))
 
         return action
+
+
+def _is_batchable(controller_cls):
+    """Return whether a controller class supports batched evaluation.
+
+    This is the case if the class that defines the acceleration of the
+    controllers also implements `batch_accel`, so that subclasses that
+    override `get_accel` (or `get_action`) are evaluated vehicle by vehicle.
+    """
+    batchable = _batchable.get(controller_cls)
+    if batchable is None:
+        owner = next(base for base in controller_cls.__mro__
+                     if 'get_accel' in vars(base))
+        batchable = owner is not BaseController and \
+            'batch_accel' in vars(owner) and \
+            controller_cls.get_action is BaseController.get_action
+        _batchable[controller_cls] = batchable
+    return batchable
+
+
+def _batch_obs(env, veh_ids):
+    """Return the state used to compute the accelerations of vehicles."""
+    vehicle = env.k.vehicle
+    state = vehicle.get_state_matrix(
+        veh_ids, fields=('speed', 'headway', 'length'))
+    lead_ids = vehicle.get_leader(veh_ids)
+    return {
+        'speed': state[:, 0],
+        'headway': state[:, 1],
+        'length': state[:, 2],
+        'lead_ids': lead_ids,
+        'has_leader': np.array([bool(lead_id) for lead_id in lead_ids]),
+        'lead_speed': vehicle.get_speeds(lead_ids),
+    }
+
+
+def batch_params(controllers, name):
+    """Return an attribute of several controllers as an array of floats."""
+    return np.array([getattr(c, name) for c in controllers], dtype=float)
+
+
+def _take(obs, indices):
+    """Return the state of a subset of the vehicles of a batch."""
+    return {key: [value[i] for i in indices] if isinstance(value, list)
+            else value[indices] for key, value in obs.items()}
+
+
+def apply_failsafes(env, controllers, accel, obs):
+    """Apply the failsafes of several controllers to their accelerations.
+
+    This is the vectorized counterpart to running the failsafes of every
+    controller (see `BaseController.get_action`). The failsafes are applied
+    in the order requested by every controller, as array expressions over
+    all controllers that share the same failsafes. Controllers that override
+    any of the failsafe methods of BaseController are processed one at a
+    time.
+
+    Parameters
+    ----------
+    env : flow.envs.Env
+        state of the environment at the current time step
+    controllers : list of BaseController
+        controllers of the vehicles
+    accel : np.ndarray
+        requested accelerations, with NaN denoting that no acceleration is
+        requested
+    obs : dict < str, np.ndarray >
+        state of the vehicles, see `BaseController.get_accel_batch`
+
+    Returns
+    -------
+    np.ndarray
+        accelerations after the failsafes
+    """
+    accel = accel.copy()
+    requested = ~np.isnan(accel)
+
+    groups = collections.OrderedDict()
+    for i, controller in enumerate(controllers):
+        if controller.failsafes and requested[i]:
+            key = controller.failsafe_names \
+                if not _overrides_failsafes(type(controller)) else None
+            groups.setdefault(key, []).append(i)
+
+    for names, group in groups.items():
+        if names is None:
+            for i in group:
+                acc = float(accel[i])
+                for failsafe in controllers[i].failsafes:
+                    acc = failsafe(env, acc)
+                accel[i] = acc
+            continue
+
+        group = np.array(group)
+        group_controllers = [controllers[i] for i in group]
+        group_obs = _take(obs, group)
+        group_accel = accel[group]
+        for name in names:
+            group_accel = _BATCH_FAILSAFES[name](
+                env, group_controllers, group_accel, group_obs)
+        accel[group] = group_accel
+
+    return accel
+
+
+def _overrides_failsafes(controller_cls):
+    """Return whether a controller class modifies any of the failsafes."""
+    overrides = _overrides.get(controller_cls)
+    if overrides is None:
+        overrides = any(getattr(controller_cls, name) is not getattr(
+            BaseController, name) for name in _FAILSAFE_METHODS)
+        _overrides[controller_cls] = overrides
+    return overrides
+
+
+def _print_warnings(controllers, flagged, message):
+    """Print a failsafe warning for the flagged controllers."""
+    for i in np.flatnonzero(flagged):
+        if controllers[i].display_warnings:
+            print(
+                "=====================================\n"
+                + message.format(controllers[i].veh_id) +
+                "\n=====================================")
+
+
+def _instantaneous_batch(env, controllers, accel, obs):
+    """Perform the "instantaneous" failsafe on a batch of accelerations."""
+    # if there is only one vehicle in the network, all actions are safe
+    if env.k.vehicle.num_vehicles == 1:
+        return accel
+
+    this_vel = obs['speed']
+    sim_step = env.sim_step
+    next_vel = this_vel + accel * sim_step
+
+    # stop immediately if the vehicle will crash into the vehicle ahead of it
+    # in the next time step (assuming it is not moving)
+    crash = (next_vel > 0) & (obs['headway'] < sim_step * next_vel +
+                              this_vel * 1e-3 + 0.5 * this_vel * sim_step)
+    _print_warnings(controllers, crash,
+                    "Vehicle {} is about to crash. Instantaneous acceleration "
+                    "clipping applied.")
+    return np.where(crash, -this_vel / sim_step, accel)
+
+
+def _safe_velocity_batch(env, controllers, accel, obs):
+    """Perform the "safe_velocity" failsafe on a batch of accelerations."""
+    # if there is only one vehicle in the network, all actions are safe
+    if env.k.vehicle.num_vehicles == 1:
+        return accel
+
+    this_vel = obs['speed']
+    sim_step = env.sim_step
+    delay = batch_params(controllers, 'delay')
+    safe_velocity = 2 * obs['headway'] / sim_step + \
+        (obs['lead_speed'] - this_vel) - this_vel * (2 * delay)
+    _print_warnings(controllers, this_vel > safe_velocity,
+                    "Speed of vehicle {} is greater than safe speed. Safe "
+                    "velocity clipping applied.")
+
+    return np.where(
+        this_vel + accel * sim_step > safe_velocity,
+        np.where(safe_velocity > 0, (safe_velocity - this_vel) / sim_step,
+                 -this_vel / sim_step),
+        accel)
+
+
+def _feasible_accel_batch(env, controllers, accel, obs):
+    """Perform the "feasible_accel" failsafe on a batch of accelerations."""
+    max_accel = batch_params(controllers, 'max_accel')
+    max_deaccel = batch_params(controllers, 'max_deaccel')
+    _print_warnings(controllers, accel > max_accel,
+                    "Acceleration of vehicle {} is greater than the max "
+                    "acceleration. Feasible acceleration clipping applied.")
+    accel = np.minimum(accel, max_accel)
+    _print_warnings(controllers, accel < -max_deaccel,
+                    "Deceleration of vehicle {} is greater than the max "
+                    "deceleration. Feasible acceleration clipping applied.")
+    return np.maximum(accel, -max_deaccel)
+
+
+def _obey_speed_limit_batch(env, controllers, accel, obs):
+    """Perform the "obey_speed_limit" failsafe on a batch of accelerations."""
+    speed_limits = {edge: env.k.network.speed_limit(edge)
+                    for edge in set(obs['edges'])}
+    edge_speed_limit = np.array([speed_limits[edge] for edge in obs['edges']],
+                                dtype=float)
+    this_vel = obs['speed']
+    sim_step = env.sim_step
+
+    exceeded = this_vel + accel * sim_step > edge_speed_limit
+    _print_warnings(controllers, exceeded & (edge_speed_limit > 0),
+                    "Speed of vehicle {} is greater than speed limit. Obey "
+                    "speed limit clipping applied.")
+    return np.where(
+        exceeded,
+        np.where(edge_speed_limit > 0,
+                 (edge_speed_limit - this_vel) / sim_step,
+                 -this_vel / sim_step),
+        accel)
+
+
+# vectorized counterpart of every failsafe, see apply_failsafes
+_BATCH_FAILSAFES = {
+    'instantaneous': _instantaneous_batch,
+    'safe_velocity': _safe_velocity_batch,
+    'feasible_accel': _feasible_accel_batch,
+    'obey_speed_limit': _obey_speed_limit_batch,
+}
+
+# methods of BaseController that implement the failsafes
+_FAILSAFE_METHODS = ('get_safe_action_instantaneous',
+                     'get_safe_velocity_action', 'safe_velocity',
+                     'get_obey_speed_limit_action', 'get_feasible_action')
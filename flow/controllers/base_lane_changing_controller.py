@@ -28,8 +28,14 @@ class BaseLaneChangeController(metaclass=ABCMeta):
         Dictionary of lane changes params that may optional contain
         "min_gap", which denotes the minimize safe gap (in meters) a car
         is willing to lane-change into.
+
+    Controllers whose class (and parent classes) declare ``__slots__`` are
+    recycled by the vehicle kernel once their vehicle leaves the network, see
+    `reset`.
     """
 
+    __slots__ = ('veh_id', 'lane_change_params')
+
     def __init__(self, veh_id, lane_change_params=None):
         """Instantiate the base class for lane-changing controllers."""
         if lane_change_params is None:
@@ -38,6 +44,19 @@ class BaseLaneChangeController(metaclass=ABCMeta):
         self.veh_id = veh_id
         self.lane_change_params = lane_change_params
 
+    def reset(self, veh_id):
+        """Assign the controller to a new vehicle of the same type.
+
+        Subclasses that store per-vehicle state should extend this method to
+        reset that state.
+
+        Parameters
+        ----------
+        veh_id : str
+            ID of the new vehicle this controller is used for
+        """
+        self.veh_id = veh_id
+
     @abstractmethod
     def get_lane_change_action(self, env):
         """Specify the lane change action to be performed.
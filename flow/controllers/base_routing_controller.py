@@ -25,13 +25,43 @@ class BaseRouter(metaclass=ABCMeta):
         ID of the vehicle this controller is used for
     router_params : dict
         Dictionary of router params
+
+    Controllers whose class (and parent classes) declare ``__slots__`` are
+    recycled by the vehicle kernel once their vehicle leaves the network, see
+    `reset`.
+
+    By default, `choose_route` is called at every simulation step. Routers
+    whose decisions only depend on specific changes in the state of their
+    vehicle may list the kernel events (see flow/core/kernel/events.py) that
+    trigger them in the `trigger_events` attribute, in which case
+    `choose_route` is only called in the steps that follow these events, if
+    the simulator supports them.
     """
 
+    __slots__ = ('veh_id', 'router_params')
+
+    # events of the vehicle kernel after which a route is chosen, or None to
+    # choose a route at every step
+    trigger_events = None
+
     def __init__(self, veh_id, router_params):
         """Instantiate the base class for routing controllers."""
         self.veh_id = veh_id
         self.router_params = router_params
 
+    def reset(self, veh_id):
+        """Assign the controller to a new vehicle of the same type.
+
+        Subclasses that store per-vehicle state should extend this method to
+        reset that state.
+
+        Parameters
+        ----------
+        veh_id : str
+            ID of the new vehicle this controller is used for
+        """
+        self.veh_id = veh_id
+
     @abstractmethod
     def choose_route(self, env):
         """Return the routing method implemented by the controller.
@@ -11,7 +11,7 @@ model to return a vehicle acceleration.
 import math
 import numpy as np
 
-from flow.controllers.base_controller import BaseController
+from flow.controllers.base_controller import BaseController, batch_params
 
 
 class CFMController(BaseController):
@@ -46,6 +46,8 @@ class CFMController(BaseController):
         to no failsafe (None)
     """
 
+    __slots__ = ('k_d', 'k_v', 'k_c', 'd_des', 'v_des')
+
     def __init__(self,
                  veh_id,
                  car_following_params,
@@ -90,6 +92,18 @@ class CFMController(BaseController):
         return self.k_d*(d_l - self.d_des) + self.k_v*(lead_vel - this_vel) + \
             self.k_c*(self.v_des - this_vel)
 
+    @classmethod
+    def batch_accel(cls, env, controllers, obs):
+        """See parent class."""
+        this_vel = obs['speed']
+        accel = batch_params(controllers, 'k_d') * (
+            obs['headway'] - batch_params(controllers, 'd_des')) + \
+            batch_params(controllers, 'k_v') * (obs['lead_speed'] - this_vel) + \
+            batch_params(controllers, 'k_c') * (
+                batch_params(controllers, 'v_des') - this_vel)
+        return np.where(obs['has_leader'], accel,
+                        batch_params(controllers, 'max_accel'))
+
 
 class BCMController(BaseController):
     """Bilateral car-following model controller.
@@ -125,6 +139,8 @@ class BCMController(BaseController):
         to no failsafe (None)
     """
 
+    __slots__ = ('k_d', 'k_v', 'k_c', 'd_des', 'v_des')
+
     def __init__(self,
                  veh_id,
                  car_following_params,
@@ -181,6 +197,23 @@ class BCMController(BaseController):
             self.k_v * ((lead_vel - this_vel) - (this_vel - trail_vel)) + \
             self.k_c * (self.v_des - this_vel)
 
+    @classmethod
+    def batch_accel(cls, env, controllers, obs):
+        """See parent class."""
+        trail_ids = env.k.vehicle.get_follower(
+            [c.veh_id for c in controllers])
+        trail = env.k.vehicle.get_state_matrix(
+            trail_ids, fields=('speed', 'headway'))
+        this_vel = obs['speed']
+        accel = batch_params(controllers, 'k_d') * (
+            obs['headway'] - trail[:, 1]) + \
+            batch_params(controllers, 'k_v') * (
+                (obs['lead_speed'] - this_vel) - (this_vel - trail[:, 0])) + \
+            batch_params(controllers, 'k_c') * (
+                batch_params(controllers, 'v_des') - this_vel)
+        return np.where(obs['has_leader'], accel,
+                        batch_params(controllers, 'max_accel'))
+
 
 class LACController(BaseController):
     """Linear Adaptive Cruise Control.
@@ -208,6 +241,8 @@ class LACController(BaseController):
         to no failsafe (None)
     """
 
+    __slots__ = ('k_1', 'k_2', 'h', 'tau', 'a', 'initial_a')
+
     def __init__(self,
                  veh_id,
                  car_following_params,
@@ -237,6 +272,12 @@ class LACController(BaseController):
         self.h = h
         self.tau = tau
         self.a = a
+        self.initial_a = a
+
+    def reset(self, veh_id):
+        """See parent class."""
+        BaseController.reset(self, veh_id)
+        self.a = self.initial_a
 
     def get_accel(self, env):
         """See parent class."""
@@ -253,6 +294,23 @@ class LACController(BaseController):
 
         return self.a
 
+    @classmethod
+    def batch_accel(cls, env, controllers, obs):
+        """See parent class."""
+        a = batch_params(controllers, 'a')
+        tau = batch_params(controllers, 'tau')
+        ex = obs['headway'] - obs['length'] - \
+            batch_params(controllers, 'h') * obs['speed']
+        ev = obs['lead_speed'] - obs['speed']
+        u = batch_params(controllers, 'k_1') * ex + \
+            batch_params(controllers, 'k_2') * ev
+        a_dot = -(a / tau) + (u / tau)
+        a = a_dot * env.sim_step + a
+
+        for controller, a_i in zip(controllers, a.tolist()):
+            controller.a = a_i
+        return a
+
 
 class OVMController(BaseController):
     """Optimal Vehicle Model controller.
@@ -288,6 +346,8 @@ class OVMController(BaseController):
         to no failsafe (None)
     """
 
+    __slots__ = ('v_max', 'alpha', 'beta', 'h_st', 'h_go')
+
     def __init__(self,
                  veh_id,
                  car_following_params,
@@ -339,6 +399,28 @@ class OVMController(BaseController):
 
         return self.alpha * (v_h - this_vel) + self.beta * h_dot
 
+    @classmethod
+    def batch_accel(cls, env, controllers, obs):
+        """See parent class."""
+        h = obs['headway']
+        this_vel = obs['speed']
+        v_max = batch_params(controllers, 'v_max')
+        h_st = batch_params(controllers, 'h_st')
+        h_go = batch_params(controllers, 'h_go')
+
+        # V function here - input: h, output : Vh
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v_h = np.select(
+                [h <= h_st, h < h_go],
+                [0, v_max / 2 * (1 - np.cos(np.pi * (h - h_st) /
+                                            (h_go - h_st)))],
+                default=v_max)
+
+        accel = batch_params(controllers, 'alpha') * (v_h - this_vel) + \
+            batch_params(controllers, 'beta') * (obs['lead_speed'] - this_vel)
+        return np.where(obs['has_leader'], accel,
+                        batch_params(controllers, 'max_accel'))
+
 
 class LinearOVM(BaseController):
     """Linear OVM controller.
@@ -368,6 +450,8 @@ class LinearOVM(BaseController):
         to no failsafe (None)
     """
 
+    __slots__ = ('v_max', 'adaptation', 'h_st')
+
     def __init__(self,
                  veh_id,
                  car_following_params,
@@ -411,6 +495,20 @@ class LinearOVM(BaseController):
 
         return (v_h - this_vel) / self.adaptation
 
+    @classmethod
+    def batch_accel(cls, env, controllers, obs):
+        """See parent class."""
+        h = obs['headway']
+        v_max = batch_params(controllers, 'v_max')
+        h_st = batch_params(controllers, 'h_st')
+
+        # V function here - input: h, output : Vh
+        alpha = 1.689  # the average value from Nakayama paper
+        v_h = np.select([h < h_st, h <= h_st + v_max / alpha],
+                        [0, alpha * (h - h_st)], default=v_max)
+
+        return (v_h - obs['speed']) / batch_params(controllers, 'adaptation')
+
 
 class IDMController(BaseController):
     """Intelligent Driver Model (IDM) controller.
@@ -449,6 +547,8 @@ class IDMController(BaseController):
         to no failsafe (None)
     """
 
+    __slots__ = ('v0', 'T', 'a', 'b', 'delta', 's0')
+
     def __init__(self,
                  veh_id,
                  v0=30,
@@ -499,6 +599,25 @@ class IDMController(BaseController):
 
         return self.a * (1 - (v / self.v0)**self.delta - (s_star / h)**2)
 
+    @classmethod
+    def batch_accel(cls, env, controllers, obs):
+        """See parent class."""
+        v = obs['speed']
+        h = obs['headway']
+        T = batch_params(controllers, 'T')
+        a = batch_params(controllers, 'a')
+        b = batch_params(controllers, 'b')
+
+        # in order to deal with ZeroDivisionError
+        h = np.where(np.abs(h) < 1e-3, 1e-3, h)
+
+        s_star = batch_params(controllers, 's0') + np.maximum(
+            0, v * T + v * (v - obs['lead_speed']) / (2 * np.sqrt(a * b)))
+        s_star = np.where(obs['has_leader'], s_star, 0)
+
+        return a * (1 - (v / batch_params(controllers, 'v0'))
+                    ** batch_params(controllers, 'delta') - (s_star / h)**2)
+
 
 class SimCarFollowingController(BaseController):
     """Controller whose actions are purely defined by the simulator.
@@ -510,10 +629,17 @@ class SimCarFollowingController(BaseController):
     Usage: See BaseController for usage example.
     """
 
+    __slots__ = ()
+
     def get_accel(self, env):
         """See parent class."""
         return None
 
+    @classmethod
+    def batch_accel(cls, env, controllers, obs):
+        """See parent class."""
+        return np.full(len(controllers), np.nan)
+
 
 class GippsController(BaseController):
     """Gipps' Model controller.
@@ -553,6 +679,8 @@ class GippsController(BaseController):
         to no failsafe (None)
     """
 
+    __slots__ = ('v_desired', 'acc', 'b', 'b_l', 's0', 'tau')
+
     def __init__(self,
                  veh_id,
                  car_following_params=None,
@@ -601,6 +729,29 @@ class GippsController(BaseController):
 
         return (v_next-v)/env.sim_step
 
+    @classmethod
+    def batch_accel(cls, env, controllers, obs):
+        """See parent class."""
+        v = obs['speed']
+        h = obs['headway']
+        v_l = obs['lead_speed']
+        v_desired = batch_params(controllers, 'v_desired')
+        tau = batch_params(controllers, 'tau')
+        b = batch_params(controllers, 'b')
+
+        # get velocity dynamics
+        with np.errstate(invalid='ignore'):
+            v_acc = v + (2.5 * batch_params(controllers, 'acc') * tau * (
+                1 - (v / v_desired)) * np.sqrt(0.025 + (v / v_desired)))
+            v_safe = (tau * b) + np.sqrt(((tau**2) * (b**2)) - (
+                b * ((2 * (h - batch_params(controllers, 's0'))) - (tau * v) -
+                     ((v_l**2) / batch_params(controllers, 'b_l')))))
+
+        # an undefined safe velocity is ignored, as with the built-in min
+        v_next = np.fmin(np.fmin(v_acc, v_safe), v_desired)
+
+        return (v_next - v) / env.sim_step
+
 
 class BandoFTLController(BaseController):
     """Bando follow-the-leader controller.
@@ -636,6 +787,8 @@ class BandoFTLController(BaseController):
         to no failsafe (None)
     """
 
+    __slots__ = ('v_max', 'alpha', 'beta', 'h_st', 'h_go', 'want_max_accel')
+
     def __init__(self,
                  veh_id,
                  car_following_params,
@@ -685,3 +838,26 @@ class BandoFTLController(BaseController):
         s_dot = v_l - v
         u = self.alpha * (v_h - v) + self.beta * s_dot/(s**2)
         return u
+
+    @classmethod
+    def batch_accel(cls, env, controllers, obs):
+        """See parent class."""
+        v = obs['speed']
+        s = obs['headway']
+        v_l = obs['lead_speed']
+        if cls.accel_func is not BandoFTLController.accel_func:
+            # the acceleration function was modified by a subclass
+            u = np.array([c.accel_func(v_i, v_l_i, s_i) for c, v_i, v_l_i, s_i
+                          in zip(controllers, v, v_l, s)], dtype=float)
+        else:
+            h_st = batch_params(controllers, 'h_st')
+            v_h = batch_params(controllers, 'v_max') * (
+                (np.tanh(s / h_st - 2) + np.tanh(2)) / (1 + np.tanh(2)))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                u = batch_params(controllers, 'alpha') * (v_h - v) + \
+                    batch_params(controllers, 'beta') * (v_l - v) / (s**2)
+
+        want_max_accel = np.array([c.want_max_accel for c in controllers],
+                                  dtype=bool)
+        return np.where(~obs['has_leader'] & want_max_accel,
+                        batch_params(controllers, 'max_accel'), u)
@@ -10,6 +10,8 @@ class SimLaneChangeController(BaseLaneChangeController):
     Usage: See base class for usage example.
     """
 
+    __slots__ = ()
+
     def get_lane_change_action(self, env):
         """See parent class."""
         return None
@@ -21,6 +23,8 @@ class StaticLaneChanger(BaseLaneChangeController):
     Usage: See base class for usage example.
     """
 
+    __slots__ = ()
+
     def get_lane_change_action(self, env):
         """See parent class."""
         return 0
@@ -31,6 +31,8 @@ class RLController(BaseController):
         >>> rl_ids = env.k.vehicle.get_rl_ids()
     """
 
+    __slots__ = ()
+
     def __init__(self, veh_id, car_following_params):
         """Instantiate an RL Controller."""
         BaseController.__init__(
@@ -3,6 +3,8 @@ import random
 import numpy as np
 
 from flow.controllers.base_routing_controller import BaseRouter
+from flow.core.kernel.events import DEPARTED, EDGE_CHANGED, LANE_CHANGED, \
+    REACHED_LAST_EDGE
 
 
 class ContinuousRouter(BaseRouter):
@@ -16,6 +18,9 @@ class ContinuousRouter(BaseRouter):
     See base class for usage example.
     """
 
+    __slots__ = ()
+    trigger_events = (REACHED_LAST_EDGE,)
+
     def choose_route(self, env):
         """See parent class.
 
@@ -52,6 +57,9 @@ class MinicityRouter(BaseRouter):
     See base class for usage example.
     """
 
+    __slots__ = ()
+    trigger_events = (DEPARTED, EDGE_CHANGED, LANE_CHANGED, REACHED_LAST_EDGE)
+
     def choose_route(self, env):
         """See parent class."""
         vehicles = env.k.vehicle
@@ -89,6 +97,9 @@ class GridRouter(BaseRouter):
     See base class for usage example.
     """
 
+    __slots__ = ()
+    trigger_events = (REACHED_LAST_EDGE,)
+
     def choose_route(self, env):
         """See parent class."""
         if len(env.k.vehicle.get_route(self.veh_id)) == 0:
@@ -112,6 +123,9 @@ class BayBridgeRouter(ContinuousRouter):
     See base class for usage example.
     """
 
+    __slots__ = ()
+    trigger_events = (DEPARTED, EDGE_CHANGED, LANE_CHANGED, REACHED_LAST_EDGE)
+
     def choose_route(self, env):
         """See parent class."""
         edge = env.k.vehicle.get_edge(self.veh_id)
@@ -136,6 +150,9 @@ class I210Router(ContinuousRouter):
     See base class for usage example.
     """
 
+    __slots__ = ()
+    trigger_events = (DEPARTED, EDGE_CHANGED, LANE_CHANGED, REACHED_LAST_EDGE)
+
     def choose_route(self, env):
         """See parent class."""
         edge = env.k.vehicle.get_edge(self.veh_id)
@@ -1,6 +1,6 @@
 """Contains a list of custom velocity controllers."""
 
-from flow.controllers.base_controller import BaseController
+from flow.controllers.base_controller import BaseController, batch_params
 import numpy as np
 
 
@@ -22,6 +22,9 @@ class FollowerStopper(BaseController):
         desired speed of the vehicles (m/s)
     """
 
+    __slots__ = ('v_des', 'dx_1_0', 'dx_2_0', 'dx_3_0', 'd_1', 'd_2', 'd_3',
+                 'danger_edges')
+
     def __init__(self,
                  veh_id,
                  car_following_params,
@@ -115,10 +118,51 @@ class FollowerStopper(BaseController):
             # compute the acceleration from the desired velocity
             return (v_cmd - this_vel) / env.sim_step
 
+    @classmethod
+    def batch_accel(cls, env, controllers, obs):
+        """See parent class."""
+        this_vel = obs['speed']
+        lead_vel = obs['lead_speed']
+        dx = obs['headway']
+        v_des = np.array([np.nan if c.v_des is None else c.v_des
+                          for c in controllers], dtype=float)
+
+        dv_minus = np.minimum(lead_vel - this_vel, 0)
+        dx_1 = batch_params(controllers, 'dx_1_0') + \
+            1 / (2 * batch_params(controllers, 'd_1')) * dv_minus**2
+        dx_2 = batch_params(controllers, 'dx_2_0') + \
+            1 / (2 * batch_params(controllers, 'd_2')) * dv_minus**2
+        dx_3 = batch_params(controllers, 'dx_3_0') + \
+            1 / (2 * batch_params(controllers, 'd_3')) * dv_minus**2
+        v = np.minimum(np.maximum(lead_vel, 0), v_des)
+
+        # compute the desired velocity
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v_cmd = np.select(
+                [dx <= dx_1, dx <= dx_2, dx <= dx_3],
+                [0, v * (dx - dx_1) / (dx_2 - dx_1),
+                 v + (v_des - this_vel) * (dx - dx_2) / (dx_3 - dx_2)],
+                default=v_des)
+        accel = (v_cmd - this_vel) / env.sim_step
+        accel[np.isnan(v_des)] = np.nan
+
+        # vehicles close to an intersection on a dangerous edge are
+        # controlled by sumo
+        for i, controller in enumerate(controllers):
+            if controller.danger_edges and \
+                    env.k.vehicle.get_edge(controller.veh_id) in \
+                    controller.danger_edges and \
+                    controller.find_intersection_dist(env) <= 10:
+                accel[i] = np.nan
+
+        return accel
+
 
 class NonLocalFollowerStopper(FollowerStopper):
     """Follower stopper that uses the average system speed to compute its acceleration."""
 
+    __slots__ = ()
+
     def get_accel(self, env):
         """See parent class."""
         lead_id = env.k.vehicle.get_leader(self.veh_id)
@@ -182,6 +226,9 @@ class PISaturation(BaseController):
         object defining sumo-specific car-following parameters
     """
 
+    __slots__ = ('v_history', 'gamma', 'g_l', 'g_u', 'v_catch', 'alpha',
+                 'beta', 'U', 'v_target', 'v_cmd')
+
     def __init__(self, veh_id, car_following_params):
         """Instantiate PISaturation."""
         BaseController.__init__(self, veh_id, car_following_params, delay=1.0)
@@ -189,15 +236,21 @@ class PISaturation(BaseController):
         # maximum achievable acceleration by the vehicle
         self.max_accel = car_following_params.controller_params['accel']
 
-        # history used to determine AV desired velocity
-        self.v_history = []
-
         # other parameters
         self.gamma = 2
         self.g_l = 7
         self.g_u = 30
         self.v_catch = 1
 
+        self.reset(veh_id)
+
+    def reset(self, veh_id):
+        """See parent class."""
+        BaseController.reset(self, veh_id)
+
+        # history used to determine AV desired velocity
+        self.v_history = []
+
         # values that are updated by using their old information
         self.alpha = 0
         self.beta = 1 - 0.5 * self.alpha
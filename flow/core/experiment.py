@@ -169,7 +169,9 @@ class Experiment:
             print("Round {0}, return: {1}".format(i, ret))
 
             # Save emission data at the end of every rollout. This is skipped
-            # by the internal method if no emission path was specified.
+            # by the internal method if no emission path was specified, and
+            # the file is written in the background while the next rollout
+            # runs.
             if self.env.simulator == "traci":
                 self.env.k.simulation.save_emission(run_id=i)
 
@@ -180,6 +182,8 @@ class Experiment:
 
         print("Total time:", time.time() - t)
         print("steps/second:", np.mean(times))
+        if self.env.profiler.enabled:
+            print(self.env.profiler.format())
         self.env.terminate()
 
         return info_dict
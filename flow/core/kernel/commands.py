@@ -0,0 +1,252 @@
+"""Script containing the TraCI command buffer of the Flow kernel."""
+import collections
+import contextlib
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+# attributes of the TraCI connection that messages are composed with (see
+# `TraCICommandBuffer.batching`). They are private to the TraCI client, and
+# have not changed since sumo 1.0.
+BATCH_ATTRIBUTES = ('_sendExact', '_string', '_queue')
+
+
+class TraCICommandBuffer(object):
+    """Buffer of TraCI commands that are sent to sumo once per step.
+
+    Actuation commands (accelerations, lane changes, routes, colors, etc.) are
+    queued via `add` while a step is prepared, and sent to sumo via `flush`
+    right before the simulation is advanced. All queued commands are sent in a
+    single TraCI message, so that the number of round trips between python and
+    sumo does not grow with the number of vehicles.
+
+    Redundant commands are coalesced before they are sent:
+
+    * If the same command is issued more than once for the same object during
+      a step (e.g. the speed of a vehicle is set twice), only the last one is
+      sent.
+    * Commands whose effect persists until they are issued again (see
+      `STATEFUL_COMMANDS`, e.g. colors) are not sent if the last value sent to
+      sumo is reissued.
+
+    Commands that are queued for an object are sent in the order in which
+    they were last issued, so that the final state of the object matches the
+    one obtained by sending every command separately.
+
+    The simulation step may also be performed on a background I/O thread
+    (see `step_async`), so that the calling thread can keep working while
+    sumo advances the simulation.
+
+    Attributes
+    ----------
+    kernel_api : traci.connection.Connection
+        TraCI connection the commands are sent through
+    batching : bool
+        whether the commands of a step are sent within a single message. This
+        relies on private attributes of the TraCI client (see
+        `BATCH_ATTRIBUTES`); with clients that do not have them, a warning is
+        issued and the commands are sent one at a time.
+    num_sent : int
+        number of commands that have been sent to sumo
+    num_coalesced : int
+        number of commands that were not sent to sumo because they were
+        redundant
+    """
+
+    # commands whose last value can be cached, as sumo does not modify it
+    STATEFUL_COMMANDS = {('vehicle', 'setColor'), ('vehicle', 'setMaxSpeed')}
+
+    def __init__(self):
+        """Instantiate an empty command buffer."""
+        self.kernel_api = None
+        self.batching = False
+        self.num_sent = 0
+        self.num_coalesced = 0
+
+        # queued commands, indexed by (domain, command, object id, key)
+        self._pending = collections.OrderedDict()
+        # last values sent for the stateful commands, indexed by (domain,
+        # object id) and then by (command, key)
+        self._applied = {}
+        # simulation step performed on the I/O thread, if any
+        self._pending_step = None
+        self._executor = None
+
+    def pass_api(self, kernel_api):
+        """Set the TraCI connection and drop all data on the previous one."""
+        self.kernel_api = kernel_api
+        self.batching = all(hasattr(kernel_api, attr)
+                            for attr in BATCH_ATTRIBUTES)
+        if not self.batching:
+            warnings.warn(
+                'The TraCI client does not support sending several commands '
+                'within a single message. Commands are sent one at a time.')
+        self.clear()
+
+    def clear(self):
+        """Drop all queued commands and cached values.
+
+        This is meant to be called whenever the state of sumo is replaced,
+        e.g. when a saved state is loaded.
+        """
+        self.wait()
+        self._pending.clear()
+        self._applied.clear()
+
+    def add(self, domain, command, obj_id, *args, key=None):
+        """Queue a command.
+
+        Parameters
+        ----------
+        domain : str
+            TraCI domain of the command, e.g. "vehicle" or "trafficlight"
+        command : str
+            name of the method of the domain, e.g. "slowDown"
+        obj_id : str
+            id of the object the command is issued for
+        args : list
+            remaining positional arguments of the method
+        key : any, optional
+            additional identifier of the command, for commands that only
+            supersede each other if they share the same key (e.g. commands
+            that modify a single element of the object)
+        """
+        index = (domain, command, obj_id, key)
+        if index in self._pending:
+            # the command is superseded, and moved to the end of the queue
+            del self._pending[index]
+            self.num_coalesced += 1
+
+        if (domain, command) in self.STATEFUL_COMMANDS and \
+                self._applied.get((domain, obj_id), {}).get(
+                    (command, key)) == args:
+            self.num_coalesced += 1
+            return
+
+        self._pending[index] = args
+
+    def get_pending(self, domain, command, obj_id, key=None):
+        """Return the arguments of a queued command, or None if not queued."""
+        return self._pending.get((domain, command, obj_id, key))
+
+    def discard(self, obj_id, domain='vehicle'):
+        """Drop all queued commands and cached values of an object.
+
+        This is meant to be called whenever the object is removed from the
+        simulation.
+        """
+        for index in [index for index in self._pending
+                      if index[0] == domain and index[2] == obj_id]:
+            del self._pending[index]
+        self._applied.pop((domain, obj_id), None)
+
+    def flush(self):
+        """Send all queued commands to sumo.
+
+        This waits for the simulation step performed on the I/O thread, if
+        any.
+
+        Raises
+        ------
+        traci.exceptions.TraCIException
+            if any of the commands is rejected by sumo. All other commands are
+            still sent.
+        """
+        self.wait()
+        if not self._pending:
+            return
+
+        pending = list(self._pending.items())
+        self._pending.clear()
+
+        for (domain, command, obj_id, key), args in pending:
+            if (domain, command) in self.STATEFUL_COMMANDS:
+                self._applied.setdefault((domain, obj_id), {})[
+                    (command, key)] = args
+        self.num_sent += len(pending)
+
+        self._send(pending)
+
+    def step_async(self):
+        """Send all queued commands, and start a simulation step.
+
+        The step is performed on the I/O thread, and this returns as soon as
+        it is started. Until it is complete (see `wait`), only the data
+        already cached by the kernel may be read, and commands may only be
+        queued in the buffer (which waits for the step before sending them).
+        The connection must not be used directly in the meantime: the TraCI
+        client only locks it while a command is sent, and reads the results
+        of the step's subscriptions after releasing the lock, so other calls
+        may interleave with the step. Older TraCI clients that do not lock
+        the connection do not support this at all, in which case the step is
+        performed right away.
+        """
+        self.flush()
+        connection = self.kernel_api
+        if not hasattr(connection, '_lock'):
+            connection.simulationStep()
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending_step = self._executor.submit(connection.simulationStep)
+
+    def wait(self):
+        """Wait for the simulation step started by `step_async`, if any.
+
+        Raises
+        ------
+        Exception
+            any error raised while performing the step
+        """
+        step, self._pending_step = self._pending_step, None
+        if step is not None:
+            step.result()
+
+    def close(self):
+        """Wait for the pending simulation step, and stop the I/O thread."""
+        try:
+            self.wait()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _send(self, pending):
+        """Send a list of commands within a single TraCI message."""
+        connection = self.kernel_api
+
+        if not self.batching:
+            for (domain, command, obj_id, _), args in pending:
+                getattr(getattr(connection, domain), command)(obj_id, *args)
+            return
+
+        # TraCI messages may contain any number of commands, but the TraCI
+        # client sends a message for every command. Messages are therefore
+        # only composed via the client, and sent once all commands are added.
+        with _composing(connection):
+            for (domain, command, obj_id, _), args in pending:
+                getattr(getattr(connection, domain), command)(obj_id, *args)
+        connection._sendExact()
+
+
+@contextlib.contextmanager
+def _composing(connection):
+    """Compose a message via a TraCI connection, without sending it.
+
+    The connection is restored on exit. If an error is raised, the commands
+    composed so far are discarded.
+    """
+    try:
+        connection._sendExact = _do_not_send
+        yield
+    except BaseException:
+        connection._string = bytes()
+        connection._queue = []
+        raise
+    finally:
+        connection.__dict__.pop('_sendExact', None)
+
+
+def _do_not_send():
+    """Replace the sending method of a TraCI connection while composing."""
+    return None
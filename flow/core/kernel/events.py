@@ -0,0 +1,78 @@
+"""Script containing the event bus of the Flow kernel."""
+
+# vehicles that entered the network
+DEPARTED = 'departed'
+# vehicles that left the network
+ARRIVED = 'arrived'
+# vehicles that started teleporting (e.g. after being stuck in a gridlock)
+TELEPORTED = 'teleported'
+# vehicles that moved to a different edge (including internal edges)
+EDGE_CHANGED = 'edge_changed'
+# vehicles that moved to a different lane of the same edge
+LANE_CHANGED = 'lane_changed'
+# vehicles that moved to the last edge of their route, or whose route
+# changed so that their current edge is its last one
+REACHED_LAST_EDGE = 'reached_last_edge'
+
+EVENTS = (DEPARTED, ARRIVED, TELEPORTED, EDGE_CHANGED, LANE_CHANGED,
+          REACHED_LAST_EDGE)
+
+
+class EventBus(object):
+    """Publisher of the events detected by the vehicle kernel.
+
+    Handlers are subscribed to an event, and are called with the list of ids
+    of all vehicles the event occurred for, once for every update of the
+    kernel in which it occurred. This allows the environments (and e.g. the
+    routing controllers) to react to changes in the network, instead of
+    polling all vehicles at every step.
+
+    Events that have no handlers are not detected by the vehicle kernel.
+
+    Usage
+    -----
+    >>> from flow.core.kernel.events import ARRIVED
+    >>> def on_arrival(veh_ids):
+    ...     print(veh_ids)
+    >>> env.k.events.subscribe(ARRIVED, on_arrival)
+    """
+
+    def __init__(self):
+        """Instantiate an event bus with no handlers."""
+        self._handlers = {event: [] for event in EVENTS}
+
+    def subscribe(self, event, handler):
+        """Call a handler whenever an event occurs.
+
+        Parameters
+        ----------
+        event : str
+            name of the event, see `EVENTS`
+        handler : callable
+            function that is called with the list of vehicle ids the event
+            occurred for
+
+        Raises
+        ------
+        ValueError
+            if the event is unknown
+        """
+        if event not in self._handlers:
+            raise ValueError('Unknown event: {}. Supported events are: {}'
+                             .format(event, ', '.join(EVENTS)))
+        self._handlers[event].append(handler)
+
+    def unsubscribe(self, event, handler):
+        """Stop calling a handler when an event occurs, if subscribed."""
+        if handler in self._handlers.get(event, ()):
+            self._handlers[event].remove(handler)
+
+    def has_handlers(self, event):
+        """Return whether any handler is subscribed to an event."""
+        return len(self._handlers[event]) > 0
+
+    def publish(self, event, veh_ids):
+        """Call all handlers of an event, if it occurred for any vehicle."""
+        if len(veh_ids) > 0:
+            for handler in list(self._handlers[event]):
+                handler(veh_ids)
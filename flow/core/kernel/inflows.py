@@ -0,0 +1,320 @@
+"""Script containing the TraCI inflow controller of the Flow kernel."""
+from copy import deepcopy
+
+import numpy as np
+
+# attributes of the inflows that are passed to sumo when a vehicle is added,
+# in the order of the positional arguments of traci's vehicle.add (after the
+# id, route, type and departure time of the vehicle)
+ADD_ATTRIBUTES = ('departLane', 'departPos', 'departSpeed', 'arrivalLane',
+                  'arrivalPos', 'arrivalSpeed')
+
+# default values of the above attributes in traci's vehicle.add
+ADD_DEFAULTS = ('first', 'base', '0', 'current', 'max', 'current')
+
+# entries of the inflows per route that change as their vehicles are added
+STREAM_STATE = ('num_added', 'next_depart')
+
+
+class TraCIInflowController(object):
+    """Controller of the inflows of vehicles, which are inserted via TraCI.
+
+    Inflows are usually written to the .rou.xml file of the network, so that
+    changing them (e.g. to train a policy on a range of inflow rates) requires
+    generating the network anew and restarting sumo. Instead, this controller
+    keeps the inflows of the network out of the .rou.xml file, and adds their
+    vehicles to the simulation via TraCI (through the command buffer of the
+    kernel) before every simulation step. The inflows can then be replaced
+    (see `set_inflows`) or their rates modified (see `set_rate`) at any time,
+    without modifying the network.
+
+    Every inflow is split among the routes starting at its edge, weighted by
+    their probabilities, as it is done for the .rou.xml file. Inflows
+    specified by "vehsPerHour" or "period" insert equally spaced vehicles
+    starting at their "begin" time, while inflows specified by "probability"
+    insert a vehicle every second with that probability (scaled to the
+    duration of a simulation step). The time of the inflows is that of the
+    current rollout, i.e. it starts anew upon every reset. Vehicles are named
+    "<inflow name><route index>.<index>", as they are by sumo.
+
+    Usage
+    -----
+    >>> inflows = InFlows()
+    >>> inflows.add(veh_type="human", edge="1", vehs_per_hour=1000)
+    >>> k.inflows.set_inflows(inflows)  # applies to the next simulation step
+    >>> k.inflows.set_rate("flow_0", vehs_per_hour=2000)
+
+    Attributes
+    ----------
+    kernel_api : traci.connection.Connection
+        TraCI connection the vehicles are added through
+    time : float
+        time since the start of the current rollout, in seconds
+    num_added : int
+        number of vehicles added since the start of the current rollout
+    num_step_added : int
+        number of vehicles added during the last simulation step. Unlike the
+        vehicles of the .rou.xml file, these are not counted as loaded by sumo.
+    """
+
+    def __init__(self, master_kernel):
+        """Instantiate a controller with the inflows of the network.
+
+        Parameters
+        ----------
+        master_kernel : flow.core.kernel.Kernel
+            the higher level kernel (used to call methods from other
+            sub-kernels)
+        """
+        self.master_kernel = master_kernel
+        self.kernel_api = None
+        self.time = 0
+        self.num_added = 0
+        self.num_step_added = 0
+
+        # inflows set via set_inflows, superseding the ones of the network
+        self._inflows = None
+        # inflows per route, indexed by their name
+        self._streams = {}
+        # number of vehicles added by every inflow (per route) since the
+        # controller was created, used to name the vehicles
+        self._counts = {}
+
+    def pass_api(self, kernel_api):
+        """Set the TraCI connection, and start the inflows anew."""
+        self.kernel_api = kernel_api
+        self._build_streams()
+        self.reset()
+
+    def set_inflows(self, inflows):
+        """Replace all inflows.
+
+        The new inflows start at the current time of the rollout, i.e.
+        vehicles whose "begin" time has passed are inserted right away.
+
+        Parameters
+        ----------
+        inflows : flow.core.params.InFlows
+            new inflows. Their edges must be the first edge of a route of the
+            network, and their vehicle types must be those of the network.
+        """
+        self._inflows = inflows
+        self._build_streams()
+
+    def set_rate(self, name, vehs_per_hour=None, probability=None,
+                 period=None):
+        """Modify the rate of an inflow.
+
+        Exactly one of the rates must be specified. The next vehicle of the
+        inflow is inserted one new period after the previous one.
+
+        Parameters
+        ----------
+        name : str
+            name of the inflow, e.g. "flow_0"
+        vehs_per_hour : float, optional
+            number of vehicles per hour, equally spaced
+        probability : float, optional
+            probability for inserting a vehicle every second
+        period : float, optional
+            period at which equally spaced vehicles are inserted, in seconds
+
+        Raises
+        ------
+        KeyError
+            if there is no inflow with this name
+        ValueError
+            if not exactly one rate is specified
+        """
+        rates = [vehs_per_hour, probability, period]
+        if len(rates) - rates.count(None) != 1:
+            raise ValueError(
+                "Exactly one among the three parameters 'vehs_per_hour', "
+                "'probability' and 'period' must be specified.")
+
+        streams = [stream for stream in self._streams.values()
+                   if stream['inflow'] == name]
+        if not streams:
+            raise KeyError('No inflow named {}'.format(name))
+
+        for stream in streams:
+            last_depart = None
+            if stream['period'] not in (None, float('inf')) \
+                    and stream['num_added'] > 0:
+                last_depart = stream['next_depart'] - stream['period']
+
+            if probability is not None:
+                stream['probability'] = probability * stream['fraction']
+                stream['period'] = None
+            else:
+                stream['probability'] = None
+                stream['period'] = _period(
+                    vehs_per_hour, period, stream['fraction'])
+                stream['next_depart'] = max(stream['begin'], self.time) \
+                    if last_depart is None \
+                    else last_depart + stream['period']
+
+    def reset(self):
+        """Start the inflows anew, at the beginning of a rollout.
+
+        Vehicles of the inflows that are waiting to be inserted into the
+        network are removed.
+        """
+        self.time = 0
+        self.num_added = 0
+        self.num_step_added = 0
+        for stream in self._streams.values():
+            self._reset_stream(stream)
+
+        if self.kernel_api is not None:
+            for veh_id in self.kernel_api.simulation.getPendingVehicles():
+                if veh_id.rsplit('.', 1)[0] in self._streams:
+                    self.kernel_api.vehicle.remove(veh_id)
+
+    def step(self, sim_step):
+        """Queue the vehicles of the inflows that depart during a step.
+
+        Parameters
+        ----------
+        sim_step : float
+            duration of the simulation step, in seconds
+        """
+        self.time += sim_step
+        self.num_step_added = 0
+        command_buffer = self.master_kernel.command_buffer
+        for name, stream in self._streams.items():
+            for _ in range(self._num_departures(stream, sim_step)):
+                veh_id = '{}.{}'.format(name, self._counts[name])
+                self._counts[name] += 1
+                stream['num_added'] += 1
+                self.num_added += 1
+                self.num_step_added += 1
+                command_buffer.add(
+                    'vehicle', 'add', veh_id, stream['route'],
+                    stream['vtype'], 'now', *stream['args'])
+
+    def save_state(self):
+        """Return a snapshot of the state of the inflows.
+
+        Returns
+        -------
+        dict
+            snapshot, which can be restored via `load_state`
+        """
+        return deepcopy({'time': self.time, 'num_added': self.num_added,
+                         'streams': self._streams})
+
+    def load_state(self, snapshot):
+        """Restore the state of the inflows from a snapshot.
+
+        The inflows themselves are not restored: inflows that were replaced
+        or modified since the snapshot was taken (see `set_inflows` and
+        `set_rate`) keep their current rates, and start anew at the time of
+        the snapshot. The other ones resume from the snapshot.
+
+        Parameters
+        ----------
+        snapshot : dict
+            snapshot returned by `save_state`
+        """
+        self.time = snapshot['time']
+        self.num_added = snapshot['num_added']
+        self.num_step_added = 0
+        for name, stream in self._streams.items():
+            saved = snapshot['streams'].get(name)
+            if saved is not None and \
+                    _definition(saved) == _definition(stream):
+                for key in STREAM_STATE:
+                    stream[key] = saved[key]
+            else:
+                self._reset_stream(stream)
+                stream['next_depart'] = max(stream['begin'], self.time)
+
+    def _num_departures(self, stream, sim_step):
+        """Return the number of vehicles of a stream departing during a step."""
+        if stream['num_added'] >= stream['number'] \
+                or self.time < stream['begin'] or self.time > stream['end']:
+            return 0
+
+        if stream['probability'] is not None:
+            probability = min(stream['probability'] * sim_step, 1)
+            return int(np.random.uniform() < probability)
+        if stream['period'] == float('inf'):
+            return 0
+
+        num = 0
+        while stream['next_depart'] <= self.time \
+                and stream['next_depart'] <= stream['end'] \
+                and stream['num_added'] + num < stream['number']:
+            num += 1
+            stream['next_depart'] += stream['period']
+        return num
+
+    def _reset_stream(self, stream):
+        """Start a stream anew."""
+        stream['num_added'] = 0
+        stream['next_depart'] = stream['begin']
+
+    def _build_streams(self):
+        """Split the inflows among the routes starting at their edge."""
+        inflows = self._inflows
+        if inflows is None:
+            inflows = self.master_kernel.network.network.net_params.inflows
+        routes = self.master_kernel.network.rts
+
+        self._streams = {}
+        for inflow in inflows.get():
+            if 'route' in inflow:
+                stream_routes = [(inflow['route'], 1)]
+            else:
+                edge = inflow['edge']
+                stream_routes = [('route{}_{}'.format(edge, i), fraction)
+                                 for i, (_, fraction) in enumerate(
+                                     routes[edge])]
+
+            for i, (route, fraction) in enumerate(stream_routes):
+                # inflows are named after the index of their route
+                name = inflow['name'] + str(i) \
+                    if 'route' not in inflow else inflow['name']
+                period = None
+                probability = None
+                if 'probability' in inflow:
+                    probability = float(inflow['probability']) * fraction
+                else:
+                    period = _period(inflow.get('vehsPerHour'),
+                                     inflow.get('period'), fraction)
+
+                stream = {
+                    'inflow': inflow['name'],
+                    'route': route,
+                    'vtype': inflow['vtype'],
+                    'fraction': fraction,
+                    'args': [str(inflow.get(attr, default)) for attr, default
+                             in zip(ADD_ATTRIBUTES, ADD_DEFAULTS)],
+                    'begin': float(inflow.get('begin') or 0),
+                    'end': float(inflow.get('end') or float('inf')),
+                    'number': int(float(inflow['number']) * fraction)
+                    if 'number' in inflow else float('inf'),
+                    'period': period,
+                    'probability': probability,
+                }
+                self._reset_stream(stream)
+                if self.time > 0:
+                    stream['next_depart'] = max(stream['begin'], self.time)
+                self._streams[name] = stream
+                self._counts.setdefault(name, 0)
+
+
+def _definition(stream):
+    """Return the entries of an inflow per route that define its vehicles."""
+    return {key: value for key, value in stream.items()
+            if key not in STREAM_STATE}
+
+
+def _period(vehs_per_hour, period, fraction):
+    """Return the period of the vehicles of an inflow on one of its routes."""
+    if vehs_per_hour is not None:
+        rate = float(vehs_per_hour) * fraction / 3600.
+    else:
+        rate = fraction / float(period)
+    return 1. / rate if rate > 0 else float('inf')
@@ -6,6 +6,10 @@ from flow.core.kernel.network import TraCIKernelNetwork, AimsunKernelNetwork
 from flow.core.kernel.vehicle import TraCIVehicle, AimsunKernelVehicle
 from flow.core.kernel.traffic_light import TraCITrafficLight, \
     AimsunKernelTrafficLight
+from flow.core.kernel.commands import TraCICommandBuffer
+from flow.core.kernel.events import EventBus
+from flow.core.kernel.inflows import TraCIInflowController
+from flow.core.profiler import NullProfiler
 from flow.utils.exceptions import FatalFlowError
 
 
@@ -41,11 +45,23 @@ class Kernel(object):
     >>> veh_id = "..."  # some vehicle ID
     >>> k.vehicle.apply_acceleration(veh_id)
 
+    For simulators that support it, these commands are collected in a command
+    buffer (``k.command_buffer``) and sent to the simulator in bulk right
+    before the next simulation step. Likewise, changes in the state of the
+    vehicles (departures, arrivals, edge changes, etc.) are published to the
+    handlers subscribed to the event bus of the kernel (``k.events``, see
+    flow/core/kernel/events.py).
+
+    If requested (see SumoParams.runtime_inflows), the vehicles of the inflows
+    are added during the simulation by an inflow controller (``k.inflows``,
+    see flow/core/kernel/inflows.py), so that the inflows can be modified
+    without generating the network anew.
+
     These subclasses can be modified and recycled to support various different
     traffic simulators, e.g. SUMO, AIMSUN, TruckSim, etc...
     """
 
-    def __init__(self, simulator, sim_params):
+    def __init__(self, simulator, sim_params, profiler=None):
         """Instantiate a Flow kernel object.
 
         Parameters
@@ -54,6 +70,9 @@ class Kernel(object):
             simulator type, must be one of {"traci"}
         sim_params : flow.core.params.SimParams
             simulation-specific parameters
+        profiler : flow.core.profiler.StepProfiler, optional
+            profiler timing the updates of the kernel subclasses. Updates are
+            not timed if not specified.
 
         Raises
         ------
@@ -61,12 +80,23 @@ class Kernel(object):
             if the specified input simulator is not a valid type
         """
         self.kernel_api = None
+        self.command_buffer = None
+        self.events = None
+        self.inflows = None
+        self.profiler = profiler if profiler is not None else NullProfiler()
 
         if simulator == "traci":
+            self.command_buffer = TraCICommandBuffer()
+            self.events = EventBus()
             self.simulation = TraCISimulation(self)
             self.network = TraCIKernelNetwork(self, sim_params)
             self.vehicle = TraCIVehicle(self, sim_params)
             self.traffic_light = TraCITrafficLight(self)
+            try:
+                if sim_params.runtime_inflows:
+                    self.inflows = TraCIInflowController(self)
+            except AttributeError:
+                pass
         elif simulator == 'aimsun':
             self.simulation = AimsunKernelSimulation(self)
             self.network = AimsunKernelNetwork(self, sim_params)
@@ -79,10 +109,14 @@ class Kernel(object):
     def pass_api(self, kernel_api):
         """Pass the kernel API to all kernel subclasses."""
         self.kernel_api = kernel_api
+        if self.command_buffer is not None:
+            self.command_buffer.pass_api(kernel_api)
         self.simulation.pass_api(kernel_api)
         self.network.pass_api(kernel_api)
         self.vehicle.pass_api(kernel_api)
         self.traffic_light.pass_api(kernel_api)
+        if self.inflows is not None:
+            self.inflows.pass_api(kernel_api)
 
     def update(self, reset):
         """Update the kernel subclasses after a simulation step.
@@ -98,10 +132,58 @@ class Kernel(object):
             specifies whether the simulator was reset in the last simulation
             step
         """
-        self.vehicle.update(reset)
-        self.traffic_light.update(reset)
-        self.network.update(reset)
-        self.simulation.update(reset)
+        with self.profiler.phase('vehicle'):
+            self.vehicle.update(reset)
+        with self.profiler.phase('traffic_light'):
+            self.traffic_light.update(reset)
+        with self.profiler.phase('network'):
+            self.network.update(reset)
+        with self.profiler.phase('simulation'):
+            self.simulation.update(reset)
+
+    def save_state(self, path):
+        """Save the state of the simulation and of the kernel subclasses.
+
+        The state of the simulator is saved to a file, while the state of the
+        vehicle and traffic light subclasses is copied to a snapshot, so that
+        both can later be restored via `load_state`.
+
+        Parameters
+        ----------
+        path : str
+            path of the file the state of the simulator is saved to
+
+        Returns
+        -------
+        dict
+            snapshot of the state of the kernel subclasses
+        """
+        snapshot = {
+            'simulation': self.simulation.save_state(path),
+            'traffic_light': self.traffic_light.save_state(),
+            'vehicle': self.vehicle.save_state(),
+        }
+        if self.inflows is not None:
+            snapshot['inflows'] = self.inflows.save_state()
+        return snapshot
+
+    def load_state(self, snapshot):
+        """Restore a state of the simulation saved via `save_state`.
+
+        The simulation is not advanced, and the kernel subclasses match the
+        state of the simulation at the time it was saved. The snapshot can be
+        loaded any number of times.
+
+        Parameters
+        ----------
+        snapshot : dict
+            snapshot returned by `save_state`
+        """
+        self.simulation.load_state(snapshot['simulation'])
+        self.traffic_light.load_state(snapshot['traffic_light'])
+        self.vehicle.load_state(snapshot['vehicle'])
+        if self.inflows is not None:
+            self.inflows.load_state(snapshot['inflows'])
 
     def close(self):
         """Terminate all components within the simulation and network."""
@@ -187,6 +187,90 @@ class BaseKernelNetwork(object):
         """
         raise NotImplementedError
 
+    def get_edge_index(self, edge):
+        """Return the integer id of an edge, as used by the batch lookups.
+
+        Parameters
+        ----------
+        edge : str
+            name of the edge or internal link
+
+        Returns
+        -------
+        int
+            id of the edge, or -1 if it is not in the network
+        """
+        raise NotImplementedError
+
+    def get_edge_name(self, index):
+        """Return the name of the edge with an integer id.
+
+        Parameters
+        ----------
+        index : int
+            id of the edge (see `get_edge_index`)
+
+        Returns
+        -------
+        str
+            name of the edge, or an empty string if the id is -1
+        """
+        raise NotImplementedError
+
+    def get_x_batch(self, edge_idx, pos):
+        """Return the absolute positions of several edge/position pairs.
+
+        This is the vectorized counterpart to `get_x`.
+
+        Parameters
+        ----------
+        edge_idx : array_like of int
+            ids of the edges (see `get_edge_index`)
+        pos : array_like of float
+            relative positions on the edges
+
+        Returns
+        -------
+        np.ndarray
+            position with respect to some global reference of every pair, or
+            -1001 for edges that are not in the network (id -1)
+        """
+        raise NotImplementedError
+
+    def get_edge_batch(self, x):
+        """Compute the edges and relative positions of absolute positions.
+
+        This is the vectorized counterpart to `get_edge`.
+
+        Parameters
+        ----------
+        x : array_like of float
+            absolute positions in the network
+
+        Returns
+        -------
+        np.ndarray
+            id of the edge of every position (see `get_edge_index`), or -1
+            for positions before the start of the network
+        np.ndarray
+            relative position on the edge of every position, or NaN for
+            positions before the start of the network
+        """
+        raise NotImplementedError
+
+    def get_lane_graph(self):
+        """Return the lane-level graph of the network.
+
+        The graph links every lane to the lanes in front of and behind it, and
+        tabulates the lanes reached after several hops along with their
+        distances, up to the `lane_lookahead` of the simulation parameters.
+
+        Returns
+        -------
+        flow.core.kernel.network.lane_graph.LaneGraph
+        """
+        raise NotImplementedError
+
     def next_edge(self, edge, lane):
         """Return the next edge/lane pair from the given edge/lane.
 
@@ -0,0 +1,178 @@
+"""Script containing the cache of the networks generated by the TraCI kernel."""
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+
+from flow.core.util import ensure_dir
+
+# version of the format of the cache entries. Entries of another version are
+# never looked up, as the version is part of their key
+CACHE_VERSION = 1
+
+# suffixes of the files of a cache entry
+NET_SUFFIX = '.net.xml'
+INDEX_SUFFIX = '.pkl'
+
+
+def netconvert_version():
+    """Return an identifier of the netconvert binary that is on the path.
+
+    The identifier consists of the path of the binary and of its last
+    modification time, so that networks generated by another version of sumo
+    are not returned by the cache.
+
+    Returns
+    -------
+    str
+    """
+    path = shutil.which('netconvert')
+    if path is None:
+        return ''
+    try:
+        return '{}:{}'.format(path, os.stat(path).st_mtime_ns)
+    except OSError:
+        return path
+
+
+class NetworkCache(object):
+    """Content-addressed cache of the networks generated with netconvert.
+
+    Generating a network requires calling netconvert and parsing the .net.xml
+    file it outputs, which is repeated whenever a network is generated anew
+    (e.g. upon every restart of the sumo instance), even though the network
+    is usually the same. To avoid this, every entry of the cache stores the
+    .net.xml file of a network along with the edges and connections parsed
+    from it, and is indexed by a digest of the contents that determine the
+    network (see `key`).
+
+    Entries are written to temporary files that are atomically renamed, so
+    that the cache can be shared by several processes (e.g. the workers of a
+    training run) without ever reading partially written entries. The cache
+    directory can be safely removed at any time.
+
+    Usage
+    -----
+    >>> cache = NetworkCache(path)
+    >>> key = cache.key(nodes_xml, edges_xml)
+    >>> entry = cache.get(key, net_file)
+    >>> if entry is None:
+    ...     # generate net_file, and parse edges and connections from it
+    ...     cache.put(key, edges, connections, net_file)
+
+    Attributes
+    ----------
+    path : str
+        directory of the cache entries
+    num_hits : int
+        number of lookups that returned an entry
+    num_misses : int
+        number of lookups that did not return an entry
+    """
+
+    def __init__(self, path):
+        """Instantiate a cache in a directory.
+
+        Parameters
+        ----------
+        path : str
+            directory of the cache entries, created if it does not exist
+        """
+        self.path = ensure_dir(path)
+        self.num_hits = 0
+        self.num_misses = 0
+
+    @staticmethod
+    def key(*parts):
+        """Return the key of the entry of a network.
+
+        Parameters
+        ----------
+        parts : bytes or str or None
+            contents that determine the network, e.g. the xml files passed to
+            netconvert and its options. None parts are hashed as empty parts.
+
+        Returns
+        -------
+        str
+        """
+        digest = hashlib.sha1(str(CACHE_VERSION).encode())
+        for part in parts:
+            if part is None:
+                part = b''
+            elif isinstance(part, str):
+                part = part.encode()
+            # the length delimits the parts, so that they cannot be shifted
+            digest.update(str(len(part)).encode() + b':' + part)
+        return digest.hexdigest()
+
+    def get(self, key, net_file=None):
+        """Return the edges and connections of a network, if it is cached.
+
+        Parameters
+        ----------
+        key : str
+            key of the network, see `key`
+        net_file : str, optional
+            path the cached .net.xml file of the network is copied to
+
+        Returns
+        -------
+        (dict, dict) or None
+            edges and connections of the network (see
+            TraCIKernelNetwork._import_edges_from_net), or None if the
+            network is not cached
+        """
+        prefix = os.path.join(self.path, key)
+        try:
+            with open(prefix + INDEX_SUFFIX, 'rb') as f:
+                edges, connections = pickle.load(f)
+            if net_file is not None:
+                shutil.copyfile(prefix + NET_SUFFIX, net_file)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            self.num_misses += 1
+            return None
+
+        self.num_hits += 1
+        return edges, connections
+
+    def put(self, key, edges, connections, net_file=None):
+        """Store the edges and connections of a network.
+
+        Parameters
+        ----------
+        key : str
+            key of the network, see `key`
+        edges : dict
+            edges of the network
+        connections : dict
+            connections of the network
+        net_file : str, optional
+            path of the .net.xml file of the network, which is stored as well
+        """
+        prefix = os.path.join(self.path, key)
+        try:
+            # the index is stored last, as it marks the entry as complete
+            if net_file is not None:
+                with open(net_file, 'rb') as f:
+                    self._store(prefix + NET_SUFFIX, f.read())
+            self._store(prefix + INDEX_SUFFIX, pickle.dumps(
+                (edges, connections), pickle.HIGHEST_PROTOCOL))
+        except OSError:
+            # caching is an optimization, so failing to store is not fatal
+            pass
+
+    def _store(self, path, data):
+        """Atomically create a file with some contents."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
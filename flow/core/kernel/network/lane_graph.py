@@ -0,0 +1,285 @@
+"""Script containing the lane graph compiled by the network kernel."""
+import numpy as np
+
+# maximum number of hops of the distance tables. Longer paths are followed
+# by chaining the tables of the lanes they reach, see `first_match`
+TABLE_HOPS = 16
+
+
+class LaneGraph(object):
+    """Lane-level graph of a network, with multi-hop distance tables.
+
+    Lanes are identified by the integer `edge * max_lanes + lane`, where
+    `edge` is the index of the edge in the list of edges the graph is built
+    from. Every lane is linked to the first lane in front of and behind it (as
+    returned by the `next_edge` and `prev_edge` methods of the network
+    kernel), and the lanes reached by following these links are tabulated
+    along with their distance, so that looking for vehicles in the lanes in
+    front of or behind a lane does not require traversing the network one
+    edge at a time.
+
+    The tables of a lane end with the first lane that is farther away than the
+    lookahead distance, with the first lane that is not linked to another one,
+    after a full loop back to the lane itself, or after `TABLE_HOPS` hops,
+    whichever comes first. Missing entries are set to -1, and their distance
+    to infinity. The memory used by the tables is therefore linear in the
+    number of lanes, and searches past the end of the tables (see
+    `first_match`) continue from the tables of the last lane they reached.
+
+    Usage
+    -----
+    >>> graph = network.get_lane_graph()
+    >>> lane = graph.lane_index("top", 0)
+    >>> graph.downstream_lanes[lane]  # lanes in front of lane 0 of "top"
+    >>> graph.downstream_dist[lane]  # distances from the start of the lane
+
+    Attributes
+    ----------
+    edge_ids : dict
+        index of every edge, by name
+    max_lanes : int
+        maximum number of lanes of an edge
+    num_lanes : np.ndarray
+        number of lanes of every edge
+    edge_length : np.ndarray
+        length of every edge
+    next_lane : np.ndarray
+        first lane in front of every lane, or -1 if there are none
+    prev_lane : np.ndarray
+        first lane behind every lane, or -1 if there are none
+    downstream_lanes : np.ndarray
+        lanes reached from every lane after 1, 2, ... hops forward, of shape
+        (number of lanes, number of hops)
+    downstream_dist : np.ndarray
+        distance from the start of every lane to the start of the lanes in
+        `downstream_lanes`
+    upstream_lanes : np.ndarray
+        lanes reached from every lane after 1, 2, ... hops backward
+    upstream_dist : np.ndarray
+        distance from the start of the lanes in `upstream_lanes` to the start
+        of every lane
+    lookahead : float or None
+        maximum distance from the end (or start, for upstream lanes) of a lane
+        to the lanes in its tables, or None if unbounded
+    max_hops : int
+        maximum number of hops of the paths searched by `first_match`, i.e.
+        the number of edges with lanes (as a path cannot cross more edges
+        than there are in the network)
+    """
+
+    def __init__(self, edges, num_lanes, edge_length, next_edge, prev_edge,
+                 lookahead=None, table_hops=TABLE_HOPS):
+        """Compile the graph of a network.
+
+        Parameters
+        ----------
+        edges : list of str
+            names of the edges (and junctions) of the network
+        num_lanes : list of int
+            number of lanes of every edge
+        edge_length : list of float
+            length of every edge
+        next_edge : function
+            returns the list of (edge, lane) pairs in front of an edge/lane
+            pair, see flow.core.kernel.network.BaseKernelNetwork.next_edge
+        prev_edge : function
+            returns the list of (edge, lane) pairs behind an edge/lane pair
+        lookahead : float, optional
+            maximum distance covered by the tables, see above. Defaults to
+            the full network.
+        table_hops : int, optional
+            maximum number of hops of the tables
+        """
+        self.edge_ids = {edge: index for index, edge in enumerate(edges)}
+        self.max_lanes = max(max(num_lanes, default=0), 1)
+        self.num_lanes = np.array(num_lanes, dtype=np.int64)
+        self.edge_length = np.array(edge_length, dtype=np.float64)
+        self.lookahead = lookahead
+
+        self.next_lane = np.full(len(edges) * self.max_lanes, -1, np.int64)
+        self.prev_lane = np.full(len(edges) * self.max_lanes, -1, np.int64)
+        for edge, index in self.edge_ids.items():
+            for lane in range(self.num_lanes[index]):
+                for table, links in ((self.next_lane, next_edge(edge, lane)),
+                                     (self.prev_lane, prev_edge(edge, lane))):
+                    if len(links) > 0 and links[0][0] in self.edge_ids:
+                        table[index * self.max_lanes + lane] = \
+                            self.lane_index(*links[0][:2])
+
+        self.max_hops = int(np.count_nonzero(self.num_lanes))
+        num_hops = min(self.max_hops, table_hops)
+        self.downstream_lanes, self.downstream_dist = self._tabulate(
+            self.next_lane, num_hops, upstream=False)
+        self.upstream_lanes, self.upstream_dist = self._tabulate(
+            self.prev_lane, num_hops, upstream=True)
+
+    @property
+    def num_hops(self):
+        """Return the number of hops of the largest table."""
+        return max(self.downstream_lanes.shape[1],
+                   self.upstream_lanes.shape[1])
+
+    def lane_index(self, edge, lane):
+        """Return the index of a lane, or -1 if it is not in the network.
+
+        Parameters
+        ----------
+        edge : str
+            name of the edge
+        lane : int
+            index of the lane on the edge
+
+        Returns
+        -------
+        int
+        """
+        index = self.edge_ids.get(edge)
+        if index is None or not 0 <= lane < self.num_lanes[index]:
+            return -1
+        return index * self.max_lanes + lane
+
+    def lane_length(self, lanes):
+        """Return the length of several lanes, or NaN for missing lanes.
+
+        Parameters
+        ----------
+        lanes : array_like of int
+            lane indices
+
+        Returns
+        -------
+        np.ndarray
+        """
+        lanes = np.asarray(lanes, dtype=np.int64)
+        return np.where(lanes >= 0,
+                        self.edge_length[np.maximum(lanes, 0) //
+                                         self.max_lanes], np.nan)
+
+    def first_match(self, lanes, match, upstream=False):
+        """Find the nearest lane in front of (or behind) lanes that matches.
+
+        Lanes are searched up to `max_hops` hops away, and within the
+        lookahead distance.
+
+        Parameters
+        ----------
+        lanes : array_like of int
+            lane indices
+        match : np.ndarray of bool
+            whether every lane of the graph matches, e.g. whether it is
+            occupied
+        upstream : bool, optional
+            whether to search behind the lanes instead of in front of them
+
+        Returns
+        -------
+        np.ndarray
+            nearest matching lane for every lane, or -1 if there is none
+        np.ndarray
+            distance to the matching lanes (see `downstream_dist` and
+            `upstream_dist`), or infinity if there is none
+        """
+        lanes = np.asarray(lanes, dtype=np.int64)
+        table, dist = (self.upstream_lanes, self.upstream_dist) if upstream \
+            else (self.downstream_lanes, self.downstream_dist)
+
+        found = np.full(len(lanes), -1, dtype=np.int64)
+        found_dist = np.full(len(lanes), np.inf)
+        active = np.flatnonzero(lanes >= 0)
+        # lane the tables are searched from, and its distance to the lanes
+        current = lanes[active]
+        offset = np.zeros(len(active))
+
+        # most searches end within the tables of the lanes. The other ones
+        # continue from the tables of the last lane they reached
+        num_hops = 0
+        while len(active) > 0 and num_hops < self.max_hops:
+            width = min(table.shape[1], self.max_hops - num_hops)
+            if width == 0:
+                break
+            block = table[current, :width]
+            block_dist = offset[:, None] + dist[current, :width]
+            valid = block >= 0
+            if self.lookahead is not None and num_hops > 0:
+                # the distance between the ends of the two lanes
+                if upstream:
+                    gap = block_dist - self.lane_length(block)
+                else:
+                    gap = block_dist - self.lane_length(
+                        lanes[active])[:, None]
+                valid &= gap <= self.lookahead
+
+            hits = valid & match[np.maximum(block, 0)]
+            hit = hits.any(axis=1)
+            hop = np.argmax(hits[hit], axis=1)
+            rows = active[hit]
+            found[rows] = block[hit, hop]
+            found_dist[rows] = block_dist[hit, hop]
+
+            keep = ~hit & valid[:, -1]
+            active = active[keep]
+            current = block[keep, -1]
+            offset = block_dist[keep, -1]
+            num_hops += width
+
+        return found, found_dist
+
+    def _tabulate(self, links, num_hops, upstream):
+        """Follow the links of every lane, and tabulate the lanes reached.
+
+        Parameters
+        ----------
+        links : np.ndarray
+            next (or previous) lane of every lane
+        num_hops : int
+            maximum number of hops
+        upstream : bool
+            whether the links lead to the lanes behind every lane
+
+        Returns
+        -------
+        np.ndarray
+            lanes reached after every hop
+        np.ndarray
+            distances to these lanes
+        """
+        num_rows = len(links)
+        lengths = self.edge_length[np.arange(num_rows) // self.max_lanes]
+        rows = np.flatnonzero(
+            np.arange(num_rows) % self.max_lanes <
+            self.num_lanes[np.arange(num_rows) // self.max_lanes])
+        lane = rows.copy()
+        dist = np.zeros(len(rows))
+
+        lane_cols, dist_cols = [], []
+        for _ in range(num_hops):
+            if not upstream:
+                dist += lengths[lane]
+            lane = links[lane]
+            keep = lane >= 0
+            rows, lane, dist = rows[keep], lane[keep], dist[keep]
+            if upstream:
+                dist += lengths[lane]
+            if self.lookahead is not None:
+                # the distance between the ends of the two lanes
+                gap = dist - lengths[lane if upstream else rows]
+                keep = gap <= self.lookahead
+                rows, lane, dist = rows[keep], lane[keep], dist[keep]
+            if len(rows) == 0:
+                break
+
+            lane_col = np.full(num_rows, -1, dtype=np.int64)
+            dist_col = np.full(num_rows, np.inf)
+            lane_col[rows] = lane
+            dist_col[rows] = dist
+            lane_cols.append(lane_col)
+            dist_cols.append(dist_col)
+
+            # past a loop back to the lane, the same lanes are reached again
+            keep = lane != rows
+            rows, lane, dist = rows[keep], lane[keep], dist[keep]
+
+        if not lane_cols:
+            return np.full((num_rows, 0), -1, dtype=np.int64), \
+                np.full((num_rows, 0), np.inf)
+        return np.stack(lane_cols, axis=1), np.stack(dist_cols, axis=1)
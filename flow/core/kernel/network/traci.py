@@ -1,7 +1,10 @@
 """Script containing the TraCI network kernel class."""
+import bisect
 import tempfile
 
 from flow.core.kernel.network import BaseKernelNetwork
+from flow.core.kernel.network.cache import NetworkCache, netconvert_version
+from flow.core.kernel.network.lane_graph import LaneGraph
 from flow.core.util import makexml, printxml, ensure_dir
 import time
 import os
@@ -9,6 +12,7 @@ import subprocess
 import xml.etree.ElementTree as ElementTree
 from lxml import etree
 from copy import deepcopy
+import numpy as np
 
 E = etree.Element
 
@@ -16,6 +20,8 @@ E = etree.Element
 RETRIES_ON_ERROR = 10
 # number of seconds to wait before trying to access the .net.xml file again
 WAIT_ON_ERROR = 1
+# options passed to netconvert along with the configuration of the network
+NETCONVERT_OPTIONS = '--no-internal-links="false"'
 
 
 def _flow(name, vtype, route, **kwargs):
@@ -61,6 +67,20 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         ensure_dir('%s' % self.net_path)
         ensure_dir('%s' % self.cfg_path)
 
+        # cache of the generated networks, shared by all processes
+        try:
+            net_cache = sim_params.net_cache
+        except AttributeError:
+            net_cache = False
+        self.net_cache = NetworkCache(os.path.join(
+            tempfile.gettempdir(), 'flow/cache/net/')) if net_cache else None
+
+        # maximum distance covered by the distance tables of the lane graph
+        try:
+            self.lane_lookahead = sim_params.lane_lookahead
+        except AttributeError:
+            self.lane_lookahead = None
+
         # variables to be defined during network generation
         self.network = None
         self.nodfn = None
@@ -83,6 +103,20 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         self.rts = None
         self.cfg = None
 
+        # indices of the absolute positions in the network, see
+        # `_build_position_index`
+        self._edge_names = []
+        self._edge_ids = {}
+        self._x_starts = {}
+        self._x_offset = None
+        self._x_add_pos = None
+        self._edgestart_x = []
+        self._edgestart_array = None
+        self._edgestart_ids = None
+
+        # lane graph of the network, see `get_lane_graph`
+        self._lane_graph = None
+
     def generate_network(self, network):
         """See parent class.
 
@@ -189,6 +223,8 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         self.total_edgestarts.sort(key=lambda tup: tup[1])
 
         self.total_edgestarts_dict = dict(self.total_edgestarts)
+        self._build_position_index()
+        self._lane_graph = None
 
         self.__length = sum(
             self._edges[edge_id]['length'] for edge_id in self._edges
@@ -245,12 +281,19 @@ class TraCIKernelNetwork(BaseKernelNetwork):
 
     def get_edge(self, x):
         """See parent class."""
-        for (edge, start_pos) in reversed(self.total_edgestarts):
-            if x >= start_pos:
-                return edge, x - start_pos
+        index = bisect.bisect_right(self._edgestart_x, x) - 1
+        if index >= 0:
+            edge, start_pos = self.total_edgestarts[index]
+            return edge, x - start_pos
 
     def get_x(self, edge, position):
         """See parent class."""
+        try:
+            start, add_pos = self._x_starts[edge]
+            return start + position if add_pos else start
+        except KeyError:
+            pass
+
         # if there was a collision which caused the vehicle to disappear,
         # return an x value of -1001
         if len(edge) == 0:
@@ -267,6 +310,94 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         else:
             return self.total_edgestarts_dict[edge] + position
 
+    def get_edge_index(self, edge):
+        """See parent class."""
+        return self._edge_ids.get(edge, -1)
+
+    def get_edge_name(self, index):
+        """See parent class."""
+        return self._edge_names[index] if index >= 0 else ''
+
+    def get_x_batch(self, edge_idx, pos):
+        """See parent class."""
+        edge_idx = np.asarray(edge_idx, dtype=np.int64)
+        pos = np.asarray(pos, dtype=np.float64)
+        valid = edge_idx >= 0
+        index = np.where(valid, edge_idx, 0)
+        return np.where(
+            valid,
+            self._x_offset[index] + np.where(self._x_add_pos[index], pos, 0),
+            -1001.)
+
+    def get_edge_batch(self, x):
+        """See parent class."""
+        x = np.asarray(x, dtype=np.float64)
+        index = np.searchsorted(self._edgestart_array, x, side='right') - 1
+        valid = index >= 0
+        index = np.where(valid, index, 0)
+        edge_idx = np.where(valid, self._edgestart_ids[index], -1)
+        pos = np.where(valid, x - self._edgestart_array[index], np.nan)
+        return edge_idx, pos
+
+    def _build_position_index(self):
+        """Index the absolute positions of all edges in the network.
+
+        Edges (including internal links, and the edges of `edge_starts` that
+        are not part of the network) are assigned integer ids. The absolute
+        position of their start, as returned by `get_x`, is stored in arrays
+        indexed by these ids, and the starts of the edges in
+        `total_edgestarts` are stored as a sorted array, so that `get_x` and
+        `get_edge` are served by a lookup and a binary search, respectively.
+        """
+        self._edge_names = list(self._edges) + [
+            edge for edge, _ in self.total_edgestarts
+            if edge not in self._edges]
+        self._edge_ids = {
+            edge: index for index, edge in enumerate(self._edge_names)}
+
+        # start of every edge, and whether the position on the edge is added
+        # to it. Edges for which get_x raises an error are left out of the
+        # dict, and are assigned a position of -1001 in the arrays.
+        self._x_starts = {}
+        for edge in self._edge_names:
+            if edge[0] == ':':
+                if edge in self.internal_edgestarts_dict:
+                    self._x_starts[edge] = (
+                        self.internal_edgestarts_dict[edge], True)
+                else:
+                    self._x_starts[edge] = (self.total_edgestarts_dict.get(
+                        edge.rsplit('_', 1)[0], -1001), False)
+            elif edge in self.total_edgestarts_dict:
+                self._x_starts[edge] = (self.total_edgestarts_dict[edge], True)
+        starts = [self._x_starts.get(edge, (-1001, False))
+                  for edge in self._edge_names]
+        self._x_offset = np.array([start for start, _ in starts],
+                                  dtype=np.float64)
+        self._x_add_pos = np.array([add_pos for _, add_pos in starts],
+                                   dtype=bool)
+
+        self._edgestart_x = [start for _, start in self.total_edgestarts]
+        self._edgestart_array = np.array(self._edgestart_x, dtype=np.float64)
+        self._edgestart_ids = np.array(
+            [self._edge_ids[edge] for edge, _ in self.total_edgestarts],
+            dtype=np.int64)
+
+    def get_lane_graph(self):
+        """See parent class.
+
+        The graph is only compiled the first time it is needed.
+        """
+        if self._lane_graph is None:
+            edges = [self._edges.get(edge, {}) for edge in self._edge_names]
+            self._lane_graph = LaneGraph(
+                self._edge_names,
+                [edge.get('lanes', 0) for edge in edges],
+                [edge.get('length', 0) for edge in edges],
+                self.next_edge,
+                self.prev_edge,
+                lookahead=self.lane_lookahead)
+        return self._lane_graph
+
     def edge_length(self, edge_id):
         """See parent class."""
         try:
@@ -424,10 +555,9 @@ class TraCIKernelNetwork(BaseKernelNetwork):
 
         # xml file for nodes; contains nodes for the boundary points with
         # respect to the x and y axes
-        x = makexml('nodes', 'http://sumo.dlr.de/xsd/nodes_file.xsd')
+        nod = makexml('nodes', 'http://sumo.dlr.de/xsd/nodes_file.xsd')
         for node_attributes in nodes:
-            x.append(E('node', **node_attributes))
-        printxml(x, self.net_path + self.nodfn)
+            nod.append(E('node', **node_attributes))
 
         # modify the length, shape, numLanes, and speed values
         for edge in edges:
@@ -444,28 +574,29 @@ class TraCIKernelNetwork(BaseKernelNetwork):
                 edge['speed'] = str(edge['speed'])
 
         # xml file for edges
-        x = makexml('edges', 'http://sumo.dlr.de/xsd/edges_file.xsd')
+        edg = makexml('edges', 'http://sumo.dlr.de/xsd/edges_file.xsd')
         for edge_attributes in edges:
-            x.append(E('edge', attrib=edge_attributes))
-        printxml(x, self.net_path + self.edgfn)
+            edg.append(E('edge', attrib=edge_attributes))
 
         # xml file for types: contains the the number of lanes and the speed
         # limit for the lanes
+        typ = None
         if types is not None:
             # modify the numLanes and speed values
-            for typ in types:
-                if 'numLanes' in typ:
-                    typ['numLanes'] = str(typ['numLanes'])
-                if 'speed' in typ:
-                    typ['speed'] = str(typ['speed'])
+            for type_attributes in types:
+                if 'numLanes' in type_attributes:
+                    type_attributes['numLanes'] = str(
+                        type_attributes['numLanes'])
+                if 'speed' in type_attributes:
+                    type_attributes['speed'] = str(type_attributes['speed'])
 
-            x = makexml('types', 'http://sumo.dlr.de/xsd/types_file.xsd')
+            typ = makexml('types', 'http://sumo.dlr.de/xsd/types_file.xsd')
             for type_attributes in types:
-                x.append(E('type', **type_attributes))
-            printxml(x, self.net_path + self.typfn)
+                typ.append(E('type', **type_attributes))
 
         # xml for connections: specifies which lanes connect to which in the
         # edges
+        con = None
         if connections is not None:
             # modify the fromLane and toLane values
             for connection in connections:
@@ -474,13 +605,31 @@ class TraCIKernelNetwork(BaseKernelNetwork):
                 if 'toLane' in connection:
                     connection['toLane'] = str(connection['toLane'])
 
-            x = makexml('connections',
-                        'http://sumo.dlr.de/xsd/connections_file.xsd')
+            con = makexml('connections',
+                          'http://sumo.dlr.de/xsd/connections_file.xsd')
             for connection_attributes in connections:
                 if 'signal_group' in connection_attributes:
                     del connection_attributes['signal_group']
-                x.append(E('connection', **connection_attributes))
-            printxml(x, self.net_path + self.confn)
+                con.append(E('connection', **connection_attributes))
+
+        # the network is fully determined by the above files, so it is looked
+        # up in the cache before calling netconvert
+        key = None
+        if self.net_cache is not None:
+            key = self.net_cache.key(
+                netconvert_version(), NETCONVERT_OPTIONS,
+                *[None if x is None else etree.tostring(x)
+                  for x in (nod, edg, typ, con)])
+            cached = self.net_cache.get(key, self.cfg_path + self.netfn)
+            if cached is not None:
+                return cached
+
+        printxml(nod, self.net_path + self.nodfn)
+        printxml(edg, self.net_path + self.edgfn)
+        if typ is not None:
+            printxml(typ, self.net_path + self.typfn)
+        if con is not None:
+            printxml(con, self.net_path + self.confn)
 
         # xml file for configuration, which specifies:
         # - the location of all files of interest for sumo
@@ -509,7 +658,7 @@ class TraCIKernelNetwork(BaseKernelNetwork):
             [
                 'netconvert -c ' + self.net_path + self.cfgfn +
                 ' --output-file=' + self.cfg_path + self.netfn +
-                ' --no-internal-links="false"'
+                ' ' + NETCONVERT_OPTIONS
             ],
             stdout=subprocess.DEVNULL,
             shell=True)
@@ -519,6 +668,9 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         for _ in range(RETRIES_ON_ERROR):
             try:
                 edges_dict, conn_dict = self._import_edges_from_net(net_params)
+                if key is not None:
+                    self.net_cache.put(key, edges_dict, conn_dict,
+                                       self.cfg_path + self.netfn)
                 return edges_dict, conn_dict
             except Exception as e:
                 print('Error during start: {}'.format(e))
@@ -566,13 +718,26 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         # this removes edges that are not connected to a network (isolated)
         net_cmd += " --remove-edges.isolated"
 
-        subprocess.call(net_cmd, shell=True)
-
         # name of the .net.xml file (located in cfg_path)
         self.netfn = netfn
 
+        # the network is fully determined by the osm file, as the above
+        # options are fixed
+        key = None
+        if self.net_cache is not None:
+            with open(osm_path, 'rb') as f:
+                key = self.net_cache.key(netconvert_version(), 'osm', f.read())
+            cached = self.net_cache.get(key, self.cfg_path + netfn)
+            if cached is not None:
+                return cached
+
+        subprocess.call(net_cmd, shell=True)
+
         # collect data from the generated network configuration file
         edges_dict, conn_dict = self._import_edges_from_net(net_params)
+        if key is not None:
+            self.net_cache.put(
+                key, edges_dict, conn_dict, self.cfg_path + netfn)
 
         return edges_dict, conn_dict
 
@@ -605,8 +770,19 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         else:
             self.netfn = net_params.template['net']
 
+        # the edges and connections are fully determined by the template
+        key = None
+        if self.net_cache is not None:
+            with open(self.netfn, 'rb') as f:
+                key = self.net_cache.key(f.read())
+            cached = self.net_cache.get(key)
+            if cached is not None:
+                return cached
+
         # collect data from the generated network configuration file
         edges_dict, conn_dict = self._import_edges_from_net(net_params)
+        if key is not None:
+            self.net_cache.put(key, edges_dict, conn_dict)
 
         return edges_dict, conn_dict
 
@@ -754,8 +930,10 @@ class TraCIKernelNetwork(BaseKernelNetwork):
                     edges=' '.join(r)
                 ))
 
-        # add the inflows from various edges to the xml file
-        if self.network.net_params.inflows is not None:
+        # add the inflows from various edges to the xml file, unless their
+        # vehicles are added at runtime by the inflow controller
+        if self.network.net_params.inflows is not None \
+                and self.master_kernel.inflows is None:
             total_inflows = self.network.net_params.inflows.get()
             for inflow in total_inflows:
                 # do not want to affect the original values
@@ -1,4 +1,5 @@
 """Script containing the base simulation kernel class."""
+import random
 
 
 class KernelSimulation(object):
@@ -56,6 +57,57 @@ class KernelSimulation(object):
         """
         raise NotImplementedError
 
+    def simulation_step_async(self):
+        """Start advancing the simulation by one step.
+
+        Simulators that support it perform the step in the background, in
+        which case `simulation_step_wait` must be called before the state of
+        the simulation is updated. By default, the step is performed right
+        away.
+        """
+        self.simulation_step()
+
+    def simulation_step_wait(self):
+        """Wait for the step started by `simulation_step_async` to complete."""
+        pass
+
+    def next_seed(self):
+        """Return a random seed for the next instance of the simulator.
+
+        This is used to induce randomness into the next rollout when the
+        simulation is restarted.
+
+        Returns
+        -------
+        int
+        """
+        return random.randint(0, int(1e5))
+
+    def save_state(self, path):
+        """Save the state of the simulation.
+
+        Parameters
+        ----------
+        path : str
+            path of the file the state of the simulator is saved to
+
+        Returns
+        -------
+        dict
+            snapshot of the state of the simulation, see `load_state`
+        """
+        raise NotImplementedError
+
+    def load_state(self, snapshot):
+        """Restore a state of the simulation saved via `save_state`.
+
+        Parameters
+        ----------
+        snapshot : dict
+            snapshot of the state of the simulation
+        """
+        raise NotImplementedError
+
     def update(self, reset):
         """Update the internal attributes of the simulation kernel.
 
@@ -0,0 +1,236 @@
+"""Script containing the launcher of the sumo processes of the TraCI kernel."""
+import atexit
+import collections
+import hashlib
+import logging
+import random
+import re
+import subprocess
+import time
+import xml.etree.ElementTree as ElementTree
+
+import sumolib
+import traci
+from traci.exceptions import FatalTraCIError
+
+# shortest and longest interval between two attempts to connect to a sumo
+# process that does not accept connections yet, in seconds
+MIN_CONNECT_INTERVAL = 0.005
+MAX_CONNECT_INTERVAL = 0.1
+
+# comments of xml files, which include the time at which sumo generated them
+XML_COMMENT = re.compile(rb'<!--.*?-->', re.DOTALL)
+
+# sumo process launched ahead of time, along with the port it listens on,
+# the key of its configuration, and its seed
+WarmInstance = collections.namedtuple(
+    'WarmInstance', ['proc', 'port', 'key', 'seed'])
+
+
+def connect(port, proc=None, timeout=100.):
+    """Connect to a sumo process as soon as it accepts TraCI connections.
+
+    Sumo only listens on its port once its configuration and network are
+    loaded, so the connection is attempted at short (and increasing) intervals
+    instead of waiting for a fixed delay.
+
+    Parameters
+    ----------
+    port : int
+        port the sumo process listens on
+    proc : subprocess.Popen, optional
+        sumo process. If specified, the connection fails as soon as the
+        process exits.
+    timeout : float, optional
+        maximum time waited for the process to accept a connection, in seconds
+
+    Returns
+    -------
+    traci.connection.Connection
+        TraCI connection to the process
+
+    Raises
+    ------
+    traci.exceptions.TraCIException
+        if the process exited before accepting a connection
+    traci.exceptions.FatalTraCIError
+        if the process did not accept a connection within the timeout
+    """
+    deadline = time.time() + timeout
+    interval = MIN_CONNECT_INTERVAL
+    while True:
+        try:
+            return traci.connect(port, numRetries=0, proc=proc)
+        except FatalTraCIError:
+            if time.time() > deadline:
+                raise
+        time.sleep(interval)
+        interval = min(2 * interval, MAX_CONNECT_INTERVAL)
+
+
+def config_digest(cfg):
+    """Return a digest of a sumo configuration and of all its input files.
+
+    Comments are ignored, so that files that are generated anew with the same
+    contents have the same digest.
+
+    Parameters
+    ----------
+    cfg : str
+        path to the .sumo.cfg file
+
+    Returns
+    -------
+    str
+        digest of the contents of the files
+    """
+    digest = hashlib.sha1()
+    paths = [cfg]
+    inputs = ElementTree.parse(cfg).getroot().find('input')
+    if inputs is not None:
+        for elem in inputs:
+            paths.extend(path.strip() for path in elem.get('value', '').split(
+                ',') if path.strip())
+
+    for path in paths:
+        digest.update(path.encode())
+        try:
+            with open(path, 'rb') as f:
+                digest.update(XML_COMMENT.sub(b'', f.read()))
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+class SumoLauncher(object):
+    """Launcher of sumo processes, with a pool of warm processes.
+
+    Starting sumo requires loading its configuration and network, which can
+    take a significant amount of time, and is repeated whenever the sumo
+    instance is restarted (e.g. upon every reset with
+    SumoParams(restart_instance=True)). To avoid this, a number of processes
+    can be launched ahead of time with the configuration of the current
+    process (see `prelaunch`). These warm processes load their network while
+    the current process is used, and wait for a client to connect. When a
+    process is then launched with the same configuration, a warm process is
+    returned instead of starting a new one.
+
+    Warm processes are launched with random seeds, as they are meant to be
+    used by instances that are restarted to induce randomness into the next
+    rollout. The seed of the next warm process can be retrieved via
+    `next_seed`, so that the restarted instance requests it.
+
+    Usage
+    -----
+    >>> launcher = SumoLauncher(pool_size=1)
+    >>> proc, port = launcher.launch(sumo_call, cfg)
+    >>> kernel_api = connect(port, proc)
+    >>> launcher.prelaunch(sumo_call, cfg)
+    >>> # the next launch with the seed of the warm process returns it
+    >>> seed = launcher.next_seed()
+
+    Attributes
+    ----------
+    pool_size : int
+        number of warm processes kept by `prelaunch`
+    num_warm_launches : int
+        number of launches that returned a warm process
+    """
+
+    def __init__(self, pool_size=0):
+        """Instantiate a launcher with no warm processes.
+
+        Parameters
+        ----------
+        pool_size : int, optional
+            number of warm processes kept by `prelaunch`
+        """
+        self.pool_size = pool_size
+        self.num_warm_launches = 0
+        self._warm = collections.deque()
+
+        # warm processes wait for a client indefinitely, so they are
+        # terminated along with the interpreter if they were not used
+        atexit.register(self.close)
+
+    def launch(self, sumo_call, cfg, port=None):
+        """Launch a sumo process, or return a matching warm process.
+
+        Parameters
+        ----------
+        sumo_call : list of str
+            command used to start sumo, excluding its port
+        cfg : str
+            path to the .sumo.cfg file loaded by the command
+        port : int, optional
+            port the process listens on, if a new process is started. A free
+            port is chosen if not specified.
+
+        Returns
+        -------
+        subprocess.Popen
+            sumo process
+        int
+            port the process listens on
+        """
+        key = (tuple(sumo_call), config_digest(cfg)) if self._warm else None
+        while self._warm:
+            instance = self._warm.popleft()
+            if instance.key == key and instance.proc.poll() is None:
+                self.num_warm_launches += 1
+                return instance.proc, instance.port
+            # the configuration changed, so the process is of no use
+            instance.proc.kill()
+
+        if port is None:
+            port = sumolib.miscutils.getFreeSocketPort()
+        return self._start(sumo_call, port), port
+
+    def prelaunch(self, sumo_call, cfg):
+        """Launch warm processes with a configuration, up to the pool size.
+
+        Warm processes with a different configuration are terminated.
+
+        Parameters
+        ----------
+        sumo_call : list of str
+            command used to start sumo, excluding its port and seed
+        cfg : str
+            path to the .sumo.cfg file loaded by the command
+        """
+        if self.pool_size <= 0:
+            return
+        digest = config_digest(cfg)
+        for instance in list(self._warm):
+            if instance.key[1] != digest or instance.proc.poll() is not None:
+                self._warm.remove(instance)
+                instance.proc.kill()
+
+        while len(self._warm) < self.pool_size:
+            seed = random.randint(0, int(1e5))
+            call = sumo_call + ["--seed", str(seed)]
+            port = sumolib.miscutils.getFreeSocketPort()
+            logging.info(" Launching warm SUMO on port " + str(port))
+            self._warm.append(WarmInstance(
+                self._start(call, port), port, (tuple(call), digest), seed))
+
+    def next_seed(self):
+        """Return the seed of the next warm process, or None if there is none.
+
+        Returns
+        -------
+        int or None
+        """
+        return self._warm[0].seed if self._warm else None
+
+    def close(self):
+        """Terminate all warm processes."""
+        while self._warm:
+            self._warm.popleft().proc.kill()
+
+    @staticmethod
+    def _start(sumo_call, port):
+        """Start a sumo process listening on a port."""
+        return subprocess.Popen(
+            sumo_call + ["--remote-port", str(port)],
+            stdout=subprocess.DEVNULL)
@@ -0,0 +1,357 @@
+"""Script containing the emission recorder of the TraCI simulation kernel."""
+import collections
+import csv
+import os
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+# columns of the emission files, in order, along with the type they are
+# stored as. String columns are stored as indices into a table of strings.
+EMISSION_COLUMNS = (
+    ('time', np.float64),
+    ('id', str),
+    ('x', np.float32),
+    ('y', np.float32),
+    ('speed', np.float32),
+    ('headway', np.float32),
+    ('leader_id', str),
+    ('target_accel_with_noise_with_failsafe', np.float32),
+    ('target_accel_no_noise_no_failsafe', np.float32),
+    ('target_accel_with_noise_no_failsafe', np.float32),
+    ('target_accel_no_noise_with_failsafe', np.float32),
+    ('realized_accel', np.float32),
+    ('road_grade', np.float32),
+    ('edge_id', str),
+    ('lane_number', np.int32),
+    ('distance', np.float32),
+    ('relative_position', np.float32),
+    ('follower_id', str),
+    ('leader_rel_speed', np.float32),
+)
+
+# supported formats of the emission files, and their extensions
+EMISSION_FORMATS = {'csv': '.csv', 'npz': '.npz', 'parquet': '.parquet'}
+
+# number of rows of every chunk of the emission data
+CHUNK_SIZE = 1 << 16
+
+# maximum number of chunks waiting to be written. Recording waits for the
+# writer beyond it, which bounds the memory used by the recorder.
+MAX_PENDING_CHUNKS = 4
+
+
+class EmissionRecorder(object):
+    """Recorder of the emission data of the vehicles in the network.
+
+    The data of every time step is appended to chunks of preallocated typed
+    columns (see `EMISSION_COLUMNS`), in which vehicle and edge ids are stored
+    as indices into a table of interned strings. Full chunks are appended to a
+    temporary file on a background writer thread, so that the memory used by
+    the recorder does not grow with the length of the simulation, and the
+    file is renamed once complete (see `save`), without waiting for it to be
+    written.
+
+    Emission files can be written as csv files, as compressed npz archives
+    (see `load_npz`), or as parquet files if pyarrow is installed. Rows are
+    written in the order they are recorded, i.e. by time, and then in the
+    order of the vehicles at every time step (rather than grouped by vehicle
+    as they used to be).
+
+    Usage
+    -----
+    >>> recorder = EmissionRecorder(emission_path, fmt='csv')
+    >>> recorder.record(time, {'id': veh_ids, 'x': x, ...})
+    >>> recorder.save('ring-0_emission')  # written in the background
+    >>> recorder.close()  # waits for all files to be written
+
+    Attributes
+    ----------
+    path : str
+        directory the emission files are written to
+    fmt : str
+        format of the emission files, one of `EMISSION_FORMATS`
+    chunk_size : int
+        number of rows of every chunk
+    num_rows : int
+        number of rows recorded since the last call to `save`
+    """
+
+    def __init__(self, path, fmt='csv', chunk_size=CHUNK_SIZE):
+        """Instantiate a recorder with no data.
+
+        Parameters
+        ----------
+        path : str
+            directory the emission files are written to
+        fmt : str, optional
+            format of the emission files, one of "csv", "npz" and "parquet"
+        chunk_size : int, optional
+            number of rows of every chunk
+
+        Raises
+        ------
+        ValueError
+            if the format is not supported
+        ImportError
+            if the parquet format is requested but pyarrow is not installed
+        """
+        if fmt not in EMISSION_FORMATS:
+            raise ValueError('Unsupported emission format: {}'.format(fmt))
+        if fmt == 'parquet' and pyarrow is None:
+            raise ImportError(
+                'pyarrow is required to write emission files in the parquet '
+                'format.')
+
+        self.path = path
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.num_rows = 0
+
+        # interned strings, and the index of every string in the table
+        self._strings = []
+        self._string_index = {}
+
+        # chunk currently recorded, and number of rows in it
+        self._chunk = self._allocate()
+        self._size = 0
+
+        # temporary file the chunks of the current data are written to, and
+        # number of chunks submitted to it
+        self._part = None
+        self._num_chunks = 0
+
+        # writes submitted to the writer thread
+        self._pending = collections.deque()
+        self._executor = None
+        # parquet writer of the current file (only used by the writer thread)
+        self._parquet_writer = None
+
+    def record(self, time, columns):
+        """Append the data of several vehicles at a time step.
+
+        Parameters
+        ----------
+        time : float
+            time of the data, in seconds
+        columns : dict of array_like
+            value of every column (other than "time") for every vehicle. Nan
+            values are written as empty values.
+        """
+        num = len(columns['id'])
+        start = 0
+        while start < num:
+            stop = min(num, start + self.chunk_size - self._size)
+            rows = slice(self._size, self._size + stop - start)
+            for name, dtype in EMISSION_COLUMNS:
+                if name == 'time':
+                    self._chunk[name][rows] = time
+                elif dtype is str:
+                    self._chunk[name][rows] = self._intern(
+                        columns[name][start:stop])
+                else:
+                    self._chunk[name][rows] = columns[name][start:stop]
+
+            self._size += stop - start
+            self.num_rows += stop - start
+            start = stop
+            if self._size == self.chunk_size:
+                self._submit_chunk()
+
+    def truncate(self, num_rows):
+        """Discard the last rows recorded, if they are not written yet.
+
+        Parameters
+        ----------
+        num_rows : int
+            number of rows to keep, among those recorded since the last call
+            to `save`
+
+        Returns
+        -------
+        bool
+            whether the rows were discarded
+        """
+        num_discarded = self.num_rows - num_rows
+        if num_discarded < 0 or num_discarded > self._size:
+            return False
+        self._size -= num_discarded
+        self.num_rows = num_rows
+        return True
+
+    def save(self, name):
+        """Write all data recorded since the last call to a file.
+
+        The file is written in the background, see `wait`.
+
+        Parameters
+        ----------
+        name : str
+            name of the file, excluding its extension
+
+        Returns
+        -------
+        str or None
+            path of the file, or None if no data was recorded
+        """
+        if self.num_rows == 0:
+            return None
+
+        self._submit_chunk()
+        path = os.path.join(self.path, name + EMISSION_FORMATS[self.fmt])
+        self._submit(self._finish_file, self._part, path)
+        self._part = None
+        self._num_chunks = 0
+        self.num_rows = 0
+        return path
+
+    def wait(self):
+        """Wait for all data submitted to the writer to be written.
+
+        Raises
+        ------
+        Exception
+            any error raised while writing the data
+        """
+        while self._pending:
+            self._pending.popleft().result()
+
+    def close(self):
+        """Wait for the pending writes, and stop the writer thread.
+
+        The data recorded since the last call to `save` is kept.
+        """
+        try:
+            self.wait()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _allocate(self):
+        """Return the empty columns of a chunk."""
+        return {name: np.empty(self.chunk_size,
+                               dtype=np.int32 if dtype is str else dtype)
+                for name, dtype in EMISSION_COLUMNS}
+
+    def _intern(self, values):
+        """Return the index of several strings in the table of strings.
+
+        None values (e.g. the id of a missing leader) are stored as empty
+        strings.
+        """
+        index = self._string_index
+        indices = []
+        for value in values:
+            if value is None:
+                value = ''
+            i = index.get(value)
+            if i is None:
+                i = index[value] = len(self._strings)
+                self._strings.append(value)
+            indices.append(i)
+        return indices
+
+    def _submit_chunk(self):
+        """Submit the current chunk to the writer, and start a new one."""
+        if self._size == 0:
+            return
+        if self._part is None:
+            self._part = os.path.join(self.path, '.emission-{}.part'.format(
+                uuid.uuid4().hex))
+        chunk = {name: column[:self._size]
+                 for name, column in self._chunk.items()}
+        self._submit(self._write_chunk, self._part, chunk, self._num_chunks)
+        self._num_chunks += 1
+        self._chunk = self._allocate()
+        self._size = 0
+
+    def _submit(self, fn, *args):
+        """Run a function on the writer thread, once the pending ones are."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        while len(self._pending) >= MAX_PENDING_CHUNKS:
+            self._pending.popleft().result()
+        self._pending.append(self._executor.submit(fn, *args))
+
+    def _decode(self, chunk):
+        """Replace the indices of the string columns of a chunk by strings."""
+        # the table of strings is only appended to, so the strings of the
+        # chunk are in it even if it grows meanwhile
+        strings = self._strings
+        return {name: np.array([strings[i] for i in chunk[name]], dtype=str)
+                if dtype is str else chunk[name]
+                for name, dtype in EMISSION_COLUMNS}
+
+    def _write_chunk(self, path, chunk, index):
+        """Append a chunk to a file (on the writer thread)."""
+        columns = self._decode(chunk)
+        names = [name for name, _ in EMISSION_COLUMNS]
+
+        if self.fmt == 'csv':
+            with open(path, 'a', newline='') as f:
+                writer = csv.writer(f, delimiter=',')
+                if index == 0:
+                    writer.writerow(names)
+                writer.writerows(zip(*[
+                    _csv_values(columns[name]) for name in names]))
+
+        elif self.fmt == 'npz':
+            # every chunk of every column is stored as a member of the archive
+            with zipfile.ZipFile(path, 'a', zipfile.ZIP_DEFLATED) as f:
+                for name in names:
+                    with f.open('{}.{:06d}.npy'.format(name, index), 'w',
+                                force_zip64=True) as member:
+                        np.lib.format.write_array(
+                            member, columns[name], allow_pickle=False)
+
+        else:
+            table = pyarrow.table({name: columns[name] for name in names})
+            if index == 0:
+                self._parquet_writer = pq.ParquetWriter(path, table.schema)
+            self._parquet_writer.write_table(table)
+
+    def _finish_file(self, part, path):
+        """Move a complete file to its final path (on the writer thread)."""
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        os.replace(part, path)
+
+
+def load_npz(path):
+    """Load an emission file written in the npz format.
+
+    Parameters
+    ----------
+    path : str
+        path to the emission file
+
+    Returns
+    -------
+    dict of np.ndarray
+        value of every column, for all rows of the file
+    """
+    chunks = collections.defaultdict(list)
+    with np.load(path) as data:
+        for key in sorted(data.files):
+            name = key.rsplit('.', 1)[0]
+            chunks[name].append(data[key])
+    return {name: np.concatenate(chunks[name])
+            for name, _ in EMISSION_COLUMNS if name in chunks}
+
+
+def _csv_values(column):
+    """Return the values of a column as they are written to csv files."""
+    if column.dtype.kind == 'f':
+        # the shortest representation of every value in its own precision
+        return np.where(np.isnan(column), '', column.astype(str)).tolist()
+    return column.tolist()
@@ -1,17 +1,16 @@
 """Script containing the TraCI simulation kernel class."""
 
 from flow.core.kernel.simulation import KernelSimulation
+from flow.core.kernel.simulation.launcher import SumoLauncher, connect
+from flow.core.kernel.simulation.recorder import EmissionRecorder
 from flow.core.util import ensure_dir
 import flow.config as config
 import traci.constants as tc
-import traci
 import traceback
 import os
-import time
 import logging
-import subprocess
 import signal
-import csv
+import numpy as np
 
 
 # Number of retries on restarting SUMO before giving up
@@ -27,6 +26,9 @@ class TraCISimulation(KernelSimulation):
     ----------
     sumo_proc : subprocess.Popen
         contains the subprocess.Popen instance used to start traci
+    launcher : flow.core.kernel.simulation.launcher.SumoLauncher
+        launcher of the sumo processes, which keeps the processes launched
+        ahead of the next restarts (see SumoParams.num_warm_instances)
     sim_step : float
         seconds per simulation step
     emission_path : str or None
@@ -34,20 +36,13 @@ class TraCISimulation(KernelSimulation):
         output is not generated if this value is not specified
     time : float
         used to internally keep track of the simulation time
-    stored_data : dict <str, dict <float, dict <str, Any>>>
-        a dict object used to store additional data if an emission file is
-        provided. The first key corresponds to the name of the vehicle, the
-        second corresponds to the time the sample was issued, and the final
-        keys represent the additional data stored at every given time for every
-        vehicle, and consists of the following keys:
-
-        * acceleration (no noise): the accelerations issued to the vehicle,
-          excluding noise
-        * acceleration (requested): the requested acceleration by the vehicle,
-          including noise
-        * acceleration (actual): the actual acceleration by the vehicle,
-          collected by computing the difference between the speeds of the
-          vehicle and dividing it by the sim_step term
+    recorder : flow.core.kernel.simulation.recorder.EmissionRecorder or None
+        recorder of the emission data of all vehicles at every time step,
+        written to the emission files in the background. The data includes
+        the accelerations requested by the controllers of the vehicles (with
+        and without noise and failsafes), and the realized accelerations,
+        computed from the difference between the speeds of the vehicles
+        divided by the sim_step term. None if no emission path is specified
     """
 
     def __init__(self, master_kernel):
@@ -62,10 +57,14 @@ class TraCISimulation(KernelSimulation):
         KernelSimulation.__init__(self, master_kernel)
 
         self.sumo_proc = None
+        self.launcher = SumoLauncher()
         self.sim_step = None
         self.emission_path = None
         self.time = 0
-        self.stored_data = dict()
+        self.recorder = None
+        # number of rows of the emission data before the last reset, if no
+        # step was performed since then
+        self._reset_rows = None
 
     def pass_api(self, kernel_api):
         """See parent class.
@@ -73,7 +72,10 @@ class TraCISimulation(KernelSimulation):
         Also initializes subscriptions.
         """
         KernelSimulation.pass_api(self, kernel_api)
+        self._subscribe()
 
+    def _subscribe(self):
+        """Subscribe to the simulation variables needed by the kernel."""
         # subscribe some simulation parameters needed to check for entering,
         # exiting, and colliding vehicles
         self.kernel_api.simulation.subscribe([
@@ -88,9 +90,68 @@ class TraCISimulation(KernelSimulation):
         ])
 
     def simulation_step(self):
-        """See parent class."""
+        """See parent class.
+
+        All commands queued in the command buffer of the kernel are sent to
+        sumo before the step is performed, along with the vehicles of the
+        inflows that depart during the step (if they are added at runtime).
+        """
+        self._step_inflows()
+        self.master_kernel.command_buffer.flush()
         self.kernel_api.simulationStep()
 
+    def simulation_step_async(self):
+        """See parent class.
+
+        The step is performed on the I/O thread of the command buffer of the
+        kernel, see flow.core.kernel.commands.TraCICommandBuffer.step_async.
+        """
+        self._step_inflows()
+        self.master_kernel.command_buffer.step_async()
+
+    def _step_inflows(self):
+        """Queue the vehicles of the inflows that depart during the step."""
+        if self.master_kernel.inflows is not None:
+            self.master_kernel.inflows.step(self.sim_step)
+
+    def simulation_step_wait(self):
+        """See parent class."""
+        self.master_kernel.command_buffer.wait()
+
+    def next_seed(self):
+        """See parent class.
+
+        If sumo processes were launched ahead of time, the seed of the next
+        one is returned, so that it is used by the restarted instance.
+        """
+        seed = self.launcher.next_seed()
+        if seed is None:
+            seed = KernelSimulation.next_seed(self)
+        return seed
+
+    def save_state(self, path):
+        """See parent class.
+
+        The state of all vehicles, traffic lights and inflows in sumo is saved
+        to the file. Queued commands are sent to sumo beforehand.
+        """
+        self.master_kernel.command_buffer.flush()
+        self.kernel_api.simulation.saveState(path)
+        return {'path': path, 'time': self.time}
+
+    def load_state(self, snapshot):
+        """See parent class.
+
+        Loading a state removes all subscriptions in sumo, so the simulation
+        variables are subscribed again. The vehicles and traffic lights are
+        subscribed again by their respective kernels. Queued commands are
+        dropped, as they refer to the replaced state.
+        """
+        self.master_kernel.command_buffer.clear()
+        self.kernel_api.simulation.loadState(snapshot['path'])
+        self._subscribe()
+        self.time = snapshot['time']
+
     def update(self, reset):
         """See parent class."""
         if reset:
@@ -98,56 +159,63 @@ class TraCISimulation(KernelSimulation):
         else:
             self.time += self.sim_step
 
-        # Collect the additional data to store in the emission file.
-        if self.emission_path is not None:
-            kv = self.master_kernel.vehicle
-            for veh_id in self.master_kernel.vehicle.get_ids():
-                t = round(self.time, 2)
-
-                # some miscellaneous pre-processing
-                position = kv.get_2d_position(veh_id)
-
-                # Make sure dictionaries corresponding to the vehicle and
-                # time are available.
-                if veh_id not in self.stored_data.keys():
-                    self.stored_data[veh_id] = dict()
-                if t not in self.stored_data[veh_id].keys():
-                    self.stored_data[veh_id][t] = dict()
-
-                # Add the speed, position, and lane data.
-                self.stored_data[veh_id][t].update({
-                    "speed": kv.get_speed(veh_id),
-                    "lane_number": kv.get_lane(veh_id),
-                    "edge_id": kv.get_edge(veh_id),
-                    "relative_position": kv.get_position(veh_id),
-                    "x": position[0],
-                    "y": position[1],
-                    "headway": kv.get_headway(veh_id),
-                    "leader_id": kv.get_leader(veh_id),
-                    "follower_id": kv.get_follower(veh_id),
-                    "leader_rel_speed":
-                        kv.get_speed(kv.get_leader(veh_id))
-                        - kv.get_speed(veh_id),
-                    "target_accel_with_noise_with_failsafe":
-                        kv.get_accel(veh_id, noise=True, failsafe=True),
-                    "target_accel_no_noise_no_failsafe":
-                        kv.get_accel(veh_id, noise=False, failsafe=False),
-                    "target_accel_with_noise_no_failsafe":
-                        kv.get_accel(veh_id, noise=True, failsafe=False),
-                    "target_accel_no_noise_with_failsafe":
-                        kv.get_accel(veh_id, noise=False, failsafe=True),
-                    "realized_accel":
-                        kv.get_realized_accel(veh_id),
-                    "road_grade": kv.get_road_grade(veh_id),
-                    "distance": kv.get_distance(veh_id),
-                })
+        # Collect the additional data to store in the emission file. The data
+        # of a reset that is directly followed by another one is replaced, so
+        # that every vehicle has a single sample per time step.
+        if self.recorder is not None:
+            if reset and self._reset_rows is not None:
+                self.recorder.truncate(self._reset_rows)
+            num_rows = self.recorder.num_rows
+            self._record_emission()
+            self._reset_rows = num_rows if reset else None
+
+    def _record_emission(self):
+        """Record the emission data of all vehicles at the current time."""
+        kv = self.master_kernel.vehicle
+        veh_ids = kv.get_ids()
+        if len(veh_ids) == 0:
+            return
+
+        state = kv.get_state_matrix(veh_ids, fields=(
+            'x', 'y', 'speed', 'previous_speed', 'headway', 'lane',
+            'distance', 'position'))
+        # accelerations that were not requested are left empty
+        accel = kv.get_state_matrix(veh_ids, fields=(
+            'accel_noise_failsafe', 'accel', 'accel_noise', 'accel_failsafe'),
+            error=np.nan)
+        leader_ids = kv.get_leader(veh_ids)
+        speed, distance = state[:, 2], state[:, 6]
+
+        self.recorder.record(round(self.time, 2), {
+            "id": veh_ids,
+            "x": state[:, 0],
+            "y": state[:, 1],
+            "speed": speed,
+            "headway": state[:, 4],
+            "leader_id": leader_ids,
+            "target_accel_with_noise_with_failsafe": accel[:, 0],
+            "target_accel_no_noise_no_failsafe": accel[:, 1],
+            "target_accel_with_noise_no_failsafe": accel[:, 2],
+            "target_accel_no_noise_with_failsafe": accel[:, 3],
+            "realized_accel": np.where(
+                distance == 0, 0, (speed - state[:, 3]) / self.sim_step),
+            "road_grade": [kv.get_road_grade(veh_id) for veh_id in veh_ids],
+            "edge_id": kv.get_edge(veh_ids),
+            "lane_number": state[:, 5],
+            "distance": distance,
+            "relative_position": state[:, 7],
+            "follower_id": kv.get_follower(veh_ids),
+            "leader_rel_speed": kv.get_speeds(leader_ids) - speed,
+        })
 
     def close(self):
         """See parent class."""
-        # Save the emission data to a csv.
-        if self.emission_path is not None:
+        # Save the emission data, and wait for it to be written.
+        if self.recorder is not None:
             self.save_emission()
+            self.recorder.close()
 
+        self.master_kernel.command_buffer.close()
         self.kernel_api.close()
 
     def check_collision(self):
@@ -170,24 +238,48 @@ class TraCISimulation(KernelSimulation):
         # Save the simulation step size (for later use).
         self.sim_step = sim_params.sim_step
 
+        # number of sumo processes launched ahead of the next restarts
+        try:
+            self.launcher.pool_size = sim_params.num_warm_instances
+        except AttributeError:
+            self.launcher.pool_size = 0
+
         # Update the emission path term.
         self.emission_path = sim_params.emission_path
         if self.emission_path is not None:
             ensure_dir(self.emission_path)
+            try:
+                emission_format = sim_params.emission_format
+            except AttributeError:
+                emission_format = 'csv'
+            # the data that is not saved yet is kept through restarts
+            if self.recorder is None \
+                    or self.recorder.path != self.emission_path \
+                    or self.recorder.fmt != emission_format:
+                self.recorder = EmissionRecorder(
+                    self.emission_path, emission_format)
+        else:
+            self.recorder = None
+
+        # file the trajectories of all vehicles are written to by sumo
+        try:
+            fcd_output = sim_params.fcd_output
+        except AttributeError:
+            fcd_output = False
+        fcd_file = None
+        if self.emission_path is not None and fcd_output:
+            fcd_file = os.path.join(
+                self.emission_path, "{}-fcd.xml".format(network.name))
 
         error = None
         for _ in range(RETRIES_ON_ERROR):
             try:
-                # port number the sumo instance will be run on
-                port = sim_params.port
-
                 sumo_binary = "sumo-gui" if sim_params.render is True \
                     else "sumo"
 
-                # command used to start sumo
+                # command used to start sumo, excluding its port and seed
                 sumo_call = [
                     sumo_binary, "-c", network.cfg,
-                    "--remote-port", str(sim_params.port),
                     "--num-clients", str(sim_params.num_clients),
                     "--step-length", str(sim_params.sim_step)
                 ]
@@ -209,11 +301,6 @@ class TraCISimulation(KernelSimulation):
                     sumo_call.append("--lanechange.overtake-right")
                     sumo_call.append("true")
 
-                # specify a simulation seed (if requested)
-                if sim_params.seed is not None:
-                    sumo_call.append("--seed")
-                    sumo_call.append(str(sim_params.seed))
-
                 if not sim_params.print_warnings:
                     sumo_call.append("--no-warnings")
                     sumo_call.append("true")
@@ -226,6 +313,22 @@ class TraCISimulation(KernelSimulation):
                 sumo_call.append("--collision.check-junctions")
                 sumo_call.append("true")
 
+                # specify a simulation seed (if requested)
+                seeded_call = list(sumo_call)
+                if sim_params.seed is not None:
+                    seeded_call.append("--seed")
+                    seeded_call.append(str(sim_params.seed))
+
+                # write the trajectories of all vehicles (if requested)
+                if fcd_file is not None:
+                    seeded_call.append("--fcd-output")
+                    seeded_call.append(fcd_file)
+
+                # Opening the I/O thread to SUMO, or reusing a warm process
+                # that was launched with the same command
+                self.sumo_proc, port = self.launcher.launch(
+                    seeded_call, network.cfg, port=sim_params.port)
+
                 logging.info(" Starting SUMO on port " + str(port))
                 logging.debug(" Cfg file: " + str(network.cfg))
                 if sim_params.num_clients > 1:
@@ -234,23 +337,18 @@ class TraCISimulation(KernelSimulation):
                 logging.debug(" Emission file: " + str(self.emission_path))
                 logging.debug(" Step length: " + str(sim_params.sim_step))
 
-                # Opening the I/O thread to SUMO
-                self.sumo_proc = subprocess.Popen(
-                    sumo_call,
-                    stdout=subprocess.DEVNULL
-                )
-
-                # wait a small period of time for the subprocess to activate
-                # before trying to connect with traci
-                if os.environ.get("TEST_FLAG", 0):
-                    time.sleep(0.1)
-                else:
-                    time.sleep(config.SUMO_SLEEP)
-
-                traci_connection = traci.connect(port, numRetries=100)
+                # connect as soon as sumo accepts connections
+                traci_connection = connect(
+                    port, self.sumo_proc, timeout=config.SUMO_TIMEOUT)
                 traci_connection.setOrder(0)
                 traci_connection.simulationStep()
 
+                # launch the processes of the next restarts (if requested)
+                # while this one is used. The gui is never launched ahead,
+                # and neither are processes that would truncate the fcd file
+                if sumo_binary == "sumo" and fcd_file is None:
+                    self.launcher.prelaunch(sumo_call, network.cfg)
+
                 return traci_connection
             except Exception as e:
                 print("Error during start: {}".format(traceback.format_exc()))
@@ -266,10 +364,11 @@ class TraCISimulation(KernelSimulation):
             print("Error during teardown: {}".format(e))
 
     def save_emission(self, run_id=0):
-        """Save any collected emission data to a csv file.
+        """Save any collected emission data to an emission file.
 
         If not data was collected, nothing happens. Moreover, any internally
-        stored data by this class is clear whenever data is stored.
+        stored data by this class is clear whenever data is stored. The file
+        is written in the background, so this returns right away.
 
         Parameters
         ----------
@@ -279,51 +378,14 @@ class TraCISimulation(KernelSimulation):
         """
         # If there is no stored data, ignore this operation. This is to ensure
         # that data isn't deleted if the operation is called twice.
-        if len(self.stored_data) == 0:
+        if self.recorder is None:
             return
 
-        # Get a csv name for the emission file.
-        name = "{}-{}_emission.csv".format(
+        # Get a name for the emission file.
+        name = "{}-{}_emission".format(
             self.master_kernel.network.network.name, run_id)
 
-        # The name of all stored data-points (excluding id and time)
-        stored_ids = [
-            "x",
-            "y",
-            "speed",
-            "headway",
-            "leader_id",
-            "target_accel_with_noise_with_failsafe",
-            "target_accel_no_noise_no_failsafe",
-            "target_accel_with_noise_no_failsafe",
-            "target_accel_no_noise_with_failsafe",
-            "realized_accel",
-            "road_grade",
-            "edge_id",
-            "lane_number",
-            "distance",
-            "relative_position",
-            "follower_id",
-            "leader_rel_speed",
-        ]
-
-        # Update the stored data to push to the csv file.
-        final_data = {"time": [], "id": []}
-        final_data.update({key: [] for key in stored_ids})
-
-        for veh_id in self.stored_data.keys():
-            for t in self.stored_data[veh_id].keys():
-                final_data['time'].append(t)
-                final_data['id'].append(veh_id)
-                for key in stored_ids:
-                    final_data[key].append(self.stored_data[veh_id][t][key])
-
-        with open(os.path.join(self.emission_path, name), "w") as f:
-            print(os.path.join(self.emission_path, name), self.emission_path)
-            writer = csv.writer(f, delimiter=',')
-            writer.writerow(final_data.keys())
-            writer.writerows(zip(*final_data.values()))
-
-        # Clear all memory from the stored data. This is useful if this
-        # function is called in between resets.
-        self.stored_data.clear()
+        path = self.recorder.save(name)
+        self._reset_rows = None
+        if path is not None:
+            print(path, self.emission_path)
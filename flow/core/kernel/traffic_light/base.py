@@ -64,6 +64,32 @@ class KernelTrafficLight(object):
         """
         raise NotImplementedError
 
+    def save_state(self):
+        """Return a snapshot of the states of the traffic lights.
+
+        This is meant to be called along with the `save_state` method of the
+        simulation kernel.
+
+        Returns
+        -------
+        dict
+            snapshot of the states of the traffic lights, see `load_state`
+        """
+        raise NotImplementedError
+
+    def load_state(self, snapshot):
+        """Restore the states of the traffic lights from a snapshot.
+
+        This is meant to be called after the `load_state` method of the
+        simulation kernel.
+
+        Parameters
+        ----------
+        snapshot : dict
+            snapshot returned by `save_state`
+        """
+        raise NotImplementedError
+
     def get_ids(self):
         """Return the names of all nodes with traffic lights."""
         raise NotImplementedError
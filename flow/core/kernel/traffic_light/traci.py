@@ -2,6 +2,7 @@
 
 from flow.core.kernel.traffic_light import KernelTrafficLight
 import traci.constants as tc
+from traci.exceptions import TraCIException
 
 
 class TraCITrafficLight(KernelTrafficLight):
@@ -43,7 +44,10 @@ class TraCITrafficLight(KernelTrafficLight):
         # number of traffic light nodes
         self.num_traffic_lights = len(self.__ids)
 
-        # subscribe the traffic light signal data
+        self._subscribe()
+
+    def _subscribe(self):
+        """Subscribe to the signal data of all traffic lights."""
         for node_id in self.__ids:
             self.kernel_api.trafficlight.subscribe(
                 node_id, [tc.TL_RED_YELLOW_GREEN_STATE])
@@ -56,20 +60,50 @@ class TraCITrafficLight(KernelTrafficLight):
                 self.kernel_api.trafficlight.getSubscriptionResults(tl_id)
         self.__tls = tls_obs.copy()
 
+    def save_state(self):
+        """See parent class."""
+        return {'tls': self.__tls.copy()}
+
+    def load_state(self, snapshot):
+        """See parent class.
+
+        The traffic lights are subscribed again, as their subscriptions are
+        removed when a state is loaded in sumo.
+        """
+        self.__tls = snapshot['tls'].copy()
+        self._subscribe()
+
     def get_ids(self):
         """See parent class."""
         return self.__ids
 
     def set_state(self, node_id, state, link_index="all"):
-        """See parent class."""
-        if link_index == "all":
-            # if lights on all lanes are changed
-            self.kernel_api.trafficlight.setRedYellowGreenState(
-                tlsID=node_id, state=state)
-        else:
-            # if lights on a single lane is changed
-            self.kernel_api.trafficlight.setLinkState(
-                tlsID=node_id, tlsLinkIndex=link_index, state=state)
+        """See parent class.
+
+        The new state is sent to sumo along with all other commands in the
+        command buffer of the kernel, right before the next simulation step.
+        """
+        commands = self.master_kernel.command_buffer
+        if link_index != "all":
+            # if lights on a single lane is changed, modify the state that is
+            # about to be sent, or else the current state
+            pending = commands.get_pending(
+                'trafficlight', 'setRedYellowGreenState', node_id)
+            if pending is not None:
+                full_state = list(pending[0])
+            elif node_id in self.__tls:
+                full_state = list(self.get_state(node_id))
+            else:
+                full_state = list(self.kernel_api.trafficlight.
+                                  getRedYellowGreenState(node_id))
+            if link_index >= len(full_state):
+                raise TraCIException(
+                    "Invalid tlsLinkIndex %s for tls '%s' with maximum index "
+                    "%s." % (link_index, node_id, len(full_state) - 1))
+            full_state[link_index] = state
+            state = ''.join(full_state)
+
+        commands.add('trafficlight', 'setRedYellowGreenState', node_id, state)
 
     def get_state(self, node_id):
         """See parent class."""
@@ -621,6 +621,12 @@ class AimsunKernelVehicle(KernelVehicle):
             return sum([self.get_ids_by_edge(edge) for edge in edges], [])
         return [veh for veh in self.__ids if self.get_edge(veh) == edges]
 
+    def get_ids_by_lane(self, edge, lane):
+        """See parent class."""
+        veh_ids = [veh for veh in self.get_ids_by_edge(edge)
+                   if self.get_lane(veh) == lane]
+        return sorted(veh_ids, key=self.get_position)
+
     def get_inflow_rate(self, time_span):
         """See parent class."""
         if len(self._num_departed) == 0:
@@ -684,6 +690,42 @@ class AimsunKernelVehicle(KernelVehicle):
             return [self.get_speed(veh, error) for veh in veh_id]
         return self.__vehicles[veh_id]['tracking_info'].CurrentSpeed / 3.6
 
+    def get_speeds(self, ids=None, error=-1001):
+        """See parent class."""
+        return self.get_state_matrix(ids, ('speed',), error)[:, 0]
+
+    def get_state_matrix(self, ids=None, fields=('speed', 'position'),
+                         error=-1001):
+        """See parent class.
+
+        Supported fields are "speed", "position", "lane", "headway",
+        "length", "angle", "x", and "y".
+        """
+        getters = {
+            'speed': self.get_speed,
+            'position': self.get_position,
+            'lane': self.get_lane,
+            'headway': self.get_headway,
+            'length': self.get_length,
+            'angle': self.get_angle,
+            'x': lambda veh: [pos[0] for pos in self.get_position_world(veh)],
+            'y': lambda veh: [pos[1] for pos in self.get_position_world(veh)],
+        }
+        if ids is None:
+            ids = self.__ids
+        found = np.array([veh_id in self.__vehicles for veh_id in ids],
+                         dtype=bool)
+        found_ids = [veh_id for veh_id in ids if veh_id in self.__vehicles]
+
+        matrix = np.full((len(ids), len(fields)), error, dtype=np.float64)
+        for j, field in enumerate(fields):
+            if field not in getters:
+                raise ValueError('Unsupported state field: {}'.format(field))
+            if found_ids:
+                matrix[found, j] = getters[field](found_ids)
+
+        return matrix
+
     def get_default_speed(self, veh_id, error=-1001):
         """See parent class."""
         raise NotImplementedError
@@ -828,6 +870,13 @@ class AimsunKernelVehicle(KernelVehicle):
         return self.master_kernel.network.get_x(self.get_edge(veh_id),
                                                 self.get_position(veh_id))
 
+    def get_x_batch(self, ids=None):
+        """See parent class."""
+        if ids is None:
+            ids = self.get_ids()
+        return np.array([self.get_x_by_id(veh_id) for veh_id in ids],
+                        dtype=np.float64)
+
     def set_lane_headways(self, veh_id, lane_headways):
         """See parent class."""
         raise NotImplementedError
@@ -109,6 +109,32 @@ class KernelVehicle(object, metaclass=ABCMeta):
         """Reset any additional state that needs to be reset."""
         pass
 
+    def save_state(self):
+        """Return a snapshot of the state of the vehicles.
+
+        This is meant to be called along with the `save_state` method of the
+        simulation kernel.
+
+        Returns
+        -------
+        dict
+            snapshot of the state of the vehicles, see `load_state`
+        """
+        raise NotImplementedError
+
+    def load_state(self, snapshot):
+        """Restore the state of the vehicles from a snapshot.
+
+        This is meant to be called after the `load_state` method of the
+        simulation kernel.
+
+        Parameters
+        ----------
+        snapshot : dict
+            snapshot returned by `save_state`
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def remove(self, veh_id):
         """Remove a vehicle.
@@ -286,6 +312,21 @@ class KernelVehicle(object, metaclass=ABCMeta):
         """Return the names of all rl-controlled vehicles in the network."""
         pass
 
+    def is_rl(self, veh_id):
+        """Return whether a vehicle is an rl-controlled vehicle in the network.
+
+        Parameters
+        ----------
+        veh_id : str
+            vehicle identifier
+
+        Returns
+        -------
+        bool
+            True if the vehicle is currently in the network and rl-controlled
+        """
+        return veh_id in self.get_rl_ids()
+
     @abstractmethod
     def get_ids_by_edge(self, edges):
         """Return the names of all vehicles in the specified edge.
@@ -294,6 +335,26 @@ class KernelVehicle(object, metaclass=ABCMeta):
         """
         pass
 
+    @abstractmethod
+    def get_ids_by_lane(self, edge, lane):
+        """Return the names of all vehicles in a lane, sorted by position.
+
+        If no vehicles are currently in the lane, then returns an empty list.
+
+        Parameters
+        ----------
+        edge : str
+            name of the edge
+        lane : int
+            lane index
+
+        Returns
+        -------
+        list of str
+            vehicle ids, from the back to the front of the lane
+        """
+        pass
+
     @abstractmethod
     def get_inflow_rate(self, time_span):
         """Return the inflow rate (in veh/hr) of vehicles from the network.
@@ -367,6 +428,61 @@ class KernelVehicle(object, metaclass=ABCMeta):
         """
         pass
 
+    @abstractmethod
+    def get_speeds(self, ids=None, error=-1001):
+        """Return the speeds of a group of vehicles as an array.
+
+        This is the bulk counterpart to `get_speed`, and is preferable when
+        collecting the speeds of many vehicles at once.
+
+        Parameters
+        ----------
+        ids : list of str, optional
+            vehicle ids. If not specified, the speeds of all vehicles in the
+            network (in the order of `get_ids`) are returned
+        error : float, optional
+            value that is returned for vehicles that are not found
+
+        Returns
+        -------
+        np.ndarray
+            speed of every vehicle, in m/s
+        """
+        pass
+
+    @abstractmethod
+    def get_state_matrix(self, ids=None, fields=('speed', 'position'),
+                         error=-1001):
+        """Return several numerical state variables of a group of vehicles.
+
+        The following fields are supported by all simulators: "speed",
+        "position", "lane", "headway", and "length". Simulators may support
+        additional fields (e.g. "x", "y", "angle").
+
+        Parameters
+        ----------
+        ids : list of str, optional
+            vehicle ids. If not specified, all vehicles in the network (in the
+            order of `get_ids`) are used
+        fields : list of str, optional
+            names of the state variables to collect
+        error : float, optional
+            value that is returned for vehicles that are not found, or for
+            which a field is not available
+
+        Returns
+        -------
+        np.ndarray
+            array of shape (len(ids), len(fields)), whose element (i, j) is
+            the value of field j for vehicle i
+
+        Raises
+        ------
+        ValueError
+            if one of the fields is not supported by the simulator
+        """
+        pass
+
     @abstractmethod
     def get_default_speed(self, veh_id, error=-1001):
         """Return the expected speed if no control were applied.
@@ -729,6 +845,26 @@ class KernelVehicle(object, metaclass=ABCMeta):
         """
         pass
 
+    @abstractmethod
+    def get_x_batch(self, ids=None):
+        """Return the 1-D representation of the positions of several vehicles.
+
+        This is the bulk counterpart to `get_x_by_id`, and is preferable when
+        collecting the positions of many vehicles at once.
+
+        Parameters
+        ----------
+        ids : list of str, optional
+            vehicle ids. If not specified, the positions of all vehicles in the
+            network (in the order of `get_ids`) are returned
+
+        Returns
+        -------
+        np.ndarray
+            position of every vehicle, see `get_x_by_id`
+        """
+        pass
+
     @abstractmethod
     def get_max_speed(self, veh_id, error):
         """Return the max speed of the specified vehicle.
@@ -760,6 +896,27 @@ class KernelVehicle(object, metaclass=ABCMeta):
         """Update stored acceleration of vehicle with veh_id."""
         pass
 
+    @abstractmethod
+    def update_accels(self, veh_ids, accel, noise=True, failsafe=True):
+        """Update the stored accelerations of a group of vehicles.
+
+        This is the bulk counterpart to `update_accel`.
+
+        Parameters
+        ----------
+        veh_ids : list of str
+            vehicle ids
+        accel : array_like or float or None
+            acceleration of every vehicle, or a single acceleration shared by
+            all vehicles. None and NaN denote that no acceleration was
+            requested.
+        noise : bool, optional
+            whether the accelerations include noise
+        failsafe : bool, optional
+            whether the accelerations were processed by the failsafes
+        """
+        pass
+
     @abstractmethod
     def get_2d_position(self, veh_id, error=-1001):
         """Return (x, y) position of vehicle with veh_id."""
@@ -0,0 +1,90 @@
+"""Script containing the sliding-window counters of the vehicle kernels."""
+
+
+class WindowCounter(object):
+    """Fixed-capacity history of per-step counts, with O(1) window sums.
+
+    The counts of the last `capacity` steps are kept in a ring buffer of
+    running totals (prefix sums), so that the sum over any number of recent
+    steps is the difference of two totals, regardless of the size of the
+    window. Older steps are overwritten, so that memory usage stays bounded
+    however long the simulation runs.
+
+    Usage
+    -----
+    >>> num_arrived = WindowCounter(capacity=3)
+    >>> for count in [1, 0, 2, 5]:
+    ...     num_arrived.append(count)
+    >>> num_arrived.sum(2)
+    7
+    >>> num_arrived.sum(10)  # only the last 3 steps are retained
+    7
+    >>> len(num_arrived)
+    3
+    """
+
+    def __init__(self, capacity):
+        """Instantiate an empty counter.
+
+        Parameters
+        ----------
+        capacity : int
+            maximum number of steps retained by the counter
+        """
+        self.capacity = max(int(capacity), 1)
+        # running totals after every step, modulo capacity + 1, so that the
+        # totals before and after the oldest retained step are both available
+        self._totals = [0] * (self.capacity + 1)
+        # number of steps appended since the last clear
+        self._num_steps = 0
+
+    def __deepcopy__(self, memo):
+        """Return a copy of the counter.
+
+        The counts are integers or floats, so the running totals are copied
+        as a flat list, which is much faster than a recursive copy.
+        """
+        counter = WindowCounter.__new__(WindowCounter)
+        counter.capacity = self.capacity
+        counter._totals = list(self._totals)
+        counter._num_steps = self._num_steps
+        return counter
+
+    def __len__(self):
+        """Return the number of steps retained by the counter."""
+        return min(self._num_steps, self.capacity)
+
+    def append(self, count):
+        """Add the count of a new step."""
+        size = self.capacity + 1
+        total = self._totals[self._num_steps % size] + count
+        self._num_steps += 1
+        self._totals[self._num_steps % size] = total
+
+    def clear(self):
+        """Remove all steps from the counter."""
+        self._totals[0] = 0
+        self._num_steps = 0
+
+    def sum(self, num_steps):
+        """Return the sum of the counts over the most recent steps.
+
+        Parameters
+        ----------
+        num_steps : int
+            number of steps to sum over. This is clipped to the number of
+            retained steps, and all retained steps are used if it is not
+            positive.
+
+        Returns
+        -------
+        int or float
+        """
+        num_steps = len(self) if num_steps <= 0 else min(num_steps, len(self))
+        size = self.capacity + 1
+        return self._totals[self._num_steps % size] - \
+            self._totals[(self._num_steps - num_steps) % size]
+
+    def last(self):
+        """Return the count of the most recent step, or 0 if there is none."""
+        return self.sum(1) if self._num_steps > 0 else 0
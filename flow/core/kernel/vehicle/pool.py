@@ -0,0 +1,114 @@
+"""Script containing the controller pool of the vehicle kernels."""
+
+
+class ControllerPool(object):
+    """Pool of the controllers of vehicles, recycled by vehicle type.
+
+    Every vehicle is assigned an acceleration controller, a lane-changing
+    controller, and (optionally) a routing controller, built from the
+    parameters of its type. When a vehicle leaves the network, its controllers
+    are returned to the pool, and are reassigned to the next vehicle of the
+    same type to enter it (via their `reset` method), instead of building a
+    new set of controllers for every departure. This avoids reallocating (and
+    garbage collecting) controllers in networks with large inflows.
+
+    Controllers are only recycled if all classes in their hierarchy declare
+    ``__slots__``, which the controllers shipped with Flow do. Controllers of
+    other classes may store arbitrary per-vehicle data that `reset` is not
+    aware of, and are built anew for every vehicle.
+
+    Usage
+    -----
+    >>> pool = ControllerPool()
+    >>> params = vehicles.type_parameters["human"]
+    >>> controllers = pool.acquire("human", "human_0", params)
+    >>> pool.release("human", controllers)
+    """
+
+    def __init__(self):
+        """Instantiate an empty pool."""
+        # controllers available for every vehicle type
+        self._free = {}
+        # whether the controllers of every class can be recycled
+        self._recyclable = {}
+
+    def clear(self):
+        """Remove all controllers from the pool."""
+        self._free.clear()
+
+    def acquire(self, veh_type, veh_id, params):
+        """Return the controllers of a vehicle entering the network.
+
+        Parameters
+        ----------
+        veh_type : str
+            type of the vehicle
+        veh_id : str
+            name of the vehicle
+        params : dict
+            parameters of the vehicle type, see
+            flow.core.params.VehicleParams.type_parameters
+
+        Returns
+        -------
+        flow.controllers.BaseController
+            acceleration controller
+        flow.controllers.BaseLaneChangeController
+            lane-changing controller
+        flow.controllers.BaseRouter or None
+            routing controller, if the type specifies one
+        """
+        free = self._free.get(veh_type)
+        if free:
+            controllers = free.pop()
+            for controller in controllers:
+                if controller is not None:
+                    controller.reset(veh_id)
+            return controllers
+
+        # specify the acceleration controller class
+        accel_controller = params["acceleration_controller"]
+        acc_controller = accel_controller[0](
+            veh_id,
+            car_following_params=params["car_following_params"],
+            **accel_controller[1])
+
+        # specify the lane-changing controller class
+        lc_controller = params["lane_change_controller"]
+        lane_changer = lc_controller[0](veh_id=veh_id, **lc_controller[1])
+
+        # specify the routing controller class
+        rt_controller = params["routing_controller"]
+        if rt_controller is not None:
+            router = rt_controller[0](
+                veh_id=veh_id, router_params=rt_controller[1])
+        else:
+            router = None
+
+        return acc_controller, lane_changer, router
+
+    def release(self, veh_type, controllers):
+        """Return the controllers of a vehicle that left the network.
+
+        Parameters
+        ----------
+        veh_type : str
+            type of the vehicle
+        controllers : tuple
+            acceleration, lane-changing, and routing controller of the
+            vehicle, as returned by `acquire`
+        """
+        if all(self._is_recyclable(controller) for controller in controllers):
+            self._free.setdefault(veh_type, []).append(tuple(controllers))
+
+    def _is_recyclable(self, controller):
+        """Return whether a controller can be reassigned to a new vehicle."""
+        if controller is None:
+            return True
+        cls = type(controller)
+        recyclable = self._recyclable.get(cls)
+        if recyclable is None:
+            recyclable = all('__slots__' in vars(base)
+                             for base in cls.__mro__ if base is not object)
+            self._recyclable[cls] = recyclable
+        return recyclable
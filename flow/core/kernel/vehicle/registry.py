@@ -0,0 +1,150 @@
+"""Script containing the vehicle id registry of the vehicle kernels."""
+
+
+def _detaching(method):
+    """Wrap a modifying list method, so that it detaches the snapshot."""
+    def wrapper(self, *args, **kwargs):
+        self._detach()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class IdSnapshot(list):
+    """List of vehicle ids, with constant-time membership tests.
+
+    Snapshots are returned by the `get_*_ids` methods of the vehicle kernel.
+    The same snapshot is returned by every call until the ids change, so
+    that getting the ids takes constant time. Snapshots may still be
+    modified like regular lists: they are then detached from the registry
+    they were taken from (which builds a new snapshot for the next call), so
+    that the kernel is not affected. Make a copy (e.g. via `list`) first to
+    also leave other holders of the snapshot unaffected.
+    """
+
+    def __init__(self, veh_ids=(), registry=None):
+        """Instantiate the snapshot from an iterable of vehicle ids.
+
+        Parameters
+        ----------
+        veh_ids : iterable of str, optional
+            vehicle ids
+        registry : IdRegistry, optional
+            registry the snapshot is taken from, if any
+        """
+        super().__init__(veh_ids)
+        self._members = None
+        self._registry = registry
+
+    def __contains__(self, veh_id):
+        """Return whether the vehicle is in the snapshot."""
+        if self._members is None:
+            self._members = frozenset(self)
+        return veh_id in self._members
+
+    def __reduce__(self):
+        """Support copying and pickling as a detached snapshot."""
+        return self.__class__, (list(self),)
+
+    def _detach(self):
+        """Detach the snapshot from its registry, before it is modified."""
+        self._members = None
+        if self._registry is not None:
+            self._registry._release(self)
+            self._registry = None
+
+    append = _detaching(list.append)
+    extend = _detaching(list.extend)
+    insert = _detaching(list.insert)
+    remove = _detaching(list.remove)
+    pop = _detaching(list.pop)
+    clear = _detaching(list.clear)
+    sort = _detaching(list.sort)
+    reverse = _detaching(list.reverse)
+    __setitem__ = _detaching(list.__setitem__)
+    __delitem__ = _detaching(list.__delitem__)
+    __iadd__ = _detaching(list.__iadd__)
+    __imul__ = _detaching(list.__imul__)
+
+
+class IdRegistry(object):
+    """Ordered set of vehicle ids.
+
+    Insertions, removals, and membership tests take constant time. Ids are
+    iterated in the order they were added, or in sorted order if the registry
+    is created with `sort=True`. An `IdSnapshot` of the ids is built the
+    first time it is requested after a modification, and shared until the
+    next one, so repeated calls to `snapshot` are cheap.
+
+    Usage
+    -----
+    >>> rl_ids = IdRegistry(sort=True)
+    >>> rl_ids.add("rl_1")
+    >>> rl_ids.add("rl_0")
+    >>> rl_ids.snapshot()
+    ['rl_0', 'rl_1']
+    >>> "rl_1" in rl_ids
+    True
+    """
+
+    def __init__(self, sort=False):
+        """Instantiate an empty registry.
+
+        Parameters
+        ----------
+        sort : bool, optional
+            whether to iterate over the ids in sorted order, rather than in
+            insertion order
+        """
+        self._sort = sort
+        # dictionaries preserve insertion order, and are used as ordered sets
+        self._ids = dict()
+        self._snapshot = None
+
+    def __contains__(self, veh_id):
+        """Return whether the vehicle is in the registry."""
+        return veh_id in self._ids
+
+    def __len__(self):
+        """Return the number of vehicles in the registry."""
+        return len(self._ids)
+
+    def __iter__(self):
+        """Iterate over a snapshot, so that the registry may be modified."""
+        return iter(self.snapshot())
+
+    def add(self, veh_id):
+        """Add a vehicle to the registry, if it is not already in it."""
+        if veh_id not in self._ids:
+            self._ids[veh_id] = None
+            self._snapshot = None
+
+    def discard(self, veh_id):
+        """Remove a vehicle from the registry, if it is in it."""
+        if veh_id in self._ids:
+            del self._ids[veh_id]
+            self._snapshot = None
+
+    def clear(self):
+        """Remove all vehicles from the registry."""
+        self._ids.clear()
+        self._snapshot = None
+
+    def snapshot(self):
+        """Return the ids in the registry as an `IdSnapshot`."""
+        if self._snapshot is None:
+            veh_ids = sorted(self._ids) if self._sort else self._ids
+            self._snapshot = IdSnapshot(veh_ids, registry=self)
+        return self._snapshot
+
+    def _release(self, snapshot):
+        """Stop sharing a snapshot that is about to be modified."""
+        if self._snapshot is snapshot:
+            self._snapshot = None
+
+    def __getstate__(self):
+        """Copy and pickle the registry without its shared snapshot."""
+        state = self.__dict__.copy()
+        state['_snapshot'] = None
+        return state
@@ -0,0 +1,247 @@
+"""Script containing the columnar vehicle state store."""
+import numpy as np
+
+# value used to denote missing data in the integer columns
+MISSING = -1
+# value used in the "leader" and "follower" columns to denote that the data
+# was collected, but no such vehicle exists
+NO_VEHICLE = -2
+
+
+class VehicleStateStore(object):
+    """Struct-of-arrays storage of the state of all vehicles in the network.
+
+    Every vehicle is assigned a slot, i.e. a row index that is shared by all
+    columns. The columns are NumPy arrays, so that per-vehicle getters reduce
+    to a single array access, and bulk consumers may read (or fancy-index) a
+    whole column at once. Slots that are freed when a vehicle leaves the
+    network are recycled by the next vehicle to enter it, and all columns grow
+    geometrically whenever the store runs out of slots.
+
+    Missing data is denoted by NaN in the float columns and by -1 in the
+    integer columns. The "leader" and "follower" columns additionally use -2
+    to denote vehicles with no leader or follower. Edges are stored as indices
+    into the ``edge_names`` list.
+
+    Usage
+    -----
+    >>> state = VehicleStateStore()
+    >>> slot = state.add("human_0")
+    >>> state.set("speed", "human_0", 5.)
+    >>> state.get("speed", "human_0", error=-1001)
+    5.0
+    >>> state.column("speed")[state.slots(["human_0"])]
+    array([5.])
+    """
+
+    # columns of floating point values
+    float_fields = (
+        'speed',  # speed of the vehicle, in m/s
+        'default_speed',  # speed if no TraCI commands were issued, in m/s
+        'previous_speed',  # speed in the previous time step, in m/s
+        'position',  # position relative to the current edge, in m
+        'x',  # absolute x coordinate, in m
+        'y',  # absolute y coordinate, in m
+        'angle',  # angle of the vehicle, in degrees
+        'headway',  # bumper-to-bumper distance to the leader, in m
+        'follower_headway',  # bumper-to-bumper distance to the follower, in m
+        'fuel',  # fuel consumption, in ml/s
+        'distance',  # distance traveled since departure, in m
+        'length',  # length of the vehicle, in m
+        'min_gap',  # minimum gap of the vehicle type, in m
+        'accel',  # acceleration requested by the controller, in m/s^2
+        'accel_failsafe',  # requested acceleration after the failsafes
+        'accel_noise',  # requested acceleration with noise
+        'accel_noise_failsafe',  # applied acceleration (noise + failsafes)
+    )
+
+    # columns of integer values
+    int_fields = (
+        'lane',  # lane index
+        'edge',  # index of the current edge in `edge_names`
+        'leader',  # slot of the leader, or NO_VEHICLE
+        'follower',  # slot of the follower, or NO_VEHICLE
+    )
+
+    # columns of arbitrary python objects
+    object_fields = (
+        'route',  # tuple of edges in the route of the vehicle
+    )
+
+    def __init__(self, capacity=64):
+        """Instantiate the store.
+
+        Parameters
+        ----------
+        capacity : int, optional
+            initial number of slots allocated for every column
+        """
+        self.capacity = 0
+        self.columns = {}
+        for field in self.float_fields:
+            self.columns[field] = np.empty(0, dtype=np.float64)
+        for field in self.int_fields:
+            self.columns[field] = np.empty(0, dtype=np.int64)
+        for field in self.object_fields:
+            self.columns[field] = np.empty(0, dtype=object)
+
+        # slot of every vehicle, and vehicle in every slot (None if free)
+        self._slot_by_id = {}
+        self._id_by_slot = []
+        self._free_slots = []
+
+        # names of all edges, and their index in the "edge" column
+        self.edge_names = []
+        self._edge_index = {}
+
+        self._grow(max(capacity, 1))
+
+    def _grow(self, capacity):
+        """Reallocate all columns with the specified number of slots."""
+        for field, col in self.columns.items():
+            new_col = np.empty(capacity, dtype=col.dtype)
+            new_col[:self.capacity] = col
+            self.columns[field] = new_col
+        self._id_by_slot.extend([None] * (capacity - self.capacity))
+        self._free_slots.extend(range(capacity - 1, self.capacity - 1, -1))
+        old_capacity = self.capacity
+        self.capacity = capacity
+        self._clear_slots(np.arange(old_capacity, capacity))
+
+    def _clear_slots(self, slots):
+        """Set all data in the specified slots to missing values."""
+        for field in self.float_fields:
+            self.columns[field][slots] = np.nan
+        for field in self.int_fields:
+            self.columns[field][slots] = MISSING
+        for field in self.object_fields:
+            self.columns[field][slots] = None
+
+    def __len__(self):
+        """Return the number of vehicles in the store."""
+        return len(self._slot_by_id)
+
+    def __contains__(self, veh_id):
+        """Return whether the vehicle has been assigned a slot."""
+        return veh_id in self._slot_by_id
+
+    def add(self, veh_id):
+        """Assign a slot to a vehicle and return it.
+
+        If the vehicle is already in the store, its current slot is returned
+        and its data is left unchanged.
+        """
+        slot = self._slot_by_id.get(veh_id)
+        if slot is not None:
+            return slot
+
+        if not self._free_slots:
+            self._grow(2 * self.capacity)
+
+        slot = self._free_slots.pop()
+        self._slot_by_id[veh_id] = slot
+        self._id_by_slot[slot] = veh_id
+        self._clear_slots(slot)
+        return slot
+
+    def remove(self, veh_id):
+        """Free the slot of a vehicle. Unknown vehicles are ignored."""
+        slot = self._slot_by_id.pop(veh_id, None)
+        if slot is not None:
+            self._id_by_slot[slot] = None
+            self._clear_slots(slot)
+            self._free_slots.append(slot)
+
+    def clear(self):
+        """Remove all vehicles from the store."""
+        for veh_id in list(self._slot_by_id):
+            self.remove(veh_id)
+
+    def slot(self, veh_id):
+        """Return the slot of a vehicle, or -1 if it is not in the store."""
+        return self._slot_by_id.get(veh_id, MISSING)
+
+    def slots(self, veh_ids):
+        """Return the slots of a list of vehicles as an array of ints.
+
+        Vehicles that are not in the store are assigned a slot of -1.
+        """
+        get = self._slot_by_id.get
+        return np.fromiter((get(veh_id, MISSING) for veh_id in veh_ids),
+                           dtype=np.int64, count=len(veh_ids))
+
+    def veh_id(self, slot):
+        """Return the vehicle in the specified slot, or None if it is free."""
+        if slot < 0:
+            return None
+        return self._id_by_slot[slot]
+
+    def veh_ids(self, slots, error=None):
+        """Return the vehicles in a list of slots.
+
+        Free and negative slots are assigned the error value.
+        """
+        id_by_slot = self._id_by_slot
+        veh_ids = [id_by_slot[slot] if slot >= 0 else None
+                   for slot in np.asarray(slots).tolist()]
+        return [error if veh_id is None else veh_id for veh_id in veh_ids]
+
+    def column(self, field):
+        """Return the array containing the specified field for all slots.
+
+        The array is indexed by slot, and is not a copy, so it should not be
+        modified by the caller.
+        """
+        return self.columns[field]
+
+    def get(self, field, veh_id, error):
+        """Return the value of a field for a vehicle.
+
+        Parameters
+        ----------
+        field : str
+            name of the column
+        veh_id : str
+            vehicle identifier
+        error : any
+            value returned if the vehicle is not in the store, or the field
+            has not been collected for the vehicle
+
+        Returns
+        -------
+        float or int or object
+        """
+        slot = self._slot_by_id.get(veh_id)
+        if slot is None:
+            return error
+        value = self.columns[field][slot]
+        if field in self.int_fields:
+            return error if value == MISSING else int(value)
+        elif field in self.object_fields:
+            return error if value is None else value
+        return error if value != value else float(value)
+
+    def set(self, field, veh_id, value):
+        """Set the value of a field for a vehicle that is in the store."""
+        self.columns[field][self._slot_by_id[veh_id]] = value
+
+    def edge_index(self, edge):
+        """Return the index of an edge, adding it to the edge table if needed.
+
+        Empty edge names (e.g. for teleporting vehicles) are treated as
+        missing, and are assigned an index of -1.
+        """
+        if not edge:
+            return MISSING
+        index = self._edge_index.get(edge)
+        if index is None:
+            index = len(self.edge_names)
+            self._edge_index[edge] = index
+            self.edge_names.append(edge)
+        return index
+
+    def edge_name(self, index, error=""):
+        """Return the name of the edge with the specified index."""
+        if index < 0:
+            return error
+        return self.edge_names[index]
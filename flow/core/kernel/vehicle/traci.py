@@ -1,17 +1,17 @@
 """Script containing the TraCI vehicle kernel class."""
-import traceback
-
 from flow.core.kernel.vehicle import KernelVehicle
+from flow.core.kernel.vehicle.state import VehicleStateStore, NO_VEHICLE
+from flow.core.kernel.vehicle.registry import IdRegistry
+from flow.core.kernel.vehicle.pool import ControllerPool
+from flow.core.kernel.vehicle.counters import WindowCounter
+from flow.core.kernel import events
 import traci.constants as tc
-from traci.exceptions import FatalTraCIError, TraCIException
 import numpy as np
 import collections
 import warnings
 from flow.controllers.car_following_models import SimCarFollowingController
 from flow.controllers.rlcontroller import RLController
 from flow.controllers.lane_change_controllers import SimLaneChangeController
-from bisect import bisect_left
-import itertools
 from copy import deepcopy
 
 # colors for vehicles
@@ -25,6 +25,49 @@ rdelta = 255 / STEPS
 color_bins = [[int(255 - rdelta * i), int(rdelta * i), 0] for i in
               range(STEPS + 1)]
 
+# numerical fields that can be collected via get_state_matrix
+STATE_MATRIX_FIELDS = VehicleStateStore.float_fields + ('lane',)
+
+# data derived from the state of all vehicles after every update. Unless
+# requested via `set_eager_data`, it is computed the first time it is needed:
+# * lane_order: vehicles on every lane, see get_ids_by_edge/get_ids_by_lane
+# * lane_data: lane leaders, followers, headways, and tailways of RL vehicles
+DERIVED_DATA = ('lane_order', 'lane_data')
+
+# columns that store the accelerations requested by the controllers, indexed
+# by whether noise and failsafes are applied, see get_accel
+ACCEL_FIELDS = {
+    (False, False): 'accel',
+    (False, True): 'accel_failsafe',
+    (True, False): 'accel_noise',
+    (True, True): 'accel_noise_failsafe',
+}
+
+# variables that every vehicle is subscribed to
+SUBSCRIPTION_VARS = (
+    tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
+    tc.VAR_ROAD_ID,
+    tc.VAR_SPEED,
+    tc.VAR_EDGES,
+    tc.VAR_POSITION,
+    tc.VAR_ANGLE,
+    tc.VAR_SPEED_WITHOUT_TRACI,
+    tc.VAR_FUELCONSUMPTION,
+    tc.VAR_DISTANCE
+)
+# maximum distance at which leaders are looked for, in m
+LEADER_DIST = 2000
+
+# attributes of the kernel that do not change over the course of a simulation,
+# and are therefore not copied by save_state
+SHARED_ATTRIBUTES = ('master_kernel', 'kernel_api', 'type_parameters',
+                     'minGap', '_controller_pool', '_eager_data',
+                     '_lane_links')
+
+# keys of the controllers of every vehicle, in the order returned by
+# ControllerPool.acquire
+CONTROLLER_KEYS = ('acc_controller', 'lane_changer', 'router')
+
 
 class TraCIVehicle(KernelVehicle):
     """Flow kernel for the TraCI API.
@@ -38,20 +81,37 @@ class TraCIVehicle(KernelVehicle):
         """See parent class."""
         KernelVehicle.__init__(self, master_kernel, sim_params)
 
-        self.__ids = []  # ids of all vehicles
-        self.__human_ids = []  # ids of human-driven vehicles
-        self.__controlled_ids = []  # ids of flow-controlled vehicles
-        self.__controlled_lc_ids = []  # ids of flow lc-controlled vehicles
-        self.__rl_ids = []  # ids of rl-controlled vehicles
-        self.__observed_ids = []  # ids of the observed vehicles
+        self.__ids = IdRegistry()  # ids of all vehicles
+        self.__human_ids = IdRegistry()  # ids of human-driven vehicles
+        self.__controlled_ids = IdRegistry()  # ids of flow-controlled vehicles
+        self.__controlled_lc_ids = IdRegistry()  # ids of flow lc-controlled vehicles
+        self.__rl_ids = IdRegistry(sort=True)  # ids of rl-controlled vehicles
+        self.__observed_ids = IdRegistry()  # ids of the observed vehicles
 
         # vehicles: Key = Vehicle ID, Value = Dictionary describing the vehicle
         # Ordered dictionary used to keep neural net inputs in order
         self.__vehicles = collections.OrderedDict()
 
-        # create a sumo_observations variable that will carry all information
-        # on the state of the vehicles for a given time step
-        self.__sumo_obs = {}
+        # last color assigned to every vehicle, see update_vehicle_colors
+        self.__colors = dict()
+
+        # columnar store that carries all information on the state of the
+        # vehicles for a given time step, as collected from sumo
+        self.__state = VehicleStateStore()
+
+        # current simulation time and time step size, in seconds
+        self._timestep = None
+        self._timedelta = None
+
+        # lane connectivity of the network, and occupancy index of all lanes
+        # (vehicles sorted by lane and position), see _sort_by_lane
+        self._lane_links = None
+        self._lane_order = None
+
+        # derived data that is computed after every update, and derived data
+        # that is out of date since the last update
+        self._eager_data = set()
+        self._stale_data = set(DERIVED_DATA)
 
         # total number of vehicles in the network
         self.num_vehicles = 0
@@ -63,20 +123,27 @@ class TraCIVehicle(KernelVehicle):
         # contains the parameters associated with each type of vehicle
         self.type_parameters = {}
 
+        # controllers of vehicles that left the network, recycled by type
+        self._controller_pool = ControllerPool()
+
         # contain the minGap attribute of each type of vehicle
         self.minGap = {}
 
-        # list of vehicle ids located in each edge in the network
-        self._ids_by_edge = dict()
+        # number of time steps for which departures and arrivals are stored
+        try:
+            max_rate_window = sim_params.max_rate_window
+        except AttributeError:
+            max_rate_window = 3600
+        window = int(np.ceil(max_rate_window / self.sim_step))
 
         # number of vehicles that entered the network for every time-step
-        self._num_departed = []
+        self._num_departed = WindowCounter(window)
         self._departed_ids = 0
 
         # number of vehicles to exit the network for every time-step
-        self._num_arrived = []
+        self._num_arrived = WindowCounter(window)
         self._arrived_ids = 0
-        self._arrived_rl_ids = []
+        self._arrived_rl_ids = collections.deque(maxlen=window)
 
         # whether or not to automatically color vehicles
         try:
@@ -85,8 +152,11 @@ class TraCIVehicle(KernelVehicle):
         except AttributeError:
             self._force_color_update = False
 
-        # old speeds used to compute accelerations
-        self.previous_speeds = {}
+        # whether to collect all subscription results in bulk
+        try:
+            self._bulk_subscriptions = sim_params.bulk_subscriptions
+        except AttributeError:
+            self._bulk_subscriptions = False
 
     def initialize(self, vehicles):
         """Initialize vehicle state information.
@@ -101,12 +171,18 @@ class TraCIVehicle(KernelVehicle):
             individual vehicles and their initial speeds
         """
         self.type_parameters = vehicles.type_parameters
+        self._controller_pool.clear()
         self.minGap = vehicles.minGap
         self.num_vehicles = 0
         self.num_rl_vehicles = 0
         self.num_not_departed = 0
 
         self.__vehicles.clear()
+        self.__colors.clear()
+        self.__state.clear()
+        self._lane_links = None
+        self._lane_order = None
+        self._stale_data = set(DERIVED_DATA)
         for typ in vehicles.initial:
             for i in range(typ['num_vehicles']):
                 veh_id = '{}_{}'.format(typ['veh_id'], i)
@@ -127,6 +203,9 @@ class TraCIVehicle(KernelVehicle):
           explicitly defined by flow, e.g. "num_arrived".
         * If vehicles exit the network, they are removed from the vehicles
           class, and newly departed vehicles are introduced to the class.
+        * Events that occurred since the last update (departures, arrivals,
+          edge changes, etc.) are published to the event bus of the kernel,
+          see flow/core/kernel/events.py.
 
         Parameters
         ----------
@@ -134,40 +213,52 @@ class TraCIVehicle(KernelVehicle):
             specifies whether the simulator was reset in the last simulation
             step
         """
-        # copy over the previous speeds
+        # store the previous locations and routes of the vehicles, if needed
+        # to detect events
+        prev_state = self._location_snapshot()
 
-        vehicle_obs = {}
-        for veh_id in self.__ids:
-            self.previous_speeds[veh_id] = self.get_speed(veh_id)
-            vehicle_obs[veh_id] = \
-                self.kernel_api.vehicle.getSubscriptionResults(veh_id)
+        # copy over the previous speeds
+        self.__state.columns['previous_speed'][:] = \
+            self.__state.columns['speed']
+
+        if self._bulk_subscriptions:
+            # the results of all vehicles were received with the last
+            # simulation step, so no additional calls are needed
+            all_obs = self.kernel_api.vehicle.getAllSubscriptionResults()
+            vehicle_obs = {veh_id: all_obs.get(veh_id, {})
+                           for veh_id in self.__ids}
+        else:
+            vehicle_obs = {}
+            for veh_id in self.__ids:
+                vehicle_obs[veh_id] = \
+                    self.kernel_api.vehicle.getSubscriptionResults(veh_id)
         sim_obs = self.kernel_api.simulation.getSubscriptionResults()
 
         arrived_rl_ids = []
         # remove exiting vehicles from the vehicles class
         for veh_id in sim_obs[tc.VAR_ARRIVED_VEHICLES_IDS]:
-            if veh_id in self.get_rl_ids():
+            if veh_id in self.__rl_ids:
                 arrived_rl_ids.append(veh_id)
-            if veh_id in sim_obs[tc.VAR_TELEPORT_STARTING_VEHICLES_IDS]:
-                # this is meant to resolve the KeyError bug when there are
-                # collisions
-                vehicle_obs[veh_id] = self.__sumo_obs[veh_id]
             self.remove(veh_id)
-            # remove exiting vehicles from the vehicle subscription if they
-            # haven't been removed already
-            if vehicle_obs[veh_id] is None:
-                vehicle_obs.pop(veh_id, None)
+            # remove exiting vehicles from the vehicle subscription results
+            vehicle_obs.pop(veh_id, None)
         self._arrived_rl_ids.append(arrived_rl_ids)
 
         # add entering vehicles into the vehicles class
         for veh_id in sim_obs[tc.VAR_DEPARTED_VEHICLES_IDS]:
-            if veh_id in self.get_ids() and vehicle_obs[veh_id] is not None:
+            if veh_id in self.__ids and vehicle_obs.get(veh_id) is not None:
                 # this occurs when a vehicle is actively being removed and
                 # placed again in the network to ensure a constant number of
                 # total vehicles (e.g. TrafficLightGridEnv). In this case, the vehicle
                 # is already in the class; its state data just needs to be
                 # updated
                 pass
+            elif self._bulk_subscriptions:
+                # the type and initial state of the vehicle are returned
+                # along with its first subscription results
+                obs = self._subscribe(veh_id)
+                vehicle_obs[veh_id] = self._add_departed(
+                    veh_id, obs[tc.VAR_TYPE], obs)
             else:
                 veh_type = self.kernel_api.vehicle.getTypeID(veh_id)
                 obs = self._add_departed(veh_id, veh_type)
@@ -210,60 +301,207 @@ class TraCIVehicle(KernelVehicle):
                 if vehicle_obs[veh_id][tc.VAR_LANE_INDEX] != prev_lane:
                     self.__vehicles[veh_id]["last_lc"] = self.time_counter
 
+            # vehicles of the inflows that are added via TraCI are not
+            # counted as loaded by sumo
+            num_loaded = sim_obs[tc.VAR_LOADED_VEHICLES_NUMBER]
+            if self.master_kernel.inflows is not None:
+                num_loaded += self.master_kernel.inflows.num_step_added
+
             # updated the list of departed and arrived vehicles
-            self._num_departed.append(sim_obs[tc.VAR_LOADED_VEHICLES_NUMBER])
+            self._num_departed.append(num_loaded)
             self._num_arrived.append(sim_obs[tc.VAR_ARRIVED_VEHICLES_NUMBER])
             self._departed_ids = sim_obs[tc.VAR_DEPARTED_VEHICLES_IDS]
             self._arrived_ids = sim_obs[tc.VAR_ARRIVED_VEHICLES_IDS]
 
             # update the number of not departed vehicles
-            self.num_not_departed += sim_obs[tc.VAR_LOADED_VEHICLES_NUMBER] - \
+            self.num_not_departed += num_loaded - \
                 sim_obs[tc.VAR_DEPARTED_VEHICLES_NUMBER]
 
-        # update the "headway", "leader", and "follower" variables
-        for veh_id in self.__ids:
-            try:
-                _position = vehicle_obs.get(veh_id, {}).get(
-                    tc.VAR_POSITION, -1001)
-                _angle = vehicle_obs.get(veh_id, {}).get(tc.VAR_ANGLE, -1001)
-                _time_step = sim_obs[tc.VAR_TIME_STEP]
-                _time_delta = sim_obs[tc.VAR_DELTA_T]
-                self.__vehicles[veh_id]["orientation"] = \
-                    list(_position) + [_angle]
-                self.__vehicles[veh_id]["timestep"] = _time_step
-                self.__vehicles[veh_id]["timedelta"] = _time_delta
-            except TypeError:
-                print(traceback.format_exc())
-            headway = vehicle_obs.get(veh_id, {}).get(tc.VAR_LEADER, None)
-            # check for a collided vehicle or a vehicle with no leader
-            if headway is None:
-                self.__vehicles[veh_id]["leader"] = None
-                self.__vehicles[veh_id]["follower"] = None
-                self.__vehicles[veh_id]["headway"] = 1e+3
-                self.__vehicles[veh_id]["follower_headway"] = 1e+3
-            else:
-                min_gap = self.minGap[self.get_type(veh_id)]
-                self.__vehicles[veh_id]["headway"] = headway[1] + min_gap
-                self.__vehicles[veh_id]["leader"] = headway[0]
-                if headway[0] in self.__vehicles:
-                    leader = self.__vehicles[headway[0]]
-                    # if veh_id is closer from leader than another follower
-                    # (in case followers are in different converging edges)
-                    if ("follower_headway" not in leader or
-                            headway[1] + min_gap < leader["follower_headway"]):
-                        leader["follower"] = veh_id
-                        leader["follower_headway"] = headway[1] + min_gap
-
-        # update the sumo observations variable
-        self.__sumo_obs = vehicle_obs.copy()
-
-        # update the lane leaders data for each vehicle
-        self._multi_lane_headways()
+        self._timestep = sim_obs[tc.VAR_TIME_STEP]
+        self._timedelta = sim_obs[tc.VAR_DELTA_T]
+
+        # update the state store with the new subscription results
+        self._update_state(vehicle_obs)
+
+        # publish the events that occurred since the last update
+        self._publish_events(sim_obs, prev_state)
+
+        # the lane leaders data for each vehicle is updated when first needed
+        self._stale_data = set(DERIVED_DATA)
+        if 'lane_data' in self._eager_data:
+            self._multi_lane_headways()
+        elif 'lane_order' in self._eager_data:
+            self._update_lane_order()
+
+    def _update_state(self, vehicle_obs):
+        """Copy the subscription results of all vehicles into the state store.
 
-        # make sure the rl vehicle list is still sorted
-        self.__rl_ids.sort()
+        This also updates the "headway", "leader", "follower", and
+        "follower_headway" columns of all vehicles.
 
-    def _add_departed(self, veh_id, veh_type):
+        Parameters
+        ----------
+        vehicle_obs : dict < str, dict >
+            subscription results of every vehicle in the network
+        """
+        state = self.__state
+        cols = state.columns
+        nan = np.nan
+
+        ids = [veh_id for veh_id in self.__ids
+               if vehicle_obs.get(veh_id) is not None]
+        obs = [vehicle_obs[veh_id] for veh_id in ids]
+        slots = state.slots(ids)
+
+        cols['speed'][slots] = [o.get(tc.VAR_SPEED, nan) for o in obs]
+        cols['default_speed'][slots] = [
+            o.get(tc.VAR_SPEED_WITHOUT_TRACI, nan) for o in obs]
+        cols['position'][slots] = [
+            o.get(tc.VAR_LANEPOSITION, nan) for o in obs]
+        cols['lane'][slots] = [o.get(tc.VAR_LANE_INDEX, -1) for o in obs]
+        cols['edge'][slots] = [
+            state.edge_index(o.get(tc.VAR_ROAD_ID, '')) for o in obs]
+        cols['angle'][slots] = [o.get(tc.VAR_ANGLE, nan) for o in obs]
+        cols['fuel'][slots] = [
+            o.get(tc.VAR_FUELCONSUMPTION, nan) for o in obs]
+        cols['distance'][slots] = [o.get(tc.VAR_DISTANCE, nan) for o in obs]
+        xy = [o.get(tc.VAR_POSITION, (nan, nan)) for o in obs]
+        cols['x'][slots] = [pos[0] for pos in xy]
+        cols['y'][slots] = [pos[1] for pos in xy]
+        for slot, o in zip(slots, obs):
+            cols['route'][slot] = o.get(tc.VAR_EDGES)
+
+        # check for a collided vehicle or a vehicle with no leader
+        leaders = [o.get(tc.VAR_LEADER) for o in obs]
+        leader_slots = np.array(
+            [NO_VEHICLE if lead is None else state.slot(lead[0])
+             for lead in leaders], dtype=np.int64)
+        headways = np.array(
+            [1e+3 if lead is None else lead[1] for lead in leaders],
+            dtype=np.float64)
+        has_leader = np.array([lead is not None for lead in leaders],
+                              dtype=bool)
+        headways[has_leader] += cols['min_gap'][slots[has_leader]]
+        cols['leader'][slots] = leader_slots
+        cols['headway'][slots] = headways
+
+        # the follower of a vehicle is the closest vehicle that has it as a
+        # leader (in case followers are in different converging edges)
+        cols['follower'][slots] = NO_VEHICLE
+        cols['follower_headway'][slots] = 1e+3
+        valid = leader_slots >= 0
+        follower_slots = slots[valid]
+        leader_slots = leader_slots[valid]
+        headways = headways[valid]
+        order = np.lexsort((headways, leader_slots))
+        closest = np.ones(len(order), dtype=bool)
+        closest[1:] = leader_slots[order][1:] != leader_slots[order][:-1]
+        order = order[closest]
+        cols['follower'][leader_slots[order]] = follower_slots[order]
+        cols['follower_headway'][leader_slots[order]] = headways[order]
+
+    def _location_snapshot(self):
+        """Return a copy of the edge, lane, and route columns of the store.
+
+        None is returned if there are no handlers for the events that are
+        detected by comparing the location of vehicles across updates.
+        """
+        bus = self.master_kernel.events
+        if bus is None or not any(bus.has_handlers(event) for event in (
+                events.EDGE_CHANGED, events.LANE_CHANGED,
+                events.REACHED_LAST_EDGE)):
+            return None
+        cols = self.__state.columns
+        return {field: cols[field].copy() for field in ('edge', 'lane',
+                                                        'route')}
+
+    def _publish_events(self, sim_obs, prev_state):
+        """Publish the events that occurred since the last update.
+
+        Parameters
+        ----------
+        sim_obs : dict
+            simulation subscription results of the current step
+        prev_state : dict < str, np.ndarray > or None
+            edge, lane, and route columns of the store in the previous
+            update, see `_location_snapshot`
+        """
+        bus = self.master_kernel.events
+        if bus is None:
+            return
+
+        departed = [veh_id for veh_id in
+                    sim_obs[tc.VAR_DEPARTED_VEHICLES_IDS]
+                    if veh_id in self.__ids]
+        bus.publish(events.ARRIVED, sim_obs[tc.VAR_ARRIVED_VEHICLES_IDS])
+        bus.publish(events.DEPARTED, departed)
+        bus.publish(events.TELEPORTED,
+                    sim_obs[tc.VAR_TELEPORT_STARTING_VEHICLES_IDS])
+
+        if prev_state is None:
+            return
+
+        state = self.__state
+        cols = state.columns
+        ids = self.__ids.snapshot()
+        slots = state.slots(ids)
+
+        # new vehicles may occupy the slots of the vehicles that left, or
+        # slots that were added to the store since the previous update, so
+        # they are not compared with the previous state of their slot
+        num_prev = len(prev_state['edge'])
+        new = np.isin(slots, state.slots(departed)) | (slots >= num_prev)
+        prev_slots = np.minimum(slots, num_prev - 1)
+
+        edges = cols['edge'][slots]
+        edge_changed = (edges != prev_state['edge'][prev_slots]) & ~new
+        lane_changed = \
+            (cols['lane'][slots] != prev_state['lane'][prev_slots]) & \
+            ~edge_changed & ~new
+        route_changed = np.asarray(
+            cols['route'][slots] != prev_state['route'][prev_slots],
+            dtype=bool)
+
+        bus.publish(events.EDGE_CHANGED,
+                    [ids[i] for i in np.flatnonzero(edge_changed)])
+        bus.publish(events.LANE_CHANGED,
+                    [ids[i] for i in np.flatnonzero(lane_changed)])
+
+        if bus.has_handlers(events.REACHED_LAST_EDGE):
+            reached = []
+            for i in np.flatnonzero(edge_changed | route_changed | new):
+                route = cols['route'][slots[i]]
+                if route and edges[i] >= 0 and \
+                        state.edge_names[edges[i]] == route[-1]:
+                    reached.append(ids[i])
+            bus.publish(events.REACHED_LAST_EDGE, reached)
+
+    def _subscribe(self, veh_id):
+        """Subscribe a vehicle to all variables needed by the kernel.
+
+        This is used when collecting subscription results in bulk. A single
+        subscription covers the variables collected every step, the leader
+        of the vehicle, and the type and length of the vehicle (which would
+        otherwise require separate calls).
+
+        Parameters
+        ----------
+        veh_id: str
+            name of the vehicle
+
+        Returns
+        -------
+        dict
+            subscription results from the new vehicle
+        """
+        self.kernel_api.vehicle.subscribe(
+            veh_id,
+            SUBSCRIPTION_VARS + (tc.VAR_TYPE, tc.VAR_LENGTH, tc.VAR_LEADER),
+            parameters={tc.VAR_LEADER: ("d", LEADER_DIST)})
+        # the results are received along with the subscription
+        return self.kernel_api.vehicle.getSubscriptionResults(veh_id)
+
+    def _add_departed(self, veh_id, veh_type, obs=None):
         """Add a vehicle that entered the network from an inflow or reset.
 
         Parameters
@@ -272,6 +510,10 @@ class TraCIVehicle(KernelVehicle):
             name of the vehicle
         veh_type: str
             type of vehicle, as specified to sumo
+        obs: dict, optional
+            subscription results of the vehicle, if it has already been
+            subscribed via `_subscribe`. Otherwise, the vehicle is subscribed
+            and its initial state is collected from sumo.
 
         Returns
         -------
@@ -281,8 +523,8 @@ class TraCIVehicle(KernelVehicle):
         if veh_type not in self.type_parameters:
             raise KeyError("Entering vehicle is not a valid type.")
 
-        if veh_id not in self.__ids:
-            self.__ids.append(veh_id)
+        self.__ids.add(veh_id)
+        self.__state.add(veh_id)
         if veh_id not in self.__vehicles:
             self.num_vehicles += 1
             self.__vehicles[veh_id] = dict()
@@ -290,60 +532,42 @@ class TraCIVehicle(KernelVehicle):
         # specify the type
         self.__vehicles[veh_id]["type"] = veh_type
 
-        car_following_params = \
-            self.type_parameters[veh_type]["car_following_params"]
+        # specify the acceleration, lane-changing, and routing controllers,
+        # recycling those of vehicles of the same type that left the network
+        acc_controller, lane_changer, router = self._controller_pool.acquire(
+            veh_type, veh_id, self.type_parameters[veh_type])
+        self.__vehicles[veh_id]["acc_controller"] = acc_controller
+        self.__vehicles[veh_id]["lane_changer"] = lane_changer
+        self.__vehicles[veh_id]["router"] = router
 
-        # specify the acceleration controller class
         accel_controller = \
             self.type_parameters[veh_type]["acceleration_controller"]
-        self.__vehicles[veh_id]["acc_controller"] = \
-            accel_controller[0](veh_id,
-                                car_following_params=car_following_params,
-                                **accel_controller[1])
-
-        # specify the lane-changing controller class
         lc_controller = \
             self.type_parameters[veh_type]["lane_change_controller"]
-        self.__vehicles[veh_id]["lane_changer"] = \
-            lc_controller[0](veh_id=veh_id, **lc_controller[1])
-
-        # specify the routing controller class
-        rt_controller = self.type_parameters[veh_type]["routing_controller"]
-        if rt_controller is not None:
-            self.__vehicles[veh_id]["router"] = \
-                rt_controller[0](veh_id=veh_id, router_params=rt_controller[1])
-        else:
-            self.__vehicles[veh_id]["router"] = None
 
         # add the vehicle's id to the list of vehicle ids
         if accel_controller[0] == RLController:
-            if veh_id not in self.__rl_ids:
-                self.__rl_ids.append(veh_id)
+            self.__rl_ids.add(veh_id)
         else:
             if veh_id not in self.__human_ids:
-                self.__human_ids.append(veh_id)
+                self.__human_ids.add(veh_id)
                 if accel_controller[0] != SimCarFollowingController:
-                    self.__controlled_ids.append(veh_id)
+                    self.__controlled_ids.add(veh_id)
                 if lc_controller[0] != SimLaneChangeController:
-                    self.__controlled_lc_ids.append(veh_id)
+                    self.__controlled_lc_ids.add(veh_id)
 
         # subscribe the new vehicle
-        self.kernel_api.vehicle.subscribe(veh_id, [
-            tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
-            tc.VAR_ROAD_ID,
-            tc.VAR_SPEED,
-            tc.VAR_EDGES,
-            tc.VAR_POSITION,
-            tc.VAR_ANGLE,
-            tc.VAR_SPEED_WITHOUT_TRACI,
-            tc.VAR_FUELCONSUMPTION,
-            tc.VAR_DISTANCE
-        ])
-        self.kernel_api.vehicle.subscribeLeader(veh_id, 2000)
+        if obs is None:
+            self.kernel_api.vehicle.subscribe(veh_id, list(SUBSCRIPTION_VARS))
+            self.kernel_api.vehicle.subscribeLeader(veh_id, LEADER_DIST)
 
         # some constant vehicle parameters to the vehicles class
-        self.__vehicles[veh_id]["length"] = self.kernel_api.vehicle.getLength(
-            veh_id)
+        if obs is None:
+            length = self.kernel_api.vehicle.getLength(veh_id)
+        else:
+            length = obs[tc.VAR_LENGTH]
+        self.__state.set('length', veh_id, length)
+        self.__state.set('min_gap', veh_id, self.minGap[veh_type])
 
         # set the "last_lc" parameter of the vehicle
         self.__vehicles[veh_id]["last_lc"] = -float("inf")
@@ -352,41 +576,126 @@ class TraCIVehicle(KernelVehicle):
         self.__vehicles[veh_id]["initial_speed"] = \
             self.type_parameters[veh_type]["initial_speed"]
 
-        # set the speed mode for the vehicle
-        speed_mode = self.type_parameters[veh_type][
-            "car_following_params"].speed_mode
-        self.kernel_api.vehicle.setSpeedMode(veh_id, speed_mode)
-
-        # set the lane changing mode for the vehicle
-        lc_mode = self.type_parameters[veh_type][
-            "lane_change_params"].lane_change_mode
-        self.kernel_api.vehicle.setLaneChangeMode(veh_id, lc_mode)
+        # set the speed and lane changing modes for the vehicle
+        self._set_modes(veh_id, veh_type)
 
         # get initial state info
-        self.__sumo_obs[veh_id] = dict()
-        self.__sumo_obs[veh_id][tc.VAR_ROAD_ID] = \
-            self.kernel_api.vehicle.getRoadID(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_LANEPOSITION] = \
-            self.kernel_api.vehicle.getLanePosition(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_LANE_INDEX] = \
-            self.kernel_api.vehicle.getLaneIndex(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_SPEED] = \
-            self.kernel_api.vehicle.getSpeed(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_FUELCONSUMPTION] = \
-            self.kernel_api.vehicle.getFuelConsumption(veh_id)
-
-        # make sure that the order of rl_ids is kept sorted
-        self.__rl_ids.sort()
+        if obs is None:
+            self.__state.set('edge', veh_id, self.__state.edge_index(
+                self.kernel_api.vehicle.getRoadID(veh_id)))
+            self.__state.set('position', veh_id,
+                             self.kernel_api.vehicle.getLanePosition(veh_id))
+            self.__state.set('lane', veh_id,
+                             self.kernel_api.vehicle.getLaneIndex(veh_id))
+            self.__state.set('speed', veh_id,
+                             self.kernel_api.vehicle.getSpeed(veh_id))
+            self.__state.set(
+                'fuel', veh_id,
+                self.kernel_api.vehicle.getFuelConsumption(veh_id))
+        else:
+            self.__state.set('edge', veh_id,
+                             self.__state.edge_index(obs[tc.VAR_ROAD_ID]))
+            self.__state.set('position', veh_id, obs[tc.VAR_LANEPOSITION])
+            self.__state.set('lane', veh_id, obs[tc.VAR_LANE_INDEX])
+            self.__state.set('speed', veh_id, obs[tc.VAR_SPEED])
+            self.__state.set('fuel', veh_id, obs[tc.VAR_FUELCONSUMPTION])
+
         self.num_rl_vehicles = len(self.__rl_ids)
 
         # get the subscription results from the new vehicle
-        new_obs = self.kernel_api.vehicle.getSubscriptionResults(veh_id)
+        if obs is None:
+            obs = self.kernel_api.vehicle.getSubscriptionResults(veh_id)
+
+        return obs
 
-        return new_obs
+    def _set_modes(self, veh_id, veh_type):
+        """Set the speed mode and lane changing mode of a vehicle in sumo.
+
+        The modes are queued in the command buffer, and sent to sumo along
+        with the next simulation step (before any action of the step).
+
+        Parameters
+        ----------
+        veh_id: str
+            name of the vehicle
+        veh_type: str
+            type of vehicle, as specified to sumo
+        """
+        commands = self.master_kernel.command_buffer
+        speed_mode = self.type_parameters[veh_type][
+            "car_following_params"].speed_mode
+        commands.add('vehicle', 'setSpeedMode', veh_id, speed_mode)
+
+        lc_mode = self.type_parameters[veh_type][
+            "lane_change_params"].lane_change_mode
+        commands.add('vehicle', 'setLaneChangeMode', veh_id, lc_mode)
 
     def reset(self):
         """See parent class."""
-        self.previous_speeds = {}
+        self.__state.columns['previous_speed'][:] = np.nan
+
+    def save_state(self):
+        """See parent class.
+
+        All attributes of the kernel that change over the course of a
+        simulation (ids, state store, counters, etc.) are copied. The
+        parameters of the vehicle types and the connection to sumo are shared
+        by the kernel and the snapshot. The controllers of the vehicles are
+        not part of the snapshot, see `load_state`.
+        """
+        memo = self._shared_memo()
+        for vehicle in self.__vehicles.values():
+            for key in CONTROLLER_KEYS:
+                memo[id(vehicle.get(key))] = None
+
+        return deepcopy({name: value for name, value in self.__dict__.items()
+                         if name not in SHARED_ATTRIBUTES}, memo)
+
+    def load_state(self, snapshot):
+        """See parent class.
+
+        The controllers of the current vehicles are returned to the controller
+        pool, and the restored vehicles are assigned newly reset controllers,
+        as they are when they depart. The vehicles are also subscribed again
+        and their speed and lane changing modes are set again, as sumo does
+        not retain them when a state is loaded. A departure event is then
+        published for all vehicles.
+        """
+        for vehicle in self.__vehicles.values():
+            if "acc_controller" in vehicle:
+                self._controller_pool.release(vehicle["type"], tuple(
+                    vehicle[key] for key in CONTROLLER_KEYS))
+
+        self.__dict__.update(deepcopy(snapshot, self._shared_memo()))
+
+        for veh_id, vehicle in self.__vehicles.items():
+            if "acc_controller" in vehicle:
+                controllers = self._controller_pool.acquire(
+                    vehicle["type"], veh_id,
+                    self.type_parameters[vehicle["type"]])
+                vehicle.update(zip(CONTROLLER_KEYS, controllers))
+
+        for veh_id in self.__ids:
+            if self._bulk_subscriptions:
+                self._subscribe(veh_id)
+            else:
+                self.kernel_api.vehicle.subscribe(
+                    veh_id, list(SUBSCRIPTION_VARS))
+                self.kernel_api.vehicle.subscribeLeader(veh_id, LEADER_DIST)
+
+            # the modes are sent to sumo along with the next simulation step
+            self._set_modes(veh_id, self.__vehicles[veh_id]["type"])
+
+        self._publish_events({
+            tc.VAR_ARRIVED_VEHICLES_IDS: (),
+            tc.VAR_DEPARTED_VEHICLES_IDS: self.__ids.snapshot(),
+            tc.VAR_TELEPORT_STARTING_VEHICLES_IDS: (),
+        }, None)
+
+    def _shared_memo(self):
+        """Return a deepcopy memo that does not copy the shared attributes."""
+        return {id(self.__dict__[name]): self.__dict__[name]
+                for name in SHARED_ATTRIBUTES if name in self.__dict__}
 
     def remove(self, veh_id):
         """See parent class."""
@@ -395,59 +704,73 @@ class TraCIVehicle(KernelVehicle):
             self.kernel_api.vehicle.unsubscribe(veh_id)
             self.kernel_api.vehicle.remove(veh_id)
 
-        if veh_id in self.__ids:
-            self.__ids.remove(veh_id)
+        self.__ids.discard(veh_id)
 
-        # remove from the vehicles kernel
+        # drop any commands that have not been sent for the vehicle
+        self.master_kernel.command_buffer.discard(veh_id)
+
+        # remove from the vehicles kernel, and recycle its controllers
         if veh_id in self.__vehicles:
-            del self.__vehicles[veh_id]
+            vehicle = self.__vehicles.pop(veh_id)
+            if "acc_controller" in vehicle:
+                self._controller_pool.release(vehicle["type"], (
+                    vehicle["acc_controller"], vehicle["lane_changer"],
+                    vehicle["router"]))
+        self.__colors.pop(veh_id, None)
 
-        if veh_id in self.__sumo_obs:
-            del self.__sumo_obs[veh_id]
+        self.__state.remove(veh_id)
 
         # remove it from all other id lists (if it is there)
-        if veh_id in self.__human_ids:
-            self.__human_ids.remove(veh_id)
-            if veh_id in self.__controlled_ids:
-                self.__controlled_ids.remove(veh_id)
-            if veh_id in self.__controlled_lc_ids:
-                self.__controlled_lc_ids.remove(veh_id)
-        elif veh_id in self.__rl_ids:
-            self.__rl_ids.remove(veh_id)
-            # make sure that the rl ids remain sorted
-            self.__rl_ids.sort()
+        self.__human_ids.discard(veh_id)
+        self.__controlled_ids.discard(veh_id)
+        self.__controlled_lc_ids.discard(veh_id)
+        self.__rl_ids.discard(veh_id)
 
         # modify the number of vehicles and RL vehicles
-        self.num_vehicles = len(self.get_ids())
-        self.num_rl_vehicles = len(self.get_rl_ids())
+        self.num_vehicles = len(self.__ids)
+        self.num_rl_vehicles = len(self.__rl_ids)
 
     def test_set_speed(self, veh_id, speed):
         """Set the speed of the specified vehicle."""
-        self.__sumo_obs[veh_id][tc.VAR_SPEED] = speed
+        self.__state.set('speed', veh_id, speed)
 
     def test_set_edge(self, veh_id, edge):
         """Set the speed of the specified vehicle."""
-        self.__sumo_obs[veh_id][tc.VAR_ROAD_ID] = edge
+        self.__state.set('edge', veh_id, self.__state.edge_index(edge))
 
     def set_follower(self, veh_id, follower):
         """Set the follower of the specified vehicle."""
-        self.__vehicles[veh_id]["follower"] = follower
+        self.__state.set('follower', veh_id, self._to_slot(follower))
 
     def set_headway(self, veh_id, headway):
         """Set the headway of the specified vehicle."""
-        self.__vehicles[veh_id]["headway"] = headway
+        self.__state.set('headway', veh_id, headway)
+
+    def _to_slot(self, veh_id):
+        """Return the slot of a vehicle, or NO_VEHICLE for empty ids."""
+        if veh_id is None or veh_id == "":
+            return NO_VEHICLE
+        return self.__state.slot(veh_id)
+
+    def _from_slot(self, slot, error):
+        """Return the vehicle in a slot, None for NO_VEHICLE, else error."""
+        if slot == NO_VEHICLE:
+            return None
+        veh_id = self.__state.veh_id(slot)
+        return error if veh_id is None else veh_id
 
     def get_orientation(self, veh_id):
         """See parent class."""
-        return self.__vehicles[veh_id]["orientation"]
+        return [self.__state.get(field, veh_id, -1001)
+                for field in ('x', 'y', 'angle')]
 
     def get_timestep(self, veh_id):
         """See parent class."""
-        return self.__vehicles[veh_id]["timestep"]
+        return self._timestep
 
     def get_timedelta(self, veh_id):
         """See parent class."""
-        return self.__vehicles[veh_id]["timedelta"]
+        return self._timedelta
 
     def get_type(self, veh_id):
         """Return the type of the vehicle of veh_id."""
@@ -459,64 +782,115 @@ class TraCIVehicle(KernelVehicle):
 
     def get_ids(self):
         """See parent class."""
-        return self.__ids
+        return self.__ids.snapshot()
 
     def get_human_ids(self):
         """See parent class."""
-        return self.__human_ids
+        return self.__human_ids.snapshot()
 
     def get_controlled_ids(self):
         """See parent class."""
-        return self.__controlled_ids
+        return self.__controlled_ids.snapshot()
 
     def get_controlled_lc_ids(self):
         """See parent class."""
-        return self.__controlled_lc_ids
+        return self.__controlled_lc_ids.snapshot()
 
     def get_rl_ids(self):
         """See parent class."""
-        return self.__rl_ids
+        return self.__rl_ids.snapshot()
+
+    def is_rl(self, veh_id):
+        """See parent class."""
+        return veh_id in self.__rl_ids
 
     def set_observed(self, veh_id):
         """See parent class."""
-        if veh_id not in self.__observed_ids:
-            self.__observed_ids.append(veh_id)
+        self.__observed_ids.add(veh_id)
 
     def remove_observed(self, veh_id):
         """See parent class."""
-        if veh_id in self.__observed_ids:
-            self.__observed_ids.remove(veh_id)
+        self.__observed_ids.discard(veh_id)
 
     def get_observed_ids(self):
         """See parent class."""
-        return self.__observed_ids
+        return self.__observed_ids.snapshot()
 
     def get_ids_by_edge(self, edges):
-        """See parent class."""
+        """See parent class.
+
+        Vehicles are ordered by lane, and then by position.
+        """
         if isinstance(edges, (list, np.ndarray)):
             return sum([self.get_ids_by_edge(edge) for edge in edges], [])
-        return self._ids_by_edge.get(edges, []) or []
+        return self._get_lane_occupants(edges, None)
 
-    def get_inflow_rate(self, time_span):
+    def get_ids_by_lane(self, edge, lane):
         """See parent class."""
-        if len(self._num_departed) == 0:
-            return 0
-        num_inflow = self._num_departed[-int(time_span / self.sim_step):]
-        return 3600 * sum(num_inflow) / (len(num_inflow) * self.sim_step)
+        return self._get_lane_occupants(edge, lane)
+
+    def _get_lane_occupants(self, edge, lane):
+        """Return the vehicles on an edge (or one of its lanes) by position.
+
+        Parameters
+        ----------
+        edge : str
+            name of the edge
+        lane : int or None
+            lane index. If set to None, all lanes are considered
+
+        Returns
+        -------
+        list of str
+            vehicle ids. Vehicles that were removed since the last update are
+            not included
+        """
+        self._update_lane_order()
+        links = self._get_lane_links()
+        index = links['edges'].get(edge)
+        max_lanes = links['graph'].max_lanes
+        if index is None or (lane is not None and not 0 <= lane < max_lanes):
+            return []
+
+        if lane is None:
+            start = self._lane_order['lane_start'][index * max_lanes]
+            end = self._lane_order['lane_end'][(index + 1) * max_lanes - 1]
+        else:
+            start = self._lane_order['lane_start'][index * max_lanes + lane]
+            end = self._lane_order['lane_end'][index * max_lanes + lane]
+
+        veh_ids = self.__state.veh_ids(self._lane_order['slots'][start:end])
+        return [veh_id for veh_id in veh_ids if veh_id is not None]
+
+    def get_inflow_rate(self, time_span):
+        """See parent class.
+
+        Time spans longer than the `max_rate_window` attribute of the
+        simulation parameters are clipped to it.
+        """
+        return self._flow_rate(self._num_departed, time_span)
 
     def get_outflow_rate(self, time_span):
-        """See parent class."""
-        if len(self._num_arrived) == 0:
+        """See parent class.
+
+        Time spans longer than the `max_rate_window` attribute of the
+        simulation parameters are clipped to it.
+        """
+        return self._flow_rate(self._num_arrived, time_span)
+
+    def _flow_rate(self, counter, time_span):
+        """Return the rate (in veh/hr) of the counts over a time span."""
+        if len(counter) == 0:
             return 0
-        num_outflow = self._num_arrived[-int(time_span / self.sim_step):]
-        return 3600 * sum(num_outflow) / (len(num_outflow) * self.sim_step)
+        num_steps = int(time_span / self.sim_step)
+        # time spans shorter than a step are computed over all stored steps
+        if num_steps <= 0 or num_steps > len(counter):
+            num_steps = len(counter)
+        return 3600 * counter.sum(num_steps) / (num_steps * self.sim_step)
 
     def get_num_arrived(self):
         """See parent class."""
-        if len(self._num_arrived) > 0:
-            return self._num_arrived[-1]
-        else:
-            return 0
+        return self._num_arrived.last()
 
     def get_arrived_ids(self):
         """See parent class."""
@@ -526,8 +900,8 @@ class TraCIVehicle(KernelVehicle):
         """See parent class."""
         if len(self._arrived_rl_ids) > 0:
             arrived = []
-            for arr in self._arrived_rl_ids[-k:]:
-                arrived.extend(arr)
+            for i in range(min(k, len(self._arrived_rl_ids)), 0, -1):
+                arrived.extend(self._arrived_rl_ids[-i])
             return arrived
         else:
             return 0
@@ -545,44 +919,78 @@ class TraCIVehicle(KernelVehicle):
         ml_to_gallons = 0.000264172
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_fuel_consumption(vehID, error) for vehID in veh_id]
-        return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_FUELCONSUMPTION, error) * ml_to_gallons
+        return self.__state.get('fuel', veh_id, error) * ml_to_gallons
 
     def get_previous_speed(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_previous_speed(vehID, error) for vehID in veh_id]
-        return self.previous_speeds.get(veh_id, 0)
+        return self.__state.get('previous_speed', veh_id, 0)
 
     def get_speed(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_speed(vehID, error) for vehID in veh_id]
-        return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_SPEED, error)
+        return self.__state.get('speed', veh_id, error)
+
+    def get_speeds(self, ids=None, error=-1001):
+        """See parent class."""
+        return self.get_state_matrix(ids, ('speed',), error)[:, 0]
+
+    def get_state_matrix(self, ids=None, fields=('speed', 'position'),
+                         error=-1001):
+        """See parent class.
+
+        Supported fields are "speed", "default_speed", "previous_speed",
+        "position", "lane", "x", "y", "angle", "headway", "follower_headway",
+        "fuel" (in ml/s), "distance", "length", and the accelerations
+        requested by the controllers ("accel", "accel_failsafe",
+        "accel_noise", and "accel_noise_failsafe", see `get_accel`).
+        """
+        if ids is None:
+            ids = self.get_ids()
+        slots = self.__state.slots(ids)
+        missing = slots < 0
+
+        matrix = np.empty((len(slots), len(fields)), dtype=np.float64)
+        for j, field in enumerate(fields):
+            if field not in STATE_MATRIX_FIELDS:
+                raise ValueError('Unsupported state field: {}'.format(field))
+            column = self.__state.column(field)[slots]
+            if field == 'lane':
+                column = np.where(column < 0, np.nan, column)
+            matrix[:, j] = column
+
+        # slots of missing vehicles point to the last row of the columns, so
+        # they are masked as well
+        matrix[np.isnan(matrix) | missing[:, None]] = error
+
+        return matrix
 
     def get_default_speed(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_default_speed(vehID, error) for vehID in veh_id]
-        return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_SPEED_WITHOUT_TRACI,
-                                                   error)
+        return self.__state.get('default_speed', veh_id, error)
 
     def get_position(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_position(vehID, error) for vehID in veh_id]
-        return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_LANEPOSITION, error)
+        return self.__state.get('position', veh_id, error)
 
     def get_edge(self, veh_id, error=""):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_edge(vehID, error) for vehID in veh_id]
-        return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_ROAD_ID, error)
+        return self.__state.edge_name(
+            self.__state.get('edge', veh_id, -1), error)
 
     def get_lane(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane(vehID, error) for vehID in veh_id]
-        return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_LANE_INDEX, error)
+        return self.__state.get('lane', veh_id, error)
 
     def get_route(self, veh_id, error=None):
         """See parent class."""
@@ -590,43 +998,44 @@ class TraCIVehicle(KernelVehicle):
             error = list()
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_route(vehID, error) for vehID in veh_id]
-        return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_EDGES, error)
+        return self.__state.get('route', veh_id, error)
 
     def get_length(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_length(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("length", error)
+        return self.__state.get('length', veh_id, error)
 
     def get_leader(self, veh_id, error=""):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_leader(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("leader", error)
+        return self._from_slot(self.__state.get('leader', veh_id, -1), error)
 
     def get_follower(self, veh_id, error=""):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_follower(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("follower", error)
+        return self._from_slot(
+            self.__state.get('follower', veh_id, -1), error)
 
     def get_headway(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_headway(vehID, error) for vehID in veh_id]
-        return self.__vehicles.get(veh_id, {}).get("headway", error)
+        return self.__state.get('headway', veh_id, error)
 
     def get_last_lc(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_headway(vehID, error) for vehID in veh_id]
+            return [self.get_last_lc(vehID, error) for vehID in veh_id]
 
         if veh_id not in self.__rl_ids:
             warnings.warn('Vehicle {} is not RL vehicle, "last_lc" term set to'
                           ' {}.'.format(veh_id, error))
             return error
         else:
-            return self.__vehicles.get(veh_id, {}).get("headway", error)
+            return self.__vehicles.get(veh_id, {}).get("last_lc", error)
 
     def get_acc_controller(self, veh_id, error=None):
         """See parent class."""
@@ -653,10 +1062,12 @@ class TraCIVehicle(KernelVehicle):
 
     def set_lane_headways(self, veh_id, lane_headways):
         """Set the lane headways of the specified vehicle."""
+        self._multi_lane_headways()
         self.__vehicles[veh_id]["lane_headways"] = lane_headways
 
     def get_lane_headways(self, veh_id, error=None):
         """See parent class."""
+        self._multi_lane_headways()
         if error is None:
             error = list()
         if isinstance(veh_id, (list, np.ndarray)):
@@ -677,10 +1088,12 @@ class TraCIVehicle(KernelVehicle):
 
     def set_lane_leaders(self, veh_id, lane_leaders):
         """Set the lane leaders of the specified vehicle."""
+        self._multi_lane_headways()
         self.__vehicles[veh_id]["lane_leaders"] = lane_leaders
 
     def get_lane_leaders(self, veh_id, error=None):
         """See parent class."""
+        self._multi_lane_headways()
         if error is None:
             error = list()
         if isinstance(veh_id, (list, np.ndarray)):
@@ -689,10 +1102,12 @@ class TraCIVehicle(KernelVehicle):
 
     def set_lane_tailways(self, veh_id, lane_tailways):
         """Set the lane tailways of the specified vehicle."""
+        self._multi_lane_headways()
         self.__vehicles[veh_id]["lane_tailways"] = lane_tailways
 
     def get_lane_tailways(self, veh_id, error=None):
         """See parent class."""
+        self._multi_lane_headways()
         if error is None:
             error = list()
         if isinstance(veh_id, (list, np.ndarray)):
@@ -701,257 +1116,276 @@ class TraCIVehicle(KernelVehicle):
 
     def set_lane_followers(self, veh_id, lane_followers):
         """Set the lane followers of the specified vehicle."""
+        self._multi_lane_headways()
         self.__vehicles[veh_id]["lane_followers"] = lane_followers
 
     def get_lane_followers(self, veh_id, error=None):
         """See parent class."""
+        self._multi_lane_headways()
         if error is None:
             error = list()
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_lane_followers(vehID, error) for vehID in veh_id]
         return self.__vehicles.get(veh_id, {}).get("lane_followers", error)
 
-    def _multi_lane_headways(self):
-        """Compute multi-lane data for all vehicles.
-
-        This includes the lane leaders/followers/headways/tailways/
-        leader velocity/follower velocity for all
-        vehicles in the network.
-        """
-        edge_list = self.master_kernel.network.get_edge_list()
-        junction_list = self.master_kernel.network.get_junction_list()
-        tot_list = edge_list + junction_list
-        num_edges = (len(self.master_kernel.network.get_edge_list()) + len(
-            self.master_kernel.network.get_junction_list()))
-
-        # maximum number of lanes in the network
-        max_lanes = max([self.master_kernel.network.num_lanes(edge_id)
-                         for edge_id in tot_list])
-
-        # Key = edge id
-        # Element = list, with the ith element containing tuples with the name
-        #           and position of all vehicles in lane i
-        edge_dict = dict.fromkeys(tot_list)
-
-        # add the vehicles to the edge_dict element
-        for veh_id in self.get_ids():
-            edge = self.get_edge(veh_id)
-            lane = self.get_lane(veh_id)
-            pos = self.get_position(veh_id)
-            if edge:
-                if edge_dict[edge] is None:
-                    edge_dict[edge] = [[] for _ in range(max_lanes)]
-                edge_dict[edge][lane].append((veh_id, pos))
-
-        # sort all lanes in each edge by position
-        for edge in tot_list:
-            if edge_dict[edge] is None:
-                del edge_dict[edge]
-            else:
-                for lane in range(max_lanes):
-                    edge_dict[edge][lane].sort(key=lambda x: x[1])
-
-        for veh_id in self.get_rl_ids():
-            # collect the lane leaders, followers, headways, and tailways for
-            # each vehicle
-            edge = self.get_edge(veh_id)
-            if edge:
-                headways, tailways, leaders, followers = \
-                    self._multi_lane_headways_util(veh_id, edge_dict,
-                                                   num_edges)
-
-                # add the above values to the vehicles class
-                self.set_lane_headways(veh_id, headways)
-                self.set_lane_tailways(veh_id, tailways)
-                self.set_lane_leaders(veh_id, leaders)
-                self.set_lane_followers(veh_id, followers)
-
-        self._ids_by_edge = dict().fromkeys(edge_list)
-
-        for edge_id in edge_dict:
-            edges = list(itertools.chain.from_iterable(edge_dict[edge_id]))
-            # check for edges with no vehicles
-            if len(edges) > 0:
-                edges, _ = zip(*edges)
-                self._ids_by_edge[edge_id] = list(edges)
-            else:
-                self._ids_by_edge[edge_id] = []
+    def set_eager_data(self, data):
+        """Specify the derived data to compute after every update.
 
-    def _multi_lane_headways_util(self, veh_id, edge_dict, num_edges):
-        """Compute multi-lane data for the specified vehicle.
+        All other derived data is only computed the first time it is accessed
+        after an update, and not at all if it is never accessed.
 
         Parameters
         ----------
-        veh_id : str
-            name of the vehicle
-        edge_dict : dict < list<tuple> >
-            Key = Edge name
-                Index = lane index
-                Element = list sorted by position of (vehicle id, position)
-
-        Returns
-        -------
-        headway : list<float>
-            Index = lane index
-            Element = headway at this lane
-        tailway : list<float>
-            Index = lane index
-            Element = tailway at this lane
-        lead_speed : list<str>
-            Index = lane index
-            Element = speed of leader at this lane
-        follow_speed : list<str>
-            Index = lane index
-            Element = speed of follower at this lane
-        leader : list<str>
-            Index = lane index
-            Element = leader at this lane
-        follower : list<str>
-            Index = lane index
-            Element = follower at this lane
-        """
-        this_pos = self.get_position(veh_id)
-        this_edge = self.get_edge(veh_id)
-        this_lane = self.get_lane(veh_id)
-        num_lanes = self.master_kernel.network.num_lanes(this_edge)
-
-        # set default values for all output values
-        headway = [1000] * num_lanes
-        tailway = [1000] * num_lanes
-        leader = [""] * num_lanes
-        follower = [""] * num_lanes
-
-        for lane in range(num_lanes):
-            # check the vehicle's current  edge for lane leaders and followers
-            if len(edge_dict[this_edge][lane]) > 0:
-                ids, positions = zip(*edge_dict[this_edge][lane])
-                ids = list(ids)
-                positions = list(positions)
-                index = bisect_left(positions, this_pos)
-
-                # if you are at the end or the front of the edge, the lane
-                # leader is in the edges in front of you
-                if (lane == this_lane and index < len(positions) - 1) \
-                        or (lane != this_lane and index < len(positions)):
-                    # check if the index does not correspond to the current
-                    # vehicle
-                    if ids[index] == veh_id:
-                        leader[lane] = ids[index + 1]
-                        headway[lane] = (positions[index + 1] - this_pos -
-                                         self.get_length(leader[lane]))
-                    else:
-                        leader[lane] = ids[index]
-                        headway[lane] = (positions[index] - this_pos
-                                         - self.get_length(leader[lane]))
-
-                # you are in the back of the queue, the lane follower is in the
-                # edges behind you
-                if index > 0:
-                    follower[lane] = ids[index - 1]
-                    tailway[lane] = (this_pos - positions[index - 1]
-                                     - self.get_length(veh_id))
-
-            # if lane leader not found, check next edges
-            if leader[lane] == "":
-                headway[lane], leader[lane] = self._next_edge_leaders(
-                    veh_id, edge_dict, lane, num_edges)
-
-            # if lane follower not found, check previous edges
-            if follower[lane] == "":
-                tailway[lane], follower[lane] = self._prev_edge_followers(
-                    veh_id, edge_dict, lane, num_edges)
-
-        return headway, tailway, leader, follower
-
-    def _next_edge_leaders(self, veh_id, edge_dict, lane, num_edges):
-        """Search for leaders in the next edge.
-
-        Looks to the edges/junctions in front of the vehicle's current edge
-        for potential leaders. This is currently done by only looking one
-        edge/junction forwards.
+        data : list of str
+            names of the derived data, see DERIVED_DATA
 
-        Returns
-        -------
-        headway : float
-            lane headway for the specified lane
-        leader : str
-            lane leader for the specified lane
+        Raises
+        ------
+        ValueError
+            if any of the names is not a valid type of derived data
         """
-        pos = self.get_position(veh_id)
-        edge = self.get_edge(veh_id)
+        data = set(data)
+        if not data.issubset(DERIVED_DATA):
+            raise ValueError("Unknown derived vehicle data: {}".format(
+                sorted(data.difference(DERIVED_DATA))))
+        self._eager_data = data
 
-        headway = 1000  # env.network.length
-        leader = ""
-        add_length = 0  # length increment in headway
-
-        for _ in range(num_edges):
-            # break if there are no edge/lane pairs behind the current one
-            if len(self.master_kernel.network.next_edge(edge, lane)) == 0:
-                break
-
-            add_length += self.master_kernel.network.edge_length(edge)
-            edge, lane = self.master_kernel.network.next_edge(edge, lane)[0]
-
-            try:
-                if len(edge_dict[edge][lane]) > 0:
-                    leader = edge_dict[edge][lane][0][0]
-                    headway = edge_dict[edge][lane][0][1] - pos + add_length \
-                        - self.get_length(leader)
-            except KeyError:
-                # current edge has no vehicles, so move on
-                # print(traceback.format_exc())
-                continue
+    def _multi_lane_headways(self):
+        """Compute multi-lane data for all RL vehicles, if out of date.
 
-            # stop if a lane follower is found
-            if leader != "":
-                break
+        This includes the lane leaders/followers/headways/tailways of all RL
+        vehicles in the network, and is done at most once per update. The lane
+        data of other vehicles can be computed on demand via
+        `compute_lane_data`.
+        """
+        if 'lane_data' in self._stale_data:
+            self._stale_data.discard('lane_data')
+            self.compute_lane_data(self.get_rl_ids())
 
-        return headway, leader
+    def _update_lane_order(self):
+        """Update the occupancy index of all lanes, if out of date."""
+        if 'lane_order' in self._stale_data:
+            self._stale_data.discard('lane_order')
+            self._lane_order = self._sort_by_lane(self._lane_order)
 
-    def _prev_edge_followers(self, veh_id, edge_dict, lane, num_edges):
-        """Search for followers in the previous edge.
+    def _get_lane_links(self):
+        """Return the lane graph of the network, and the lanes of the edges.
 
-        Looks to the edges/junctions behind the vehicle's current edge for
-        potential followers. This is currently done by only looking one
-        edge/junction backwards.
+        Lanes are identified by their index in the lane graph of the network
+        kernel (see flow.core.kernel.network.lane_graph.LaneGraph). The edges
+        of the state store are mapped to the edges of the graph the first time
+        this is needed.
 
         Returns
         -------
-        tailway : float
-            lane tailway for the specified lane
-        follower : str
-            lane follower for the specified lane
+        dict
+            * graph: lane graph of the network
+            * edges: index of every edge and junction in the lane graph
+            * edge_map: index in the lane graph of every edge of the state
+              store, or -1 if not in the network
         """
-        pos = self.get_position(veh_id)
-        edge = self.get_edge(veh_id)
+        if self._lane_links is not None:
+            return self._lane_links
+
+        graph = self.master_kernel.network.get_lane_graph()
+        # edges that are added to the state store later on are not part of
+        # the network, so all edges of the network are added to it beforehand
+        for edge in graph.edge_ids:
+            self.__state.edge_index(edge)
+        self._lane_links = {
+            'graph': graph,
+            'edges': graph.edge_ids,
+            'edge_map': np.array(
+                [graph.edge_ids.get(edge, -1)
+                 for edge in self.__state.edge_names], dtype=np.int64),
+        }
+
+        return self._lane_links
+
+    def _valid_lanes(self, slots):
+        """Return the lane index of vehicles, or -1 if not in a lane."""
+        links = self._get_lane_links()
+        graph, edge_map = links['graph'], links['edge_map']
+        edges = self.__state.columns['edge'][slots]
+        lanes = self.__state.columns['lane'][slots]
+        valid = (slots >= 0) & (edges >= 0) & (edges < len(edge_map))
+        edges = np.where(valid, edge_map[np.where(valid, edges, 0)], -1)
+        valid &= edges >= 0
+        valid[valid] = lanes[valid] < graph.num_lanes[edges[valid]]
+        valid &= lanes >= 0
+        return np.where(valid, edges * graph.max_lanes + lanes, -1)
+
+    def _sort_by_lane(self, prev_order=None):
+        """Sort all vehicles in the network by edge, lane, and position.
+
+        The sort starts from the ordering of the previous time step, which is
+        updated incrementally with the vehicles that departed or arrived since
+        then. Since few vehicles change lanes or overtake each other in a
+        single time step, the input is nearly sorted, and the (stable) sort
+        runs in close to linear time. Vehicles with equal positions remain in
+        the order they were previously in, or that of `get_ids` if new.
 
-        tailway = 1000  # env.network.length
-        follower = ""
-        add_length = 0  # length increment in headway
-
-        for _ in range(num_edges):
-            # break if there are no edge/lane pairs behind the current one
-            if len(self.master_kernel.network.prev_edge(edge, lane)) == 0:
-                break
-
-            edge, lane = self.master_kernel.network.prev_edge(edge, lane)[0]
-            add_length += self.master_kernel.network.edge_length(edge)
-
-            try:
-                if len(edge_dict[edge][lane]) > 0:
-                    tailway = pos - edge_dict[edge][lane][-1][1] + add_length \
-                              - self.get_length(veh_id)
-                    follower = edge_dict[edge][lane][-1][0]
-            except KeyError:
-                # current edge has no vehicles, so move on
-                # print(traceback.format_exc())
-                continue
+        Parameters
+        ----------
+        prev_order : dict or None
+            the output of this method in the previous time step, if any
 
-            # stop if a lane follower is found
-            if follower != "":
-                break
+        Returns
+        -------
+        dict
+            * slots: slots of the vehicles, sorted by lane and position
+            * positions: positions of the sorted vehicles
+            * keys: key used to locate positions within a lane with a binary
+              search, see `_lane_key`
+            * offset: positional offset of the keys
+            * lane_start: for every flat lane index, the index of the first
+              vehicle of the lane in the sorted arrays
+            * lane_end: for every flat lane index, one past the index of the
+              last vehicle of the lane in the sorted arrays
+        """
+        links = self._get_lane_links()
+        slots = self.__state.slots(self.__ids)
+
+        if prev_order is not None:
+            # keep the previous ordering of the vehicles that are still in the
+            # network, and append the vehicles that entered it
+            in_network = np.zeros(self.__state.capacity, dtype=bool)
+            in_network[slots] = True
+            prev_slots = prev_order['slots']
+            prev_slots = prev_slots[in_network[prev_slots]]
+            in_prev = np.zeros(self.__state.capacity, dtype=bool)
+            in_prev[prev_slots] = True
+            slots = np.concatenate((prev_slots, slots[~in_prev[slots]]))
+
+        flat = self._valid_lanes(slots)
+        slots, flat = slots[flat >= 0], flat[flat >= 0]
+        positions = self.__state.columns['position'][slots]
+
+        offset = np.max(np.abs(positions)) + 1 if len(positions) else 1
+        keys = self._lane_key(flat, positions, offset)
+        order = np.argsort(keys, kind='stable')
+        slots, flat = slots[order], flat[order]
+        positions, keys = positions[order], keys[order]
+
+        all_lanes = np.arange(len(links['graph'].next_lane))
+
+        return {
+            'slots': slots,
+            'positions': positions,
+            'keys': keys,
+            'offset': offset,
+            'lane_start': np.searchsorted(flat, all_lanes, side='left'),
+            'lane_end': np.searchsorted(flat, all_lanes, side='right'),
+        }
+
+    @staticmethod
+    def _lane_key(flat, positions, offset):
+        """Return a key that orders vehicles by lane and then by position."""
+        return flat * (2 * offset + 1) + (positions + offset)
+
+    def compute_lane_data(self, veh_ids):
+        """Compute the lane leaders, followers, headways, and tailways.
+
+        This is done for all lanes of the edge the specified vehicles are
+        located on, based on the state of the network in the last update.
+        The results are available through the `get_lane_*` methods. This is
+        done automatically for RL vehicles after every update.
+
+        Leaders and followers are first searched for in the current edge of a
+        vehicle, and then in the nearest occupied lanes in front of or behind
+        it, which are looked up in the lane graph of the network (see
+        flow.core.kernel.network.lane_graph.LaneGraph).
 
-        return tailway, follower
+        Parameters
+        ----------
+        veh_ids : list of str
+            vehicle ids
+        """
+        self._update_lane_order()
+
+        links = self._get_lane_links()
+        graph = links['graph']
+        max_lanes = graph.max_lanes
+        cols = self.__state.columns
+        sorted_slots = self._lane_order['slots']
+        sorted_pos = self._lane_order['positions']
+        lane_start = self._lane_order['lane_start']
+        lane_end = self._lane_order['lane_end']
+
+        # vehicles that are not located on a lane are skipped
+        veh_ids = list(veh_ids)
+        q_slots = self.__state.slots(veh_ids)
+        q_flat = self._valid_lanes(q_slots)
+        valid = np.flatnonzero(q_flat >= 0)
+        if len(valid) == 0:
+            return
+        q_slots, q_flat = q_slots[valid], q_flat[valid]
+        q_edges = q_flat // max_lanes
+        q_num_lanes = graph.num_lanes[q_edges]
+
+        # one query per (vehicle, lane) pair
+        pair_q = np.repeat(np.arange(len(valid)), q_num_lanes)
+        pair_lane = np.arange(len(pair_q)) - np.repeat(
+            np.cumsum(q_num_lanes) - q_num_lanes, q_num_lanes)
+        pos = cols['position'][q_slots[pair_q]]
+        own_lane = q_flat[pair_q] == q_edges[pair_q] * max_lanes + pair_lane
+        target = q_edges[pair_q] * max_lanes + pair_lane
+        start, end = lane_start[target], lane_end[target]
+        index = np.searchsorted(
+            self._lane_order['keys'],
+            self._lane_key(target, pos, self._lane_order['offset']))
+
+        headway = np.full(len(pair_q), 1000.)
+        tailway = np.full(len(pair_q), 1000.)
+        leader = np.full(len(pair_q), NO_VEHICLE, dtype=np.int64)
+        follower = np.full(len(pair_q), NO_VEHICLE, dtype=np.int64)
+
+        # lane leaders in the current edge, skipping the vehicle itself
+        found = np.where(own_lane, index < end - 1, index < end)
+        cand = index[found]
+        cand[sorted_slots[cand] == q_slots[pair_q[found]]] += 1
+        leader[found] = sorted_slots[cand]
+        headway[found] = sorted_pos[cand] - pos[found] \
+            - cols['length'][leader[found]]
+
+        # lane followers in the current edge
+        found = index > start
+        cand = index[found] - 1
+        follower[found] = sorted_slots[cand]
+        tailway[found] = pos[found] - sorted_pos[cand] \
+            - cols['length'][q_slots[pair_q[found]]]
+
+        # if lane leader not found, check the nearest occupied lane in front
+        occupied = lane_end > lane_start
+        active = np.flatnonzero(leader == NO_VEHICLE)
+        lane, add_length = graph.first_match(target[active], occupied)
+        found = lane >= 0
+        cand, idx = lane_start[lane[found]], active[found]
+        leader[idx] = sorted_slots[cand]
+        headway[idx] = sorted_pos[cand] - pos[idx] + add_length[found] \
+            - cols['length'][leader[idx]]
+
+        # if lane follower not found, check the nearest occupied lane behind
+        active = np.flatnonzero(follower == NO_VEHICLE)
+        lane, add_length = graph.first_match(
+            target[active], occupied, upstream=True)
+        found = lane >= 0
+        cand, idx = lane_end[lane[found]] - 1, active[found]
+        follower[idx] = sorted_slots[cand]
+        tailway[idx] = pos[idx] - sorted_pos[cand] + add_length[found] \
+            - cols['length'][q_slots[pair_q[idx]]]
+
+        # add the above values to the vehicles class
+        leader = self.__state.veh_ids(leader, error="")
+        follower = self.__state.veh_ids(follower, error="")
+        headway, tailway = headway.tolist(), tailway.tolist()
+        stops = np.cumsum(q_num_lanes).tolist()
+        for i, begin, stop in zip(valid.tolist(), [0] + stops[:-1], stops):
+            veh_id = veh_ids[i]
+            self.set_lane_headways(veh_id, headway[begin:stop])
+            self.set_lane_tailways(veh_id, tailway[begin:stop])
+            self.set_lane_leaders(veh_id, leader[begin:stop])
+            self.set_lane_followers(veh_id, follower[begin:stop])
 
     def apply_acceleration(self, veh_ids, acc, smooth=True):
         """See parent class."""
@@ -960,15 +1394,16 @@ class TraCIVehicle(KernelVehicle):
             veh_ids = [veh_ids]
             acc = [acc]
 
+        commands = self.master_kernel.command_buffer
         for i, vid in enumerate(veh_ids):
-            if acc[i] is not None and vid in self.get_ids():
+            if acc[i] is not None and vid in self.__ids:
                 self.__vehicles[vid]["accel"] = acc[i]
                 this_vel = self.get_speed(vid)
                 next_vel = max([this_vel + acc[i] * self.sim_step, 0])
                 if smooth:
-                    self.kernel_api.vehicle.slowDown(vid, next_vel, 1e-3)
+                    commands.add('vehicle', 'slowDown', vid, next_vel, 1e-3)
                 else:
-                    self.kernel_api.vehicle.setSpeed(vid, next_vel)
+                    commands.add('vehicle', 'setSpeed', vid, next_vel)
 
     def apply_lane_change(self, veh_ids, direction):
         """See parent class."""
@@ -997,10 +1432,11 @@ class TraCIVehicle(KernelVehicle):
 
             # perform the requested lane action action in TraCI
             if target_lane != this_lane:
-                self.kernel_api.vehicle.changeLane(
-                    veh_id, int(target_lane), self.sim_step)
+                self.master_kernel.command_buffer.add(
+                    'vehicle', 'changeLane', veh_id, int(target_lane),
+                    self.sim_step)
 
-                if veh_id in self.get_rl_ids():
+                if veh_id in self.__rl_ids:
                     self.prev_last_lc[veh_id] = \
                         self.__vehicles[veh_id]["last_lc"]
 
@@ -1013,18 +1449,45 @@ class TraCIVehicle(KernelVehicle):
 
         for i, veh_id in enumerate(veh_ids):
             if route_choices[i] is not None:
-                self.kernel_api.vehicle.setRoute(
-                    vehID=veh_id, edgeList=route_choices[i])
+                self.master_kernel.command_buffer.add(
+                    'vehicle', 'setRoute', veh_id, route_choices[i])
 
     def get_x_by_id(self, veh_id):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_x_by_id(vehID) for vehID in veh_id]
-        if self.get_edge(veh_id) == '':
+            return self.get_x_batch(veh_id).tolist()
+        edge = self.get_edge(veh_id)
+        if edge == '':
             # occurs when a vehicle crashes is teleported for some other reason
             return 0.
         return self.master_kernel.network.get_x(
-            self.get_edge(veh_id), self.get_position(veh_id))
+            edge, self.get_position(veh_id))
+
+    def get_x_batch(self, ids=None):
+        """See parent class.
+
+        The edges of the state store are mapped to the edge ids of the network
+        kernel, so that the positions are computed by a single call to its
+        `get_x_batch` method.
+        """
+        if ids is None:
+            ids = self.get_ids()
+        slots = self.__state.slots(ids)
+        network = self.master_kernel.network
+
+        # the last element maps missing edges (-1) to missing network edges
+        edge_ids = np.array(
+            [network.get_edge_index(edge) for edge in self.__state.edge_names]
+            + [-1], dtype=np.int64)
+        edges = np.where(slots >= 0, self.__state.column('edge')[slots], -1)
+        positions = self.__state.column('position')[slots]
+        x = network.get_x_batch(
+            edge_ids[edges], np.where(np.isnan(positions), -1001, positions))
+
+        # vehicles that are not in the network (e.g. that are teleported) are
+        # assigned a position of 0
+        x[edges < 0] = 0.
+        return x
 
     def update_vehicle_colors(self):
         """See parent class.
@@ -1033,60 +1496,54 @@ class TraCIVehicle(KernelVehicle):
         - red: autonomous (rl) vehicles
         - white: unobserved human-driven vehicles
         - cyan: observed human-driven vehicles
+
+        Colors are only sent to sumo for vehicles whose color changed since
+        the last time it was set.
         """
-        for veh_id in self.get_rl_ids():
-            try:
-                # If vehicle is already being colored via argument to vehicles.add(), don't re-color it.
-                if self._force_color_update or 'color' not in \
-                        self.type_parameters[self.get_type(veh_id)]:
-                    # color rl vehicles red
-                    self.set_color(veh_id=veh_id, color=RED)
-            except (FatalTraCIError, TraCIException) as e:
-                print('Error when updating rl vehicle colors:', e)
+        # If vehicle is already being colored via argument to vehicles.add(),
+        # don't re-color it.
+        recolor = {
+            veh_type: self._force_color_update or 'color' not in params
+            for veh_type, params in self.type_parameters.items()}
+
+        colors = {}
+
+        # color rl vehicles red
+        for veh_id in self.__rl_ids:
+            colors[veh_id] = RED
 
         # color vehicles white if not observed and cyan if observed
-        for veh_id in self.get_human_ids():
-            try:
-                color = CYAN if veh_id in self.get_observed_ids() else WHITE
-                # If vehicle is already being colored via argument to vehicles.add(), don't re-color it.
-                if self._force_color_update or 'color' not in \
-                        self.type_parameters[self.get_type(veh_id)]:
-                    self.set_color(veh_id=veh_id, color=color)
-            except (FatalTraCIError, TraCIException) as e:
-                print('Error when updating human vehicle colors:', e)
-
-        for veh_id in self.get_ids():
-            try:
-                if 'av' in veh_id:
-                    color = RED
-                    # If vehicle is already being colored via argument to vehicles.add(), don't re-color it.
-                    if self._force_color_update or 'color' not in \
-                            self.type_parameters[self.get_type(veh_id)]:
-                        self.set_color(veh_id=veh_id, color=color)
-            except (FatalTraCIError, TraCIException) as e:
-                print('Error when updating human vehicle colors:', e)
+        for veh_id in self.__human_ids:
+            colors[veh_id] = CYAN if veh_id in self.__observed_ids else WHITE
+
+        for veh_id in self.__ids:
+            if 'av' in veh_id:
+                colors[veh_id] = RED
 
         # color vehicles by speed if desired
         if self._color_by_speed:
             max_speed = self.master_kernel.network.max_speed()
             speed_ranges = np.linspace(0, max_speed, STEPS)
-            for veh_id in self.get_ids():
-                veh_speed = self.get_speed(veh_id)
-                bin_index = np.digitize(veh_speed, speed_ranges)
-                # If vehicle is already being colored via argument to vehicles.add(), don't re-color it.
-                if self._force_color_update or 'color' not in \
-                        self.type_parameters[self.get_type(veh_id)]:
-                    self.set_color(veh_id=veh_id, color=color_bins[bin_index])
+            veh_ids = self.get_ids()
+            bin_index = np.digitize(self.get_speeds(veh_ids), speed_ranges)
+            for veh_id, i in zip(veh_ids, bin_index.tolist()):
+                colors[veh_id] = tuple(color_bins[i])
+
+        for veh_id, color in colors.items():
+            if recolor[self.get_type(veh_id)] and \
+                    self.__colors.get(veh_id) != color:
+                self.set_color(veh_id=veh_id, color=color)
 
         # clear the list of observed vehicles
-        for veh_id in self.get_observed_ids():
-            self.remove_observed(veh_id)
+        self.__observed_ids.clear()
 
     def get_color(self, veh_id):
         """See parent class.
 
         This does not pass the last term (i.e. transparency).
         """
+        # apply any color that is still waiting in the command buffer
+        self.master_kernel.command_buffer.flush()
         r, g, b, t = self.kernel_api.vehicle.getColor(veh_id)
         return r, g, b
 
@@ -1096,8 +1553,9 @@ class TraCIVehicle(KernelVehicle):
         The last term for sumo (transparency) is set to 255.
         """
         r, g, b = color
-        self.kernel_api.vehicle.setColor(
-            vehID=veh_id, color=(r, g, b, 255))
+        self.__colors[veh_id] = (r, g, b)
+        self.master_kernel.command_buffer.add(
+            'vehicle', 'setColor', veh_id, (r, g, b, 255))
 
     def add(self, veh_id, type_id, edge, pos, lane, speed):
         """See parent class."""
@@ -1123,41 +1581,35 @@ class TraCIVehicle(KernelVehicle):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
             return [self.get_max_speed(vehID, error) for vehID in veh_id]
+        # apply any max speed that is still waiting in the command buffer
+        self.master_kernel.command_buffer.flush()
         return self.kernel_api.vehicle.getMaxSpeed(veh_id)
 
     def set_max_speed(self, veh_id, max_speed):
         """See parent class."""
-        self.kernel_api.vehicle.setMaxSpeed(veh_id, max_speed)
+        self.master_kernel.command_buffer.add(
+            'vehicle', 'setMaxSpeed', veh_id, max_speed)
 
     def get_accel(self, veh_id, noise=True, failsafe=True):
         """See parent class."""
-        metric_name = 'accel'
-        if noise:
-            metric_name += '_with_noise'
-        else:
-            metric_name += '_no_noise'
-        if failsafe:
-            metric_name += '_with_falsafe'
-        else:
-            metric_name += '_no_failsafe'
-
-        if metric_name not in self.__vehicles[veh_id]:
-            self.__vehicles[veh_id][metric_name] = None
-        return self.__vehicles[veh_id][metric_name]
+        return self.__state.get(
+            ACCEL_FIELDS[noise, failsafe], veh_id, error=None)
 
     def update_accel(self, veh_id, accel, noise=True, failsafe=True):
         """See parent class."""
-        metric_name = 'accel'
-        if noise:
-            metric_name += '_with_noise'
-        else:
-            metric_name += '_no_noise'
-        if failsafe:
-            metric_name += '_with_falsafe'
-        else:
-            metric_name += '_no_failsafe'
+        if veh_id in self.__state:
+            self.__state.set(ACCEL_FIELDS[noise, failsafe], veh_id,
+                             np.nan if accel is None else accel)
 
-        self.__vehicles[veh_id][metric_name] = accel
+    def update_accels(self, veh_ids, accel, noise=True, failsafe=True):
+        """See parent class."""
+        slots = self.__state.slots(veh_ids)
+        accel = np.broadcast_to(
+            np.nan if accel is None else np.asarray(accel, dtype=float),
+            slots.shape)
+        valid = slots >= 0
+        self.__state.column(ACCEL_FIELDS[noise, failsafe])[slots[valid]] = \
+            accel[valid]
 
     def get_realized_accel(self, veh_id):
         """See parent class."""
@@ -1167,11 +1619,14 @@ class TraCIVehicle(KernelVehicle):
 
     def get_2d_position(self, veh_id, error=-1001):
         """See parent class."""
-        return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_POSITION, error)
+        if veh_id not in self.__state:
+            return error
+        return (self.__state.get('x', veh_id, error),
+                self.__state.get('y', veh_id, error))
 
     def get_distance(self, veh_id, error=-1001):
         """See parent class."""
-        return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_DISTANCE, error)
+        return self.__state.get('distance', veh_id, error)
 
     def get_road_grade(self, veh_id):
         """See parent class."""
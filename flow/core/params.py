@@ -588,6 +588,73 @@ class SumoParams(SimParams):
         current time step
     use_ballistic: bool, optional
         If true, use a ballistic integration step instead of an euler step
+    bulk_subscriptions : bool, optional
+        If true, the state of all vehicles is collected from a single set of
+        subscription results per simulation step, and the initial state of
+        newly departed vehicles is folded into their subscription, so that
+        the number of TraCI calls per step does not grow with the number of
+        vehicles. Defaults to False
+    max_rate_window : float, optional
+        longest time span (in seconds) over which the inflow and outflow rates
+        of the network can be computed, see
+        flow.core.kernel.vehicle.KernelVehicle.get_outflow_rate. Only the
+        number of departures and arrivals within this time span is stored.
+        Defaults to one hour
+    fast_reset : bool, optional
+        If true, the state of sumo is saved after the vehicles are first
+        placed in the network, and restored upon every later reset instead of
+        removing and re-adding all vehicles. The saved state also supersedes
+        restart_instance, as it resets the inflows as well: the instance is
+        then neither restarted nor reseeded upon reset. The random number
+        generator of sumo is not part of the state, so that rollouts still
+        differ, and the speed factors of the restored vehicles are drawn
+        anew. Other attributes drawn by sumo when the vehicles were first
+        placed (e.g. random departure lanes of the inflows) are the same in
+        every rollout. The state is discarded whenever the sumo instance is
+        restarted, and is not used if the initial positions of the vehicles
+        are shuffled. Defaults to False
+    num_warm_instances : int, optional
+        number of sumo processes that are launched ahead of time with the
+        configuration of the current process, so that restarting the instance
+        (e.g. upon reset if restart_instance is set to True) connects to a
+        process that has already loaded its network. Warm processes are
+        launched with random seeds, and are discarded if the configuration
+        changes. Every warm process holds a copy of the network in memory.
+        Defaults to 0
+    net_cache : bool, optional
+        If true, the networks generated by netconvert are cached, along with
+        the edges and connections parsed from them, in a directory that is
+        shared by all processes. Generating a network that is already cached
+        (e.g. upon every restart of the instance) then skips netconvert and
+        the parsing of the .net.xml file. Defaults to True
+    runtime_inflows : bool, optional
+        If true, the vehicles of the inflows are not written to the .rou.xml
+        file, but added via TraCI during the simulation by the inflow
+        controller of the kernel (see flow/core/kernel/inflows.py). The
+        inflows then restart upon every reset without restarting the
+        instance, and can be replaced or have their rates modified without
+        generating the network anew. Defaults to False
+    lane_lookahead : float, optional
+        maximum distance (in meters) past the end of their lane at which the
+        lane leaders and followers of vehicles are searched for. Beyond it,
+        vehicles have no lane leader or follower. Defaults to None, i.e. the
+        full network. In either case, the lanes tabulated for every lane of
+        the network are bounded (see
+        flow.core.kernel.network.lane_graph.TABLE_HOPS), so that the memory
+        used by the lane graph is linear in the number of lanes
+    emission_format : str, optional
+        format of the emission files created if emission_path is specified:
+        "csv", "npz" (compressed numpy arrays, see
+        flow.core.kernel.simulation.recorder.load_npz), or "parquet" (which
+        requires pyarrow). In all formats, rows are ordered by time rather
+        than grouped by vehicle. Defaults to "csv"
+    fcd_output : bool, optional
+        If true and emission_path is specified, sumo writes the trajectories
+        of all vehicles at every time step (its floating car data output) to
+        "<network name>-fcd.xml" in the emission path, which can be converted
+        via flow.core.util.emission_to_csv. The file is written anew whenever
+        the instance is restarted, and no warm instances are launched.
+        Defaults to False
     """
 
     def __init__(self,
@@ -609,7 +676,16 @@ class SumoParams(SimParams):
                  teleport_time=-1,
                  num_clients=1,
                  color_by_speed=False,
-                 use_ballistic=False):
+                 use_ballistic=False,
+                 bulk_subscriptions=False,
+                 max_rate_window=3600,
+                 fast_reset=False,
+                 num_warm_instances=0,
+                 net_cache=True,
+                 runtime_inflows=False,
+                 lane_lookahead=None,
+                 emission_format='csv',
+                 fcd_output=False):
         """Instantiate SumoParams."""
         super(SumoParams, self).__init__(
             sim_step, render, restart_instance, emission_path, save_render,
@@ -624,6 +700,15 @@ class SumoParams(SimParams):
         self.num_clients = num_clients
         self.color_by_speed = color_by_speed
         self.use_ballistic = use_ballistic
+        self.bulk_subscriptions = bulk_subscriptions
+        self.max_rate_window = max_rate_window
+        self.fast_reset = fast_reset
+        self.num_warm_instances = num_warm_instances
+        self.net_cache = net_cache
+        self.runtime_inflows = runtime_inflows
+        self.lane_lookahead = lane_lookahead
+        self.emission_format = emission_format
+        self.fcd_output = fcd_output
 
 
 class EnvParams:
@@ -657,6 +742,26 @@ class EnvParams:
         specifies whether to clip actions from the policy by their range when
         they are inputted to the reward function. Note that the actions are
         still clipped before they are provided to `apply_rl_actions`.
+    profile : bool, optional
+        specifies whether to time the phases of the steps and resets of the
+        environment (controllers, simulation step, kernel updates, etc.). The
+        statistics are available via `env.profiler`, see
+        flow.core.profiler.StepProfiler
+    profile_path : str, optional
+        path to the folder in which a Chrome trace of the phases of every
+        episode is stored, if profiling is enabled. No trace is stored if not
+        specified.
+    overlap_steps : bool, optional
+        specifies whether the observation and reward of a step should be
+        computed while the simulator performs the last simulation step of
+        the step, instead of once it is complete. The observation and reward
+        then describe the state after sims_per_step - 1 simulation steps,
+        i.e. they lag one simulation step behind, unless a collision occurs
+        in the last one. This is only done if sims_per_step > 1, and for
+        single-agent environments whose `get_state` and `compute_reward` only
+        use the data collected by the kernel (see
+        flow.envs.Env.supports_overlap_steps). Otherwise, a warning is issued
+        and steps are not overlapped.
     """
 
     def __init__(self,
@@ -665,7 +770,10 @@ class EnvParams:
                  warmup_steps=0,
                  sims_per_step=1,
                  evaluate=False,
-                 clip_actions=True):
+                 clip_actions=True,
+                 profile=False,
+                 profile_path=None,
+                 overlap_steps=False):
         """Instantiate EnvParams."""
         self.additional_params = \
             additional_params if additional_params is not None else {}
@@ -674,6 +782,9 @@ class EnvParams:
         self.sims_per_step = sims_per_step
         self.evaluate = evaluate
         self.clip_actions = clip_actions
+        self.profile = profile
+        self.profile_path = profile_path
+        self.overlap_steps = overlap_steps
 
     def get_additional_param(self, key):
         """Return a variable from additional_params."""
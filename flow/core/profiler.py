@@ -0,0 +1,346 @@
+"""Script containing the step profiler of the Flow environments."""
+import functools
+import json
+import os
+import time
+
+from flow.core.util import ensure_dir
+
+# number of buckets of the duration histograms. Durations are bucketed by the
+# number of bits of their value in nanoseconds, i.e. bucket i contains the
+# durations in [2 ** (i - 1), 2 ** i) ns, and the last bucket all longer ones
+NUM_BUCKETS = 40
+
+
+class PhaseStats(object):
+    """Duration statistics of a phase of the steps of an environment.
+
+    Attributes
+    ----------
+    count : int
+        number of times the phase was performed
+    total : int
+        total duration of the phase, in nanoseconds
+    min : int
+        shortest duration of the phase, in nanoseconds
+    max : int
+        longest duration of the phase, in nanoseconds
+    buckets : list of int
+        histogram of the durations of the phase, see NUM_BUCKETS
+    """
+
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        """Instantiate empty statistics."""
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        self.buckets = [0] * NUM_BUCKETS
+
+    def add(self, duration):
+        """Add the duration of a new occurrence of the phase, in ns."""
+        if self.count == 0 or duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+        self.count += 1
+        self.total += duration
+        self.buckets[min(duration.bit_length(), NUM_BUCKETS - 1)] += 1
+
+    def percentile(self, q):
+        """Return an upper bound of a percentile of the durations, in ns.
+
+        The bound is the upper edge of the histogram bucket the percentile
+        falls in (capped by the longest duration), and is therefore at most
+        twice the actual percentile.
+
+        Parameters
+        ----------
+        q : float
+            percentile, in [0, 100]
+
+        Returns
+        -------
+        int
+        """
+        if self.count == 0:
+            return 0
+        rank = q / 100 * self.count
+        cumulative = 0
+        for i, count in enumerate(self.buckets):
+            cumulative += count
+            if count > 0 and cumulative >= rank:
+                return min(2 ** i, self.max)
+        return self.max
+
+    def summary(self):
+        """Return the statistics of the phase, in seconds.
+
+        Returns
+        -------
+        dict
+            number of occurrences of the phase ("count"), as well as its total,
+            mean, minimum, median ("p50"), 99th percentile ("p99") and maximum
+            duration
+        """
+        return {
+            'count': self.count,
+            'total': self.total * 1e-9,
+            'mean': self.total / max(self.count, 1) * 1e-9,
+            'min': self.min * 1e-9,
+            'p50': self.percentile(50) * 1e-9,
+            'p99': self.percentile(99) * 1e-9,
+            'max': self.max * 1e-9,
+        }
+
+
+class StepProfiler(object):
+    """Profiler of the phases of the steps and resets of an environment.
+
+    Every phase (e.g. the computation of the accelerations of all vehicles, or
+    the simulation step) is timed when it is wrapped by the `phase` context
+    manager, and its duration is added to a histogram of the durations of
+    that phase. Phases may be nested, in which case they are named after the
+    path of the enclosing phases, e.g. "step/update/vehicle".
+
+    If a trace directory is specified, all phases of an episode are
+    additionally stored, and dumped in the Chrome trace event format (which
+    can be loaded in chrome://tracing or https://ui.perfetto.dev) at the end
+    of the episode.
+
+    Usage
+    -----
+    >>> profiler = StepProfiler()
+    >>> with profiler.phase("step"):
+    ...     with profiler.phase("simulation_step"):
+    ...         pass
+    >>> profiler.summary()["step/simulation_step"]["count"]
+    1
+
+    Attributes
+    ----------
+    stats : dict of PhaseStats
+        duration statistics of every phase, indexed by its path
+    trace_dir : str or None
+        directory the traces of the episodes are dumped to
+    name : str
+        prefix of the names of the trace files
+    num_episodes : int
+        number of completed episodes
+    """
+
+    enabled = True
+
+    def __init__(self, trace_dir=None, name='flow'):
+        """Instantiate a profiler with no recorded phases.
+
+        Parameters
+        ----------
+        trace_dir : str, optional
+            directory the Chrome traces of the episodes are dumped to. No
+            trace is stored if not specified.
+        name : str, optional
+            prefix of the names of the trace files
+        """
+        self.stats = {}
+        self.trace_dir = trace_dir
+        self.name = name
+        self.num_episodes = 0
+
+        # paths of the phases that are currently performed
+        self._stack = []
+        # context managers of the phases, indexed by parent path and name
+        self._phases = {}
+        # trace events of the current episode
+        self._events = []
+        # whether any phase was recorded since the start of the episode
+        self._active = False
+        self._origin = time.perf_counter_ns()
+
+    def phase(self, name):
+        """Return a context manager that times a phase.
+
+        Parameters
+        ----------
+        name : str
+            name of the phase, relative to the phase that is currently
+            performed (if any)
+
+        Returns
+        -------
+        object
+            context manager
+        """
+        parent = self._stack[-1] if self._stack else None
+        try:
+            return self._phases[parent, name]
+        except KeyError:
+            path = name if parent is None else parent + '/' + name
+            phase = self._phases[parent, name] = _Phase(self, path)
+            return phase
+
+    def _record(self, path, start, end):
+        """Store the duration of a phase."""
+        stats = self.stats.get(path)
+        if stats is None:
+            stats = self.stats[path] = PhaseStats()
+        stats.add(end - start)
+        self._active = True
+        if self.trace_dir is not None:
+            self._events.append((path, start, end))
+
+    def summary(self):
+        """Return the statistics of all phases, in seconds.
+
+        Returns
+        -------
+        dict of dict
+            statistics of every phase (see PhaseStats.summary), indexed by its
+            path
+        """
+        return {path: self.stats[path].summary() for path in sorted(self.stats)}
+
+    def format(self):
+        """Return a table of the statistics of all phases, in milliseconds."""
+        lines = ['{:<40s} {:>8s} {:>10s} {:>8s} {:>8s} {:>8s}'.format(
+            'phase', 'count', 'total', 'mean', 'p99', 'max')]
+        for path, stats in self.summary().items():
+            lines.append('{:<40s} {:>8d} {:>10.1f} {:>8.3f} {:>8.3f} {:>8.3f}'
+                         .format(path, stats['count'], stats['total'] * 1e3,
+                                 stats['mean'] * 1e3, stats['p99'] * 1e3,
+                                 stats['max'] * 1e3))
+        return '\n'.join(lines)
+
+    def clear(self):
+        """Remove the statistics of all phases."""
+        self.stats.clear()
+
+    def end_episode(self):
+        """Mark the end of an episode, and dump its trace (if requested).
+
+        This is a no-op if no phase was recorded since the previous episode.
+        """
+        if not self._active:
+            return
+        self._active = False
+        self.num_episodes += 1
+
+        if self.trace_dir is not None:
+            self.dump_trace(os.path.join(self.trace_dir, '{}_{}.json'.format(
+                self.name, self.num_episodes)))
+            self._events = []
+
+    def dump_trace(self, path):
+        """Dump the phases of the current episode in the Chrome trace format.
+
+        Parameters
+        ----------
+        path : str
+            path of the trace file
+        """
+        pid = os.getpid()
+        events = [{
+            'name': name.rsplit('/', 1)[-1],
+            'cat': 'flow',
+            'ph': 'X',
+            'ts': (start - self._origin) / 1e3,
+            'dur': (end - start) / 1e3,
+            'pid': pid,
+            'tid': 0,
+            'args': {'path': name},
+        } for name, start, end in self._events]
+
+        ensure_dir(os.path.dirname(os.path.abspath(path)))
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+class NullProfiler(object):
+    """Profiler that does not record anything.
+
+    This is used by environments for which profiling is disabled, so that the
+    phases of their steps can be wrapped in the same way at almost no cost.
+    """
+
+    enabled = False
+    stats = {}
+    num_episodes = 0
+
+    def phase(self, name):
+        """See StepProfiler.phase."""
+        return _NULL_PHASE
+
+    def summary(self):
+        """See StepProfiler.summary."""
+        return {}
+
+    def format(self):
+        """See StepProfiler.format."""
+        return ''
+
+    def clear(self):
+        """See StepProfiler.clear."""
+        pass
+
+    def end_episode(self):
+        """See StepProfiler.end_episode."""
+        pass
+
+
+class _Phase(object):
+    """Context manager timing a phase of a profiler."""
+
+    __slots__ = ('profiler', 'path', 'start')
+
+    def __init__(self, profiler, path):
+        self.profiler = profiler
+        self.path = path
+        self.start = 0
+
+    def __enter__(self):
+        self.profiler._stack.append(self.path)
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *args):
+        end = time.perf_counter_ns()
+        self.profiler._stack.pop()
+        self.profiler._record(self.path, self.start, end)
+
+
+class _NullPhase(object):
+    """Context manager that does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+def profiled(name, episode=False):
+    """Time a method of an environment as a phase of its profiler.
+
+    Parameters
+    ----------
+    name : str
+        name of the phase
+    episode : bool, optional
+        whether the method starts a new episode (e.g. `reset`), in which case
+        the previous episode is ended before the method is called
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if episode:
+                self.profiler.end_episode()
+            with self.profiler.phase(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -40,7 +40,7 @@ def desired_velocity(env, fail=False, edge_list=None):
     else:
         veh_ids = env.k.vehicle.get_ids_by_edge(edge_list)
 
-    vel = np.array(env.k.vehicle.get_speed(veh_ids))
+    vel = env.k.vehicle.get_speeds(veh_ids)
     num_vehicles = len(veh_ids)
 
     if any(vel < -100) or fail or num_vehicles == 0:
@@ -78,7 +78,7 @@ def average_velocity(env, fail=False):
     float
         reward value
     """
-    vel = np.array(env.k.vehicle.get_speed(env.k.vehicle.get_ids()))
+    vel = env.k.vehicle.get_speeds()
 
     if any(vel < -100) or fail:
         return 0.
@@ -104,7 +104,7 @@ def rl_forward_progress(env, gain=0.1):
     float
         reward value
     """
-    rl_velocity = env.k.vehicle.get_speed(env.k.vehicle.get_rl_ids())
+    rl_velocity = env.k.vehicle.get_speeds(env.k.vehicle.get_rl_ids())
     rl_norm_vel = np.linalg.norm(rl_velocity, 1)
     return rl_norm_vel * gain
 
@@ -131,7 +131,7 @@ def min_delay(env):
     float
         reward value
     """
-    vel = np.array(env.k.vehicle.get_speed(env.k.vehicle.get_ids()))
+    vel = env.k.vehicle.get_speeds()
 
     vel = vel[vel >= -1e-6]
     v_top = max(
@@ -190,7 +190,7 @@ def min_delay_unscaled(env):
     float
         reward value
     """
-    vel = np.array(env.k.vehicle.get_speed(env.k.vehicle.get_ids()))
+    vel = env.k.vehicle.get_speeds()
 
     vel = vel[vel >= -1e-6]
     v_top = max(
@@ -226,7 +226,7 @@ def penalize_standstill(env, gain=1):
         reward value
     """
     veh_ids = env.k.vehicle.get_ids()
-    vel = np.array(env.k.vehicle.get_speed(veh_ids))
+    vel = env.k.vehicle.get_speeds(veh_ids)
     num_standstill = len(vel[vel == 0])
     penalty = gain * num_standstill
     return -penalty
@@ -250,7 +250,7 @@ def penalize_near_standstill(env, thresh=0.3, gain=1):
         multiplicative factor on the action penalty
     """
     veh_ids = env.k.vehicle.get_ids()
-    vel = np.array(env.k.vehicle.get_speed(veh_ids))
+    vel = env.k.vehicle.get_speeds(veh_ids)
     penalize = len(vel[vel < thresh])
     penalty = gain * penalize
     return -penalty
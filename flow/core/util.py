@@ -2,9 +2,12 @@
 
 import csv
 import errno
+import heapq
 import os
+import shutil
+import tempfile
 from lxml import etree
-from xml.etree import ElementTree
+import numpy as np
 
 
 def makexml(name, nsl):
@@ -32,13 +35,65 @@ def ensure_dir(path):
     return path
 
 
-def emission_to_csv(emission_path, output_path=None):
+# attributes of the vehicles of the emission files generated by sumo (via the
+# --emission-output option), along with the column they are stored in and
+# whether they are numerical. The lane is stored in the edge_id and
+# lane_number columns.
+EMISSION_ATTRIBUTES = [
+    ('CO', 'CO', True),
+    ('y', 'y', True),
+    ('CO2', 'CO2', True),
+    ('electricity', 'electricity', True),
+    ('type', 'type', False),
+    ('id', 'id', False),
+    ('eclass', 'eclass', False),
+    ('waiting', 'waiting', True),
+    ('NOx', 'NOx', True),
+    ('fuel', 'fuel', True),
+    ('HC', 'HC', True),
+    ('x', 'x', True),
+    ('route', 'route', False),
+    ('pos', 'relative_position', True),
+    ('noise', 'noise', True),
+    ('angle', 'angle', True),
+    ('PMx', 'PMx', True),
+    ('speed', 'speed', True),
+]
+
+# attributes of the vehicles of the floating car data (fcd) files generated by
+# sumo (via the --fcd-output option), see EMISSION_ATTRIBUTES
+FCD_ATTRIBUTES = [
+    ('id', 'id', False),
+    ('type', 'type', False),
+    ('x', 'x', True),
+    ('y', 'y', True),
+    ('angle', 'angle', True),
+    ('speed', 'speed', True),
+    ('pos', 'relative_position', True),
+    ('slope', 'slope', True),
+]
+
+# number of rows converted at a time by emission_to_csv
+EMISSION_CHUNK_SIZE = 1 << 14
+
+# maximum number of sorted runs that are merged at a time by emission_to_csv
+MAX_MERGED_RUNS = 64
+
+
+def emission_to_csv(emission_path, output_path=None, sort_by_id=True,
+                    chunk_size=EMISSION_CHUNK_SIZE):
     """Convert an emission file generated by sumo into a csv file.
 
     Note that the emission file contains information generated by sumo, not
     flow. This means that some data, such as absolute position, is not
     immediately available from the emission file, but can be recreated.
 
+    Both the emission files (--emission-output) and the floating car data
+    files (--fcd-output) of sumo are supported. The file is parsed as a
+    stream, and converted in chunks of rows, so that files that do not fit
+    in memory can be converted. Vehicles that are missing any of the
+    attributes of the file format are skipped.
+
     Parameters
     ----------
     emission_path : str
@@ -46,54 +101,132 @@ def emission_to_csv(emission_path, output_path=None):
     output_path : str
         path to the csv file that will be generated, default is the same
         directory as the emission file, with the same name
+    sort_by_id : bool, optional
+        whether to sort the rows by vehicle id (and then by time), instead of
+        by time. Chunks of rows are sorted in memory, and then merged.
+    chunk_size : int, optional
+        number of rows converted at a time
     """
-    parser = etree.XMLParser(recover=True)
-    tree = ElementTree.parse(emission_path, parser=parser)
-    root = tree.getroot()
-
-    # parse the xml data into a dict
-    out_data = []
-    for time in root.findall('timestep'):
-        t = float(time.attrib['time'])
-
-        for car in time:
-            out_data.append(dict())
-            try:
-                out_data[-1]['time'] = t
-                out_data[-1]['CO'] = float(car.attrib['CO'])
-                out_data[-1]['y'] = float(car.attrib['y'])
-                out_data[-1]['CO2'] = float(car.attrib['CO2'])
-                out_data[-1]['electricity'] = float(car.attrib['electricity'])
-                out_data[-1]['type'] = car.attrib['type']
-                out_data[-1]['id'] = car.attrib['id']
-                out_data[-1]['eclass'] = car.attrib['eclass']
-                out_data[-1]['waiting'] = float(car.attrib['waiting'])
-                out_data[-1]['NOx'] = float(car.attrib['NOx'])
-                out_data[-1]['fuel'] = float(car.attrib['fuel'])
-                out_data[-1]['HC'] = float(car.attrib['HC'])
-                out_data[-1]['x'] = float(car.attrib['x'])
-                out_data[-1]['route'] = car.attrib['route']
-                out_data[-1]['relative_position'] = float(car.attrib['pos'])
-                out_data[-1]['noise'] = float(car.attrib['noise'])
-                out_data[-1]['angle'] = float(car.attrib['angle'])
-                out_data[-1]['PMx'] = float(car.attrib['PMx'])
-                out_data[-1]['speed'] = float(car.attrib['speed'])
-                out_data[-1]['edge_id'] = car.attrib['lane'].rpartition('_')[0]
-                out_data[-1]['lane_number'] = car.attrib['lane'].\
-                    rpartition('_')[-1]
-            except KeyError:
-                del out_data[-1]
-
-    # sort the elements of the dictionary by the vehicle id
-    out_data = sorted(out_data, key=lambda k: k['id'])
-
     # default output path
     if output_path is None:
         output_path = emission_path[:-3] + 'csv'
 
-    # output the dict data into a csv file
-    keys = out_data[0].keys()
-    with open(output_path, 'w') as output_file:
-        dict_writer = csv.DictWriter(output_file, keys)
-        dict_writer.writeheader()
-        dict_writer.writerows(out_data)
+    chunks = _emission_chunks(emission_path, chunk_size)
+    header = next(chunks)
+
+    if not sort_by_id:
+        with open(output_path, 'w', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(header)
+            for chunk in chunks:
+                writer.writerows(chunk)
+        return
+
+    # sort every chunk by vehicle id, and store them as separate runs
+    id_index = header.index('id')
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(output_path) or None)
+    try:
+        runs = []
+        for chunk in chunks:
+            chunk.sort(key=lambda row: row[id_index])
+            runs.append(os.path.join(tmp_dir, 'run-{}'.format(len(runs))))
+            with open(runs[-1], 'w', newline='') as f:
+                csv.writer(f).writerows(chunk)
+
+        # merge the runs, a group at a time. Rows with the same id are kept in
+        # the order of the runs, i.e. by time.
+        num_merged = 0
+        while len(runs) > MAX_MERGED_RUNS:
+            groups = [runs[i:i + MAX_MERGED_RUNS]
+                      for i in range(0, len(runs), MAX_MERGED_RUNS)]
+            runs = []
+            for group in groups:
+                runs.append(os.path.join(
+                    tmp_dir, 'merged-{}'.format(num_merged)))
+                num_merged += 1
+                _merge_runs(group, id_index, runs[-1])
+        _merge_runs(runs, id_index, output_path, header)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _emission_chunks(emission_path, chunk_size):
+    """Parse the rows of an emission file, a chunk at a time.
+
+    Yields the header of the file first, and then lists of rows. Every chunk
+    is converted column by column, and the elements of the file are cleared
+    as soon as they are parsed.
+    """
+    attributes = EMISSION_ATTRIBUTES
+    header = None
+    rows = []
+    for event, elem in etree.iterparse(
+            emission_path, events=('start', 'end'),
+            tag=('emission-export', 'fcd-export', 'timestep'),
+            recover=True, huge_tree=True):
+        if event == 'start':
+            if elem.tag == 'fcd-export':
+                attributes = FCD_ATTRIBUTES
+            continue
+        if elem.tag != 'timestep':
+            continue
+
+        if header is None:
+            header = ['time'] + [column for _, column, _ in attributes] + \
+                ['edge_id', 'lane_number']
+            yield header
+
+        time = elem.attrib['time']
+        for veh in elem.iterchildren('vehicle'):
+            attrib = veh.attrib
+            try:
+                rows.append([time] + [attrib[name] for name, _, _ in
+                                      attributes] + [attrib['lane']])
+            except KeyError:
+                continue
+
+        # free the memory of the elements that were parsed
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+        if len(rows) >= chunk_size:
+            yield _convert_rows(rows, attributes)
+            rows = []
+
+    if header is None:
+        yield ['time'] + [column for _, column, _ in attributes] + \
+            ['edge_id', 'lane_number']
+    if rows:
+        yield _convert_rows(rows, attributes)
+
+
+def _convert_rows(rows, attributes):
+    """Convert the attributes of a chunk of rows to the values of the csv."""
+    columns = list(zip(*rows))
+    numerical = [True] + [numerical for _, _, numerical in attributes]
+    for i, is_numerical in enumerate(numerical):
+        if is_numerical:
+            columns[i] = list(map(str, np.array(
+                columns[i], dtype=np.float64).tolist()))
+    lanes = [lane.rpartition('_') for lane in columns[-1]]
+    columns[-1:] = [[lane[0] for lane in lanes], [lane[2] for lane in lanes]]
+    return [list(row) for row in zip(*columns)]
+
+
+def _merge_runs(runs, id_index, output_path, header=None):
+    """Merge sorted runs of rows into a csv file, and delete the runs."""
+    files = [open(run, newline='') for run in runs]
+    try:
+        with open(output_path, 'w', newline='') as output_file:
+            writer = csv.writer(output_file)
+            if header is not None:
+                writer.writerow(header)
+            writer.writerows(heapq.merge(
+                *[csv.reader(f) for f in files],
+                key=lambda row: row[id_index]))
+    finally:
+        for f in files:
+            f.close()
+    for run in runs:
+        os.remove(run)
@@ -2,6 +2,7 @@
 
 from abc import ABCMeta, abstractmethod
 from copy import deepcopy
+from functools import partial
 import os
 import atexit
 import time
@@ -10,6 +11,8 @@ import numpy as np
 import random
 import shutil
 import subprocess
+import tempfile
+import warnings
 from flow.renderer.pyglet_renderer import PygletRenderer as Renderer
 from flow.utils.flow_warnings import deprecated_attribute
 
@@ -24,6 +27,9 @@ import sumolib
 
 from flow.core.util import ensure_dir
 from flow.core.kernel import Kernel
+from flow.core.kernel.events import EVENTS
+from flow.core.profiler import StepProfiler, NullProfiler, profiled
+from flow.controllers.base_controller import BaseController
 from flow.utils.exceptions import FatalFlowError
 
 
@@ -98,8 +104,25 @@ class Env(gym.Env, metaclass=ABCMeta):
         renderer class, used to collect image-based representations of the
         traffic network. This attribute is set to None if `sim_params.render`
         is set to True or False.
+    eager_vehicle_data : tuple of str
+        derived vehicle data (e.g. lane leaders and headways) that the
+        environment needs after every step, and that the vehicle kernel should
+        therefore compute right after every update. All other derived data is
+        computed the first time it is accessed in a step, if at all. See
+        flow.core.kernel.vehicle.traci.DERIVED_DATA
+    profiler : flow.core.profiler.StepProfiler or NullProfiler
+        profiler timing the phases of the steps and resets of the environment,
+        if `env_params.profile` is set to True
+    supports_overlap_steps : bool
+        whether `get_state` and `compute_reward` only read the data collected
+        by the kernel, without any TraCI command, so that they may be
+        computed while the simulator performs a step (see
+        flow.core.params.EnvParams.overlap_steps)
     """
 
+    eager_vehicle_data = ()
+    supports_overlap_steps = False
+
     def __init__(self,
                  env_params,
                  sim_params,
@@ -155,9 +178,68 @@ class Env(gym.Env, metaclass=ABCMeta):
         # the simulator used by this environment
         self.simulator = simulator
 
+        # time the phases of the steps and resets, if requested
+        try:
+            profile = env_params.profile
+            profile_path = env_params.profile_path
+        except AttributeError:
+            profile, profile_path = False, None
+
+        # whether the observations and rewards are computed while the last
+        # simulation step of every step is performed. They then lag one
+        # simulation step behind, which is only done for environments that
+        # support it, and if there are several simulation steps per step
+        try:
+            overlap_steps = env_params.overlap_steps
+        except AttributeError:
+            overlap_steps = False
+        self._overlap_steps = overlap_steps and \
+            self.supports_overlap_steps and env_params.sims_per_step > 1
+        if overlap_steps and not self._overlap_steps:
+            warnings.warn(
+                'Steps are not overlapped, as {} does not support it or '
+                'sims_per_step is 1.'.format(type(self).__name__))
+
+        # whether to reset the simulation by restoring its state after the
+        # initial placement of vehicles, and the saved state (if any)
+        try:
+            self._fast_reset = sim_params.fast_reset
+        except AttributeError:
+            self._fast_reset = False
+        self._reset_state = None
+        if self._fast_reset and sim_params.restart_instance:
+            warnings.warn(
+                'SumoParams.fast_reset supersedes restart_instance: the sumo '
+                'instance is neither restarted nor reseeded upon reset.')
+        if profile:
+            self.profiler = StepProfiler(
+                trace_dir=profile_path, name=self.network.name)
+        else:
+            self.profiler = NullProfiler()
+
         # create the Flow kernel
         self.k = Kernel(simulator=self.simulator,
-                        sim_params=self.sim_params)
+                        sim_params=self.sim_params,
+                        profiler=self.profiler)
+        if self.simulator == 'traci':
+            self.k.vehicle.set_eager_data(self.eager_vehicle_data)
+
+        # vehicles whose routing controllers are triggered by the events of
+        # the kernel, see _get_routing_ids
+        self._routing_requests = None
+        self._poll_routers = True
+        if self.k.events is not None:
+            routers = [params['routing_controller'][0] for params in
+                       self.network.vehicles.type_parameters.values()
+                       if params['routing_controller'] is not None]
+            self._routing_requests = dict()
+            self._poll_routers = any(
+                router.trigger_events is None for router in routers)
+            for event in EVENTS:
+                if any(event in (router.trigger_events or ())
+                       for router in routers):
+                    self.k.events.subscribe(
+                        event, partial(self._request_routing, event))
 
         # use the network class's network parameters to generate the necessary
         # network components within the network kernel
@@ -245,6 +327,9 @@ class Env(gym.Env, metaclass=ABCMeta):
         render : bool, optional
             specifies whether to use the gui
         """
+        # the saved state does not apply to the new instance
+        self._discard_reset_state()
+
         self.k.close()
 
         # killed the sumo process if using sumo/TraCI
@@ -292,6 +377,7 @@ class Env(gym.Env, metaclass=ABCMeta):
 
             self.initial_state[veh_id] = (type_id, edge, lane, pos, speed)
 
+    @profiled('step')
     def step(self, rl_actions):
         """Advance the environment by one step.
 
@@ -322,58 +408,76 @@ class Env(gym.Env, metaclass=ABCMeta):
         info : dict
             contains other diagnostic information from the previous action
         """
-        for _ in range(self.env_params.sims_per_step):
+        crash = False
+        states = None
+        for i in range(self.env_params.sims_per_step):
             self.time_counter += 1
             self.step_counter += 1
 
             # perform acceleration actions for controlled human-driven vehicles
-            if len(self.k.vehicle.get_controlled_ids()) > 0:
-                accel = []
-                for veh_id in self.k.vehicle.get_controlled_ids():
-                    action = self.k.vehicle.get_acc_controller(
-                        veh_id).get_action(self)
-                    accel.append(action)
-                self.k.vehicle.apply_acceleration(
-                    self.k.vehicle.get_controlled_ids(), accel)
+            with self.profiler.phase('controllers'):
+                if len(self.k.vehicle.get_controlled_ids()) > 0:
+                    accel = BaseController.get_accel_batch(
+                        self, self.k.vehicle.get_controlled_ids())
+                    self.k.vehicle.apply_acceleration(
+                        self.k.vehicle.get_controlled_ids(), accel)
 
             # perform lane change actions for controlled human-driven vehicles
-            if len(self.k.vehicle.get_controlled_lc_ids()) > 0:
-                direction = []
-                for veh_id in self.k.vehicle.get_controlled_lc_ids():
-                    target_lane = self.k.vehicle.get_lane_changing_controller(
-                        veh_id).get_action(self)
-                    direction.append(target_lane)
-                self.k.vehicle.apply_lane_change(
-                    self.k.vehicle.get_controlled_lc_ids(),
-                    direction=direction)
+            with self.profiler.phase('lane_changers'):
+                if len(self.k.vehicle.get_controlled_lc_ids()) > 0:
+                    direction = []
+                    for veh_id in self.k.vehicle.get_controlled_lc_ids():
+                        target_lane = \
+                            self.k.vehicle.get_lane_changing_controller(
+                                veh_id).get_action(self)
+                        direction.append(target_lane)
+                    self.k.vehicle.apply_lane_change(
+                        self.k.vehicle.get_controlled_lc_ids(),
+                        direction=direction)
 
             # perform (optionally) routing actions for all vehicles in the
             # network, including RL and SUMO-controlled vehicles
-            routing_ids = []
-            routing_actions = []
-            for veh_id in self.k.vehicle.get_ids():
-                if self.k.vehicle.get_routing_controller(veh_id) \
-                        is not None:
-                    routing_ids.append(veh_id)
-                    route_contr = self.k.vehicle.get_routing_controller(
-                        veh_id)
-                    routing_actions.append(route_contr.choose_route(self))
-
-            self.k.vehicle.choose_routes(routing_ids, routing_actions)
-
-            self.apply_rl_actions(rl_actions)
-
-            self.additional_command()
-
-            # advance the simulation in the simulator by one step
-            self.k.simulation.simulation_step()
+            with self.profiler.phase('routing'):
+                routing_ids = []
+                routing_actions = []
+                for veh_id in self._get_routing_ids():
+                    if self.k.vehicle.get_routing_controller(veh_id) \
+                            is not None:
+                        routing_ids.append(veh_id)
+                        route_contr = self.k.vehicle.get_routing_controller(
+                            veh_id)
+                        routing_actions.append(route_contr.choose_route(self))
+
+                self.k.vehicle.choose_routes(routing_ids, routing_actions)
+
+            with self.profiler.phase('apply_rl_actions'):
+                self.apply_rl_actions(rl_actions)
+
+            with self.profiler.phase('additional_command'):
+                self.additional_command()
+
+            # advance the simulation in the simulator by one step. If steps
+            # are overlapped, the observation and reward are computed from
+            # the current state while the last simulation step is performed
+            if self._overlap_steps and \
+                    i == self.env_params.sims_per_step - 1:
+                with self.profiler.phase('simulation_step'):
+                    self.k.simulation.simulation_step_async()
+                states, reward = self._observe(rl_actions, crash)
+                with self.profiler.phase('simulation_step_wait'):
+                    self.k.simulation.simulation_step_wait()
+            else:
+                with self.profiler.phase('simulation_step'):
+                    self.k.simulation.simulation_step()
 
             # store new observations in the vehicles and traffic lights class
-            self.k.update(reset=False)
+            with self.profiler.phase('update'):
+                self.k.update(reset=False)
 
             # update the colors of vehicles
             if self.sim_params.render:
-                self.k.vehicle.update_vehicle_colors()
+                with self.profiler.phase('render'):
+                    self.k.vehicle.update_vehicle_colors()
 
             # crash encodes whether the simulator experienced a collision
             crash = self.k.simulation.check_collision()
@@ -383,13 +487,13 @@ class Env(gym.Env, metaclass=ABCMeta):
                 break
 
             # render a frame
-            self.render()
+            with self.profiler.phase('render'):
+                self.render()
 
-        states = self.get_state()
-
-        # collect information of the state of the network based on the
-        # environment class used
-        self.state = np.asarray(states).T
+        # the results of overlapped steps describe the state before the last
+        # simulation step, unless it ended with a collision
+        if states is None or crash:
+            states, reward = self._observe(rl_actions, crash)
 
         # collect observation new state associated with action
         next_observation = np.copy(states)
@@ -403,15 +507,74 @@ class Env(gym.Env, metaclass=ABCMeta):
         # compute the info for each agent
         infos = {}
 
+        return next_observation, reward, done, infos
+
+    def _observe(self, rl_actions, crash):
+        """Compute the observation and reward of the current state.
+
+        Parameters
+        ----------
+        rl_actions : array_like
+            actions provided by the rl algorithm during the step
+        crash : bool
+            whether a collision occurred during the step
+
+        Returns
+        -------
+        array_like
+            observation of the environment
+        float
+            reward of the step
+        """
+        with self.profiler.phase('get_state'):
+            states = self.get_state()
+
+        # collect information of the state of the network based on the
+        # environment class used
+        self.state = np.asarray(states).T
+
         # compute the reward
-        if self.env_params.clip_actions:
-            rl_clipped = self.clip_actions(rl_actions)
-            reward = self.compute_reward(rl_clipped, fail=crash)
-        else:
-            reward = self.compute_reward(rl_actions, fail=crash)
+        with self.profiler.phase('compute_reward'):
+            if self.env_params.clip_actions:
+                rl_clipped = self.clip_actions(rl_actions)
+                reward = self.compute_reward(rl_clipped, fail=crash)
+            else:
+                reward = self.compute_reward(rl_actions, fail=crash)
+
+        return states, reward
+
+    def _request_routing(self, event, veh_ids):
+        """Mark the vehicles whose routers are triggered by an event."""
+        for veh_id in veh_ids:
+            router = self.k.vehicle.get_routing_controller(veh_id)
+            if router is not None and router.trigger_events is not None and \
+                    event in router.trigger_events:
+                self._routing_requests[veh_id] = None
+
+    def _get_routing_ids(self):
+        """Return the vehicles whose routers should choose a route.
+
+        These are all vehicles in the network, unless the simulator supports
+        events, in which case these are the vehicles whose routers were
+        triggered by an event since the last step (see
+        flow.controllers.BaseRouter.trigger_events), as well as those whose
+        routers act at every step.
+        """
+        if self._routing_requests is None:
+            return self.k.vehicle.get_ids()
 
-        return next_observation, reward, done, infos
+        veh_ids = list(self._routing_requests)
+        self._routing_requests.clear()
+        if self._poll_routers:
+            requested = set(veh_ids)
+            for veh_id in self.k.vehicle.get_ids():
+                router = self.k.vehicle.get_routing_controller(veh_id)
+                if router is not None and router.trigger_events is None and \
+                        veh_id not in requested:
+                    veh_ids.append(veh_id)
+        return veh_ids
 
+    @profiled('reset', episode=True)
     def reset(self):
         """Reset the environment.
 
@@ -440,7 +603,8 @@ class Env(gym.Env, metaclass=ABCMeta):
 
         # warn about not using restart_instance when using inflows
         if len(self.net_params.inflows.get()) > 0 and \
-                not self.sim_params.restart_instance:
+                not (self.sim_params.restart_instance or self._fast_reset or
+                     self.k.inflows is not None):
             print(
                 "**********************************************************\n"
                 "**********************************************************\n"
@@ -453,96 +617,115 @@ class Env(gym.Env, metaclass=ABCMeta):
                 "**********************************************************"
             )
 
-        if self.sim_params.restart_instance or \
-                (self.step_counter > 2e6 and self.simulator != 'aimsun'):
+        # a saved state of the simulation supersedes restarting the instance
+        if (self.sim_params.restart_instance and self._reset_state is None) \
+                or (self.step_counter > 2e6 and self.simulator != 'aimsun'):
             self.step_counter = 0
             # issue a random seed to induce randomness into the next rollout
-            self.sim_params.seed = random.randint(0, 1e5)
+            self.sim_params.seed = self.k.simulation.next_seed()
 
             self.k.vehicle = deepcopy(self.initial_vehicles)
             self.k.vehicle.master_kernel = self.k
             # restart the sumo instance
-            self.restart_simulation(self.sim_params)
+            with self.profiler.phase('restart_simulation'):
+                self.restart_simulation(self.sim_params)
 
         # perform shuffling (if requested)
         elif self.initial_config.shuffle:
             self.setup_initial_state()
 
-        # clear all vehicles from the network and the vehicles class
-        if self.simulator == 'traci':
-            for veh_id in self.k.kernel_api.vehicle.getIDList():  # FIXME: hack
+        if self._reset_state is not None:
+            # restore the state of the simulation after the initial placement
+            # of vehicles, see SumoParams.fast_reset
+            with self.profiler.phase('load_state'):
+                self.k.load_state(self._reset_state)
+                self._sample_speed_factors()
+        else:
+            # clear all vehicles from the network and the vehicles class
+            if self.simulator == 'traci':
+                for veh_id in self.k.kernel_api.vehicle.getIDList():  # FIXME: hack
+                    try:
+                        self.k.vehicle.remove(veh_id)
+                    except (FatalTraCIError, TraCIException):
+                        print(traceback.format_exc())
+
+            # clear all vehicles from the network and the vehicles class
+            # FIXME (ev, ak) this is weird and shouldn't be necessary
+            for veh_id in list(self.k.vehicle.get_ids()):
+                # do not try to remove the vehicles from the network in the first
+                # step after initializing the network, as there will be no vehicles
+                if self.step_counter == 0:
+                    continue
                 try:
                     self.k.vehicle.remove(veh_id)
                 except (FatalTraCIError, TraCIException):
-                    print(traceback.format_exc())
-
-        # clear all vehicles from the network and the vehicles class
-        # FIXME (ev, ak) this is weird and shouldn't be necessary
-        for veh_id in list(self.k.vehicle.get_ids()):
-            # do not try to remove the vehicles from the network in the first
-            # step after initializing the network, as there will be no vehicles
-            if self.step_counter == 0:
-                continue
-            try:
-                self.k.vehicle.remove(veh_id)
-            except (FatalTraCIError, TraCIException):
-                print("Error during start: {}".format(traceback.format_exc()))
-
-        # do any additional resetting of the vehicle class needed
-        self.k.vehicle.reset()
-
-        # reintroduce the initial vehicles to the network
-        for veh_id in self.initial_ids:
-            type_id, edge, lane_index, pos, speed = \
-                self.initial_state[veh_id]
-
-            try:
-                self.k.vehicle.add(
-                    veh_id=veh_id,
-                    type_id=type_id,
-                    edge=edge,
-                    lane=lane_index,
-                    pos=pos,
-                    speed=speed)
-            except (FatalTraCIError, TraCIException):
-                # if a vehicle was not removed in the first attempt, remove it
-                # now and then reintroduce it
-                self.k.vehicle.remove(veh_id)
-                if self.simulator == 'traci':
-                    self.k.kernel_api.vehicle.remove(veh_id)  # FIXME: hack
-                self.k.vehicle.add(
-                    veh_id=veh_id,
-                    type_id=type_id,
-                    edge=edge,
-                    lane=lane_index,
-                    pos=pos,
-                    speed=speed)
-
-        # advance the simulation in the simulator by one step
-        self.k.simulation.simulation_step()
-
-        # update the information in each kernel to match the current state
-        self.k.update(reset=True)
-
-        # update the colors of vehicles
-        if self.sim_params.render:
-            self.k.vehicle.update_vehicle_colors()
+                    print("Error during start: {}".format(traceback.format_exc()))
 
-        if self.simulator == 'traci':
-            initial_ids = self.k.kernel_api.vehicle.getIDList()
-        else:
-            initial_ids = self.initial_ids
+            # do any additional resetting of the vehicle class needed
+            self.k.vehicle.reset()
 
-        # check to make sure all vehicles have been spawned
-        if len(self.initial_ids) > len(initial_ids):
-            missing_vehicles = list(set(self.initial_ids) - set(initial_ids))
-            msg = '\nNot enough vehicles have spawned! Bad start?\n' \
-                  'Missing vehicles / initial state:\n'
-            for veh_id in missing_vehicles:
-                msg += '- {}: {}\n'.format(veh_id, self.initial_state[veh_id])
-            raise FatalFlowError(msg=msg)
+            # start the inflows anew, see SumoParams.runtime_inflows
+            if self.k.inflows is not None:
+                self.k.inflows.reset()
 
-        states = self.get_state()
+            # reintroduce the initial vehicles to the network
+            for veh_id in self.initial_ids:
+                type_id, edge, lane_index, pos, speed = \
+                    self.initial_state[veh_id]
+
+                try:
+                    self.k.vehicle.add(
+                        veh_id=veh_id,
+                        type_id=type_id,
+                        edge=edge,
+                        lane=lane_index,
+                        pos=pos,
+                        speed=speed)
+                except (FatalTraCIError, TraCIException):
+                    # if a vehicle was not removed in the first attempt, remove it
+                    # now and then reintroduce it
+                    self.k.vehicle.remove(veh_id)
+                    if self.simulator == 'traci':
+                        self.k.kernel_api.vehicle.remove(veh_id)  # FIXME: hack
+                    self.k.vehicle.add(
+                        veh_id=veh_id,
+                        type_id=type_id,
+                        edge=edge,
+                        lane=lane_index,
+                        pos=pos,
+                        speed=speed)
+
+            # advance the simulation in the simulator by one step
+            with self.profiler.phase('simulation_step'):
+                self.k.simulation.simulation_step()
+
+            # update the information in each kernel to match the current state
+            with self.profiler.phase('update'):
+                self.k.update(reset=True)
+
+            # update the colors of vehicles
+            if self.sim_params.render:
+                self.k.vehicle.update_vehicle_colors()
+
+            if self.simulator == 'traci':
+                initial_ids = self.k.kernel_api.vehicle.getIDList()
+            else:
+                initial_ids = self.initial_ids
+
+            # check to make sure all vehicles have been spawned
+            if len(self.initial_ids) > len(initial_ids):
+                missing_vehicles = list(set(self.initial_ids) - set(initial_ids))
+                msg = '\nNot enough vehicles have spawned! Bad start?\n' \
+                      'Missing vehicles / initial state:\n'
+                for veh_id in missing_vehicles:
+                    msg += '- {}: {}\n'.format(veh_id, self.initial_state[veh_id])
+                raise FatalFlowError(msg=msg)
+
+            if self._fast_reset and not self.initial_config.shuffle:
+                self._save_reset_state()
+
+        with self.profiler.phase('get_state'):
+            states = self.get_state()
 
         # collect information of the state of the network based on the
         # environment class used
@@ -556,10 +739,54 @@ class Env(gym.Env, metaclass=ABCMeta):
             observation, _, _, _ = self.step(rl_actions=None)
 
         # render a frame
-        self.render(reset=True)
+        with self.profiler.phase('render'):
+            self.render(reset=True)
 
         return observation
 
+    def _save_reset_state(self):
+        """Save the state of the simulation to restore it upon reset.
+
+        This is called after the initial placement of vehicles if
+        SumoParams.fast_reset is set, see `reset`.
+        """
+        fd, path = tempfile.mkstemp(
+            prefix='{}_'.format(self.network.name), suffix='.state.xml')
+        os.close(fd)
+        self._reset_state = self.k.save_state(path)
+
+    def _sample_speed_factors(self):
+        """Draw new speed factors for the vehicles of a restored state.
+
+        The vehicles of the saved state keep the speed factors drawn by sumo
+        when they were first inserted. New ones are drawn as sumo does when
+        vehicles are inserted, i.e. from a normal distribution given by the
+        speed factor and deviation of their type, truncated to [0.2, 2].
+        """
+        for veh_id in self.k.vehicle.get_ids():
+            params = self.k.vehicle.type_parameters[self.k.vehicle.get_type(
+                veh_id)]["car_following_params"].controller_params
+            mean = float(params["speedFactor"])
+            dev = float(params["speedDev"])
+            if dev <= 0:
+                continue
+            for _ in range(100):
+                factor = np.random.normal(mean, dev)
+                if 0.2 <= factor <= 2:
+                    break
+            self.k.command_buffer.add(
+                'vehicle', 'setSpeedFactor', veh_id, min(max(factor, 0.2), 2))
+
+    def _discard_reset_state(self):
+        """Remove the saved state of the simulation, if any."""
+        if self._reset_state is None:
+            return
+        try:
+            os.remove(self._reset_state['simulation']['path'])
+        except OSError:
+            pass
+        self._reset_state = None
+
     def additional_command(self):
         """Additional commands that may be performed by the step method."""
         pass
@@ -688,6 +915,14 @@ class Env(gym.Env, metaclass=ABCMeta):
         Should be done at end of every experiment. Must be in Env because the
         environment opens the TraCI connection.
         """
+        # dump the trace of the last episode, if profiled
+        self.profiler.end_episode()
+        self._discard_reset_state()
+
+        # terminate the sumo processes launched ahead of restarts, if any
+        if self.simulator == 'traci':
+            self.k.simulation.launcher.close()
+
         try:
             # close everything within the kernel
             self.k.close()
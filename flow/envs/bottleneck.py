@@ -21,6 +21,7 @@ import numpy as np
 from gym.spaces.box import Box
 
 from flow.core import rewards
+from flow.core.kernel.events import EDGE_CHANGED
 from flow.envs.base import Env
 
 MAX_LANES = 4  # base number of largest number of lanes in the network
@@ -106,10 +107,6 @@ class BottleneckEnv(Env):
         A factor describing how many lanes are in the system. Scaling=1 implies
         4 lanes going to 2 going to 1, scaling=2 implies 8 lanes going to 4
         going to 2, etc.
-    edge_dict : dict of dicts
-        A dict mapping edges to a dict of lanes where each entry in the lane
-        dict tracks the vehicles that are in that lane. Used to save on
-        unnecessary lookups.
     cars_waiting_for_toll : {veh_id: {lane_change_mode: int, color: (int)}}
         A dict mapping vehicle ids to a dict tracking the color and lane change
         mode of vehicles before they entered the toll area. When vehicles exit
@@ -201,7 +198,6 @@ class BottleneckEnv(Env):
         env_add_params = self.env_params.additional_params
         # tells how scaled the number of lanes are
         self.scaling = network.net_params.additional_params.get("scaling", 1)
-        self.edge_dict = dict()
         self.cars_waiting_for_toll = dict()
         self.cars_before_ramp = dict()
         self.toll_wait_time = np.abs(
@@ -230,30 +226,44 @@ class BottleneckEnv(Env):
         self.smoothed_num = np.zeros(10)  # averaged number of vehs in '4'
         self.outflow_index = 0
 
+        # vehicles that moved to a new edge since the last step, used to
+        # detect vehicles that passed the toll booth or the ramp meters. If
+        # the simulator does not support events, all vehicles are checked.
+        self._moved_ids = None
+        if self.k.events is not None and not (
+                env_add_params['disable_tb'] and
+                env_add_params['disable_ramp_metering']):
+            self._moved_ids = dict()
+            self.k.events.subscribe(EDGE_CHANGED, self._on_edge_changed)
+
+    def _on_edge_changed(self, veh_ids):
+        """Store the vehicles that moved to a new edge."""
+        self._moved_ids.update(dict.fromkeys(veh_ids))
+
+    def _get_passed_ids(self, cars, edge):
+        """Return the vehicles in a dict of cars that are on a given edge.
+
+        This is used to find the cars waiting at the toll booth (or the ramp
+        meters) that already passed it. The cars are returned in the order of
+        the dict.
+        """
+        if self._moved_ids is not None:
+            # only the cars that moved to a new edge may have passed
+            moved = {veh_id for veh_id in self._moved_ids if veh_id in cars}
+            if len(moved) == 0:
+                return []
+            cars = [veh_id for veh_id in cars if veh_id in moved]
+        return [veh_id for veh_id in cars
+                if self.k.vehicle.get_edge(veh_id) == edge]
+
     def additional_command(self):
-        """Build a dict with vehicle information.
+        """Apply the toll booth and ramp meter controls, if enabled.
 
-        The dict contains the list of vehicles and their position for each edge
-        and for each edge within the edge.
+        This also keeps track of the number of vehicles in the last edge,
+        which is used by the ramp meters.
         """
         super().additional_command()
 
-        # build a dict containing the list of vehicles and their position for
-        # each edge and for each lane within the edge
-        empty_edge = [[] for _ in range(MAX_LANES * self.scaling)]
-
-        self.edge_dict = {k: deepcopy(empty_edge) for k in EDGE_LIST}
-        for veh_id in self.k.vehicle.get_ids():
-            try:
-                edge = self.k.vehicle.get_edge(veh_id)
-                if edge not in self.edge_dict:
-                    self.edge_dict[edge] = deepcopy(empty_edge)
-                lane = self.k.vehicle.get_lane(veh_id)  # integer
-                pos = self.k.vehicle.get_position(veh_id)
-                self.edge_dict[edge][lane].append((veh_id, pos))
-            except Exception:
-                pass
-
         if not self.env_params.additional_params['disable_tb']:
             self.apply_toll_bridge_control()
         if not self.env_params.additional_params['disable_ramp_metering']:
@@ -266,6 +276,9 @@ class BottleneckEnv(Env):
         self.outflow_index = \
             (self.outflow_index + 1) % self.smoothed_num.shape[0]
 
+        if self._moved_ids is not None:
+            self._moved_ids.clear()
+
     def ramp_meter_lane_change_control(self):
         """Control lane change behavior of vehicles near the ramp meters.
 
@@ -279,25 +292,26 @@ class BottleneckEnv(Env):
         behavior of the vehicles has been adjusted, we temporary set the color
         of the affected vehicles to light blue.
         """
-        cars_that_have_left = []
-        for veh_id in self.cars_before_ramp:
-            if self.k.vehicle.get_edge(veh_id) == EDGE_AFTER_RAMP_METER:
-                color = self.cars_before_ramp[veh_id]['color']
-                self.k.vehicle.set_color(veh_id, color)
-                if self.simulator == 'traci':
-                    lane_change_mode = self.cars_before_ramp[veh_id][
-                        'lane_change_mode']
-                    self.k.kernel_api.vehicle.setLaneChangeMode(
-                        veh_id, lane_change_mode)
-                cars_that_have_left.append(veh_id)
+        cars_that_have_left = self._get_passed_ids(
+            self.cars_before_ramp, EDGE_AFTER_RAMP_METER)
+        for veh_id in cars_that_have_left:
+            color = self.cars_before_ramp[veh_id]['color']
+            self.k.vehicle.set_color(veh_id, color)
+            if self.simulator == 'traci':
+                lane_change_mode = self.cars_before_ramp[veh_id][
+                    'lane_change_mode']
+                self.k.kernel_api.vehicle.setLaneChangeMode(
+                    veh_id, lane_change_mode)
 
         for veh_id in cars_that_have_left:
             del self.cars_before_ramp[veh_id]
 
         for lane in range(NUM_RAMP_METERS * self.scaling):
-            cars_in_lane = self.edge_dict[EDGE_BEFORE_RAMP_METER][lane]
+            cars_in_lane = self.k.vehicle.get_ids_by_lane(
+                EDGE_BEFORE_RAMP_METER, lane)
 
-            for veh_id, pos in cars_in_lane:
+            for veh_id in cars_in_lane:
+                pos = self.k.vehicle.get_position(veh_id)
                 if pos > RAMP_METER_AREA:
                     if veh_id not in self.cars_waiting_for_toll:
                         if self.simulator == 'traci':
@@ -370,31 +384,29 @@ class BottleneckEnv(Env):
         long a vehicle should wait. We then turn on a red light for that many
         seconds.
         """
-        cars_that_have_left = []
-        for veh_id in self.cars_waiting_for_toll:
-            if self.k.vehicle.get_edge(veh_id) == EDGE_AFTER_TOLL:
-                lane = self.k.vehicle.get_lane(veh_id)
-                color = self.cars_waiting_for_toll[veh_id]["color"]
-                self.k.vehicle.set_color(veh_id, color)
-                if self.simulator == 'traci':
-                    lane_change_mode = \
-                        self.cars_waiting_for_toll[veh_id]["lane_change_mode"]
-                    self.k.kernel_api.vehicle.setLaneChangeMode(
-                        veh_id, lane_change_mode)
-                if lane not in self.fast_track_lanes:
-                    self.toll_wait_time[lane] = max(
-                        0,
-                        np.random.normal(
-                            MEAN_NUM_SECONDS_WAIT_AT_TOLL / self.sim_step,
-                            1 / self.sim_step))
-                else:
-                    self.toll_wait_time[lane] = max(
-                        0,
-                        np.random.normal(
-                            MEAN_NUM_SECONDS_WAIT_AT_FAST_TRACK /
-                            self.sim_step, 1 / self.sim_step))
-
-                cars_that_have_left.append(veh_id)
+        cars_that_have_left = self._get_passed_ids(
+            self.cars_waiting_for_toll, EDGE_AFTER_TOLL)
+        for veh_id in cars_that_have_left:
+            lane = self.k.vehicle.get_lane(veh_id)
+            color = self.cars_waiting_for_toll[veh_id]["color"]
+            self.k.vehicle.set_color(veh_id, color)
+            if self.simulator == 'traci':
+                lane_change_mode = \
+                    self.cars_waiting_for_toll[veh_id]["lane_change_mode"]
+                self.k.kernel_api.vehicle.setLaneChangeMode(
+                    veh_id, lane_change_mode)
+            if lane not in self.fast_track_lanes:
+                self.toll_wait_time[lane] = max(
+                    0,
+                    np.random.normal(
+                        MEAN_NUM_SECONDS_WAIT_AT_TOLL / self.sim_step,
+                        1 / self.sim_step))
+            else:
+                self.toll_wait_time[lane] = max(
+                    0,
+                    np.random.normal(
+                        MEAN_NUM_SECONDS_WAIT_AT_FAST_TRACK /
+                        self.sim_step, 1 / self.sim_step))
 
         for veh_id in cars_that_have_left:
             del self.cars_waiting_for_toll[veh_id]
@@ -402,9 +414,11 @@ class BottleneckEnv(Env):
         traffic_light_states = ["G"] * NUM_TOLL_LANES * self.scaling
 
         for lane in range(NUM_TOLL_LANES * self.scaling):
-            cars_in_lane = self.edge_dict[EDGE_BEFORE_TOLL][lane]
+            cars_in_lane = self.k.vehicle.get_ids_by_lane(
+                EDGE_BEFORE_TOLL, lane)
 
-            for veh_id, pos in cars_in_lane:
+            for veh_id in cars_in_lane:
+                pos = self.k.vehicle.get_position(veh_id)
                 if pos > TOLL_BOOTH_AREA:
                     if veh_id not in self.cars_waiting_for_toll:
                         # Disable lane changes inside Toll Area
@@ -909,7 +923,7 @@ class BottleneckDesiredVelocityEnv(BottleneckEnv):
             for i, id in enumerate(ids):
                 segment = np.searchsorted(self.obs_slices[edge],
                                           pos_list[i]) - 1
-                if id in self.k.vehicle.get_rl_ids():
+                if self.k.vehicle.is_rl(id):
                     rl_vehicle_speeds[segment, lane_list[i]] \
                         += self.k.vehicle.get_speed(id)
                     num_rl_vehicles[segment, lane_list[i]] += 1
@@ -1002,7 +1016,9 @@ class BottleneckDesiredVelocityEnv(BottleneckEnv):
         creating a new network similar to the previous one, but with a new
         Inflow object with a rate within the additional environment parameter
         "inflow_range", which is a list consisting of the smallest and largest
-        allowable inflow rates.
+        allowable inflow rates. If the vehicles of the inflows are added at
+        runtime (see SumoParams.runtime_inflows), the inflows of the current
+        network are replaced instead.
 
         **WARNING**: The inflows assume there are vehicles of type
         "followerstopper" and "human" within the VehicleParams object.
@@ -1013,25 +1029,36 @@ class BottleneckDesiredVelocityEnv(BottleneckEnv):
             flow_rate = np.random.uniform(
                 min(inflow_range), max(inflow_range)) * self.scaling
 
+            # introduce new inflows within the pre-defined inflow range
+            inflow = InFlows()
+            inflow.add(
+                veh_type="followerstopper",  # FIXME: make generic
+                edge="1",
+                vehs_per_hour=flow_rate * .1,
+                departLane="random",
+                departSpeed=10)
+            inflow.add(
+                veh_type="human",
+                edge="1",
+                vehs_per_hour=flow_rate * .9,
+                departLane="random",
+                departSpeed=10)
+
+            # if the vehicles of the inflows are added at runtime, the inflows
+            # are replaced without creating a new network
+            if self.k.inflows is not None:
+                self.k.inflows.set_inflows(inflow)
+                observation = super().reset()
+
+                # reset the timer to zero
+                self.time_counter = 0
+
+                return observation
+
             # We try this for 100 trials in case unexpected errors during
             # instantiation.
             for _ in range(100):
                 try:
-                    # introduce new inflows within the pre-defined inflow range
-                    inflow = InFlows()
-                    inflow.add(
-                        veh_type="followerstopper",  # FIXME: make generic
-                        edge="1",
-                        vehs_per_hour=flow_rate * .1,
-                        departLane="random",
-                        departSpeed=10)
-                    inflow.add(
-                        veh_type="human",
-                        edge="1",
-                        vehs_per_hour=flow_rate * .9,
-                        departLane="random",
-                        departSpeed=10)
-
                     # all other network parameters should match the previous
                     # environment (we only want to change the inflow)
                     additional_net_params = {
@@ -129,10 +129,6 @@ class BottleneckEnv(Env):
             A factor describing how many lanes are in the system. Scaling=1 implies
             4 lanes going to 2 going to 1, scaling=2 implies 8 lanes going to 4
             going to 2, etc.
-        edge_dict : dict of dicts
-            A dict mapping edges to a dict of lanes where each entry in the lane
-            dict tracks the vehicles that are in that lane. Used to save on
-            unnecessary lookups.
         cars_waiting_for_toll : {veh_id: {lane_change_mode: int, color: (int)}}
             A dict mapping vehicle ids to a dict tracking the color and lane change
             mode of vehicles before they entered the toll area. When vehicles exit
@@ -224,7 +220,6 @@ class BottleneckEnv(Env):
         env_add_params = self.env_params.additional_params
         # tells how scaled the number of lanes are
         self.scaling = network.net_params.additional_params.get("scaling", 1)
-        self.edge_dict = dict()
         self.cars_waiting_for_toll = dict()
         self.cars_before_ramp = dict()
         self.toll_wait_time = np.abs(
@@ -254,29 +249,13 @@ class BottleneckEnv(Env):
         self.outflow_index = 0
 
     def additional_command(self):
-        """Build a dict with vehicle information.
+        """Apply the toll booth and ramp meter controls, if enabled.
 
-        The dict contains the list of vehicles and their position for each edge
-        and for each edge within the edge.
+        This also keeps track of the number of vehicles in the last edge,
+        which is used by the ramp meters.
         """
         super().additional_command()
 
-        # build a dict containing the list of vehicles and their position for
-        # each edge and for each lane within the edge
-        empty_edge = [[] for _ in range(MAX_LANES * self.scaling)]
-
-        self.edge_dict = {k: deepcopy(empty_edge) for k in EDGE_LIST}
-        for veh_id in self.k.vehicle.get_ids():
-            try:
-                edge = self.k.vehicle.get_edge(veh_id)
-                if edge not in self.edge_dict:
-                    self.edge_dict[edge] = deepcopy(empty_edge)
-                lane = self.k.vehicle.get_lane(veh_id)  # integer
-                pos = self.k.vehicle.get_position(veh_id)
-                self.edge_dict[edge][lane].append((veh_id, pos))
-            except Exception:
-                pass
-
         if not self.env_params.additional_params['disable_tb']:
             self.apply_toll_bridge_control()
         if not self.env_params.additional_params['disable_ramp_metering']:
@@ -318,9 +297,11 @@ class BottleneckEnv(Env):
             del self.cars_before_ramp[veh_id]
 
         for lane in range(NUM_RAMP_METERS * self.scaling):
-            cars_in_lane = self.edge_dict[EDGE_BEFORE_RAMP_METER][lane]
+            cars_in_lane = self.k.vehicle.get_ids_by_lane(
+                EDGE_BEFORE_RAMP_METER, lane)
 
-            for veh_id, pos in cars_in_lane:
+            for veh_id in cars_in_lane:
+                pos = self.k.vehicle.get_position(veh_id)
                 if pos > RAMP_METER_AREA:
                     if veh_id not in self.cars_waiting_for_toll:
                         if self.simulator == 'traci':
@@ -425,9 +406,11 @@ class BottleneckEnv(Env):
         traffic_light_states = ["G"] * NUM_TOLL_LANES * self.scaling
 
         for lane in range(NUM_TOLL_LANES * self.scaling):
-            cars_in_lane = self.edge_dict[EDGE_BEFORE_TOLL][lane]
+            cars_in_lane = self.k.vehicle.get_ids_by_lane(
+                EDGE_BEFORE_TOLL, lane)
 
-            for veh_id, pos in cars_in_lane:
+            for veh_id in cars_in_lane:
+                pos = self.k.vehicle.get_position(veh_id)
                 if pos > TOLL_BOOTH_AREA:
                     if veh_id not in self.cars_waiting_for_toll:
                         # Disable lane changes inside Toll Area
@@ -1068,7 +1051,9 @@ class BottleneckDesiredVelocityFairEnv(BottleneckEnv):
         creating a new network similar to the previous one, but with a new
         Inflow object with a rate within the additional environment parameter
         "inflow_range", which is a list consisting of the smallest and largest
-        allowable inflow rates.
+        allowable inflow rates. If the vehicles of the inflows are added at
+        runtime (see SumoParams.runtime_inflows), the inflows of the current
+        network are replaced instead.
 
         **WARNING**: The inflows assume there are vehicles of type
         "followerstopper" and "human" within the VehicleParams object.
@@ -1079,25 +1064,36 @@ class BottleneckDesiredVelocityFairEnv(BottleneckEnv):
             flow_rate = np.random.uniform(
                 min(inflow_range), max(inflow_range)) * self.scaling
 
+            # introduce new inflows within the pre-defined inflow range
+            inflow = InFlows()
+            inflow.add(
+                veh_type="followerstopper",  # FIXME: make generic
+                edge="1",
+                vehs_per_hour=flow_rate * .1,
+                departLane="random",
+                departSpeed=10)
+            inflow.add(
+                veh_type="human",
+                edge="1",
+                vehs_per_hour=flow_rate * .9,
+                departLane="random",
+                departSpeed=10)
+
+            # if the vehicles of the inflows are added at runtime, the inflows
+            # are replaced without creating a new network
+            if self.k.inflows is not None:
+                self.k.inflows.set_inflows(inflow)
+                observation = super().reset()
+
+                # reset the timer to zero
+                self.time_counter = 0
+
+                return observation
+
             # We try this for 100 trials in case unexpected errors during
             # instantiation.
             for _ in range(100):
                 try:
-                    # introduce new inflows within the pre-defined inflow range
-                    inflow = InFlows()
-                    inflow.add(
-                        veh_type="followerstopper",  # FIXME: make generic
-                        edge="1",
-                        vehs_per_hour=flow_rate * .1,
-                        departLane="random",
-                        departSpeed=10)
-                    inflow.add(
-                        veh_type="human",
-                        edge="1",
-                        vehs_per_hour=flow_rate * .9,
-                        departLane="random",
-                        departSpeed=10)
-
                     # all other network parameters should match the previous
                     # environment (we only want to change the inflow)
                     additional_net_params = {
@@ -110,7 +110,7 @@ class MergePOEnv(Env):
         """See class definition."""
         for i, rl_id in enumerate(self.rl_veh):
             # ignore rl vehicles outside the network
-            if rl_id not in self.k.vehicle.get_rl_ids():
+            if not self.k.vehicle.is_rl(rl_id):
                 continue
             self.k.vehicle.apply_acceleration(rl_id, rl_actions[i])
 
@@ -205,10 +205,10 @@ class MergePOEnv(Env):
 
         # remove rl vehicles that exited the network
         for veh_id in list(self.rl_queue):
-            if veh_id not in self.k.vehicle.get_rl_ids():
+            if not self.k.vehicle.is_rl(veh_id):
                 self.rl_queue.remove(veh_id)
         for veh_id in self.rl_veh:
-            if veh_id not in self.k.vehicle.get_rl_ids():
+            if not self.k.vehicle.is_rl(veh_id):
                 self.rl_veh.remove(veh_id)
 
         # fil up rl_veh until they are enough controlled vehicles
@@ -2,7 +2,6 @@
 
 from copy import deepcopy
 import numpy as np
-import random
 import traceback
 from gym.spaces import Box
 
@@ -12,12 +11,15 @@ from traci.exceptions import TraCIException
 from ray.rllib.env import MultiAgentEnv
 
 from flow.envs.base import Env
+from flow.controllers.base_controller import BaseController
+from flow.core.profiler import profiled
 from flow.utils.exceptions import FatalFlowError
 
 
 class MultiEnv(MultiAgentEnv, Env):
     """Multi-agent version of base env. See parent class for info."""
 
+    @profiled('step')
     def step(self, rl_actions):
         """Advance the environment by one step.
 
@@ -53,50 +55,58 @@ class MultiEnv(MultiAgentEnv, Env):
             self.step_counter += 1
 
             # perform acceleration actions for controlled human-driven vehicles
-            if len(self.k.vehicle.get_controlled_ids()) > 0:
-                accel = []
-                for veh_id in self.k.vehicle.get_controlled_ids():
-                    accel_contr = self.k.vehicle.get_acc_controller(veh_id)
-                    action = accel_contr.get_action(self)
-                    accel.append(action)
-                self.k.vehicle.apply_acceleration(
-                    self.k.vehicle.get_controlled_ids(), accel)
+            with self.profiler.phase('controllers'):
+                if len(self.k.vehicle.get_controlled_ids()) > 0:
+                    accel = BaseController.get_accel_batch(
+                        self, self.k.vehicle.get_controlled_ids())
+                    self.k.vehicle.apply_acceleration(
+                        self.k.vehicle.get_controlled_ids(), accel)
 
             # perform lane change actions for controlled human-driven vehicles
-            if len(self.k.vehicle.get_controlled_lc_ids()) > 0:
-                direction = []
-                for veh_id in self.k.vehicle.get_controlled_lc_ids():
-                    target_lane = self.k.vehicle.get_lane_changing_controller(
-                        veh_id).get_action(self)
-                    direction.append(target_lane)
-                self.k.vehicle.apply_lane_change(
-                    self.k.vehicle.get_controlled_lc_ids(),
-                    direction=direction)
+            with self.profiler.phase('lane_changers'):
+                if len(self.k.vehicle.get_controlled_lc_ids()) > 0:
+                    direction = []
+                    for veh_id in self.k.vehicle.get_controlled_lc_ids():
+                        target_lane = \
+                            self.k.vehicle.get_lane_changing_controller(
+                                veh_id).get_action(self)
+                        direction.append(target_lane)
+                    self.k.vehicle.apply_lane_change(
+                        self.k.vehicle.get_controlled_lc_ids(),
+                        direction=direction)
 
             # perform (optionally) routing actions for all vehicle in the
             # network, including rl and sumo-controlled vehicles
-            routing_ids = []
-            routing_actions = []
-            for veh_id in self.k.vehicle.get_ids():
-                if self.k.vehicle.get_routing_controller(veh_id) is not None:
-                    routing_ids.append(veh_id)
-                    route_contr = self.k.vehicle.get_routing_controller(veh_id)
-                    routing_actions.append(route_contr.choose_route(self))
-            self.k.vehicle.choose_routes(routing_ids, routing_actions)
-
-            self.apply_rl_actions(rl_actions)
-
-            self.additional_command()
+            with self.profiler.phase('routing'):
+                routing_ids = []
+                routing_actions = []
+                for veh_id in self._get_routing_ids():
+                    if self.k.vehicle.get_routing_controller(veh_id) \
+                            is not None:
+                        routing_ids.append(veh_id)
+                        route_contr = self.k.vehicle.get_routing_controller(
+                            veh_id)
+                        routing_actions.append(route_contr.choose_route(self))
+                self.k.vehicle.choose_routes(routing_ids, routing_actions)
+
+            with self.profiler.phase('apply_rl_actions'):
+                self.apply_rl_actions(rl_actions)
+
+            with self.profiler.phase('additional_command'):
+                self.additional_command()
 
             # advance the simulation in the simulator by one step
-            self.k.simulation.simulation_step()
+            with self.profiler.phase('simulation_step'):
+                self.k.simulation.simulation_step()
 
             # store new observations in the vehicles and traffic lights class
-            self.k.update(reset=False)
+            with self.profiler.phase('update'):
+                self.k.update(reset=False)
 
             # update the colors of vehicles
             if self.sim_params.render:
-                self.k.vehicle.update_vehicle_colors()
+                with self.profiler.phase('render'):
+                    self.k.vehicle.update_vehicle_colors()
 
             # crash encodes whether the simulator experienced a collision
             crash = self.k.simulation.check_collision()
@@ -105,7 +115,8 @@ class MultiEnv(MultiAgentEnv, Env):
             if crash:
                 break
 
-        states = self.get_state()
+        with self.profiler.phase('get_state'):
+            states = self.get_state()
         done = {key: key in self.k.vehicle.get_arrived_ids()
                 for key in states.keys()}
         if crash or (self.time_counter >= self.env_params.sims_per_step *
@@ -116,11 +127,12 @@ class MultiEnv(MultiAgentEnv, Env):
         infos = {key: {} for key in states.keys()}
 
         # compute the reward
-        if self.env_params.clip_actions:
-            clipped_actions = self.clip_actions(rl_actions)
-            reward = self.compute_reward(clipped_actions, fail=crash)
-        else:
-            reward = self.compute_reward(rl_actions, fail=crash)
+        with self.profiler.phase('compute_reward'):
+            if self.env_params.clip_actions:
+                clipped_actions = self.clip_actions(rl_actions)
+                reward = self.compute_reward(clipped_actions, fail=crash)
+            else:
+                reward = self.compute_reward(rl_actions, fail=crash)
 
         for rl_id in self.k.vehicle.get_arrived_rl_ids(self.env_params.sims_per_step):
             done[rl_id] = True
@@ -129,6 +141,7 @@ class MultiEnv(MultiAgentEnv, Env):
 
         return states, reward, done, infos
 
+    @profiled('reset', episode=True)
     def reset(self, new_inflow_rate=None):
         """Reset the environment.
 
@@ -157,7 +170,8 @@ class MultiEnv(MultiAgentEnv, Env):
 
         # warn about not using restart_instance when using inflows
         if len(self.net_params.inflows.get()) > 0 and \
-                not self.sim_params.restart_instance:
+                not (self.sim_params.restart_instance or self._fast_reset or
+                     self.k.inflows is not None):
             print(
                 "**********************************************************\n"
                 "**********************************************************\n"
@@ -170,99 +184,118 @@ class MultiEnv(MultiAgentEnv, Env):
                 "**********************************************************"
             )
 
-        if self.sim_params.restart_instance or \
-                (self.step_counter > 2e6 and self.simulator != 'aimsun'):
+        # a saved state of the simulation supersedes restarting the instance
+        if (self.sim_params.restart_instance and self._reset_state is None) \
+                or (self.step_counter > 2e6 and self.simulator != 'aimsun'):
             self.step_counter = 0
             # issue a random seed to induce randomness into the next rollout
-            self.sim_params.seed = random.randint(0, 1e5)
+            self.sim_params.seed = self.k.simulation.next_seed()
 
             self.k.vehicle = deepcopy(self.initial_vehicles)
             self.k.vehicle.master_kernel = self.k
             # restart the sumo instance
-            self.restart_simulation(self.sim_params)
+            with self.profiler.phase('restart_simulation'):
+                self.restart_simulation(self.sim_params)
 
         # perform shuffling (if requested)
         elif self.initial_config.shuffle:
             self.setup_initial_state()
 
-        # clear all vehicles from the network and the vehicles class
-        if self.simulator == 'traci':
-            for veh_id in self.k.kernel_api.vehicle.getIDList():  # FIXME: hack
+        if self._reset_state is not None:
+            # restore the state of the simulation after the initial placement
+            # of vehicles, see SumoParams.fast_reset
+            with self.profiler.phase('load_state'):
+                self.k.load_state(self._reset_state)
+        else:
+            # clear all vehicles from the network and the vehicles class
+            if self.simulator == 'traci':
+                for veh_id in self.k.kernel_api.vehicle.getIDList():  # FIXME: hack
+                    try:
+                        self.k.vehicle.remove(veh_id)
+                    except (FatalTraCIError, TraCIException):
+                        print(traceback.format_exc())
+
+            # clear all vehicles from the network and the vehicles class
+            # FIXME (ev, ak) this is weird and shouldn't be necessary
+            for veh_id in list(self.k.vehicle.get_ids()):
+                # do not try to remove the vehicles from the network in the first
+                # step after initializing the network, as there will be no vehicles
+                if self.step_counter == 0:
+                    continue
                 try:
                     self.k.vehicle.remove(veh_id)
                 except (FatalTraCIError, TraCIException):
-                    print(traceback.format_exc())
-
-        # clear all vehicles from the network and the vehicles class
-        # FIXME (ev, ak) this is weird and shouldn't be necessary
-        for veh_id in list(self.k.vehicle.get_ids()):
-            # do not try to remove the vehicles from the network in the first
-            # step after initializing the network, as there will be no vehicles
-            if self.step_counter == 0:
-                continue
-            try:
-                self.k.vehicle.remove(veh_id)
-            except (FatalTraCIError, TraCIException):
-                print("Error during start: {}".format(traceback.format_exc()))
-
-        # do any additional resetting of the vehicle class needed
-        self.k.vehicle.reset()
-
-        # reintroduce the initial vehicles to the network
-        for veh_id in self.initial_ids:
-            type_id, edge, lane_index, pos, speed = \
-                self.initial_state[veh_id]
-
-            try:
-                self.k.vehicle.add(
-                    veh_id=veh_id,
-                    type_id=type_id,
-                    edge=edge,
-                    lane=lane_index,
-                    pos=pos,
-                    speed=speed)
-            except (FatalTraCIError, TraCIException):
-                # if a vehicle was not removed in the first attempt, remove it
-                # now and then reintroduce it
-                self.k.vehicle.remove(veh_id)
-                if self.simulator == 'traci':
-                    self.k.kernel_api.vehicle.remove(veh_id)  # FIXME: hack
-                self.k.vehicle.add(
-                    veh_id=veh_id,
-                    type_id=type_id,
-                    edge=edge,
-                    lane=lane_index,
-                    pos=pos,
-                    speed=speed)
-
-        # advance the simulation in the simulator by one step
-        self.k.simulation.simulation_step()
-
-        # update the information in each kernel to match the current state
-        self.k.update(reset=True)
-
-        # update the colors of vehicles
-        if self.sim_params.render:
-            self.k.vehicle.update_vehicle_colors()
-
-        # check to make sure all vehicles have been spawned
-        if len(self.initial_ids) > self.k.vehicle.num_vehicles:
-            missing_vehicles = list(
-                set(self.initial_ids) - set(self.k.vehicle.get_ids()))
-            msg = '\nNot enough vehicles have spawned! Bad start?\n' \
-                  'Missing vehicles / initial state:\n'
-            for veh_id in missing_vehicles:
-                msg += '- {}: {}\n'.format(veh_id, self.initial_state[veh_id])
-            raise FatalFlowError(msg=msg)
+                    print("Error during start: {}".format(traceback.format_exc()))
+
+            # do any additional resetting of the vehicle class needed
+            self.k.vehicle.reset()
+
+            # start the inflows anew, see SumoParams.runtime_inflows
+            if self.k.inflows is not None:
+                self.k.inflows.reset()
+
+            # reintroduce the initial vehicles to the network
+            for veh_id in self.initial_ids:
+                type_id, edge, lane_index, pos, speed = \
+                    self.initial_state[veh_id]
+
+                try:
+                    self.k.vehicle.add(
+                        veh_id=veh_id,
+                        type_id=type_id,
+                        edge=edge,
+                        lane=lane_index,
+                        pos=pos,
+                        speed=speed)
+                except (FatalTraCIError, TraCIException):
+                    # if a vehicle was not removed in the first attempt, remove it
+                    # now and then reintroduce it
+                    self.k.vehicle.remove(veh_id)
+                    if self.simulator == 'traci':
+                        self.k.kernel_api.vehicle.remove(veh_id)  # FIXME: hack
+                    self.k.vehicle.add(
+                        veh_id=veh_id,
+                        type_id=type_id,
+                        edge=edge,
+                        lane=lane_index,
+                        pos=pos,
+                        speed=speed)
+
+            # advance the simulation in the simulator by one step
+            with self.profiler.phase('simulation_step'):
+                self.k.simulation.simulation_step()
+
+            # update the information in each kernel to match the current state
+            with self.profiler.phase('update'):
+                self.k.update(reset=True)
+
+            # update the colors of vehicles
+            if self.sim_params.render:
+                self.k.vehicle.update_vehicle_colors()
+
+            # check to make sure all vehicles have been spawned
+            if len(self.initial_ids) > self.k.vehicle.num_vehicles:
+                missing_vehicles = list(
+                    set(self.initial_ids) - set(self.k.vehicle.get_ids()))
+                msg = '\nNot enough vehicles have spawned! Bad start?\n' \
+                      'Missing vehicles / initial state:\n'
+                for veh_id in missing_vehicles:
+                    msg += '- {}: {}\n'.format(veh_id, self.initial_state[veh_id])
+                raise FatalFlowError(msg=msg)
+
+            if self._fast_reset and not self.initial_config.shuffle:
+                self._save_reset_state()
 
         # perform (optional) warm-up steps before training
         for _ in range(self.env_params.warmup_steps):
             observation, _, _, _ = self.step(rl_actions=None)
 
         # render a frame
-        self.render(reset=True)
+        with self.profiler.phase('render'):
+            self.render(reset=True)
 
-        return self.get_state()
+        with self.profiler.phase('get_state'):
+            return self.get_state()
 
     def clip_actions(self, rl_actions=None):
         """Clip the actions passed from the RL agent.
@@ -77,10 +77,11 @@ class AdversarialAccelEnv(AccelEnv, MultiEnv):
 
         The adversary state and the agent state are identical.
         """
-        state = np.array([[
-            self.k.vehicle.get_speed(veh_id) / self.k.network.max_speed(),
-            self.k.vehicle.get_x_by_id(veh_id) / self.k.network.length()
-        ] for veh_id in self.sorted_ids])
+        ids = self.sorted_ids
+        state = np.column_stack((
+            self.k.vehicle.get_speeds(ids) / self.k.network.max_speed(),
+            self.k.vehicle.get_x_batch(ids) / self.k.network.length()
+        ))
         state = np.ndarray.flatten(state)
         return {'av': state, 'adversary': state}
 
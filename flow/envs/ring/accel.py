@@ -66,6 +66,9 @@ class AccelEnv(Env):
         metrics to track
     """
 
+    # the state and reward only use the data collected by the kernel
+    supports_overlap_steps = True
+
     def __init__(self, env_params, sim_params, network, simulator='traci'):
         for p in ADDITIONAL_ENV_PARAMS.keys():
             if p not in env_params.additional_params:
@@ -102,7 +105,7 @@ class AccelEnv(Env):
         """See class definition."""
         sorted_rl_ids = [
             veh_id for veh_id in self.sorted_ids
-            if veh_id in self.k.vehicle.get_rl_ids()
+            if self.k.vehicle.is_rl(veh_id)
         ]
         self.k.vehicle.apply_acceleration(sorted_rl_ids, rl_actions)
 
@@ -115,12 +118,11 @@ class AccelEnv(Env):
 
     def get_state(self):
         """See class definition."""
-        speed = [self.k.vehicle.get_speed(veh_id) / self.k.network.max_speed()
-                 for veh_id in self.sorted_ids]
-        pos = [self.k.vehicle.get_x_by_id(veh_id) / self.k.network.length()
-               for veh_id in self.sorted_ids]
+        ids = self.sorted_ids
+        speed = self.k.vehicle.get_speeds(ids) / self.k.network.max_speed()
+        pos = self.k.vehicle.get_x_batch(ids) / self.k.network.length()
 
-        return np.array(speed + pos)
+        return np.concatenate((speed, pos))
 
     def additional_command(self):
         """See parent class.
@@ -134,9 +136,9 @@ class AccelEnv(Env):
                 self.k.vehicle.set_observed(veh_id)
 
         # update the "absolute_position" variable
-        for veh_id in self.k.vehicle.get_ids():
-            this_pos = self.k.vehicle.get_x_by_id(veh_id)
-
+        ids = self.k.vehicle.get_ids()
+        for veh_id, this_pos in zip(
+                ids, self.k.vehicle.get_x_batch(ids).tolist()):
             if this_pos == -1001:
                 # in case the vehicle isn't in the network
                 self.absolute_position[veh_id] = -1001
@@ -176,8 +178,9 @@ class AccelEnv(Env):
         """
         obs = super().reset()
 
-        for veh_id in self.k.vehicle.get_ids():
-            self.absolute_position[veh_id] = self.k.vehicle.get_x_by_id(veh_id)
-            self.prev_pos[veh_id] = self.k.vehicle.get_x_by_id(veh_id)
+        ids = self.k.vehicle.get_ids()
+        for veh_id, pos in zip(ids, self.k.vehicle.get_x_batch(ids).tolist()):
+            self.absolute_position[veh_id] = pos
+            self.prev_pos[veh_id] = pos
 
         return obs
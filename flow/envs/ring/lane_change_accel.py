@@ -120,14 +120,12 @@ class LaneChangeAccelEnv(AccelEnv):
             self.k.network.num_lanes(edge)
             for edge in self.k.network.get_edge_list())
 
-        speed = [self.k.vehicle.get_speed(veh_id) / max_speed
-                 for veh_id in self.sorted_ids]
-        pos = [self.k.vehicle.get_x_by_id(veh_id) / length
-               for veh_id in self.sorted_ids]
-        lane = [self.k.vehicle.get_lane(veh_id) / max_lanes
-                for veh_id in self.sorted_ids]
-
-        return np.array(speed + pos + lane)
+        ids = self.sorted_ids
+        speed = self.k.vehicle.get_speeds(ids) / max_speed
+        pos = self.k.vehicle.get_x_batch(ids) / length
+        lane = np.array(self.k.vehicle.get_lane(ids)) / max_lanes
+
+        return np.concatenate((speed, pos, lane))
 
     def _apply_rl_actions(self, actions):
         """See class definition."""
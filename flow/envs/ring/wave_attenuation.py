@@ -140,12 +140,11 @@ class WaveAttenuationEnv(Env):
 
     def get_state(self):
         """See class definition."""
-        speed = [self.k.vehicle.get_speed(veh_id) / self.k.network.max_speed()
-                 for veh_id in self.k.vehicle.get_ids()]
-        pos = [self.k.vehicle.get_x_by_id(veh_id) / self.k.network.length()
-               for veh_id in self.k.vehicle.get_ids()]
+        ids = self.k.vehicle.get_ids()
+        speed = self.k.vehicle.get_speeds(ids) / self.k.network.max_speed()
+        pos = self.k.vehicle.get_x_batch(ids) / self.k.network.length()
 
-        return np.array(speed + pos)
+        return np.concatenate((speed, pos))
 
     def additional_command(self):
         """Define which vehicles are observed for visualization purposes."""
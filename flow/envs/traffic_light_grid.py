@@ -12,6 +12,7 @@ from gym.spaces.discrete import Discrete
 from gym.spaces import Tuple
 
 from flow.core import rewards
+from flow.core.kernel.events import DEPARTED, EDGE_CHANGED
 from flow.envs.base import Env
 
 ADDITIONAL_ENV_PARAMS = {
@@ -169,6 +170,18 @@ class TrafficLightGridEnv(Env):
         # check whether the action space is meant to be discrete or continuous
         self.discrete = env_params.additional_params.get("discrete", False)
 
+        # vehicles that entered the network or moved to a new edge since the
+        # last step, used to detect vehicles that reached their exit edge.
+        # They are only tracked once `additional_command` starts consuming
+        # them, so that subclasses overriding it do not accumulate them. Until
+        # then, or if the simulator does not support events, all vehicles are
+        # checked.
+        self._moved_ids = None
+
+    def _on_moved(self, veh_ids):
+        """Store the vehicles that entered or moved within the network."""
+        self._moved_ids.update(dict.fromkeys(veh_ids))
+
     @property
     def action_space(self):
         """See class definition."""
@@ -437,7 +450,16 @@ class TrafficLightGridEnv(Env):
         Used to insert vehicles that are on the exit edge and place them
         back on their entrance edge.
         """
-        for veh_id in self.k.vehicle.get_ids():
+        if self._moved_ids is None:
+            veh_ids = self.k.vehicle.get_ids()
+            if self.k.events is not None:
+                self._moved_ids = dict()
+                self.k.events.subscribe(DEPARTED, self._on_moved)
+                self.k.events.subscribe(EDGE_CHANGED, self._on_moved)
+        else:
+            veh_ids = list(self._moved_ids)
+            self._moved_ids.clear()
+        for veh_id in veh_ids:
             self._reroute_if_final_edge(veh_id)
 
     def _reroute_if_final_edge(self, veh_id):
@@ -17,6 +17,7 @@ from typing import Dict, List
 
 from flow.core.util import ensure_dir
 from flow.utils.registry import env_constructor, make_create_env
+from flow.utils.vec_env import FlowVecEnv
 from flow.utils.rllib import FlowParamsEncoder, get_flow_params
 
 def print_box(s,k=50):
@@ -79,7 +80,7 @@ def run_model_stablebaseline(flow_params:Dict, num_cpus:int=1, rollout_size:int=
         stable_baselines.*
             the trained model
     """
-    from stable_baselines.common.vec_env import DummyVecEnv, SubprocVecEnv
+    from stable_baselines.common.vec_env import DummyVecEnv
     from stable_baselines import PPO2
 
     if num_cpus == 1:
@@ -87,8 +88,8 @@ def run_model_stablebaseline(flow_params:Dict, num_cpus:int=1, rollout_size:int=
         # The algorithms require a vectorized environment to run
         env = DummyVecEnv([lambda: constructor])
     else:
-        env = SubprocVecEnv([env_constructor(params=flow_params, version=i)
-                            for i in range(num_cpus)])
+        env = FlowVecEnv([env_constructor(params=flow_params, version=i)
+                          for i in range(num_cpus)])
 
     print_box('Initialising MlpPolicy in Stable Baselines')
     train_model = PPO2('MlpPolicy', env, verbose=1, n_steps=rollout_size, tensorboard_log='delete_ppo')
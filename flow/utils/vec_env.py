@@ -0,0 +1,516 @@
+"""Vectorized environment running Flow environments in worker processes.
+
+Observations, rewards and dones are written by the workers directly into
+shared memory, instead of being pickled and sent through pipes, and the
+environments are stepped concurrently via `step_async` and `step_wait`.
+"""
+
+import multiprocessing
+import os
+import pickle
+import tempfile
+import traceback
+
+import cloudpickle
+import numpy as np
+from gym.spaces import Box
+
+try:
+    from stable_baselines.common.vec_env import VecEnv
+except ImportError:
+    VecEnv = object
+
+# directory the shared buffers are mapped from. /dev/shm is memory-backed on
+# Linux, so that the buffers are never written to disk
+SHARED_MEMORY_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+class FlowVecEnv(VecEnv):
+    """Vectorized environment running Flow environments in worker processes.
+
+    Every environment is created and stepped in a separate process. At every
+    step, the workers write the observations, rewards and dones of their
+    environments directly into NumPy arrays in shared memory, so that only the
+    actions and infos are sent through pipes. The environments are stepped
+    concurrently: `step_async` sends the actions to all workers and returns
+    immediately, and `step_wait` waits for all of them to complete the step.
+
+    Environments are reset automatically at the end of their episodes, in
+    which case the returned observation is the first one of the next episode,
+    and the last observation of the episode is stored in the
+    "terminal_observation" entry of the info of the environment.
+
+    Multi-agent environments are supported via a fixed layout of agent slots,
+    if `max_agents` is specified. Every agent is assigned a slot when it
+    enters the network, and keeps it until it is done. The observations,
+    rewards and dones are then arrays of shape (num_envs, max_agents, ...),
+    the ids of the agents in every slot are stored in `agent_ids`, and the
+    slots that are in use in `active`. Actions may be provided either as an
+    array of the same layout, or as a list of dicts indexed by agent id. At
+    the end of an episode, the rewards and dones refer to the slots of the
+    last step of the episode, whose agent ids are stored in the
+    "terminal_agent_ids" entry of the info of the environment.
+
+    This implements the interface of the vectorized environments of
+    stable-baselines, and subclasses `VecEnv` if it is installed.
+
+    Usage
+    -----
+    >>> from flow.utils.registry import env_constructor
+    >>> env = FlowVecEnv([env_constructor(flow_params, version=i)
+    ...                   for i in range(num_cpus)])
+    >>> obs = env.reset()
+    >>> obs, rewards, dones, infos = env.step(actions)
+
+    Attributes
+    ----------
+    num_envs : int
+        number of environments
+    observation_space : gym.spaces.Box
+        observation space of a single environment (or agent)
+    action_space : gym.spaces.Space
+        action space of a single environment (or agent)
+    max_agents : int or None
+        number of agent slots of every environment, for multi-agent
+        environments
+    agent_ids : list of list of str
+        ids of the agents in every slot of every environment (None for unused
+        slots), for multi-agent environments
+    active : np.ndarray
+        whether every slot of every environment is used, for multi-agent
+        environments
+    """
+
+    def __init__(self, env_fns, max_agents=None, start_method=None):
+        """Start the worker processes and create their environments.
+
+        Parameters
+        ----------
+        env_fns : list of callable
+            functions that create the environments, e.g. as returned by
+            flow.utils.registry.env_constructor
+        max_agents : int, optional
+            number of agent slots of every environment. This must be specified
+            for multi-agent environments, and is the maximum number of agents
+            that may be in an environment at the same time.
+        start_method : str, optional
+            method used to start the worker processes, see
+            multiprocessing.get_context. Defaults to the default method of
+            the platform.
+
+        Raises
+        ------
+        TypeError
+            if the observation space of the environments is not a Box
+        """
+        self.max_agents = max_agents
+        self.waiting = False
+        self.closed = False
+
+        context = multiprocessing.get_context(start_method)
+        self.remotes, work_remotes = zip(
+            *[context.Pipe() for _ in range(len(env_fns))])
+        self.processes = []
+        for index, (work_remote, remote, env_fn) in enumerate(
+                zip(work_remotes, self.remotes, env_fns)):
+            process = context.Process(
+                target=_worker,
+                args=(work_remote, remote, cloudpickle.dumps(env_fn), index,
+                      max_agents),
+                daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.remotes[0].send(('get_spaces', None))
+        try:
+            observation_space, action_space = self._recv(self.remotes[0])
+        except RuntimeError:
+            self.close()
+            raise
+        if not isinstance(observation_space, Box):
+            self.close()
+            raise TypeError('FlowVecEnv only supports Box observation '
+                            'spaces, not {}'.format(observation_space))
+
+        if VecEnv is object:
+            self.num_envs = len(env_fns)
+            self.observation_space = observation_space
+            self.action_space = action_space
+        else:
+            super().__init__(len(env_fns), observation_space, action_space)
+
+        # allocate the shared buffers, and map them in all workers
+        agents = () if max_agents is None else (max_agents,)
+        arrays = {
+            'obs': ((self.num_envs,) + agents + observation_space.shape,
+                    observation_space.dtype),
+            'rewards': ((self.num_envs,) + agents, np.float64),
+            'dones': ((self.num_envs,) + agents, np.bool_),
+        }
+        if max_agents is not None:
+            arrays['active'] = ((self.num_envs, max_agents), np.bool_)
+        self._buffers = SharedBuffers(arrays)
+        self._send_all('attach', self._buffers.layout)
+        self._recv_all()
+        # all workers mapped the buffers, which are freed once unmapped
+        self._buffers.unlink()
+
+        self.agent_ids = [[None] * (max_agents or 0)
+                          for _ in range(self.num_envs)]
+
+    @property
+    def active(self):
+        """Return whether every slot of every environment is used."""
+        if self.max_agents is None:
+            return None
+        return self._buffers['active'].copy()
+
+    def reset(self):
+        """Reset all environments.
+
+        Returns
+        -------
+        np.ndarray
+            first observation of every environment (or agent)
+        """
+        self._send_all('reset', None)
+        for i, agent_ids in enumerate(self._recv_all()):
+            if agent_ids is not None:
+                self.agent_ids[i] = agent_ids
+        return self._buffers['obs'].copy()
+
+    def step(self, actions):
+        """Step all environments, see `step_async` and `step_wait`."""
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_async(self, actions):
+        """Send the actions of all environments to the workers.
+
+        Parameters
+        ----------
+        actions : array_like or list of dict
+            action of every environment (or of every agent slot of every
+            environment, or dict of actions indexed by agent id, for
+            multi-agent environments)
+        """
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action))
+        self.waiting = True
+
+    def step_wait(self):
+        """Wait for all environments to complete the step.
+
+        Returns
+        -------
+        np.ndarray
+            observation of every environment (or agent)
+        np.ndarray
+            reward of every environment (or agent)
+        np.ndarray
+            whether the episode of every environment (or agent) is done
+        list of dict
+            info of every environment
+        """
+        results = self._recv_all()
+        self.waiting = False
+
+        infos = []
+        for i, (info, agent_ids) in enumerate(results):
+            infos.append(info)
+            if agent_ids is not None:
+                self.agent_ids[i] = agent_ids
+
+        return (self._buffers['obs'].copy(),
+                self._buffers['rewards'].copy(),
+                self._buffers['dones'].copy(),
+                infos)
+
+    def close(self):
+        """Terminate all environments and worker processes."""
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            try:
+                remote.send(('close', None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join()
+        if hasattr(self, '_buffers'):
+            self._buffers.unlink()
+        self.closed = True
+
+    def get_attr(self, attr_name, indices=None):
+        """Return an attribute of the environments."""
+        remotes = self._get_target_remotes(indices)
+        for remote in remotes:
+            remote.send(('get_attr', attr_name))
+        return [self._recv(remote) for remote in remotes]
+
+    def set_attr(self, attr_name, value, indices=None):
+        """Set an attribute of the environments."""
+        remotes = self._get_target_remotes(indices)
+        for remote in remotes:
+            remote.send(('set_attr', (attr_name, value)))
+        for remote in remotes:
+            self._recv(remote)
+
+    def env_method(self, method_name, *method_args, indices=None,
+                   **method_kwargs):
+        """Call a method of the environments, and return its results."""
+        remotes = self._get_target_remotes(indices)
+        for remote in remotes:
+            remote.send(
+                ('env_method', (method_name, method_args, method_kwargs)))
+        return [self._recv(remote) for remote in remotes]
+
+    def seed(self, seed=None):
+        """Seed the environments, with consecutive seeds."""
+        return [self.env_method('seed', None if seed is None else seed + i,
+                                indices=i)[0]
+                for i in range(self.num_envs)]
+
+    def _get_target_remotes(self, indices):
+        """Return the pipes to the workers of some environments."""
+        if indices is None:
+            indices = range(self.num_envs)
+        elif isinstance(indices, int):
+            indices = [indices]
+        return [self.remotes[i] for i in indices]
+
+    def _send_all(self, command, data):
+        """Send the same command to all workers."""
+        for remote in self.remotes:
+            remote.send((command, data))
+
+    def _recv_all(self):
+        """Return the replies of all workers."""
+        return [self._recv(remote) for remote in self.remotes]
+
+    @staticmethod
+    def _recv(remote):
+        """Return the reply of a worker, raising the error it failed with."""
+        status, data = remote.recv()
+        if status == 'error':
+            raise RuntimeError('Error in a FlowVecEnv worker:\n' + data)
+        return data
+
+
+class SharedBuffers(object):
+    """NumPy arrays mapped from a shared memory file.
+
+    The arrays can be mapped by other processes via the layout of the buffers
+    (see `attach`), regardless of how they were started.
+
+    Attributes
+    ----------
+    layout : tuple
+        path of the shared memory file, and dict of the offset, shape and
+        dtype of every array, indexed by name
+    """
+
+    # alignment of the arrays in the file, in bytes
+    ALIGNMENT = 64
+
+    def __init__(self, arrays=None, layout=None):
+        """Allocate the arrays, or map the arrays of an existing layout.
+
+        Parameters
+        ----------
+        arrays : dict, optional
+            shape and dtype of every array, indexed by name
+        layout : tuple, optional
+            layout of existing buffers
+        """
+        if layout is None:
+            fields = {}
+            size = 0
+            for name, (shape, dtype) in arrays.items():
+                fields[name] = (size, shape, np.dtype(dtype).str)
+                nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+                size += -(-max(nbytes, 1) // self.ALIGNMENT) * self.ALIGNMENT
+
+            fd, path = tempfile.mkstemp(
+                prefix='flow_vec_env_', dir=SHARED_MEMORY_DIR)
+            os.ftruncate(fd, size)
+            os.close(fd)
+            layout = (path, fields)
+
+        self.layout = layout
+        path, fields = layout
+        self._arrays = {
+            name: np.memmap(path, dtype=np.dtype(dtype), mode='r+',
+                            offset=offset, shape=shape)
+            for name, (offset, shape, dtype) in fields.items()}
+
+    def __getitem__(self, name):
+        """Return one of the arrays."""
+        return self._arrays[name]
+
+    def unlink(self):
+        """Remove the shared memory file, once mapped by all processes."""
+        try:
+            os.unlink(self.layout[0])
+        except FileNotFoundError:
+            pass
+
+
+def _worker(remote, parent_remote, env_fn, index, max_agents):
+    """Create an environment, and execute the commands of the main process.
+
+    Parameters
+    ----------
+    remote : multiprocessing.connection.Connection
+        pipe to the main process
+    parent_remote : multiprocessing.connection.Connection
+        end of the pipe of the main process, closed by the worker
+    env_fn : bytes
+        pickled function creating the environment
+    index : int
+        index of the environment in the shared buffers
+    max_agents : int or None
+        number of agent slots, for multi-agent environments
+    """
+    parent_remote.close()
+    env = None
+    buffers = None
+    slots = None
+
+    while True:
+        try:
+            command, data = remote.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        try:
+            if env is None:
+                env = pickle.loads(env_fn)()
+
+            if command == 'get_spaces':
+                result = (env.observation_space, env.action_space)
+            elif command == 'attach':
+                buffers = SharedBuffers(layout=data)
+                result = None
+            elif command == 'reset':
+                obs = env.reset()
+                if max_agents is None:
+                    buffers['obs'][index] = obs
+                    buffers['rewards'][index] = 0
+                    buffers['dones'][index] = False
+                    result = None
+                else:
+                    slots = _AgentSlots(max_agents)
+                    slots.write(buffers, index, obs, {}, {})
+                    result = list(slots.agent_ids)
+            elif command == 'step':
+                if max_agents is None:
+                    obs, reward, done, info = env.step(data)
+                    if done:
+                        info['terminal_observation'] = obs
+                        obs = env.reset()
+                    buffers['obs'][index] = obs
+                    buffers['rewards'][index] = reward
+                    buffers['dones'][index] = done
+                    result = (info, None)
+                else:
+                    obs, reward, done, info = env.step(slots.actions(data))
+                    slots.write(buffers, index, obs, reward, done)
+                    if done.get('__all__', False):
+                        info = dict(info)
+                        info['terminal_observation'] = obs
+                        info['terminal_agent_ids'] = list(slots.agent_ids)
+                        slots = _AgentSlots(max_agents)
+                        # the rewards and dones of the last step are kept
+                        rewards = buffers['rewards'][index].copy()
+                        dones = buffers['dones'][index].copy()
+                        slots.write(buffers, index, env.reset(), {}, {})
+                        buffers['rewards'][index] = rewards
+                        buffers['dones'][index] = dones
+                    result = (info, list(slots.agent_ids))
+            elif command == 'get_attr':
+                result = getattr(env, data)
+            elif command == 'set_attr':
+                result = setattr(env, data[0], data[1])
+            elif command == 'env_method':
+                method_name, args, kwargs = data
+                result = getattr(env, method_name)(*args, **kwargs)
+            elif command == 'close':
+                _terminate(env)
+                remote.close()
+                break
+            else:
+                raise NotImplementedError(
+                    'Unknown FlowVecEnv command: {}'.format(command))
+        except Exception:
+            remote.send(('error', traceback.format_exc()))
+        else:
+            remote.send(('ok', result))
+
+
+def _terminate(env):
+    """Close an environment and its simulation."""
+    unwrapped = getattr(env, 'unwrapped', env)
+    if hasattr(unwrapped, 'terminate'):
+        unwrapped.terminate()
+    else:
+        env.close()
+
+
+class _AgentSlots(object):
+    """Assignment of the agents of a multi-agent environment to slots."""
+
+    def __init__(self, max_agents):
+        self.agent_ids = [None] * max_agents
+        # slot of every agent, indexed by agent id
+        self._slots = {}
+        # agents that were done in the last step
+        self._done = []
+
+    def actions(self, actions):
+        """Return the actions of the agents, indexed by agent id."""
+        if actions is None or isinstance(actions, dict):
+            return actions
+        return {agent_id: actions[slot]
+                for agent_id, slot in self._slots.items()}
+
+    def write(self, buffers, index, obs, reward, done):
+        """Write the results of a step in the slots of the agents.
+
+        Agents that are done keep their slot for this step, and release it
+        at the next one. New agents are assigned the first free slots.
+        """
+        # release the slots of the agents that were done, or that left
+        for agent_id in self._done + [agent_id for agent_id in self._slots
+                                      if agent_id not in obs]:
+            if agent_id in self._slots:
+                self.agent_ids[self._slots.pop(agent_id)] = None
+
+        for agent_id in obs:
+            if agent_id not in self._slots:
+                slot = self.agent_ids.index(None) \
+                    if None in self.agent_ids else None
+                if slot is None:
+                    raise ValueError(
+                        'More than {} agents in the environment, increase '
+                        'max_agents'.format(len(self.agent_ids)))
+                self.agent_ids[slot] = agent_id
+                self._slots[agent_id] = slot
+
+        buffers['obs'][index] = 0
+        buffers['rewards'][index] = 0
+        buffers['dones'][index] = False
+        buffers['active'][index] = False
+        for agent_id, slot in self._slots.items():
+            buffers['active'][index, slot] = True
+            buffers['obs'][index, slot] = obs[agent_id]
+            buffers['rewards'][index, slot] = reward.get(agent_id, 0)
+            buffers['dones'][index, slot] = \
+                done.get(agent_id, False) or done.get('__all__', False)
+
+        self._done = [agent_id for agent_id in self._slots
+                      if buffers['dones'][index, self._slots[agent_id]]]
@@ -103,7 +103,9 @@ def visualizer_rllib(args):
     sim_params.restart_instance = True
     dir_path = os.path.dirname(os.path.realpath(__file__))
     emission_path = '{0}/test_time_rollout/'.format(dir_path)
-    sim_params.emission_path = emission_path if args.gen_emission else None
+    sim_params.emission_path = emission_path \
+        if args.gen_emission or args.gen_fcd else None
+    sim_params.fcd_output = args.gen_fcd
 
     # pick your rendering mode
     if args.render_mode == 'sumo_web3d':
@@ -323,6 +325,17 @@ def visualizer_rllib(args):
         # delete the .xml version of the emission file
         os.remove(emission_path)
 
+    # if prompted, convert the trajectories written by sumo into a csv file
+    if args.gen_fcd:
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        fcd_path = '{0}/test_time_rollout/{1}-fcd.xml'.format(
+            dir_path, env.network.name)
+
+        # convert the trajectory file into a csv file
+        emission_to_csv(fcd_path)
+        print("\nGenerated trajectory file at " + fcd_path[:-4] + ".csv")
+        os.remove(fcd_path)
+
 
 def create_parser():
     """Create the parser to capture CLI arguments."""
@@ -356,6 +369,11 @@ def create_parser():
         action='store_true',
         help='Specifies whether to generate an emission file from the '
              'simulation')
+    parser.add_argument(
+        '--gen_fcd',
+        action='store_true',
+        help='Specifies whether to generate a file with the trajectories of '
+             'all vehicles (sumo\'s floating car data) from the simulation')
     parser.add_argument(
         '--evaluate',
         action='store_true',
@@ -10,6 +10,8 @@ from flow.controllers.car_following_models import IDMController, \
     OVMController, BCMController, LinearOVM, CFMController, LACController, \
     GippsController, BandoFTLController
 from flow.controllers import FollowerStopper, PISaturation, NonLocalFollowerStopper
+from flow.controllers.base_controller import BaseController
+from flow.core.kernel.vehicle.pool import ControllerPool
 from tests.setup_scripts import ring_road_exp_setup
 import os
 import numpy as np
@@ -877,6 +879,24 @@ class TestLACController(unittest.TestCase):
 
         np.testing.assert_array_almost_equal(requested_accel, expected_accel)
 
+    def test_get_accel_batch(self):
+        """Check that the batched accelerations update the controllers."""
+        self.env.reset()
+        ids = self.env.k.vehicle.get_ids()
+
+        test_headways = [5, 10, 15, 20, 25]
+        for i, veh_id in enumerate(ids):
+            self.env.k.vehicle.set_headway(veh_id, test_headways[i])
+
+        requested_accel = BaseController.get_accel_batch(self.env, ids)
+
+        expected_accel = [0., 1.5, 3., 4.5, 6.]
+
+        np.testing.assert_array_almost_equal(requested_accel, expected_accel)
+        np.testing.assert_array_almost_equal(
+            [self.env.k.vehicle.get_acc_controller(veh_id).a
+             for veh_id in ids], expected_accel)
+
 
 class TestGippsController(unittest.TestCase):
     """
@@ -988,5 +1008,146 @@ class TestBandoFTLController(unittest.TestCase):
         np.testing.assert_array_almost_equal(requested_accel, expected_accel)
 
 
+class TestControllerPool(unittest.TestCase):
+    """Tests that controllers are recycled for vehicles of the same type."""
+
+    def setUp(self):
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="test",
+            acceleration_controller=(PISaturation, {}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=1)
+        vehicles.add(
+            veh_id="custom",
+            acceleration_controller=(CustomIDMController, {}),
+            num_vehicles=1)
+        self.type_parameters = vehicles.type_parameters
+
+    def test_recycling(self):
+        pool = ControllerPool()
+        controllers = pool.acquire(
+            "test", "test_0", self.type_parameters["test"])
+        self.assertFalse(hasattr(controllers[0], "__dict__"))
+
+        # the controllers of a vehicle are reassigned to the next vehicle of
+        # the same type, and their per-vehicle state is reset
+        controllers[0].v_history.append(10)
+        pool.release("test", controllers)
+        new_controllers = pool.acquire(
+            "test", "test_1", self.type_parameters["test"])
+        for controller, new_controller in zip(controllers, new_controllers):
+            self.assertIs(controller, new_controller)
+            self.assertEqual(new_controller.veh_id, "test_1")
+        self.assertListEqual(new_controllers[0].v_history, [])
+
+        # new controllers are built once the recycled ones are all in use
+        controllers = pool.acquire(
+            "test", "test_2", self.type_parameters["test"])
+        self.assertIsNot(controllers[0], new_controllers[0])
+
+    def test_no_slots(self):
+        """Check that controllers without __slots__ are not recycled."""
+        pool = ControllerPool()
+        controllers = pool.acquire(
+            "custom", "custom_0", self.type_parameters["custom"])
+        pool.release("custom", controllers)
+        new_controllers = pool.acquire(
+            "custom", "custom_1", self.type_parameters["custom"])
+        self.assertIsNot(controllers[0], new_controllers[0])
+        self.assertEqual(new_controllers[0].veh_id, "custom_1")
+
+
+class TestAccelBatch(unittest.TestCase):
+    """Tests that batched accelerations match the per-vehicle ones."""
+
+    def setUp(self):
+        vehicles = VehicleParams()
+        for controller in [(IDMController, {}),
+                           (IDMController, {"v0": 20, "T": 1.5}),
+                           (OVMController, {}),
+                           (LinearOVM, {}),
+                           (CFMController, {}),
+                           (BCMController, {}),
+                           (GippsController, {}),
+                           (BandoFTLController, {}),
+                           (FollowerStopper, {"v_des": 10}),
+                           (CustomIDMController, {})]:
+            vehicles.add(
+                veh_id="test_{}".format(len(vehicles.types)),
+                acceleration_controller=controller,
+                routing_controller=(ContinuousRouter, {}),
+                num_vehicles=2)
+
+        self.env, _, _ = ring_road_exp_setup(vehicles=vehicles)
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def test_get_accel_batch(self):
+        self.env.reset()
+        ids = self.env.k.vehicle.get_controlled_ids()
+        for i, veh_id in enumerate(ids):
+            self.env.k.vehicle.set_headway(veh_id, 2 + i)
+
+        requested_accel = BaseController.get_accel_batch(self.env, ids)
+        expected_accel = [
+            self.env.k.vehicle.get_acc_controller(veh_id).get_action(self.env)
+            for veh_id in ids
+        ]
+        np.testing.assert_array_almost_equal(requested_accel, expected_accel)
+
+        # the accelerations of all vehicles are stored in the kernel
+        for veh_id, accel in zip(ids, expected_accel):
+            self.assertAlmostEqual(self.env.k.vehicle.get_accel(
+                veh_id, noise=False, failsafe=True), accel)
+
+
+class TestFailsafeBatch(TestAccelBatch):
+    """Tests that batched failsafes match the per-vehicle ones."""
+
+    def setUp(self):
+        vehicles = VehicleParams()
+        for fail_safe in ['instantaneous', 'safe_velocity', 'feasible_accel',
+                          'obey_speed_limit',
+                          ['obey_speed_limit', 'safe_velocity',
+                           'feasible_accel', 'instantaneous']]:
+            for controller in [IDMController, OVMController, BCMController]:
+                vehicles.add(
+                    veh_id="test_{}".format(len(vehicles.types)),
+                    acceleration_controller=(controller, {
+                        "fail_safe": fail_safe,
+                        "display_warnings": False}),
+                    routing_controller=(ContinuousRouter, {}),
+                    car_following_params=SumoCarFollowingParams(
+                        accel=1, decel=1),
+                    num_vehicles=1)
+
+        self.env, _, _ = ring_road_exp_setup(vehicles=vehicles)
+
+    def test_get_accel_batch(self):
+        TestAccelBatch.test_get_accel_batch(self)
+
+        # all variants of the accelerations are stored in the kernel
+        ids = self.env.k.vehicle.get_controlled_ids()
+        requested_accel = BaseController.get_accel_batch(self.env, ids)
+        np.testing.assert_array_almost_equal(
+            requested_accel,
+            [self.env.k.vehicle.get_accel(veh_id) for veh_id in ids])
+        self.assertTrue(all(
+            -1 <= self.env.k.vehicle.get_accel(veh_id) <= 1
+            for veh_id in ids[6:9] + ids[12:]))
+
+
+class CustomIDMController(IDMController):
+    """IDM controller that stores per-vehicle data in its __dict__."""
+
+    def get_accel(self, env):
+        """See parent class."""
+        self.last_accel = IDMController.get_accel(self, env)
+        return self.last_accel
+
+
 if __name__ == '__main__':
     unittest.main()
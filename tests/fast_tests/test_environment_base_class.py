@@ -1,18 +1,27 @@
 import unittest
 
 from flow.core.params import SumoParams, EnvParams, InitialConfig, \
-    NetParams, SumoCarFollowingParams, SumoLaneChangeParams
+    NetParams, SumoCarFollowingParams, SumoLaneChangeParams, InFlows
 from flow.core.params import VehicleParams
 
 from flow.controllers.routing_controllers import ContinuousRouter
 from flow.controllers.car_following_models import IDMController
 from flow.controllers import RLController
 from flow.envs.ring.accel import ADDITIONAL_ENV_PARAMS
+from flow.networks.highway import ADDITIONAL_NET_PARAMS as HIGHWAY_PARAMS
 from flow.utils.exceptions import FatalFlowError
 from flow.envs import Env, TestEnv
+from flow.core.profiler import StepProfiler, PhaseStats
+from flow.core.kernel.simulation.recorder import EmissionRecorder, \
+    EMISSION_COLUMNS, load_npz
 
 from tests.setup_scripts import ring_road_exp_setup, highway_exp_setup
 import os
+import csv
+import json
+import shutil
+import tempfile
+import time
 import gym.spaces as spaces
 from gym.spaces.box import Box
 import numpy as np
@@ -136,6 +145,83 @@ class TestEmissionPath(unittest.TestCase):
         self.assertIsNone(self.env.sim_params.emission_path)
 
 
+class TestEmissionRecorder(unittest.TestCase):
+    """Tests the recording of the emission data of the vehicles to emission
+    files that are written in the background."""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_csv(self):
+        vehicles = VehicleParams()
+        vehicles.add("idm", acceleration_controller=(IDMController, {}),
+                     routing_controller=(ContinuousRouter, {}),
+                     num_vehicles=3)
+        env, _, _ = ring_road_exp_setup(
+            sim_params=SumoParams(emission_path=self.path, render=False),
+            vehicles=vehicles)
+        env.reset()
+        for _ in range(10):
+            env.step(None)
+        env.k.simulation.save_emission(run_id=1)
+        env.terminate()
+
+        name = os.path.join(self.path, "{}-1_emission.csv".format(
+            env.network.name))
+        with open(name) as f:
+            rows = list(csv.DictReader(f))
+        self.assertListEqual(
+            list(rows[0].keys()), [name for name, _ in EMISSION_COLUMNS])
+
+        # every vehicle has a single sample at every step since the reset
+        self.assertEqual(len(rows), 3 * 11)
+        self.assertEqual(len({(row["id"], row["time"]) for row in rows}), 33)
+        self.assertEqual(rows[-1]["time"], "1.0")
+        self.assertNotEqual(rows[-1]["target_accel_no_noise_no_failsafe"], "")
+        self.assertListEqual(os.listdir(self.path), [os.path.basename(name)])
+
+    def test_npz_chunks(self):
+        recorder = EmissionRecorder(self.path, fmt="npz", chunk_size=4)
+        for t in range(3):
+            recorder.record(t, {
+                name: ["veh_{}".format(i) for i in range(3)] if dtype is str
+                else [t + i for i in range(3)]
+                for name, dtype in EMISSION_COLUMNS if name != "time"})
+
+        # only the rows that are not written yet can be discarded
+        self.assertFalse(recorder.truncate(2))
+        self.assertTrue(recorder.truncate(8))
+        path = recorder.save("test_emission")
+        self.assertIsNone(recorder.save("empty_emission"))
+        recorder.close()
+
+        data = load_npz(path)
+        np.testing.assert_array_equal(data["time"], [0, 0, 0, 1, 1, 1, 2, 2])
+        np.testing.assert_array_equal(data["speed"], [0, 1, 2, 1, 2, 3, 2, 3])
+        self.assertListEqual(data["id"].tolist(), ["veh_0", "veh_1", "veh_2"]
+                             * 2 + ["veh_0", "veh_1"])
+        self.assertEqual(data["lane_number"].dtype, np.int32)
+
+    def test_no_leader(self):
+        recorder = EmissionRecorder(self.path)
+        columns = {name: [None, "veh_0"] if dtype is str else [0, 1]
+                   for name, dtype in EMISSION_COLUMNS if name != "time"}
+        columns["id"] = ["veh_0", "veh_1"]
+        recorder.record(0, columns)
+        path = recorder.save("test_emission")
+        recorder.close()
+
+        # vehicles with no leader or follower have empty ids, as before
+        with open(path) as f:
+            rows = list(csv.DictReader(f))
+        self.assertListEqual([row["leader_id"] for row in rows], ["", "veh_0"])
+        self.assertListEqual(
+            [row["follower_id"] for row in rows], ["", "veh_0"])
+
+
 class TestApplyingActionsWithSumo(unittest.TestCase):
     """
     Tests the apply_acceleration, apply_lane_change, and choose_routes
@@ -339,6 +425,277 @@ class TestSimsPerStep(unittest.TestCase):
         self.assertEqual(t2 - t1, sims_per_step)
 
 
+class TestOverlapSteps(unittest.TestCase):
+    """Ensures that the observations of overlapped steps describe the state
+    before the last simulation step when using
+    flow.core.params.EnvParams.overlap_steps"""
+
+    def setUp(self):
+        self.vehicles = VehicleParams()
+        self.vehicles.add("human",
+                          acceleration_controller=(IDMController, {}),
+                          routing_controller=(ContinuousRouter, {}),
+                          num_vehicles=4)
+        self.vehicles.add("rl", acceleration_controller=(RLController, {}),
+                          routing_controller=(ContinuousRouter, {}),
+                          num_vehicles=1)
+
+    def test_it_works(self):
+        observations = []
+        for overlap_steps, sims_per_step in [(False, 1), (True, 2)]:
+            env_params = EnvParams(overlap_steps=overlap_steps,
+                                   sims_per_step=sims_per_step,
+                                   additional_params=ADDITIONAL_ENV_PARAMS)
+            env, _, _ = ring_road_exp_setup(
+                vehicles=self.vehicles, env_params=env_params)
+            self.assertEqual(env._overlap_steps, overlap_steps)
+            observations.append(
+                [env.step(rl_actions=None)[0]
+                 for _ in range(20 // sims_per_step)])
+            env.terminate()
+
+        # the simulation itself is not affected, and the observations lag
+        # one simulation step behind
+        np.testing.assert_array_almost_equal(
+            observations[0][::2], observations[1])
+
+    def test_unsupported(self):
+        # steps are not overlapped if the observations would lag a full step
+        env_params = EnvParams(overlap_steps=True,
+                               additional_params=ADDITIONAL_ENV_PARAMS)
+        with self.assertWarns(UserWarning):
+            env, _, _ = ring_road_exp_setup(
+                vehicles=self.vehicles, env_params=env_params)
+        self.assertFalse(env._overlap_steps)
+        env.terminate()
+
+
+class TestFastReset(unittest.TestCase):
+    """Ensures that restoring the saved state of the simulation upon reset
+    when using flow.core.params.SumoParams.fast_reset reproduces the initial
+    state of the vehicles"""
+
+    def test_it_works(self):
+        vehicles = VehicleParams()
+        vehicles.add("human", acceleration_controller=(IDMController, {}),
+                     routing_controller=(ContinuousRouter, {}),
+                     num_vehicles=4)
+        vehicles.add("rl", acceleration_controller=(RLController, {}),
+                     routing_controller=(ContinuousRouter, {}),
+                     num_vehicles=1)
+        env_params = EnvParams(additional_params=ADDITIONAL_ENV_PARAMS)
+        sim_params = SumoParams(sim_step=0.1, fast_reset=True)
+        env, _, _ = ring_road_exp_setup(
+            vehicles=vehicles, env_params=env_params, sim_params=sim_params)
+        self.assertIsNotNone(env._reset_state)
+
+        observations = []
+        for _ in range(3):
+            obs = [env.reset()]
+            obs += [env.step(rl_actions=[1])[0] for _ in range(20)]
+            observations.append(obs)
+            self.assertEqual(len(env.k.kernel_api.vehicle.getIDList()), 5)
+            self.assertEqual(env.k.vehicle.num_vehicles, 5)
+
+        np.testing.assert_array_almost_equal(observations[0], observations[1])
+        np.testing.assert_array_almost_equal(observations[0], observations[2])
+
+        # the saved state is discarded when the instance is restarted
+        env.restart_simulation(sim_params)
+        self.assertIsNone(env._reset_state)
+        env.terminate()
+
+    def test_speed_factors(self):
+        vehicles = VehicleParams()
+        vehicles.add("human", num_vehicles=4)
+        sim_params = SumoParams(sim_step=0.1, fast_reset=True)
+        env, _, _ = ring_road_exp_setup(
+            vehicles=vehicles, sim_params=sim_params)
+
+        # the speed factors of the vehicles are drawn anew upon every reset
+        factors = []
+        for _ in range(3):
+            env.reset()
+            env.step(rl_actions=None)
+            factors.append([env.k.kernel_api.vehicle.getSpeedFactor(veh_id)
+                            for veh_id in sorted(env.k.vehicle.get_ids())])
+        self.assertFalse(np.allclose(factors[1], factors[2]))
+        for factor in factors[2]:
+            self.assertTrue(0.2 <= factor <= 2)
+        env.terminate()
+
+    def test_set_inflows(self):
+        inflows = InFlows()
+        inflows.add(veh_type="idm", edge="highway_0", vehs_per_hour=3600,
+                    depart_lane="free", depart_speed=10)
+        net_params = NetParams(
+            inflows=inflows,
+            additional_params=dict(HIGHWAY_PARAMS, length=500))
+        sim_params = SumoParams(
+            sim_step=0.1, runtime_inflows=True, fast_reset=True)
+        env, _, _ = highway_exp_setup(
+            sim_params=sim_params, net_params=net_params)
+        env.reset()
+        self.assertIsNotNone(env._reset_state)
+
+        def num_added():
+            for _ in range(50):
+                env.step(None)
+            return env.k.inflows.num_added
+
+        # inflows set between resets supersede those of the saved state
+        new_inflows = InFlows()
+        new_inflows.add(veh_type="idm", edge="highway_0", period=0.45)
+        env.k.inflows.set_inflows(new_inflows)
+        for _ in range(2):
+            env.reset()
+            self.assertEqual(num_added(), 10)
+
+        # and so do modified rates
+        env.k.inflows.set_rate('flow_0', vehs_per_hour=0)
+        env.reset()
+        self.assertEqual(num_added(), 0)
+
+        # unmodified inflows resume from the saved state
+        env.k.inflows.set_inflows(inflows)
+        env.reset()
+        self.assertEqual(num_added(), 5)
+        env.terminate()
+
+
+class TestWarmInstances(unittest.TestCase):
+    """Ensures that restarting the sumo instance upon reset connects to a
+    process that was launched ahead of time when using
+    flow.core.params.SumoParams.num_warm_instances"""
+
+    def test_it_works(self):
+        sim_params = SumoParams(sim_step=0.1, restart_instance=True,
+                                num_warm_instances=1)
+        env, _, _ = ring_road_exp_setup(sim_params=sim_params)
+        launcher = env.k.simulation.launcher
+        seed = launcher.next_seed()
+        self.assertIsNotNone(seed)
+        num_warm_launches = launcher.num_warm_launches
+
+        # let the warm process load its network before the files of the
+        # network are generated anew
+        time.sleep(2)
+        env.reset()
+        self.assertEqual(launcher.num_warm_launches, num_warm_launches + 1)
+        self.assertEqual(env.sim_params.seed, seed)
+        self.assertEqual(env.k.vehicle.num_vehicles, 1)
+
+        # the warm processes are terminated along with the environment
+        proc = launcher._warm[0].proc
+        env.terminate()
+        self.assertIsNotNone(proc.wait(timeout=10))
+
+
+class TestRuntimeInflows(unittest.TestCase):
+    """Ensures that the vehicles of the inflows are added during the
+    simulation when using flow.core.params.SumoParams.runtime_inflows"""
+
+    def test_it_works(self):
+        inflows = InFlows()
+        inflows.add(veh_type="idm", edge="highway_0", vehs_per_hour=3600,
+                    depart_lane="free", depart_speed=10)
+        net_params = NetParams(
+            inflows=inflows,
+            additional_params=dict(HIGHWAY_PARAMS, length=500))
+        sim_params = SumoParams(sim_step=0.1, runtime_inflows=True)
+        env, _, _ = highway_exp_setup(
+            sim_params=sim_params, net_params=net_params)
+
+        # the inflows are not written to the routes of the network
+        with open(env.k.network.cfg_path + env.k.network.roufn) as f:
+            self.assertNotIn('<flow', f.read())
+
+        # one vehicle per second is added starting at 1 second
+        for _ in range(55):
+            env.step(None)
+        self.assertEqual(env.k.inflows.num_added, 5)
+        self.assertIn('flow_00.0', env.k.vehicle.get_ids())
+        self.assertAlmostEqual(env.k.vehicle.get_inflow_rate(5), 3600)
+
+        # the inflows start anew upon reset
+        env.reset()
+        self.assertEqual(env.k.inflows.num_added, 0)
+
+        # the rate is modified at runtime
+        env.k.inflows.set_rate('flow_0', vehs_per_hour=0)
+        for _ in range(50):
+            env.step(None)
+        self.assertEqual(env.k.inflows.num_added, 0)
+
+        new_inflows = InFlows()
+        new_inflows.add(veh_type="idm", edge="highway_0", period=0.45)
+        env.k.inflows.set_inflows(new_inflows)
+        for _ in range(8):
+            env.step(None)
+        self.assertEqual(env.k.inflows.num_added, 2)
+        env.terminate()
+
+
+class TestStepProfiler(unittest.TestCase):
+    """Ensures that the phases of the steps and resets are timed when using
+    flow.core.params.EnvParams.profile"""
+
+    def test_phase_stats(self):
+        profiler = StepProfiler()
+        with profiler.phase("step"):
+            with profiler.phase("simulation_step"):
+                pass
+        with profiler.phase("step"):
+            pass
+        summary = profiler.summary()
+        self.assertListEqual(list(summary), ["step", "step/simulation_step"])
+        self.assertEqual(summary["step"]["count"], 2)
+        self.assertEqual(summary["step/simulation_step"]["count"], 1)
+
+        # percentiles are bounded by the histogram buckets
+        stats = PhaseStats()
+        for duration in [3, 5, 6, 100]:
+            stats.add(duration)
+        self.assertEqual(stats.percentile(50), 8)
+        self.assertEqual(stats.percentile(100), 100)
+        self.assertEqual(stats.min, 3)
+
+    def test_env_profile(self):
+        trace_dir = os.path.join(
+            os.path.dirname(os.path.realpath(__file__)), "test_files/profile")
+        env_params = EnvParams(
+            additional_params=ADDITIONAL_ENV_PARAMS, warmup_steps=2,
+            profile=True, profile_path=trace_dir)
+        env, _, _ = ring_road_exp_setup(env_params=env_params)
+        for _ in range(5):
+            env.step(rl_actions=None)
+        env.reset()
+
+        summary = env.profiler.summary()
+        self.assertEqual(summary["step"]["count"], 5)
+        self.assertEqual(summary["reset/step"]["count"], 4)
+        for phase in ["controllers", "routing", "simulation_step",
+                      "update/vehicle", "get_state", "compute_reward"]:
+            self.assertEqual(summary["step/" + phase]["count"], 5)
+
+        # a trace is dumped for the completed episode
+        trace_files = os.listdir(trace_dir)
+        self.assertEqual(len(trace_files), 1)
+        self.assertTrue(trace_files[0].endswith("_1.json"))
+        with open(os.path.join(trace_dir, trace_files[0])) as f:
+            trace = json.load(f)
+        self.assertEqual(
+            len([e for e in trace["traceEvents"] if e["name"] == "step"]), 7)
+
+        env.terminate()
+        shutil.rmtree(trace_dir)
+
+        # the profiler is disabled by default
+        env, _, _ = ring_road_exp_setup()
+        self.assertFalse(env.profiler.enabled)
+        env.terminate()
+
+
 class TestAbstractMethods(unittest.TestCase):
     """
     These series of tests are meant to ensure that the environment abstractions
@@ -418,6 +775,38 @@ class TestVehicleColoring(unittest.TestCase):
             else:
                 self.assertEqual(env.k.vehicle.get_color(veh_id), WHITE)
 
+    def test_changed_colors_only(self):
+        vehicles = VehicleParams()
+        vehicles.add("human", num_vehicles=10)
+        _, network, _ = ring_road_exp_setup(vehicles=vehicles)
+        env = TestEnv(EnvParams(), SumoParams(color_by_speed=True), network)
+        env.reset()
+        commands = env.k.command_buffer
+        # send the modes of the vehicles, which are queued upon departure
+        commands.flush()
+
+        # the colors of all vehicles are sent the first time
+        env.k.vehicle.update_vehicle_colors()
+        num_sent = commands.num_sent
+        commands.flush()
+        self.assertEqual(commands.num_sent - num_sent, 10)
+
+        # no colors are sent if the speeds of the vehicles do not change
+        env.k.vehicle.update_vehicle_colors()
+        num_sent = commands.num_sent
+        commands.flush()
+        self.assertEqual(commands.num_sent - num_sent, 0)
+
+        # only the vehicles whose speed bin changed are recolored
+        env.k.vehicle.test_set_speed("human_0", 30)
+        env.k.vehicle.update_vehicle_colors()
+        num_sent = commands.num_sent
+        commands.flush()
+        self.assertEqual(commands.num_sent - num_sent, 1)
+        self.assertEqual(env.k.vehicle.get_color("human_0"), (0, 255, 0))
+
+        env.terminate()
+
 
 class TestNotEnoughVehicles(unittest.TestCase):
     """Tests that when not enough vehicles spawn an error is raised."""
@@ -886,11 +886,20 @@ class TestBottleneckDesiredVelocityEnv(unittest.TestCase):
     def test_reset_inflows(self):
         """Tests that the inflow  change within the expected range when calling
         reset."""
+        self._check_reset_inflows(
+            SumoParams(sim_step=0.5, restart_instance=True))
+
+    def test_reset_runtime_inflows(self):
+        """Tests that the inflows change without creating a new network when
+        their vehicles are added at runtime."""
+        env = self._check_reset_inflows(
+            SumoParams(sim_step=0.5, runtime_inflows=True))
+        self.assertEqual(len(env.network.net_params.inflows.get()), 1)
+
+    def _check_reset_inflows(self, sim_params):
         # set a random seed for inflows to be the same every time
         np.random.seed(seed=123)
 
-        sim_params = SumoParams(sim_step=0.5, restart_instance=True)
-
         vehicles = VehicleParams()
         vehicles.add(veh_id="human")
         vehicles.add(veh_id="followerstopper")
@@ -945,6 +954,7 @@ class TestBottleneckDesiredVelocityEnv(unittest.TestCase):
             env.step(rl_actions=None)
         self.assertAlmostEqual(
             env.k.vehicle.get_inflow_rate(250)/expected_inflow, 1, 1)
+        return env
 
 
 class TestMultiAgentAccelPOEnv(unittest.TestCase):
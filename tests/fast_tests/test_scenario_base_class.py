@@ -9,6 +9,7 @@ from flow.core.params import VehicleParams
 from flow.core.params import EnvParams
 from flow.core.params import SumoParams
 from flow.core.params import SumoCarFollowingParams
+from flow.core.kernel.network.lane_graph import LaneGraph
 from flow.networks.ring import RingNetwork, ADDITIONAL_NET_PARAMS
 from flow.envs import TestEnv
 from flow.networks import Network
@@ -64,6 +65,16 @@ class TestGetX(unittest.TestCase):
         pos = 4.72
         self.assertAlmostEqual(self.env.k.network.get_x(edge, pos), -1001)
 
+    def test_getx_batch(self):
+        network = self.env.k.network
+        edges = ["bottom", ":bottom", "", ":center_0"]
+        pos = [4.72, 0.1, 4.72, 1]
+        np.testing.assert_array_almost_equal(
+            network.get_x_batch(
+                [network.get_edge_index(edge) for edge in edges], pos),
+            [network.get_x(edge, p) for edge, p in zip(edges, pos)])
+        self.assertEqual(network.get_edge_index(""), -1)
+
 
 class TestGetEdge(unittest.TestCase):
     """
@@ -92,6 +103,23 @@ class TestGetEdge(unittest.TestCase):
         self.assertTupleEqual(
             self.env.k.network.get_edge(x2), (":bottom", 0.1))
 
+    def test_get_edge_batch(self):
+        network = self.env.k.network
+        x = [5, 0.1, -1]
+        edge_idx, pos = network.get_edge_batch(x)
+        self.assertListEqual(
+            [network.get_edge_name(index) for index in edge_idx],
+            ["bottom", ":bottom", ""])
+        np.testing.assert_array_almost_equal(pos[:2], [4.72, 0.1])
+        self.assertTrue(np.isnan(pos[2]))
+
+        # positions are consistent with the scalar lookup
+        for x in np.linspace(0, network.length(), 100):
+            edge_idx, pos = network.get_edge_batch([x])
+            edge, edge_pos = network.get_edge(x)
+            self.assertEqual(network.get_edge_name(edge_idx[0]), edge)
+            self.assertAlmostEqual(pos[0], edge_pos)
+
 
 class TestEvenStartPos(unittest.TestCase):
     """
@@ -885,6 +913,96 @@ class TestNextPrevEdge(unittest.TestCase):
         self.assertTrue(len(prev_edge) == 0)
 
 
+class TestLaneGraph(unittest.TestCase):
+    """Tests the lane graph returned by get_lane_graph()."""
+
+    def setUp(self):
+        self.env, _, _ = ring_road_exp_setup()
+        self.graph = self.env.k.network.get_lane_graph()
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def edge_names(self, lanes):
+        return [self.env.k.network.get_edge_name(lane // self.graph.max_lanes)
+                if lane >= 0 else '' for lane in lanes]
+
+    def test_links(self):
+        top = self.graph.lane_index("top", 0)
+        self.assertEqual(self.graph.lane_index("top", 1), -1)
+        self.assertEqual(self.graph.lane_index("nonexistent", 0), -1)
+        self.assertListEqual(
+            self.edge_names([self.graph.next_lane[top],
+                             self.graph.prev_lane[top]]),
+            [":left_0", ":top_0"])
+
+    def test_distance_tables(self):
+        top = self.graph.lane_index("top", 0)
+        length = self.env.k.network.length()
+
+        # the tables end with a full loop around the ring
+        self.assertListEqual(
+            self.edge_names(self.graph.downstream_lanes[top]),
+            [":left_0", "left", ":bottom_0", "bottom", ":right_0", "right",
+             ":top_0", "top"])
+        self.assertAlmostEqual(self.graph.downstream_dist[top, 0],
+                               self.env.k.network.edge_length("top"))
+        self.assertAlmostEqual(self.graph.downstream_dist[top, -1], length)
+        self.assertListEqual(
+            self.edge_names(self.graph.upstream_lanes[top]),
+            [":top_0", "right", ":right_0", "bottom", ":bottom_0", "left",
+             ":left_0", "top"])
+        self.assertAlmostEqual(self.graph.upstream_dist[top, -1], length)
+
+        # nearest lanes that match
+        match = np.zeros(len(self.graph.next_lane), dtype=bool)
+        bottom = self.graph.lane_index("bottom", 0)
+        match[bottom] = True
+        lanes, dist = self.graph.first_match([top, bottom, -1], match)
+        np.testing.assert_array_equal(lanes, [bottom, bottom, -1])
+        np.testing.assert_array_almost_equal(
+            dist, [length / 2, length, np.inf])
+        lanes, dist = self.graph.first_match([top], match, upstream=True)
+        np.testing.assert_array_equal(lanes, [bottom])
+        np.testing.assert_array_almost_equal(dist, [length / 2])
+
+    def test_chained_tables(self):
+        net = self.env.k.network
+        edges = [net._edges.get(edge, {}) for edge in net._edge_names]
+        graph = LaneGraph(net._edge_names,
+                          [edge.get('lanes', 0) for edge in edges],
+                          [edge.get('length', 0) for edge in edges],
+                          net.next_edge, net.prev_edge, table_hops=3)
+        self.assertEqual(graph.num_hops, 3)
+        self.assertEqual(graph.max_hops, self.graph.max_hops)
+
+        # searches past the end of the tables give the same results
+        lanes = np.arange(-1, len(graph.next_lane))
+        for i in range(len(graph.next_lane)):
+            match = np.zeros(len(graph.next_lane), dtype=bool)
+            match[i] = True
+            for upstream in [False, True]:
+                expected = self.graph.first_match(lanes, match, upstream)
+                actual = graph.first_match(lanes, match, upstream)
+                np.testing.assert_array_equal(actual[0], expected[0])
+                np.testing.assert_array_almost_equal(actual[1], expected[1])
+
+    def test_lookahead(self):
+        self.env.terminate()
+        self.env, _, _ = ring_road_exp_setup(
+            sim_params=SumoParams(lane_lookahead=60, render=False))
+        graph = self.env.k.network.get_lane_graph()
+        top = graph.lane_index("top", 0)
+
+        # only the lanes starting within 60 m of the end of the lane are kept
+        self.assertEqual(graph.num_hops, 4)
+        self.assertListEqual(
+            [self.env.k.network.get_edge_name(lane // graph.max_lanes)
+             for lane in graph.downstream_lanes[top]],
+            [":left_0", "left", ":bottom_0", "bottom"])
+
+
 class TestDefaultRoutes(unittest.TestCase):
 
     def test_default_routes(self):
@@ -1057,5 +1175,41 @@ class TestNetworkTemplateGenerator(unittest.TestCase):
         self.assertDictEqual(network.routes, expected_routes)
 
 
+class TestNetworkCache(unittest.TestCase):
+    """Tests the cache of the networks generated by the TraCI kernel."""
+
+    def test_restart_hits_cache(self):
+        """Tests that restarting the instance does not call netconvert."""
+        sim_params = SumoParams(
+            sim_step=0.1, render=False, restart_instance=True)
+        env, _, _ = ring_road_exp_setup(sim_params=sim_params)
+        cache = env.k.network.net_cache
+        edges = env.k.network._edges
+        connections = env.k.network._connections
+        num_hits = cache.num_hits
+
+        # the network is generated anew upon reset
+        env.reset()
+        self.assertEqual(cache.num_hits, num_hits + 1)
+        self.assertDictEqual(env.k.network._edges, edges)
+        self.assertDictEqual(env.k.network._connections, connections)
+
+        # netconvert was not called, so its input files were not generated
+        self.assertFalse(os.path.exists(
+            env.k.network.net_path + env.k.network.nodfn))
+
+        # the cached network is usable by sumo
+        env.step(None)
+        self.assertEqual(env.k.vehicle.num_vehicles, 1)
+        env.terminate()
+
+    def test_disabled(self):
+        """Tests that networks are not cached if net_cache is False."""
+        sim_params = SumoParams(sim_step=0.1, render=False, net_cache=False)
+        env, _, _ = ring_road_exp_setup(sim_params=sim_params)
+        self.assertIsNone(env.k.network.net_cache)
+        env.terminate()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 
 from flow.core.experiment import Experiment
+from flow.core.params import EnvParams
+from flow.envs import TrafficLightGridPOEnv
 
 from tests.setup_scripts import traffic_light_grid_mxn_exp_setup
 
@@ -136,5 +138,36 @@ class Test2x2Environment(unittest.TestCase):
             self.env._get_relative_node('center1', 'blah')
 
 
+class TestTrafficLightGridPOEnv(unittest.TestCase):
+    def setUp(self):
+        self.env_params = EnvParams(
+            additional_params={
+                "target_velocity": 50,
+                "switch_time": 3.0,
+                "num_observed": 2,
+                "tl_type": "controlled",
+                "discrete": False
+            },
+            horizon=100)
+        env, network, flow_params = traffic_light_grid_mxn_exp_setup(
+            env_params=self.env_params)
+        env.terminate()
+
+        self.env = TrafficLightGridPOEnv(
+            self.env_params, flow_params['sim'], network)
+        self.env.reset()
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def test_moved_ids(self):
+        """Check that the overridden additional_command does not leave the
+        vehicles that moved to a new edge accumulating across steps."""
+        for _ in range(50):
+            self.env.step(rl_actions=None)
+            self.assertFalse(self.env._moved_ids)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,12 @@
 import unittest
 import csv
 import os
+import shutil
+import tempfile
 import json
 import collections
+import numpy as np
+from gym.spaces import Box
 
 from flow.envs import AccelEnv
 from flow.networks import FigureEightNetwork
@@ -16,6 +20,9 @@ from flow.envs import MergePOEnv
 from flow.networks import MergeNetwork
 from flow.utils.registry import make_create_env
 from flow.utils.rllib import FlowParamsEncoder, get_flow_params
+from flow.utils.vec_env import FlowVecEnv
+from flow.envs.ring.accel import ADDITIONAL_ENV_PARAMS
+from tests.setup_scripts import ring_road_exp_setup
 
 os.environ["TEST_FLAG"] = "True"
 
@@ -58,6 +65,71 @@ class TestEmissionToCSV(unittest.TestCase):
         # I don't think is a problem
         self.assertEqual(len(dict1), 104)
 
+    def test_chunked_sort(self):
+        # a small emission file, converted a few rows at a time
+        vehicle = '<vehicle id="{}" eclass="HBEFA3/PC_G_EU4" CO2="2624.72" ' \
+            'CO="164.78" HC="0.81" NOx="1.20" PMx="0.07" fuel="1128.61" ' \
+            'electricity="0.00" noise="55.94" route="route0" type="idm" ' \
+            'waiting="0.00" lane="edge_1_{}" pos="{}" speed="1.50" ' \
+            'angle="90.00" x="0.00" y="0.00"/>'
+        path = tempfile.mkdtemp()
+        xml = ['<emission-export>']
+        for t in range(5):
+            xml.append('<timestep time="{:.2f}">'.format(t))
+            xml.extend(vehicle.format(veh_id, t % 2, t)
+                       for veh_id in ["b", "c", "a"])
+            # vehicles that are missing attributes are skipped
+            xml.append('<vehicle id="d" x="0.00"/>')
+            xml.append('</timestep>')
+        xml.append('</emission-export>')
+        with open(os.path.join(path, "emission.xml"), "w") as f:
+            f.write("\n".join(xml))
+
+        emission_to_csv(os.path.join(path, "emission.xml"), chunk_size=4)
+        with open(os.path.join(path, "emission.csv")) as f:
+            rows = list(csv.DictReader(f))
+        shutil.rmtree(path)
+
+        # rows are sorted by id, and then by time
+        self.assertListEqual(
+            [(row["id"], row["time"]) for row in rows],
+            [(veh_id, str(float(t))) for veh_id in "abc" for t in range(5)])
+        self.assertListEqual(
+            [(row["edge_id"], row["lane_number"], row["relative_position"])
+             for row in rows[:2]], [("edge_1", "0", "0.0"),
+                                    ("edge_1", "1", "1.0")])
+
+    def test_fcd_output(self):
+        path = tempfile.mkdtemp()
+        vehicles = VehicleParams()
+        vehicles.add("idm", acceleration_controller=(IDMController, {}),
+                     routing_controller=(ContinuousRouter, {}),
+                     num_vehicles=3)
+        env, _, _ = ring_road_exp_setup(
+            sim_params=SumoParams(emission_path=path, fcd_output=True,
+                                  render=False),
+            vehicles=vehicles)
+        env.reset()
+        for _ in range(10):
+            env.step(None)
+        env.terminate()
+
+        # the trajectories written by sumo are converted to csv, by time
+        fcd_path = os.path.join(path, "{}-fcd.xml".format(env.network.name))
+        emission_to_csv(fcd_path, sort_by_id=False)
+        with open(fcd_path[:-3] + "csv") as f:
+            rows = list(csv.DictReader(f))
+        shutil.rmtree(path)
+
+        self.assertListEqual(
+            list(rows[0].keys()),
+            ['time', 'id', 'type', 'x', 'y', 'angle', 'speed',
+             'relative_position', 'slope', 'edge_id', 'lane_number'])
+        self.assertEqual(len({row["id"] for row in rows}), 3)
+        self.assertListEqual(
+            [row["time"] for row in rows],
+            sorted([row["time"] for row in rows], key=float))
+
 
 class TestRegistry(unittest.TestCase):
     """Tests the methods located in flow/utils/registry.py"""
@@ -323,5 +395,88 @@ class TestRllib(unittest.TestCase):
                                      flow_params["veh"].__dict__))
 
 
+def create_ring_env():
+    vehicles = VehicleParams()
+    vehicles.add("human", acceleration_controller=(IDMController, {}),
+                 routing_controller=(ContinuousRouter, {}), num_vehicles=4)
+    vehicles.add("rl", acceleration_controller=(RLController, {}),
+                 routing_controller=(ContinuousRouter, {}), num_vehicles=1)
+    env_params = EnvParams(horizon=5, additional_params=ADDITIONAL_ENV_PARAMS)
+    env, _, _ = ring_road_exp_setup(vehicles=vehicles, env_params=env_params)
+    return env
+
+
+class MultiAgentDummyEnv(object):
+    """Multi-agent env whose agents enter and leave at fixed steps."""
+
+    observation_space = Box(low=-1, high=10, shape=(2,), dtype=np.float32)
+    action_space = Box(low=-1, high=1, shape=(1,), dtype=np.float32)
+
+    def reset(self):
+        self.t = 0
+        return {"a": np.zeros(2), "b": np.ones(2)}
+
+    def step(self, actions):
+        self.t += 1
+        agents = [["a", "b", "c"], ["b", "c"], ["b", "c"]][self.t - 1]
+        obs = {agent: np.full(2, self.t) for agent in agents}
+        reward = {agent: float(actions[agent][0]) for agent in actions}
+        done = {"a": self.t == 1, "__all__": self.t == 3}
+        return obs, reward, done, {}
+
+    def terminate(self):
+        pass
+
+
+class TestFlowVecEnv(unittest.TestCase):
+    """Tests the vectorized environment in flow/utils/vec_env.py."""
+
+    def test_single_agent(self):
+        env = FlowVecEnv([create_ring_env, create_ring_env])
+        obs = env.reset()
+        self.assertEqual(obs.shape, (2,) + env.observation_space.shape)
+
+        for i in range(5):
+            obs, rewards, dones, infos = env.step(np.zeros((2, 1)))
+            self.assertEqual(rewards.shape, (2,))
+            # the environments are reset at the end of their episodes
+            self.assertEqual(dones.tolist(), [i == 4, i == 4])
+        self.assertEqual(infos[0]["terminal_observation"].shape,
+                         env.observation_space.shape)
+        self.assertListEqual(env.get_attr("time_counter"), [0, 0])
+
+        env.close()
+
+    def test_multi_agent(self):
+        env = FlowVecEnv([MultiAgentDummyEnv], max_agents=3)
+        obs = env.reset()
+        self.assertEqual(obs.shape, (1, 3, 2))
+        self.assertListEqual(env.agent_ids[0], ["a", "b", None])
+
+        # "a" keeps its slot during the step it is done, "c" takes a new one
+        obs, rewards, dones, _ = env.step(np.array([[[1], [2], [3]]]))
+        self.assertListEqual(env.agent_ids[0], ["a", "b", "c"])
+        self.assertListEqual(rewards[0].tolist(), [1, 2, 0])
+        self.assertListEqual(dones[0].tolist(), [True, False, False])
+
+        # the slot of "a" is then released
+        obs, rewards, _, _ = env.step([{"b": [4], "c": [5]}])
+        self.assertListEqual(env.agent_ids[0], [None, "b", "c"])
+        self.assertListEqual(env.active[0].tolist(), [False, True, True])
+        self.assertListEqual(rewards[0].tolist(), [0, 4, 5])
+        self.assertListEqual(obs[0].tolist(), [[0, 0], [2, 2], [2, 2]])
+
+        # at the end of the episode, the observations of the next one are
+        # returned
+        obs, rewards, dones, infos = env.step(np.array([[[0], [6], [7]]]))
+        self.assertListEqual(infos[0]["terminal_agent_ids"], [None, "b", "c"])
+        self.assertListEqual(rewards[0].tolist(), [0, 6, 7])
+        self.assertListEqual(dones[0].tolist(), [False, True, True])
+        self.assertListEqual(env.agent_ids[0], ["a", "b", None])
+        self.assertListEqual(obs[0].tolist(), [[0, 0], [1, 1], [0, 0]])
+
+        env.close()
+
+
 if __name__ == '__main__':
     unittest.main()
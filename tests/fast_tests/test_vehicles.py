@@ -1,6 +1,8 @@
 import unittest
+import copy
 import os
 import numpy as np
+from traci.exceptions import TraCIException
 
 from flow.core.params import VehicleParams
 from flow.core.params import SumoCarFollowingParams, NetParams, \
@@ -9,6 +11,13 @@ from flow.controllers.car_following_models import IDMController, \
     SimCarFollowingController
 from flow.controllers.lane_change_controllers import StaticLaneChanger
 from flow.controllers.rlcontroller import RLController
+from flow.controllers.routing_controllers import ContinuousRouter
+from flow.core.kernel.vehicle.state import VehicleStateStore
+from flow.core.kernel.vehicle.registry import IdRegistry
+from flow.core.kernel.vehicle.counters import WindowCounter
+from flow.core.kernel.events import EventBus, DEPARTED, EDGE_CHANGED, \
+    REACHED_LAST_EDGE
+from flow.networks.ring import ADDITIONAL_NET_PARAMS
 
 from tests.setup_scripts import ring_road_exp_setup, highway_exp_setup
 
@@ -179,6 +188,10 @@ class TestVehiclesClass(unittest.TestCase):
                         msg="RL vehicle still in get_ids()")
         self.assertTrue("test_rl_0" not in env.k.vehicle.get_rl_ids(),
                         msg="RL vehicle still in get_rl_ids()")
+        self.assertFalse(env.k.vehicle.is_rl("test_rl_0"),
+                         msg="RL vehicle still in is_rl()")
+        self.assertTrue(env.k.vehicle.is_rl("test_rl_1"))
+        self.assertFalse(env.k.vehicle.is_rl("test_1"))
 
         # ensure that the vehicles are not storing extra information in the
         # vehicles.__vehicles dict
@@ -252,6 +265,90 @@ class TestMultiLaneData(unittest.TestCase):
         np.testing.assert_array_almost_equal(actual_lane_tail,
                                              expected_lane_tail)
 
+    def test_human_vehicles(self):
+        """Test that the lane data can be computed for non-RL vehicles."""
+        additional_net_params = {
+            "length": 230,
+            "lanes": 3,
+            "speed_limit": 30,
+            "resolution": 40
+        }
+        net_params = NetParams(additional_params=additional_net_params)
+
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="test",
+            acceleration_controller=(IDMController, {}),
+            num_vehicles=21)
+
+        initial_config = InitialConfig(lanes_distribution=float("inf"))
+
+        env, _, _ = ring_road_exp_setup(
+            net_params=net_params,
+            vehicles=vehicles,
+            initial_config=initial_config)
+        env.reset()
+
+        env.k.vehicle.compute_lane_data(env.k.vehicle.get_ids())
+        self.assertCountEqual(env.k.vehicle.get_lane_leaders("test_0"),
+                              ["test_3", "test_1", "test_2"])
+        self.assertCountEqual(env.k.vehicle.get_lane_followers("test_0"),
+                              ["test_18", "test_19", "test_20"])
+        self.assertCountEqual(env.k.vehicle.get_lane_headways("test_0"),
+                              [27.85714285714286, -5, -5])
+
+        env.terminate()
+
+    def test_lazy_computation(self):
+        """Test that the lane data is only computed when needed."""
+        additional_net_params = {
+            "length": 230,
+            "lanes": 2,
+            "speed_limit": 30,
+            "resolution": 40
+        }
+        net_params = NetParams(additional_params=additional_net_params)
+
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="rl",
+            acceleration_controller=(RLController, {}),
+            num_vehicles=2)
+        vehicles.add(
+            veh_id="test",
+            acceleration_controller=(IDMController, {}),
+            num_vehicles=6)
+
+        initial_config = InitialConfig(lanes_distribution=float("inf"))
+
+        lane_data = []
+        for eager_data in [("lane_data",), ()]:
+            env, _, _ = ring_road_exp_setup(
+                net_params=net_params,
+                vehicles=vehicles,
+                initial_config=initial_config)
+            env.k.vehicle.set_eager_data(eager_data)
+            env.reset()
+            env.step(rl_actions=None)
+
+            # the data is only computed after an update if requested
+            computed = "lane_data" not in env.k.vehicle._stale_data
+            self.assertEqual(computed, len(eager_data) > 0)
+
+            lane_data.append([
+                env.k.vehicle.get_lane_headways(["rl_0", "rl_1"]),
+                env.k.vehicle.get_lane_tailways(["rl_0", "rl_1"]),
+                env.k.vehicle.get_lane_leaders(["rl_0", "rl_1"]),
+                env.k.vehicle.get_lane_followers(["rl_0", "rl_1"]),
+                env.k.vehicle.get_ids_by_lane("top", 1),
+            ])
+            self.assertNotIn("lane_data", env.k.vehicle._stale_data)
+            env.terminate()
+
+        self.assertListEqual(lane_data[0], lane_data[1])
+
+        self.assertRaises(ValueError, env.k.vehicle.set_eager_data, ["speed"])
+
     def test_no_junctions_highway(self):
         additional_net_params = {
             "length": 100,
@@ -567,6 +664,25 @@ class TestIdsByEdge(unittest.TestCase):
         expected_ids = ["test_0", "test_1", "test_2", "test_3", "test_4"]
         self.assertCountEqual(ids, expected_ids)
 
+    def test_ids_by_lane(self):
+        self.env.reset()
+        for _ in range(50):
+            self.env.step(rl_actions=None)
+
+            # vehicles in every lane are sorted by position
+            for edge in self.env.k.network.get_edge_list():
+                ids = self.env.k.vehicle.get_ids_by_lane(edge, 0)
+                self.assertCountEqual(
+                    ids, self.env.k.vehicle.get_ids_by_edge(edge))
+                pos = self.env.k.vehicle.get_position(ids)
+                self.assertListEqual(pos, sorted(pos))
+
+        # invalid edges and lanes have no vehicles
+        self.assertListEqual(self.env.k.vehicle.get_ids_by_lane("bottom", 1),
+                             [])
+        self.assertListEqual(self.env.k.vehicle.get_ids_by_lane("none", 0),
+                             [])
+
 
 class TestObservedIDs(unittest.TestCase):
     """Tests the observed_ids methods, which are used for visualization."""
@@ -600,5 +716,395 @@ class TestObservedIDs(unittest.TestCase):
         self.assertCountEqual(env.k.vehicle.get_observed_ids(), ["test_1"])
 
 
+class TestBulkGetters(unittest.TestCase):
+    """Tests the array-returning getters of the vehicle kernel."""
+
+    def setUp(self):
+        vehicles = VehicleParams()
+        vehicles.add(veh_id="test", num_vehicles=5)
+        self.env, _, _ = ring_road_exp_setup(vehicles=vehicles)
+        self.env.reset()
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def test_get_speeds(self):
+        ids = self.env.k.vehicle.get_ids()
+        self.env.k.vehicle.test_set_speed("test_2", 4.5)
+
+        speeds = self.env.k.vehicle.get_speeds()
+        self.assertIsInstance(speeds, np.ndarray)
+        np.testing.assert_array_almost_equal(
+            speeds, self.env.k.vehicle.get_speed(ids))
+        self.assertAlmostEqual(speeds[ids.index("test_2")], 4.5)
+
+        # missing vehicles are assigned the error value
+        np.testing.assert_array_almost_equal(
+            self.env.k.vehicle.get_speeds(["test_0", "nonexistent"]),
+            [self.env.k.vehicle.get_speed("test_0"), -1001])
+
+    def test_get_state_matrix(self):
+        ids = ["test_1", "nonexistent", "test_3"]
+        matrix = self.env.k.vehicle.get_state_matrix(
+            ids, fields=("position", "lane", "headway"), error=np.nan)
+        self.assertEqual(matrix.shape, (3, 3))
+        np.testing.assert_array_almost_equal(
+            matrix[[0, 2]],
+            np.array([self.env.k.vehicle.get_position(["test_1", "test_3"]),
+                      self.env.k.vehicle.get_lane(["test_1", "test_3"]),
+                      self.env.k.vehicle.get_headway(["test_1", "test_3"])]).T)
+        self.assertTrue(np.all(np.isnan(matrix[1])))
+
+        self.assertRaises(ValueError, self.env.k.vehicle.get_state_matrix,
+                          ids, fields=("route",))
+
+    def test_get_x_batch(self):
+        for _ in range(10):
+            self.env.step(None)
+        ids = self.env.k.vehicle.get_ids()
+        x = self.env.k.vehicle.get_x_batch(ids)
+        self.assertIsInstance(x, np.ndarray)
+        np.testing.assert_array_almost_equal(
+            x, [self.env.k.vehicle.get_x_by_id(veh_id) for veh_id in ids])
+
+        # missing vehicles are at the start of the network
+        np.testing.assert_array_almost_equal(
+            self.env.k.vehicle.get_x_batch(["nonexistent"]), [0])
+
+
+class TestBulkSubscriptions(unittest.TestCase):
+    """Tests the bulk subscription mode of the TraCI vehicle kernel."""
+
+    def test_bulk_subscriptions(self):
+        """Check that both modes collect the same state for all vehicles."""
+        states = []
+        for bulk_subscriptions in [False, True]:
+            vehicles = VehicleParams()
+            vehicles.add(veh_id="test",
+                         acceleration_controller=(IDMController, {}),
+                         num_vehicles=5)
+            sim_params = SumoParams(
+                sim_step=0.1, bulk_subscriptions=bulk_subscriptions)
+            env, _, _ = ring_road_exp_setup(
+                sim_params=sim_params, vehicles=vehicles)
+            env.reset()
+            for _ in range(10):
+                env.step(rl_actions=None)
+
+            ids = env.k.vehicle.get_ids()
+            states.append((
+                sorted(ids),
+                env.k.vehicle.get_state_matrix(
+                    sorted(ids), fields=("speed", "position", "headway",
+                                         "length", "lane", "fuel")),
+                env.k.vehicle.get_leader(sorted(ids)),
+                env.k.vehicle.get_follower(sorted(ids)),
+                env.k.vehicle.get_route(sorted(ids)),
+            ))
+            env.terminate()
+
+        self.assertListEqual(states[0][0], states[1][0])
+        np.testing.assert_array_almost_equal(states[0][1], states[1][1])
+        self.assertListEqual(states[0][2], states[1][2])
+        self.assertListEqual(states[0][3], states[1][3])
+        self.assertListEqual(states[0][4], states[1][4])
+
+    def test_departed_modes(self):
+        """Check that the modes of departing vehicles are buffered."""
+        vehicles = VehicleParams()
+        vehicles.add(veh_id="test",
+                     car_following_params=SumoCarFollowingParams(
+                         speed_mode="aggressive"),
+                     lane_change_params=SumoLaneChangeParams(
+                         lane_change_mode="no_lc_safe"),
+                     num_vehicles=3)
+        env, _, _ = ring_road_exp_setup(
+            sim_params=SumoParams(bulk_subscriptions=True),
+            vehicles=vehicles)
+        env.reset()
+
+        # the modes are sent along with the next simulation step, at the
+        # latest
+        env.step(rl_actions=None)
+        for veh_id in env.k.vehicle.get_ids():
+            self.assertEqual(
+                env.k.kernel_api.vehicle.getSpeedMode(veh_id), 0)
+            self.assertEqual(
+                env.k.kernel_api.vehicle.getLaneChangeMode(veh_id), 512)
+        env.terminate()
+
+
+class TestCommandBuffer(unittest.TestCase):
+    """Tests the buffering of commands sent to sumo by the kernel."""
+
+    def setUp(self):
+        vehicles = VehicleParams()
+        vehicles.add(veh_id="test", num_vehicles=3)
+        self.env, _, _ = ring_road_exp_setup(vehicles=vehicles)
+        self.env.reset()
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def test_coalescing(self):
+        commands = self.env.k.command_buffer
+        # send the modes of the vehicles, which are queued upon departure
+        commands.flush()
+        num_sent, num_coalesced = commands.num_sent, commands.num_coalesced
+
+        # only the last of the commands issued for a vehicle is sent
+        self.env.k.vehicle.set_color("test_0", (255, 0, 0))
+        self.env.k.vehicle.set_color("test_0", (0, 255, 0))
+        self.env.k.vehicle.set_max_speed("test_1", 5)
+        self.env.k.vehicle.apply_acceleration(["test_1", "test_2"], [1, 1])
+        self.env.k.vehicle.apply_acceleration(["test_2"], [-1])
+        self.env.step(rl_actions=None)
+        self.assertEqual(commands.num_sent - num_sent, 4)
+        self.assertEqual(commands.num_coalesced - num_coalesced, 2)
+        self.assertEqual(self.env.k.vehicle.get_color("test_0"), (0, 255, 0))
+        self.assertAlmostEqual(self.env.k.vehicle.get_max_speed("test_1"), 5)
+
+        # values that were already sent are not sent again
+        self.env.k.vehicle.set_color("test_0", (0, 255, 0))
+        self.env.k.vehicle.set_color("test_1", (0, 255, 0))
+        self.env.step(rl_actions=None)
+        self.assertEqual(commands.num_sent - num_sent, 5)
+        self.assertEqual(commands.num_coalesced - num_coalesced, 3)
+
+        # queued commands are dropped for removed vehicles
+        self.env.k.vehicle.set_color("test_2", (0, 255, 0))
+        self.env.k.vehicle.remove("test_2")
+        self.env.step(rl_actions=None)
+        self.assertEqual(commands.num_sent - num_sent, 5)
+
+    def test_rejected_command(self):
+        commands = self.env.k.command_buffer
+        connection = self.env.k.kernel_api
+        self.assertTrue(commands.batching)
+
+        # commands rejected by sumo raise an error, and leave the connection
+        # as it was
+        commands.add('vehicle', 'setSpeedMode', 'nonexistent', 0)
+        self.assertRaises(TraCIException, commands.flush)
+        self.assertNotIn('_sendExact', connection.__dict__)
+        self.assertEqual(connection._queue, [])
+
+        # the connection is still usable
+        self.env.k.vehicle.set_color("test_0", (255, 0, 0))
+        self.env.step(rl_actions=None)
+        self.assertEqual(self.env.k.vehicle.get_color("test_0"), (255, 0, 0))
+
+
+class TestVehicleStateStore(unittest.TestCase):
+    """Tests the columnar store used by the TraCI vehicle kernel."""
+
+    def test_slots(self):
+        state = VehicleStateStore(capacity=2)
+        for i in range(5):
+            state.add("test_{}".format(i))
+            state.set("speed", "test_{}".format(i), float(i))
+
+        # the columns grow once the initial capacity is exceeded
+        self.assertGreaterEqual(state.capacity, 5)
+        np.testing.assert_array_equal(
+            state.column("speed")[state.slots(["test_3", "test_1"])], [3, 1])
+
+        # missing data is replaced by the error value
+        self.assertEqual(state.get("speed", "test_5", error=-1001), -1001)
+        self.assertEqual(state.get("headway", "test_0", error=-1001), -1001)
+
+        # removed slots are cleared and recycled
+        slot = state.slot("test_2")
+        state.remove("test_2")
+        self.assertNotIn("test_2", state)
+        self.assertEqual(state.add("test_5"), slot)
+        self.assertEqual(state.get("speed", "test_5", error=-1001), -1001)
+
+    def test_edges(self):
+        state = VehicleStateStore()
+        state.add("test_0")
+        state.set("edge", "test_0", state.edge_index("bottom"))
+        self.assertEqual(state.edge_name(state.get("edge", "test_0", -1)),
+                         "bottom")
+        self.assertEqual(state.edge_index(""), -1)
+        self.assertEqual(state.edge_name(-1), "")
+
+    def test_kernel_view(self):
+        vehicles = VehicleParams()
+        vehicles.add(veh_id="test", num_vehicles=5)
+        env, _, _ = ring_road_exp_setup(vehicles=vehicles)
+        env.reset()
+
+        # the leader of every vehicle on a single-lane ring follows it
+        for veh_id in env.k.vehicle.get_ids():
+            leader = env.k.vehicle.get_leader(veh_id)
+            self.assertEqual(env.k.vehicle.get_follower(leader), veh_id)
+            self.assertEqual(len(env.k.vehicle.get_orientation(veh_id)), 3)
+
+        env.terminate()
+
+
+class TestIdRegistry(unittest.TestCase):
+    """Tests the registry used to store the ids of the vehicle kernel."""
+
+    def test_registry(self):
+        registry = IdRegistry()
+        for veh_id in ["test_2", "test_0", "test_1", "test_0"]:
+            registry.add(veh_id)
+        self.assertListEqual(registry.snapshot(),
+                             ["test_2", "test_0", "test_1"])
+        self.assertIn("test_1", registry)
+
+        registry.discard("test_0")
+        registry.discard("test_3")
+        self.assertListEqual(registry.snapshot(), ["test_2", "test_1"])
+        self.assertEqual(len(registry), 2)
+
+        # sorted registries iterate over the ids in sorted order
+        registry = IdRegistry(sort=True)
+        for veh_id in ["rl_2", "rl_0", "rl_1"]:
+            registry.add(veh_id)
+        self.assertListEqual(list(registry), ["rl_0", "rl_1", "rl_2"])
+
+    def test_snapshot(self):
+        registry = IdRegistry()
+        registry.add("test_0")
+        snapshot = registry.snapshot()
+
+        # snapshots are not modified by the registry
+        registry.add("test_1")
+        self.assertListEqual(snapshot, ["test_0"])
+        self.assertListEqual(registry.snapshot(), ["test_0", "test_1"])
+
+        # snapshots are shared until the registry is modified
+        snapshot = registry.snapshot()
+        self.assertIs(registry.snapshot(), snapshot)
+        self.assertIsNot(copy.deepcopy(registry).snapshot(), snapshot)
+
+        # modifying a snapshot does not modify the registry, and updates its
+        # membership tests
+        snapshot.remove("test_0")
+        snapshot.append("test_2")
+        snapshot.sort(reverse=True)
+        self.assertListEqual(snapshot, ["test_2", "test_1"])
+        self.assertNotIn("test_0", snapshot)
+        self.assertIn("test_2", snapshot)
+        self.assertListEqual(registry.snapshot(), ["test_0", "test_1"])
+        self.assertIn("test_0", registry.snapshot())
+        self.assertNotIn("test_2", registry.snapshot())
+        self.assertIsNot(registry.snapshot(), snapshot)
+
+
+class TestWindowCounter(unittest.TestCase):
+    """Tests the counters used to compute inflow and outflow rates."""
+
+    def test_window_sums(self):
+        counts = [3, 0, 1, 4, 1, 5, 9, 2, 6]
+        counter = WindowCounter(capacity=4)
+        self.assertEqual(counter.last(), 0)
+        for i, count in enumerate(counts):
+            counter.append(count)
+            # sums match the ones over the full history, up to the capacity
+            for num_steps in range(1, 6):
+                expected = sum(counts[max(i + 1 - min(num_steps, 4), 0):i + 1])
+                self.assertEqual(counter.sum(num_steps), expected)
+        self.assertEqual(len(counter), 4)
+        self.assertEqual(counter.last(), 6)
+        self.assertEqual(counter.sum(0), 22)
+
+        counter.clear()
+        self.assertEqual(len(counter), 0)
+        self.assertEqual(counter.sum(2), 0)
+
+    def test_kernel_rates(self):
+        vehicles = VehicleParams()
+        vehicles.add(veh_id="test", num_vehicles=5)
+        sim_params = SumoParams(sim_step=0.5, max_rate_window=2)
+        env, _, _ = ring_road_exp_setup(
+            sim_params=sim_params, vehicles=vehicles)
+        env.reset()
+
+        # only the steps within the maximum window are stored
+        for _ in range(10):
+            env.step(rl_actions=None)
+        self.assertEqual(len(env.k.vehicle._num_arrived), 4)
+        self.assertEqual(env.k.vehicle.get_outflow_rate(100), 0)
+        self.assertEqual(env.k.vehicle.get_num_arrived(), 0)
+
+        env.terminate()
+
+
+class TestEventBus(unittest.TestCase):
+    """Tests the events published by the vehicle kernel."""
+
+    def test_subscribe(self):
+        bus = EventBus()
+        received = []
+        bus.subscribe(DEPARTED, received.append)
+        self.assertTrue(bus.has_handlers(DEPARTED))
+        self.assertFalse(bus.has_handlers(EDGE_CHANGED))
+
+        # handlers are only called if the event occurred for any vehicle
+        bus.publish(DEPARTED, [])
+        bus.publish(DEPARTED, ["a", "b"])
+        self.assertListEqual(received, [["a", "b"]])
+
+        bus.unsubscribe(DEPARTED, received.append)
+        self.assertFalse(bus.has_handlers(DEPARTED))
+        self.assertRaises(ValueError, bus.subscribe, "foo", print)
+
+    def test_kernel_events(self):
+        vehicles = VehicleParams()
+        vehicles.add(veh_id="test", num_vehicles=5,
+                     routing_controller=(ContinuousRouter, {}))
+        env, _, _ = ring_road_exp_setup(vehicles=vehicles)
+
+        received = {DEPARTED: [], EDGE_CHANGED: [], REACHED_LAST_EDGE: []}
+        for event in received:
+            env.k.events.subscribe(event, received[event].extend)
+        env.reset()
+        self.assertCountEqual(received[DEPARTED], env.k.vehicle.get_ids())
+
+        edges = {veh_id: env.k.vehicle.get_edge(veh_id)
+                 for veh_id in env.k.vehicle.get_ids()}
+        del received[EDGE_CHANGED][:]
+        for _ in range(50):
+            env.step(rl_actions=None)
+            for veh_id in env.k.vehicle.get_ids():
+                edge = env.k.vehicle.get_edge(veh_id)
+                if edge != edges[veh_id]:
+                    # every edge change is published
+                    self.assertIn(veh_id, received[EDGE_CHANGED])
+                    if edge == env.k.vehicle.get_route(veh_id)[-1]:
+                        self.assertIn(veh_id, received[REACHED_LAST_EDGE])
+                edges[veh_id] = edge
+            del received[EDGE_CHANGED][:]
+            del received[REACHED_LAST_EDGE][:]
+
+        env.terminate()
+
+    def test_events_after_store_growth(self):
+        # more vehicles depart than the initial capacity of the state store,
+        # so the store grows during the update that detects the events
+        vehicles = VehicleParams()
+        vehicles.add(veh_id="test", num_vehicles=100,
+                     routing_controller=(ContinuousRouter, {}))
+        additional_net_params = ADDITIONAL_NET_PARAMS.copy()
+        additional_net_params["length"] = 1500
+        env, _, _ = ring_road_exp_setup(
+            vehicles=vehicles,
+            net_params=NetParams(additional_params=additional_net_params))
+
+        received = []
+        env.k.events.subscribe(EDGE_CHANGED, received.extend)
+        env.k.events.subscribe(DEPARTED, received.extend)
+        env.reset()
+        self.assertCountEqual(received, env.k.vehicle.get_ids())
+
+        env.terminate()
+
+
 if __name__ == '__main__':
     unittest.main()